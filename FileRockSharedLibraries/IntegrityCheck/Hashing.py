@@ -57,6 +57,20 @@ def getHash(elements_to_combine):
     return(answer)
 
 
+def getPartsHash(*parts):
+    '''
+    Returns the same hash of getHash(parts), feeding the digest one part at a time instead of
+    joining them. Parts that are already byte strings are used as they are.
+    Nones are skipped.
+    '''
+    m = md5()
+    update = m.update
+    for part in parts:
+        if type(part) is str: update(part)
+        elif part is not None: update(part.encode('utf-8'))
+    return m.hexdigest()
+
+
 def encode(the_string):
     '''
     Encodes in base-64 a given string and returns it.
@@ -68,8 +68,13 @@ class Proof(JsonSerializable):
     that computation path.  
     '''
 
-    def __init__(self, json_serialized):
-                
+    def __init__(self, json_serialized, string_table=None):
+        '''
+        @json_serialized: the json-encoded proof.
+        @string_table: an optional dictionary used to intern pathnames and labels. Proofs decoded
+        with the same table share the strings they have in common, e.g. those of the upper nodes,
+        and take less memory.
+        '''
         self.proofpaths = {}        
         json_decoded = json.loads(json_serialized)        
         
@@ -78,32 +83,7 @@ class Proof(JsonSerializable):
         self.operation = json_decoded['operation']
         
         for starting_pathname in proofpaths:
-            
-            starting_node = None
-            previous = None
-            for nodedata in proofpaths[starting_pathname]:
-                node = SkipListNode(nodedata['pathname'],nodedata['height'], label = nodedata['label'], filehash = nodedata['filehash'])
-                proxy = None                
-                if nodedata['proxy']!=None:                    
-                    proxydata = nodedata['proxy']
-                    proxy = ProxyNode(proxydata['pathname'],proxydata['height'],proxydata['label'])        
-                    proxyside = nodedata['proxy_side']
-                    if proxyside =='r':  node.right_child = proxy
-                    if proxyside =='l':  node.lower_child = proxy
-                    proxy.father = node                    
-
-                if starting_node==None: starting_node = node
-
-                try: 
-                    previous.father = node
-                    if previous.pathname == node.pathname:   node.lower_child = previous
-                    else: node.right_child = previous
-
-                except: pass
-
-                previous = node
-
-            self.proofpaths[starting_pathname] = starting_node
+            self.proofpaths[starting_pathname] = _decodeProofPath(proofpaths[starting_pathname], string_table)
 
 
     def __str__(self):
@@ -159,6 +139,7 @@ class Proof(JsonSerializable):
             newlist = []
             node = proofpaths[proofpathname]
             while isinstance(node, SkipListNode):
+                father = node.father
                 nodemap = {}
                 nodemap['pathname'] = node.pathname
                 nodemap['height'] = node.height
@@ -177,11 +158,11 @@ class Proof(JsonSerializable):
 
                 nodemap['proxy'] = proxy
                 nodemap['proxy_side']=pside                
-                nodemap['isplateau'] = node.isPlateau()
+                nodemap['isplateau'] = father is None or father.pathname != node.pathname
 
                 newlist.append(nodemap)
 
-                node = node.father
+                node = father
             proofmap[proofpathname]=newlist
 
         json_map['proofpaths'] = proofmap
@@ -361,6 +342,104 @@ class Proof(JsonSerializable):
         return self._serialize(self.pathname, self.operation, self.proofpaths)
 
 
+def _decodeProofPath(nodes_data, string_table=None):
+    '''
+    Builds the nodes of a computation path from their decoded json representation.
+    Returns the leave of the path.
+    @nodes_data: the list of node maps, from the leave to the root.
+    @string_table: optional dictionary used to intern pathnames and labels.
+    '''
+    if string_table is not None: intern_string = string_table.setdefault
+    starting_node = None
+    previous = None
+    for nodedata in nodes_data:
+        pathname = nodedata['pathname']
+        label = nodedata['label']
+        if string_table is not None:
+            pathname = intern_string(pathname, pathname)
+            if label is not None: label = intern_string(label, label)
+        node = SkipListNode(pathname, nodedata['height'], label, nodedata['filehash'])
+
+        proxydata = nodedata['proxy']
+        if proxydata is not None:
+            pathname = proxydata['pathname']
+            label = proxydata['label']
+            if string_table is not None:
+                pathname = intern_string(pathname, pathname)
+                if label is not None: label = intern_string(label, label)
+            proxy = ProxyNode(pathname, proxydata['height'], label)
+            proxyside = nodedata['proxy_side']
+            if proxyside == 'r': node.right_child = proxy
+            elif proxyside == 'l': node.lower_child = proxy
+            proxy.father = node
+
+        if previous is None:
+            starting_node = node
+        else:
+            previous.father = node
+            if previous.pathname == node.pathname: node.lower_child = previous
+            else: node.right_child = previous
+        previous = node
+    return starting_node
+
+
 class MalformedProofException(Exception): pass
 class UnrelatedProofException(Exception): pass
 
+
+
+if __name__ == '__main__':
+    import time
+    from hashlib import md5
+
+    def typical_proof(index, height=16):
+        ''' A download proof with a path of the given height, whose upper nodes are shared with the proofs of near indexes '''
+        nodes = []
+        for level in xrange(height):
+            owner = index >> (level / 2) << (level / 2)
+            neighbour = owner + (1 << (level / 2))
+            pathname = u'folder%03d/file%06d.txt' % (owner % 1000, owner)
+            proxy_pathname = u'folder%03d/file%06d.txt' % (neighbour % 1000, neighbour)
+            nodes.append({'pathname': pathname, 'height': level / 2,
+                          'label': md5('%s,%s' % (owner, level)).hexdigest(),
+                          'filehash': md5(str(owner)).hexdigest() if level == 0 else None,
+                          'proxy': {'pathname': proxy_pathname, 'height': level / 2,
+                                    'label': md5('%s,%s' % (neighbour, level)).hexdigest(),
+                                    'filehash': None},
+                          'proxy_side': 'r', 'isplateau': level % 2 == 1})
+        return json.dumps({'pathname': nodes[0]['pathname'], 'operation': 'VERIFY',
+                           'proofpaths': {nodes[0]['pathname']: nodes}})
+
+    def proofs_size(proofs):
+        ''' Bytes taken by the nodes of the proofs and by their strings, each object counted once '''
+        seen = set()
+        total = 0
+        for proof in proofs:
+            for leaf in proof.getStartingNodes():
+                node = leaf
+                while node is not None:
+                    for obj in (node, getattr(node, '__dict__', None), node.pathname, node.label, node.filehash,
+                                node.right_child, getattr(node.right_child, '__dict__', None)):
+                        if obj is not None and id(obj) not in seen:
+                            seen.add(id(obj))
+                            total += sys.getsizeof(obj)
+                    proxy = node.right_child
+                    if proxy is not None:
+                        for obj in (proxy.pathname, proxy.label):
+                            if id(obj) not in seen:
+                                seen.add(id(obj))
+                                total += sys.getsizeof(obj)
+                    node = node.father
+        return total
+
+    def decode_test(serialized, string_table):
+        begin = time.time()
+        proofs = [Proof(s, string_table) for s in serialized]
+        end = time.time()
+        print "%s proofs decoded, string table: %s" % (len(proofs), string_table is not None)
+        print "> %s seconds elapsed" % (end - begin)
+        print "> %s bytes per proof" % (proofs_size(proofs) / len(proofs))
+
+    serialized = [typical_proof(i) for i in xrange(10000)]
+    decode_test(serialized, None)
+    decode_test(serialized, {})
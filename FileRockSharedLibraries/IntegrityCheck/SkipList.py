@@ -68,7 +68,7 @@ class AbstractSkipList(object):
         '''
         Main fields are initialized at start.
         '''
-        self.pathnames = [NEGATIVE_INFINITE, POSITIVE_INFINITE ]
+        self.pathnames = set([NEGATIVE_INFINITE, POSITIVE_INFINITE])
         self.leaves = {}
         self.plateaus = {}
         self.root = None
@@ -114,7 +114,7 @@ class AbstractSkipList(object):
         
         if pathname in self.pathnames: raise SkipListHandlingException("Pathname %s already in set" % pathname)
         if data == None: raise SkipListHandlingException("Trying to insert a pathname %s with None filehash attached: " % pathname)
-        self.pathnames.append(pathname)        
+        self.pathnames.add(pathname)        
         newleaf = SkipListNode(pathname, 0, data, filehash = data)        
         newplateau = self._buildTower(newleaf)        
         self.leaves[pathname] = newleaf
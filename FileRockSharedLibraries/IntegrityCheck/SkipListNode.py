@@ -42,23 +42,29 @@ FileRock Client is licensed under GPLv3 License.
 """
 
 import logging
-from Hashing import getHash, encode
+from Hashing import getPartsHash, encode
 POSITIVE_INFINITE = u'+INF'
 NEGATIVE_INFINITE = u'-INF'
 
-class SkipListNode():
+class SkipListNode(object):
     '''
     This class represents a node of the SkipList and describes its position in the data structure.
     It also implements the ASL function of label computation.
     It's important to remember that such 'label' is, for root node in the SkipList, the basis.
+    Nodes are many and small, so they have no instance dictionary: only the attributes in __slots__ can be set.
     '''
 
-    def __init__(self, pathname, height, label = None, filehash = None, loggername = "SkipListNodeLogger"):
+    __slots__ = ('pathname', 'height', 'label', 'lower_child', 'right_child',
+                 'father', 'outdated_label', 'filehash', '_encoded_pathname')
+
+    loggername = "SkipListNodeLogger"
+
+    def __init__(self, pathname, height, label = None, filehash = None, loggername = None):
         ''' 
         A SkipListNode is identified by a couple (pathname, height), that is its cartesian position in the skip list.
         @label: it is the value needed for authentication process; it should be set at level 0 only, it's None by default.
         @filehash: it is the file content hash; it should be set at level 0 only, None by default.
-        @loggername: the name of the logger to be used in it.        
+        @loggername: unused, kept for compatibility. Nodes share the class loggername.
         '''
 
         self.pathname = pathname  
@@ -69,8 +75,11 @@ class SkipListNode():
         self.father = None
         self.outdated_label = True        
         self.filehash = filehash
-        self.loggername = loggername
-        self.who = self.__class__.__name__
+        self._encoded_pathname = None
+
+    @property
+    def who(self):
+        return self.__class__.__name__
 
     def isNegativeInfinite(self):
         '''Returns True if node is part of the right guard.'''
@@ -112,25 +121,54 @@ class SkipListNode():
     def computeLabel(self, forced = False):
         '''
         Computes node label.
+        The computation is iterative and bottom-up: only the outdated
+        nodes (see outdateAncestors) are visited, the others contribute
+        with their stored label.
         @forced: if True, forces the computation without using lazy-load. False by default
         raise: MalformedNodeException
         '''
         if not (forced or self.outdated_label): return self.label
-        
+
+        stack = [(self, False)]
+        while len(stack) > 0:
+            node, children_done = stack.pop()
+            if children_done:
+                node._updateLabel()
+                continue
+            stack.append((node, True))
+            for child in (node.lower_child, node.right_child):
+                if isinstance(child, SkipListNode) and child._isLabelToBeComputed(forced):
+                    stack.append((child, False))
+        return self.label
+
+    def _isLabelToBeComputed(self, forced):
+        return forced or self.outdated_label
+
+    def _updateLabel(self):
+        '''
+        Computes node label from the labels of its children, that must be up to date.
+        raise: MalformedNodeException
+        '''
         if self.height == 0:
-            if self.filehash == None: raise MalformedNodeException("Leaf of %s has None filehash!" % repr(self.pathname))            
-            if isinstance( self.right_child, SkipListNode ):                
-                self.label = getHash( [ encode(self.pathname), self.filehash, self.right_child.computeLabel(forced) ] )
+            if self.filehash == None: raise MalformedNodeException("Leaf of %s has None filehash!" % repr(self.pathname))
+            if isinstance( self.right_child, SkipListNode ):
+                self.label = getPartsHash(self.getEncodedPathname(), self.filehash, self.right_child.computeLabel(False))
             else:
-                encoded = encode(self.pathname)                
-                self.label = encoded+self.filehash
-        else: 
-            if not isinstance(self.right_child, SkipListNode): self.label = self.lower_child.computeLabel(forced)
-            else: self.label = getHash([self.lower_child.computeLabel(forced), self.right_child.computeLabel(forced)])
-        
-        self.outdated_label = False        
-        return self.label
-    
+                self.label = self.getEncodedPathname()+self.filehash
+        else:
+            if not isinstance(self.right_child, SkipListNode): self.label = self.lower_child.computeLabel(False)
+            else: self.label = getPartsHash(self.lower_child.computeLabel(False), self.right_child.computeLabel(False))
+
+        self.outdated_label = False
+
+    def getEncodedPathname(self):
+        '''
+        Returns the base-64 encoding of the pathname, that is part of leaf labels.
+        It's computed once, since the pathname of a node never changes.
+        '''
+        if self._encoded_pathname is None: self._encoded_pathname = encode(self.pathname)
+        return self._encoded_pathname
+
     def outdateAncestors(self):
         ''' 
         Marks the node and its ancestors with outdated mark and nullify its label.
@@ -200,8 +238,10 @@ class ProxyNode(SkipListNode):
     This class represents a node in a proof path that contributes with its label in the computation, but it has no tree under it.
     Like a SkipListNode, it describes its own identity with its position, but it comes with a fixed label.        
     '''
+
+    __slots__ = ()
             
-    def computeLabel(self, forced):
+    def computeLabel(self, forced = False):
         '''
         Returns assigned label.
         raise: MalformedProxyException if proxy has not necessary data.
@@ -209,6 +249,9 @@ class ProxyNode(SkipListNode):
         if self.father == None: raise MalformedProxyException("Proxy (%s,%s) has None father!" % (self.pathname, self.height))        
         if self.label == None or self.label == "": raise MalformedProxyException("No label assigned to proxy of (%s,%s) " % (self.pathname, self.height))        
         return self.label    
+
+    def _isLabelToBeComputed(self, forced):
+        return False
     
     def resetData(self):
         pass
@@ -220,3 +263,77 @@ class ProxyNode(SkipListNode):
 class MalformedSkipListException(Exception): pass
 class MalformedNodeException(Exception): pass
 class MalformedProxyException(Exception): pass
+
+
+if __name__ == '__main__':
+    import time
+    from hashlib import md5
+    from Hashing import getHash
+
+    MAX_HEIGHT = 8
+
+    def synthetic_skiplist(leaves_count):
+        ''' Builds a skiplist with the given number of leaves, whose towers are as tall as the trailing zeros of their index in base 4 '''
+        last_at_height = [None] * (MAX_HEIGHT + 1)
+        root = None
+        towers = [(NEGATIVE_INFINITE, MAX_HEIGHT)]
+        for index in xrange(1, leaves_count + 1):
+            height = 0
+            while index % (4 ** (height + 1)) == 0 and height < MAX_HEIGHT - 1: height += 1
+            towers.append((u'folder%03d/file%07d.txt' % (index % 1000, index), height))
+        towers.append((POSITIVE_INFINITE, MAX_HEIGHT))
+        for pathname, top in towers:
+            node = SkipListNode(pathname, 0, filehash = md5(pathname.encode('utf-8')).hexdigest())
+            last_at_height[0], lower = node, node
+            for height in xrange(1, top + 1):
+                node = SkipListNode(pathname, height)
+                node.lower_child, lower.father = lower, node
+                last_at_height[height], lower = node, node
+            if root is None: root = node
+            else:
+                left_buddy = last_at_height[top] if last_at_height[top] is not node else None
+                if left_buddy is None: left_buddy = previous_at_height[top]
+                left_buddy.right_child, node.father = node, left_buddy
+            previous_at_height = list(last_at_height)
+        return root
+
+    def nodes_in_postorder(root):
+        ''' Returns the nodes of the tree, children before their father '''
+        nodes, to_visit = [], [root]
+        while len(to_visit) > 0:
+            node = to_visit.pop()
+            nodes.append(node)
+            for child in (node.lower_child, node.right_child):
+                if child is not None: to_visit.append(child)
+        nodes.reverse()
+        return nodes
+
+    def join_hashing_test(nodes):
+        ''' The labels as computed by getHash, joining the encoded parts '''
+        begin = time.time()
+        for node in nodes:
+            if node.height == 0:
+                if node.right_child is not None: node.label = getHash([encode(node.pathname), node.filehash, node.right_child.label])
+                else: node.label = encode(node.pathname) + node.filehash
+            elif node.right_child is None: node.label = node.lower_child.label
+            else: node.label = getHash([node.lower_child.label, node.right_child.label])
+        end = time.time()
+        print "getHash: %s nodes" % len(nodes)
+        print "> %s seconds elapsed" % (end - begin)
+        return nodes[-1].label
+
+    def parts_hashing_test(nodes, message):
+        ''' The labels as computed by the nodes, feeding the digest part by part '''
+        begin = time.time()
+        for node in nodes: node._updateLabel()
+        end = time.time()
+        print "getPartsHash: %s nodes, %s" % (len(nodes), message)
+        print "> %s seconds elapsed" % (end - begin)
+        return nodes[-1].label
+
+    root = synthetic_skiplist(1000000)
+    nodes = nodes_in_postorder(root)
+    expected = join_hashing_test(nodes)
+    assert parts_hashing_test(nodes, "pathnames to be encoded") == expected
+    assert parts_hashing_test(nodes, "pathnames already encoded") == expected
+    assert root.computeLabel(forced = True) == expected
@@ -55,7 +55,7 @@ APPLICATION_PATHS = u"Application Paths"
 
 APPNAME = u"filerock"
 CONFIG_FILE_NAME = u"config.ini"
-CURRENT_CONFIG_VERSION = 13
+CURRENT_CONFIG_VERSION = 18
 BLACKLISTED_DIR = ".FileRockTemp"
 
 PROXY_PORT = '443'
@@ -83,7 +83,23 @@ DEFAULT_CONFIG = {
     u"Client": {
         u'commit_threshold_seconds': u'10',
         u'commit_threshold_operations': u'10',
-        u'commit_threshold_bytes': u'52428800'  # 50 MB
+        u'commit_threshold_bytes': u'52428800',  # 50 MB
+        u'adaptive_commit': u'True',
+        u'commit_max_operations': u'1000',
+        u'commit_max_bytes': u'524288000',  # 500 MB
+        u'commit_max_seconds': u'300',
+        u'commit_overhead_percent': u'10',
+        u'priority_scheduling': u'True',
+        u'small_file_size': u'4194304',  # 4 MB
+        u'small_files_workers': u'1',
+        u'scheduling_aging_seconds': u'120',
+        u'autoscaling_workers': u'True',
+        u'transfer_workers_min': u'1',
+        u'transfer_workers_max': u'16',
+        u'crypto_workers_min': u'1',
+        u'crypto_workers_max': u'0',  # 0 means the number of CPUs
+        u'streaming_encryption': u'True',
+        u'hashing_threads': u'4'
     },
     u"User Defined Options": {
         u'on_tray_click': u'panel',
@@ -49,6 +49,7 @@ from filerockclient.warebox import Warebox
 from filerockclient.constants import RUNNING_FROM_SOURCE, RUNNING_INSTALLED
 from filerockclient.serversession.server_session import ServerSession
 from filerockclient.databases.storage_cache import StorageCache
+from filerockclient.databases.sqlite_driver import close_thread_connections
 from filerockclient.serversession.startup_synchronization import \
     StartupSynchronization
 from filerockclient.linker import Linker
@@ -576,8 +577,21 @@ class Core(object):
             self._server_session.terminate()
         if self.FSWatcher is not None:
             self.FSWatcher.terminate()
+        close_thread_connections()
         self.logger.debug(u'Core terminated.')
 
+    def set_bandwidth_limits(self, upload_limit, download_limit):
+        """Change the bandwidth limits without restarting.
+
+        @param upload_limit:
+                    Maximum upload rate in KB/s, 0 means no limit.
+        @param download_limit:
+                    Maximum download rate in KB/s, 0 means no limit.
+        """
+        if self._server_session is not None:
+            self._server_session.worker_pool.set_bandwidth_limits(
+                upload_limit, download_limit)
+
     def connect(self):
         """Connect to the server.
         """
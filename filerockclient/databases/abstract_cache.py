@@ -56,9 +56,12 @@ import logging
 import copy
 
 from contextlib import contextmanager
-from filerockclient.databases.sqlite_driver import SQLiteDB
+from filerockclient.databases.sqlite_driver import SQLiteDB, \
+    JOURNAL_MODE_DELETE
 
 TABLENAME = 'Override me!'
+# SQLite doesn't accept more than 999 parameters in a statement
+MAX_QUERY_PARAMETERS = 900
 KEY = u'pathname'
 SCHEMA = [u'pathname Text', u'field2 Text', u'filed3 Text']
 
@@ -118,10 +121,15 @@ class AbstractCache(object):
                 defining the fields of the records.
     @param key:
                 Name of the field that identifies the records.
+    @param journal_mode:
+                Journal mode of the database, see the sqlite_driver
+                module. Caches which get attached to another cache's
+                transaction must use JOURNAL_MODE_DELETE.
      """
 
     def __init__(self,
-                 database_file, table_name, table_schema, key, logger=None):
+                 database_file, table_name, table_schema, key, logger=None,
+                 journal_mode=JOURNAL_MODE_DELETE):
 
         if logger is None:
             self.logger = logging.getLogger()
@@ -133,7 +141,7 @@ class AbstractCache(object):
         self._key = None
         self._columns = None
         self._schema = None
-        self._db = SQLiteDB(database_file)
+        self._db = SQLiteDB(database_file, journal_mode)
         self._filename = database_file
         self.recreated = False
         # Note: self.schema is a property object
@@ -218,15 +226,30 @@ class AbstractCache(object):
 
     def _create_index_if_needed(self):
         """Assuming the database is there and the schema is ok, 
-        it add a key index if it is not present."""
+        it add a key index if it is not present.
+
+        The index is UNIQUE, so that records can be upserted with a
+        single "INSERT OR REPLACE" statement. Databases created with
+        the former non-unique index are migrated, keeping the most
+        recently inserted record for duplicated keys."""
 
         data=self._query(u"SELECT sql FROM sqlite_master "
                          u"WHERE type='index' and name=?", 
                          [self._key+"_index"])
-        
-        if len(data)==0:
+
+        if len(data) > 0 and data[0][0].upper().startswith(u'CREATE UNIQUE'):
+            return
+
+        if len(data) > 0:
+            self.logger.debug("making unique the index of %s"
+                              % self._table_name)
+            self._execute(u'DELETE FROM %s WHERE rowid NOT IN '
+                          u'(SELECT MAX(rowid) FROM %s GROUP BY %s)' %
+                          (self._table_name, self._table_name, self._key))
+            self._execute(u'DROP INDEX "%s_index"' % self._key)
+        else:
             self.logger.debug("adding index to %s" % self._table_name)
-            self._execute(u'CREATE INDEX "%s_index" on %s (%s ASC)' %
+        self._execute(u'CREATE UNIQUE INDEX "%s_index" on %s (%s ASC)' %
                       (self._key, self._table_name, self._key))
 
 
@@ -249,29 +272,40 @@ class AbstractCache(object):
 
         @param record: a tuple of values (column1_value, column2_value, ...)
         """
-        number_of_field = len(record)
-        if number_of_field != len(self.schema):
+        self._check_number_of_fields(record)
+        self._execute(self._upsert_statement(), tuple(record))
+
+    def update_records_bulk(self, records):
+        """
+        Write many records into the cache with a single batched
+        statement.
+
+        Records with the same key values of existing ones overwrite
+        them. Raises WrongNumberOfParameters exception if any record
+        has a wrong number of fields, in which case nothing is written.
+
+        @param records: an iterable of tuples of values
+                (column1_value, column2_value, ...)
+        """
+        records = [tuple(record) for record in records]
+        if len(records) == 0:
+            return
+        for record in records:
+            self._check_number_of_fields(record)
+        self._execute(self._upsert_statement(), records)
+
+    def _check_number_of_fields(self, record):
+        if len(record) != len(self.schema):
             raise WrongNumberOfParameters(
                             u'Passed %s parameters, %s were required in the'
                             ' following schema: %s'
                             % (len(record), len(self.schema), self.schema))
 
-        if not self.exist_record(record[self._key_index]):
-            self._insert_record(record)
-        else:
-            self._update_record(record)
-
-    def _insert_record(self, record):
-        fields = ', '.join(['?'] * len(record))
-        statement = ''.join([u'INSERT INTO %s VALUES (', fields, ')'])
-        self._execute(statement % self.table_name, record)
-
-    def _update_record(self, record):
-        columns = u', '.join(["%s = ?" % column for column in self._columns])
-        statement = u"UPDATE %s SET %s WHERE %s = ?"
-        statement = statement % (self.table_name, columns, self.key)
-        values = record + (record[self._key_index],)
-        self._execute(statement, values)
+    def _upsert_statement(self):
+        # Relies on the UNIQUE index on the key column
+        fields = ', '.join(['?'] * len(self._columns))
+        statement = ''.join([u'INSERT OR REPLACE INTO %s VALUES (', fields, ')'])
+        return statement % self.table_name
 
     def update_record_fields(self, key_value, **fields):
         """
@@ -353,6 +387,27 @@ class AbstractCache(object):
                 % (self.key, key_value))
         return result[0]
 
+    def get_records_bulk(self, key_values):
+        """
+        Return the records with the given key values.
+
+        The records are read with as few queries as possible, rather
+        than with a query for each key.
+
+        @param key_values: an iterable of values of the key column
+        @return: a dictionary mapping each found key value to its
+                record. Keys with no record aren't in the dictionary.
+        """
+        key_values = list(key_values)
+        result = {}
+        for i in xrange(0, len(key_values), MAX_QUERY_PARAMETERS):
+            batch = key_values[i:i + MAX_QUERY_PARAMETERS]
+            statement = u'SELECT * FROM %s WHERE %s IN (%s)' % (
+                self.table_name, self.key, ', '.join(['?'] * len(batch)))
+            for record in self._query(statement, batch):
+                result[record[self._key_index]] = record
+        return result
+
     def get_all_records(self):
         return self._query(u"SELECT * FROM %s" % self.table_name)
 
@@ -365,10 +420,20 @@ class AbstractCache(object):
         """ Delete all records from the database """
         self._execute(u"DELETE FROM %s" % self.table_name)
 
+    def close(self):
+        """Close the connections of all threads to the database.
+
+        The cache can still be used afterwards, new connections are
+        opened on demand.
+        """
+        self._db.close_all()
+
     def destroy(self):
         """ Delete DB File """
-        if os.path.exists(self._filename):
-            os.remove(self._filename)
+        self._db.close_all()
+        for suffix in ['', '-wal', '-shm']:
+            if os.path.exists(self._filename + suffix):
+                os.remove(self._filename + suffix)
 
     def _execute(self, statement, parameters=[]):
         if not self._autocommit:
@@ -378,11 +443,14 @@ class AbstractCache(object):
                 transactional_self._db.execute(statement, parameters)
 
     def _query(self, statement, parameters=[]):
-        try:
-            return self._db.query(statement, parameters)
-        finally:
-            if self._autocommit:
-                self._db.close()
+        return self._db.query(statement, parameters)
+
+    def _on_rollback(self):
+        """Called on the transactional clones of the caches taking part
+        in a transaction that has been rollbacked. Subclasses keeping
+        any state about the content of the database must drop it.
+        """
+        pass
 
     @contextmanager
     def transaction(self, *caches_to_attach):
@@ -411,31 +479,78 @@ class AbstractCache(object):
         transactional_self._db.begin_transaction()
 
         attached_caches = [transactional_self]
+        attached_names = []
 
-        for cache in caches_to_attach:
-            statement = "ATTACH DATABASE '%s' as %s" \
+        try:
+            for cache in caches_to_attach:
+                statement = "ATTACH DATABASE '%s' as %s" \
                                   % (cache._filename, cache.__class__.__name__)
-            transactional_self._execute(statement)
-            transactional_cache = copy.copy(cache)
-            transactional_cache._autocommit = False
-            transactional_cache._db = self._db
-            transactional_cache._table_name = "%s.%s" \
+                transactional_self._execute(statement)
+                attached_names.append(cache.__class__.__name__)
+                transactional_cache = copy.copy(cache)
+                transactional_cache._autocommit = False
+                transactional_cache._db = self._db
+                transactional_cache._table_name = "%s.%s" \
                                 % (cache.__class__.__name__, cache._table_name)
-            attached_caches.append(transactional_cache)
+                attached_caches.append(transactional_cache)
 
-        try:
             if not caches_to_attach:
                 yield transactional_self
             else:
                 yield tuple(attached_caches)
         except:
             transactional_self._db.rollback_transaction()
+            for cache in attached_caches:
+                cache._on_rollback()
             raise
         else:
-            transactional_self._db.commit_transaction()
+            try:
+                transactional_self._db.commit_transaction()
+            except:
+                # The connection is kept open, don't leave the
+                # transaction pending on it
+                transactional_self._db.rollback_transaction()
+                for cache in attached_caches:
+                    cache._on_rollback()
+                raise
         finally:
-            transactional_self._db.close()
+            # Connections are long-lived, so the attached databases
+            # must be explicitly detached
+            for name in attached_names:
+                transactional_self._db.execute("DETACH DATABASE %s" % name)
 
 
 if __name__ == '__main__':
-    pass
+    import sys
+    import time
+    import tempfile
+    from filerockclient.databases.sqlite_driver import JOURNAL_MODE_WAL
+
+    SCHEMA = [u'pathname text', u'size int', u'lmtime text', u'etag text']
+
+    def lookup_test(journal_mode, reconnect, how_many):
+        ''' The queries made by Warebox._is_new() for each scanned file '''
+        database_file = tempfile.mktemp()
+        cache = AbstractCache(database_file, u'test', SCHEMA, u'pathname',
+                              journal_mode=journal_mode)
+        cache.update_records_bulk(
+            (u'file%s' % i, i, u'2012-01-01 00:00:00', u'etag')
+            for i in xrange(how_many))
+        begin = time.time()
+        for i in xrange(how_many):
+            if cache.exist_record(u'file%s' % i):
+                cache.get_record(u'file%s' % i)
+            if reconnect:
+                # What the cache did before connections became long-lived
+                cache.close()
+        end = time.time()
+        cache.destroy()
+        print "%s, %s: %s lookups" % (
+            journal_mode, 'reconnecting' if reconnect else 'persistent',
+            how_many)
+        print "> %s seconds elapsed" % (end - begin)
+
+    how_many = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    lookup_test(JOURNAL_MODE_DELETE, True, how_many)
+    lookup_test(JOURNAL_MODE_DELETE, False, how_many)
+    lookup_test(JOURNAL_MODE_WAL, False, how_many)
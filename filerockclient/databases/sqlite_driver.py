@@ -50,8 +50,17 @@ tricky: a connection to a database file can't be shared by two or more
 threads. While connection pooling would have been an option, we have
 found simpler to make each thread use its own connection. The connection
 is automagically created and handled by the SQLiteDB class, but you
-should never forget about it. For example, each thread has to close its
-own connection (that is, no global "closing procedure" is possible).
+should never forget about it. Connections are long-lived: a thread keeps
+using the same connection until it closes it, so each thread should call
+close_thread_connections() before terminating. SQLiteDB.close_all()
+closes the connections of every thread and must be called only when
+they are not using the database anymore (e.g. at shutdown).
+
+Databases can be opened in WAL journal mode, which lets readers proceed
+while a thread is writing and makes commits much cheaper. Note however
+that in WAL mode a transaction involving ATTACHed databases is atomic
+for each database but not across all of them, so databases which take
+part in such transactions must keep the default rollback journal.
 
 SQLite acquires an EXCLUSIVE lock while it writes to a database, meaning
 that concurrent threads must wait for it to finish. For example, if a
@@ -81,20 +90,53 @@ FileRock Client is licensed under GPLv3 License.
 import logging
 import sqlite3
 import threading
+import weakref
+
+
+JOURNAL_MODE_DELETE = 'DELETE'
+JOURNAL_MODE_WAL = 'WAL'
+
+# Negative values are in KiB rather than in pages
+CACHE_SIZE = -8192
+
+# All SQLiteDB instances, so that a thread can close all its connections
+_databases = weakref.WeakSet()
+_databases_lock = threading.Lock()
+
+
+def close_thread_connections():
+    """Close the connections of the current thread to all databases.
+
+    Threads that made use of any database should call it just before
+    terminating.
+    """
+    with _databases_lock:
+        databases = list(_databases)
+    for database in databases:
+        database.close()
 
 
 class SQLiteDB(object):
     """A wrapper around the standard sqlite3 module with a nice interface."""
 
-    def __init__(self, database_file):
+    def __init__(self, database_file, journal_mode=JOURNAL_MODE_DELETE):
         """
         @param database_file:
                     The absolute filesystem pathname of the database
                     file. It will be created if it doesn't exist.
+        @param journal_mode:
+                    Either JOURNAL_MODE_DELETE (the SQLite default) or
+                    JOURNAL_MODE_WAL.
         """
         self._logger = logging.getLogger("FR.%s" % self.__class__.__name__)
         self._filename = database_file
+        self._journal_mode = journal_mode
         self._thread_local = threading.local()
+        # thread -> connection, for closing them all at shutdown
+        self._connections = {}
+        self._connections_lock = threading.Lock()
+        with _databases_lock:
+            _databases.add(self)
 
     def _get_connection(self):
         """
@@ -107,17 +149,54 @@ class SQLiteDB(object):
         try:
             connection = self._thread_local.connection
         except AttributeError:
-            connection = sqlite3.connect(self._filename)
+            # The connection is still used by this thread only, but
+            # close_all() must be able to close it from another one.
+            connection = sqlite3.connect(self._filename,
+                                         check_same_thread=False)
             try:
-                connection.execute('PRAGMA case_sensitive_like = True')
-            except Exception as e:
-                self._logger.error(
-                    u'Error setting PRAGMA case_sensitive_like: %s' % e)
+                self._configure_connection(connection)
+            except Exception:
                 connection.close()
                 raise
             self._thread_local.connection = connection
+            self._register_connection(connection)
         return connection
 
+    def _configure_connection(self, connection):
+        """Set the PRAGMAs of a newly created connection."""
+        try:
+            connection.execute('PRAGMA case_sensitive_like = True')
+        except Exception as e:
+            self._logger.error(
+                u'Error setting PRAGMA case_sensitive_like: %s' % e)
+            raise
+        connection.execute('PRAGMA cache_size = %d' % CACHE_SIZE)
+        if self._journal_mode != JOURNAL_MODE_WAL:
+            return
+        # The journal mode is persistent, this is a no-op for any
+        # connection but the first one.
+        result = connection.execute('PRAGMA journal_mode = WAL').fetchone()
+        if result is None or result[0].upper() != JOURNAL_MODE_WAL:
+            self._logger.warning(
+                u'Could not enable WAL journal mode on %s, got: %r'
+                % (self._filename, result))
+            return
+        # In WAL mode NORMAL can't corrupt the database, at most the
+        # last commits are lost on power failure.
+        connection.execute('PRAGMA synchronous = NORMAL')
+
+    def _register_connection(self, connection):
+        """Remember the connection of the current thread, closing the
+        ones left open by terminated threads.
+        """
+        with self._connections_lock:
+            dead = [thread for thread in self._connections
+                    if not thread.is_alive()]
+            leaked = [self._connections.pop(thread) for thread in dead]
+            self._connections[threading.current_thread()] = connection
+        for leaked_connection in leaked:
+            leaked_connection.close()
+
     def begin_transaction(self):
         """
         Begin a transaction.
@@ -151,10 +230,33 @@ class SQLiteDB(object):
         to rollback.
         """
         try:
-            self._thread_local.connection.close()
+            connection = self._thread_local.connection
             del self._thread_local.connection
         except AttributeError:
-            pass
+            return
+        with self._connections_lock:
+            thread = threading.current_thread()
+            if self._connections.get(thread) is connection:
+                del self._connections[thread]
+        connection.close()
+
+    def close_all(self):
+        """
+        Close the connections to the database of all threads.
+
+        Must be called only when no thread is using the database
+        anymore, since it doesn't wait for running statements.
+        """
+        with self._connections_lock:
+            connections = self._connections.values()
+            self._connections = {}
+        self._thread_local = threading.local()
+        for connection in connections:
+            try:
+                connection.close()
+            except sqlite3.Error as e:
+                self._logger.warning(
+                    u'Error closing connection to %s: %s' % (self._filename, e))
 
     def execute(self, statement, eargs=[]):
         """
@@ -39,8 +39,10 @@ FileRock Client is licensed under GPLv3 License.
 
 import logging
 import datetime
+import threading
 
 from filerockclient.databases.abstract_cache import AbstractCache
+from filerockclient.util.pathname_trie import PathnameTrie
 
 
 TABLE_NAME = "storage_cache"
@@ -64,12 +66,18 @@ class StorageCache(AbstractCache):
         - it's the local filesystem time for restored records which got lost
     In any case it is NOT the time of the commit, which isn't saved yet. It
     will be the "record time", that is, the time when the record was updated.
+
+    Hierarchy queries (e.g. exist_record_proper_prefix) are answered by a
+    PathnameTrie of the cached pathnames, loaded on first use and then
+    kept updated by the methods modifying the cache.
     '''
 
     def __init__(self, database_file):
         logger = logging.getLogger("FR.%s" % self.__class__.__name__)
         AbstractCache.__init__(
                 self, database_file, TABLE_NAME, SCHEMA, KEY, logger)
+        # Shared with the transactional clones made by transaction()
+        self._pathnames = _PathnameIndex()
 
     def get_all_records(self):
         """
@@ -93,15 +101,23 @@ class StorageCache(AbstractCache):
 
     def exist_record_proper_prefix(self, prefix):
         """
-        Checks the presence of pathnames with the given prefix
+        Checks the presence of pathnames inside the given folder
+
+        @param prefix: a folder pathname
+        """
+        with self._pathnames.lock:
+            trie = self._pathnames.get(self.get_all_keys)
+            return trie.count_descendants(prefix) > 0
 
-        @param prefix: a string prefix
+    def find_first_missing_ancestor(self, pathname):
         """
-        query = "SELECT COUNT(*) FROM storage_cache " \
-                "WHERE pathname LIKE (? || '%') AND NOT pathname = ?"
-        result = self._query(query, (prefix, prefix))
-        count = result[0][0]
-        return count > 0
+        @param pathname: a pathname
+        @return the shallowest ancestor folder of pathname which isn't in
+                the cache, None if they are all in it.
+        """
+        with self._pathnames.lock:
+            trie = self._pathnames.get(self.get_all_keys)
+            return trie.first_missing_ancestor(pathname)
 
     def update_record(self,
                 pathname, warebox_size, storage_size, lmtime,
@@ -111,6 +127,84 @@ class StorageCache(AbstractCache):
         AbstractCache.update_record(self,
                                pathname, warebox_size, storage_size,
                                lmtime_str, warebox_etag, storage_etag)
+        self._pathnames.add([pathname])
+
+    def update_records_bulk(self, records):
+        """
+        @param records: an iterable of tuples
+                (pathname, warebox_size, storage_size,
+                lmtime, warebox_etag, storage_etag)
+        """
+        records = [
+            (pathname, warebox_size, storage_size,
+             lmtime.strftime('%Y-%m-%d %H:%M:%S'), warebox_etag, storage_etag)
+            for (pathname, warebox_size, storage_size,
+                 lmtime, warebox_etag, storage_etag) in records]
+        AbstractCache.update_records_bulk(self, records)
+        self._pathnames.add(record[0] for record in records)
+
+    def update_record_fields(self, key_value, **fields):
+        AbstractCache.update_record_fields(self, key_value, **fields)
+        if KEY in fields:
+            self._pathnames.invalidate()
+
+    def delete_record(self, key_value):
+        AbstractCache.delete_record(self, key_value)
+        self._pathnames.remove([key_value])
+
+    def delete_records(self, key_values):
+        AbstractCache.delete_records(self, key_values)
+        self._pathnames.remove(key_values)
+
+    def clear(self):
+        AbstractCache.clear(self)
+        self._pathnames.invalidate()
+
+    def destroy(self):
+        AbstractCache.destroy(self)
+        self._pathnames.invalidate()
+
+    def _on_rollback(self):
+        self._pathnames.invalidate()
+
+
+class _PathnameIndex(object):
+    """
+    The PathnameTrie of the pathnames in a StorageCache, or nothing if
+    it hasn't been loaded yet or has been invalidated.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._trie = None
+
+    def get(self, get_all_pathnames):
+        """
+        Must be called holding self.lock.
+
+        @param get_all_pathnames: callable returning all the pathnames
+                in the cache, called if the trie must be loaded
+        @return an instance of PathnameTrie
+        """
+        if self._trie is None:
+            self._trie = PathnameTrie(get_all_pathnames())
+        return self._trie
+
+    def add(self, pathnames):
+        with self.lock:
+            if self._trie is not None:
+                for pathname in pathnames:
+                    self._trie.add(pathname)
+
+    def remove(self, pathnames):
+        with self.lock:
+            if self._trie is not None:
+                for pathname in pathnames:
+                    self._trie.remove(pathname)
+
+    def invalidate(self):
+        with self.lock:
+            self._trie = None
 
 
 if __name__ == '__main__':
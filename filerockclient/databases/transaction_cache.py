@@ -66,6 +66,17 @@ class TransactionCache(AbstractCache):
         timestamp_str = transaction_timestamp.strftime('%Y-%m-%d %H:%M:%S')
         AbstractCache.update_record(self, op_id, operation_str, timestamp_str)
 
+    def update_records_bulk(self, records):
+        """
+        @param records: an iterable of tuples
+                (op_id, operation, transaction_timestamp)
+        """
+        AbstractCache.update_records_bulk(self, [
+            (op_id,
+             buffer(pickle.dumps(operation)),
+             transaction_timestamp.strftime('%Y-%m-%d %H:%M:%S'))
+            for (op_id, operation, transaction_timestamp) in records])
+
     def get_all_records(self):
         records = AbstractCache.get_all_records(self)
         result = []
@@ -27,6 +27,10 @@
 """
 This is the warebox_cache module.
 
+Besides the WareboxCache itself, the module provides an in-memory,
+write-back mirror of it, which lets a scan of the warebox check each
+pathname without querying the database.
+
 ----
 
 This module is part of the FileRock Client.
@@ -38,7 +42,9 @@ FileRock Client is licensed under GPLv3 License.
 """
 
 import logging
+import threading
 from filerockclient.databases.abstract_cache import AbstractCache
+from filerockclient.databases.sqlite_driver import JOURNAL_MODE_WAL
 
 TABLE_NAME = u'warebox_cache'
 
@@ -49,6 +55,12 @@ SCHEMA = [u'pathname text',
 
 KEY = u'pathname'
 
+# Records kept in memory by a WareboxCacheMirror, beyond which the
+# mirror falls back on querying the database for the missing ones.
+MIRROR_MAX_RECORDS = 100000
+# Modified records kept in memory before writing them to the database
+MIRROR_MAX_DIRTY_RECORDS = 10000
+
 
 class WareboxCache(AbstractCache):
 
@@ -58,7 +70,134 @@ class WareboxCache(AbstractCache):
                                            TABLE_NAME,
                                            SCHEMA,
                                            KEY,
-                                           logger=None)
+                                           logger=None,
+                                           journal_mode=JOURNAL_MODE_WAL)
+
+
+class WareboxCacheMirror(object):
+    """
+    An in-memory, write-back copy of a WareboxCache.
+
+    load() reads the whole cache with a single query; afterwards records
+    are read from memory and modifications are kept in memory as well,
+    until flush() writes them all with a single batched statement.
+    Modifications are written anyway when they are more than
+    max_dirty_records.
+
+    If the cache has more than max_records records the mirror keeps in
+    memory only the first max_records ones and queries the database for
+    the others, so to bound the memory used for very large wareboxes.
+
+    The mirror is thread-safe. The underlying cache must not be
+    modified directly while a mirror of it is in use.
+    """
+
+    def __init__(self, cache,
+                 max_records=MIRROR_MAX_RECORDS,
+                 max_dirty_records=MIRROR_MAX_DIRTY_RECORDS):
+        """
+        @param cache:
+                    Instance of WareboxCache.
+        @param max_records:
+                    Maximum number of records kept in memory.
+        @param max_dirty_records:
+                    Maximum number of modified records kept in memory
+                    before writing them to the database.
+        """
+        self._cache = cache
+        self._max_records = max_records
+        self._max_dirty_records = max_dirty_records
+        self._lock = threading.RLock()
+        # pathname -> record, as returned by WareboxCache.get_record()
+        self._records = {}
+        self._dirty = {}
+        self._complete = False
+
+    def is_complete(self):
+        """
+        @return
+                    True if all records are in memory, False if the
+                    mirror is memory-bounded and queries the database
+                    for the records it doesn't have.
+        """
+        with self._lock:
+            return self._complete
+
+    def load(self):
+        """Read the cache content, up to max_records records."""
+        records = self._cache._query(
+            u'SELECT * FROM %s LIMIT ?' % self._cache.table_name,
+            (self._max_records + 1,))
+        with self._lock:
+            self._complete = len(records) <= self._max_records
+            self._records = dict(
+                (record[0], record) for record in records[:self._max_records])
+            self._dirty = {}
+
+    def get_record(self, pathname):
+        """
+        @param pathname:
+                    A warebox relative pathname.
+        @return
+                    The (pathname, size, lmtime, etag) record for the
+                    pathname, or None if there isn't any.
+        """
+        with self._lock:
+            record = self._dirty.get(pathname)
+            if record is None:
+                record = self._records.get(pathname)
+            if record is not None or self._complete:
+                return record
+        return self._cache.get_record(pathname)
+
+    def update_record(self, pathname, size, lmtime, etag):
+        """Write a record, overwriting any previous one.
+
+        @param pathname:
+                    A warebox relative pathname.
+        @param size:
+                    The pathname size in bytes.
+        @param lmtime:
+                    The pathname last modification time, as datetime.
+        @param etag:
+                    The hexadecimal MD5 hash of the pathname content.
+        """
+        # Store the same representation returned by the database
+        record = (unicode(pathname), size, unicode(lmtime), etag)
+        with self._lock:
+            self._dirty[record[0]] = record
+            if record[0] in self._records \
+            or len(self._records) < self._max_records:
+                self._records[record[0]] = record
+            else:
+                self._complete = False
+            must_flush = len(self._dirty) >= self._max_dirty_records
+        if must_flush:
+            self.flush()
+
+    def delete_records(self, pathnames):
+        """Delete the records of the given pathnames, both from memory
+        and from the database.
+
+        @param pathnames:
+                    List of warebox relative pathnames.
+        """
+        with self._lock:
+            for pathname in pathnames:
+                self._records.pop(pathname, None)
+                self._dirty.pop(pathname, None)
+            self._cache.delete_records(pathnames)
+
+    def flush(self):
+        """Write all modified records to the database in a single
+        transaction.
+        """
+        with self._lock:
+            if len(self._dirty) == 0:
+                return
+            self._cache.update_records_bulk(self._dirty.values())
+            self._dirty = {}
+
 
 if __name__ == '__main__':
     wc = WareboxCache('./warebox_cache_temp')
@@ -82,7 +82,9 @@ import bisect
 import Queue
 import logging
 from filerockclient.events_queue import PathnameEvent
+from filerockclient.exceptions import ExecutionInterrupted
 from filerockclient.util.suspendable_thread import SuspendableThread
+from filerockclient.util.pathname_trie import PathnameTrie
 
 
 class WareboxSnapshot(object):
@@ -148,35 +150,53 @@ class WareboxSnapshot(object):
         '''
         Updates the list of pathnames this snapshot contains by
         accessing the Warebox. Any previous content is discarded.
+        The "size" and "lmtime" metadata are updated too, since the
+        Warebox scan collects them together with the pathnames.
         '''
-        pathnames = self._warebox.get_content(blacklisted=True)
+        pathnames = []
         metadata = {}
-        for pathname in pathnames:
-            metadata[pathname] = {'size': None, 'lmtime': None, 'etag': None}
+        for pathname, size, lmtime in self._warebox.scan_content(
+                                                        blacklisted=True):
+            pathnames.append(pathname)
+            metadata[pathname] = {
+                'size': size, 'lmtime': lmtime, 'etag': None}
         self.pathnames = pathnames
         self.metadata = metadata
 
-    def update_etag(self, last_snapshot):
+    def update_etag(self, last_snapshot, interruption=None):
         '''
         Updates the "etag" metadata (an MD5 hash of its content) for all
         pathnames in the snapshot.
+        Etags are taken from last_snapshot if they are up to date,
+        otherwise they are recomputed in parallel with fresh data from
+        the disk.
         If accessing the filesystem fails on a pathname for any reason,
         then that pathname is removed from the snapshot.
+        The etags computed meanwhile are persisted in the Warebox cache
+        at the end, in case it has been loaded into memory.
+        Raises ExecutionInterrupted if "interruption" gets set.
         '''
-        def compute_etag_if_necessary(pathname):
-            '''Gets the etag from last_snapshot if it's up to date,
-            otherwise recompute it with fresh data from the disk.'''
+        to_compute = []
+        for pathname in self.pathnames:
             lmtime = self.metadata[pathname]['lmtime']
             try:
                 last_lmtime = last_snapshot.metadata[pathname]['lmtime']
             except KeyError:
                 last_lmtime = None
             if last_lmtime is None or lmtime != last_lmtime:
-                return self._warebox.compute_md5_hex(pathname)
+                to_compute.append(pathname)
             else:
-                return last_snapshot.metadata[pathname]['etag']
-
-        self._update_metadata('etag', compute_etag_if_necessary)
+                self.metadata[pathname]['etag'] = \
+                    last_snapshot.metadata[pathname]['etag']
+
+        sizes = dict((pathname, self.metadata[pathname]['size'])
+                     for pathname in to_compute)
+        etags, failed = self._warebox.compute_etags(
+            to_compute, sizes, interruption)
+        for pathname, etag in etags.iteritems():
+            self.metadata[pathname]['etag'] = etag
+        self._remove_pathnames(failed)
+        self._warebox.flush_cache_mirror()
 
     def update_lmtime(self):
         '''
@@ -211,7 +231,13 @@ class WareboxSnapshot(object):
                 self.metadata[pathname][what] = value
             except:
                 failed.append(pathname)
-        for pathname in failed:
+        self._remove_pathnames(failed)
+
+    def _remove_pathnames(self, pathnames):
+        '''
+        Removes the given pathnames from the snapshot.
+        '''
+        for pathname in pathnames:
             # TODO: lists are inefficient at deleting
             self.pathnames.remove(pathname)
             del self.metadata[pathname]
@@ -310,11 +336,10 @@ class WareboxSnapshot(object):
         in such a way that no hiearachy inconsistences are induced
         (e.g.: a file is created before its parent folder).
         '''
-        deleted_pathnames = [
+        deleted_pathnames = PathnameTrie(
             pathname for pathname in last_snapshot.pathnames
-            if not pathname in self.metadata]
-        deleted_pathnames.sort(key=lambda x: -len(x))
-        return deleted_pathnames
+            if not pathname in self.metadata)
+        return list(deleted_pathnames.iter_descendants(u'', postorder=True))
 
     def learn_pathname(self, pathname, size, lmtime, etag):
         if not pathname in self.metadata:
@@ -391,8 +416,6 @@ class FileSystemWatcherCrossPlatform(SuspendableThread):
         '''
         snapshot = self._make_empty_snapshot()
         snapshot.update_content()
-        snapshot.update_size()
-        snapshot.update_lmtime()
         return snapshot
 
     def _make_empty_snapshot(self):
@@ -435,8 +458,22 @@ class FileSystemWatcherCrossPlatform(SuspendableThread):
         events are put in self._output_event_queue.
         '''
         snapshot_chunks = snapshot.split_by_size()
+        self._warebox.load_cache_mirror()
+        try:
+            self._handle_snapshot_chunks(snapshot, snapshot_chunks)
+        finally:
+            self._warebox.release_cache_mirror()
+        deleted = snapshot.detect_deletions_from(self._last_snapshot)
+        for pathname in deleted:
+            self._output_event_queue.put(PathnameEvent('DELETE', pathname))
+
+    def _handle_snapshot_chunks(self, snapshot, snapshot_chunks):
+        '''
+        Produces the creation, modification and copy events for each
+        chunk of "snapshot".
+        '''
         for chunk in snapshot_chunks:
-            chunk.update_etag(self._last_snapshot)
+            chunk.update_etag(self._last_snapshot, self._must_die)
             created, modified, copied = \
                 chunk.detect_modifications_from(self._last_snapshot)
             for pathname in created:
@@ -460,9 +497,6 @@ class FileSystemWatcherCrossPlatform(SuspendableThread):
                 self._output_event_queue.put(
                     PathnameEvent(
                         'COPY', dst_pathname, size, lmtime, etag, src_pathname))
-        deleted = snapshot.detect_deletions_from(self._last_snapshot)
-        for pathname in deleted:
-            self._output_event_queue.put(PathnameEvent('DELETE', pathname))
 
     def _wait_for_next_scan(self):
         '''
@@ -517,7 +551,11 @@ class FileSystemWatcherCrossPlatform(SuspendableThread):
             self._check_suspension()
             self._receive_external_snapshot_modifications()
             snapshot = self._make_snapshot()
-            self._handle_snapshot(snapshot)
+            try:
+                self._handle_snapshot(snapshot)
+            except ExecutionInterrupted:
+                # Termination has been requested while hashing
+                break
             self._last_snapshot = snapshot
             #self._logger.debug(u'Scan ended')
             self._wait_for_next_scan()
@@ -0,0 +1,288 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Parallel computation of the etags of warebox pathnames.
+
+Hashing the content of many files one after another uses a single core,
+no matter how many the machine has. hashlib releases the GIL while
+hashing buffers bigger than 2 KB and reading files releases it as well,
+so a pool of threads hashing different files scales on multi-core
+machines. Files are read with large buffers, both to keep the GIL
+released most of the time and to reduce the number of system calls.
+
+Files are handed to the threads from the biggest to the smallest one,
+so that the biggest files start as soon as possible and the threads
+don't end up waiting for a single thread hashing a big file at the
+end of the run.
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+import hashlib
+import logging
+import threading
+import time
+import Queue
+
+from filerockclient.exceptions import ExecutionInterrupted
+from filerockclient.databases.sqlite_driver import close_thread_connections
+
+
+DEFAULT_HASHING_THREADS = 4
+HASHING_BUFFER_SIZE = 1024 * 1024
+
+
+class HashingEngine(object):
+    """
+    Computes the etags of many pathnames with a pool of threads and
+    keeps track of the hashing throughput.
+
+    The etag of each pathname is computed by a callback, which usually
+    is Warebox.compute_md5_hex. The callback is expected to read files
+    through md5(), which is how the engine counts the hashed bytes.
+    """
+
+    def __init__(self, compute_etag, max_threads=DEFAULT_HASHING_THREADS,
+                 buffer_size=HASHING_BUFFER_SIZE):
+        """
+        @param compute_etag:
+                    Thread-safe callable taking a pathname and an
+                    optional "interruption" event, returning the etag
+                    of the pathname.
+        @param max_threads:
+                    Maximum number of pathnames hashed in parallel.
+                    With 1 the pathnames are hashed in the calling
+                    thread.
+        @param buffer_size:
+                    Size in bytes of the reads made by md5().
+        """
+        self.logger = logging.getLogger("FR.%s" % self.__class__.__name__)
+        self._compute_etag = compute_etag
+        self._max_threads = max(1, max_threads)
+        self._buffer_size = buffer_size
+        self._lock = threading.Lock()
+        self._hashed_bytes = 0
+        self._hashing_time = 0.0
+
+    def md5(self, file_, interruption=None):
+        """Compute the binary MD5 hash of the content of a file.
+
+        @param file_:
+                    A file-like object opened for reading.
+        @param interruption:
+                    Optional threading.Event object. When set, hashing
+                    is aborted by raising ExecutionInterrupted.
+        @return
+                    The binary MD5 hash of the file content.
+        """
+        md5 = hashlib.md5()
+        hashed_bytes = 0
+        try:
+            for chunk in iter(lambda: file_.read(self._buffer_size), ''):
+                if interruption is not None and interruption.is_set():
+                    raise ExecutionInterrupted()
+                md5.update(chunk)
+                hashed_bytes += len(chunk)
+        finally:
+            with self._lock:
+                self._hashed_bytes += hashed_bytes
+        return md5.digest()
+
+    def compute_etags(self, pathnames, sizes=None, interruption=None):
+        """Compute the etags of the given pathnames.
+
+        @param pathnames:
+                    List of pathnames.
+        @param sizes:
+                    Optional dictionary mapping pathnames to their size,
+                    used to hash the biggest pathnames first.
+        @param interruption:
+                    Optional threading.Event object. When set, the
+                    computation is aborted by raising
+                    ExecutionInterrupted.
+        @return
+                    A tuple (etags, failed): a dictionary mapping
+                    pathnames to their etag and the list of pathnames
+                    whose etag couldn't be computed.
+        """
+        if sizes is not None:
+            pathnames = sorted(pathnames,
+                               key=lambda pathname: sizes.get(pathname, 0),
+                               reverse=True)
+        with self._lock:
+            hashed_bytes_before = self._hashed_bytes
+        begin = time.time()
+        if self._max_threads == 1 or len(pathnames) < 2:
+            etags, failed = self._serial_compute(pathnames, interruption)
+        else:
+            etags, failed = self._parallel_compute(pathnames, interruption)
+        elapsed = time.time() - begin
+        with self._lock:
+            self._hashing_time += elapsed
+            hashed_bytes = self._hashed_bytes - hashed_bytes_before
+        if hashed_bytes > 0:
+            self.logger.debug(
+                u'Hashed %s bytes of %s pathnames in %.3f seconds (%s)'
+                % (hashed_bytes, len(pathnames), elapsed,
+                   _format_throughput(hashed_bytes, elapsed)))
+        return etags, failed
+
+    def _compute(self, pathname, interruption, etags, failed):
+        try:
+            etags[pathname] = self._compute_etag(pathname, interruption)
+        except ExecutionInterrupted:
+            raise
+        except Exception as e:
+            self.logger.debug(
+                u'Could not compute the etag of %r: %r' % (pathname, e))
+            failed.append(pathname)
+
+    def _serial_compute(self, pathnames, interruption):
+        etags = {}
+        failed = []
+        for pathname in pathnames:
+            _check_interruption(interruption)
+            self._compute(pathname, interruption, etags, failed)
+        return etags, failed
+
+    def _parallel_compute(self, pathnames, interruption):
+        etags = {}
+        failed = []
+        errors = []
+        stop = threading.Event()
+        to_hash = Queue.Queue()
+        for pathname in pathnames:
+            to_hash.put(pathname)
+
+        def hash_pathnames():
+            try:
+                while not stop.is_set():
+                    if interruption is not None and interruption.is_set():
+                        return
+                    try:
+                        pathname = to_hash.get_nowait()
+                    except Queue.Empty:
+                        return
+                    self._compute(pathname, interruption, etags, failed)
+            except ExecutionInterrupted:
+                pass
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                # The etag callback may have used the warebox cache
+                close_thread_connections()
+
+        threads = []
+        for i in xrange(min(self._max_threads, len(pathnames))):
+            thread = threading.Thread(
+                target=hash_pathnames, name='HashingEngine-%s' % i)
+            thread.daemon = True
+            threads.append(thread)
+            thread.start()
+        try:
+            for thread in threads:
+                # Thread.join() without timeout can't be interrupted
+                while thread.is_alive():
+                    thread.join(0.5)
+        finally:
+            stop.set()
+
+        _check_interruption(interruption)
+        if len(errors) > 0:
+            raise errors[0]
+        return etags, failed
+
+    def get_stats(self):
+        """
+        @return
+                    Dictionary with the total number of hashed bytes,
+                    the total time spent computing etags in seconds and
+                    the resulting throughput in bytes per second.
+        """
+        with self._lock:
+            hashed_bytes = self._hashed_bytes
+            hashing_time = self._hashing_time
+        throughput = hashed_bytes / hashing_time if hashing_time > 0 else 0.0
+        return {
+            'hashed_bytes': hashed_bytes,
+            'hashing_time': hashing_time,
+            'throughput': throughput
+        }
+
+
+def _check_interruption(interruption):
+    if interruption is not None and interruption.is_set():
+        raise ExecutionInterrupted()
+
+
+def _format_throughput(hashed_bytes, elapsed):
+    if elapsed <= 0:
+        return u'n/a'
+    return u'%.1f MB/s' % (hashed_bytes / elapsed / (1024 * 1024))
+
+
+if __name__ == '__main__':
+    import os
+    import sys
+    import binascii
+
+    def compute_etag(pathname, interruption=None):
+        with open(pathname, 'rb') as file_:
+            return binascii.hexlify(engine.md5(file_, interruption))
+
+    def hashing_test(root_path, max_threads, buffer_size):
+        ''' Hash every file under root_path '''
+        global engine
+        engine = HashingEngine(compute_etag, max_threads, buffer_size)
+        pathnames = []
+        sizes = {}
+        for curr_folder, _, files in os.walk(root_path):
+            for name in files:
+                pathname = os.path.join(curr_folder, name)
+                pathnames.append(pathname)
+                sizes[pathname] = os.path.getsize(pathname)
+        begin = time.time()
+        etags, failed = engine.compute_etags(pathnames, sizes)
+        end = time.time()
+        stats = engine.get_stats()
+        print "HashingEngine (%s threads, %s KB reads): %s pathnames, %s MB/s" \
+            % (max_threads, buffer_size / 1024, len(etags),
+               stats['throughput'] / (1024 * 1024))
+        print "> %s seconds elapsed" % (end - begin)
+
+    root_path = os.path.abspath(sys.argv[1])
+    hashing_test(root_path, 1, 8192)
+    hashing_test(root_path, 1, HASHING_BUFFER_SIZE)
+    hashing_test(root_path, DEFAULT_HASHING_THREADS, HASHING_BUFFER_SIZE)
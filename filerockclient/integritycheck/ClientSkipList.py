@@ -69,22 +69,30 @@ class ClientSkipList(AbstractSkipList):
         self._normalize(root_node)
         self.logger.debug(u'SkipList successfully initialized and normalized.')
 
+    def addSubtree(self, root_node):
+        '''Adjusts the SkipList for a subtree of SkipListNodes that has
+        just been linked to the tree, e.g. by merging a further proof
+        path.
+        '''
+        self._normalize(root_node)
+
     def _normalize(self, root):
-        '''This method recursively navigate a SkipListNode tree and
-        adjusts the SkipList accordingly.
+        '''This method navigates a SkipListNode tree and adjusts the
+        SkipList accordingly.
 
         This method guarantees not only the presence of the node in its
         correct position in SkipList data structures, but also that it
         has correct label directly from dataset.
         '''
-        if root is None:
-            return
-        if not root.pathname in self.pathnames:
-            self.pathnames.append(root.pathname)
-        #self._resetNodeData(root)
-        if root.height == 0:
-            self.leaves[root.pathname] = root
-        if root.isPlateau():
-            self.plateaus[root.pathname] = root
-        self._normalize(root.lower_child)
-        self._normalize(root.right_child)
+        to_visit = [root]
+        while len(to_visit) > 0:
+            node = to_visit.pop()
+            if node is None:
+                continue
+            self.pathnames.add(node.pathname)
+            if node.height == 0:
+                self.leaves[node.pathname] = node
+            if node.isPlateau():
+                self.plateaus[node.pathname] = node
+            to_visit.append(node.right_child)
+            to_visit.append(node.lower_child)
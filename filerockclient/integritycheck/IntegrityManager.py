@@ -109,6 +109,32 @@ class IntegrityManager(object):
                 "Basis mismatch between trusted-basis and proof-basis!",
                 proof, pathname, operation_basis)
 
+    def verifyOperation(self, verb, pathname, proof, filehash=None):
+        '''Checks the correctness of the described operation and the
+        integrity of the related information, as addOperation() does,
+        without adding it to the operation register.
+
+        Operations verified against the same trusted basis share the
+        hashing of the common part of their proofs, so it's convenient
+        to verify them sorted by pathname.
+
+        @verb: describes the operation
+        @pathname: the target pathname of the operation
+        @filehash: None by default, it's used in insertions and updatings.
+        @proof: the Proof recieved by the server.
+
+        raise: the same exceptions of addOperation().
+        '''
+        self._checkUnicodePathname(pathname)
+        proof.operation = verb
+        proof.pathname = pathname
+        operation_basis = self.proofmanager.verifyOperation(
+            proof, self.trusted_basis, filehash)
+        if operation_basis != self.trusted_basis:
+            raise WrongBasisFromProofException(
+                "Basis mismatch between trusted-basis and proof-basis!",
+                proof, pathname, operation_basis)
+
     def clear(self):
         self.proofmanager.flushOperationList()
         self.trusted_basis = None
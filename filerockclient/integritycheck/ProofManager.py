@@ -41,6 +41,7 @@ import logging
 from copy import deepcopy
 
 from filerockclient.integritycheck.ClientSkipList import ClientSkipList
+from filerockclient.integritycheck.ProofVerifier import ProofVerifier
 from FileRockSharedLibraries.IntegrityCheck.SkipListNode import (SkipListNode,
                                                                  ProxyNode)
 
@@ -51,6 +52,9 @@ UPDATE = 'UPDATE'
 POSITIVE_INFINITE = u'+INF'
 NEGATIVE_INFINITE = u'-INF'
 
+# The tree of verified proofs is dropped when it grows bigger than this
+MAX_VERIFIED_NODES = 100000
+
 
 class MalformedProofException(Exception):
     pass
@@ -72,6 +76,8 @@ class ProofManager():
         self.operations = []
         self.verbose = verbose
         self.logger = logging.getLogger("FR." + self.__class__.__name__)
+        self._commit_skiplist = _CommitSkipList()
+        self._verifier = None
         self.logger.debug(u"ProofManager initialized.")
 
     def addOperation(self, proof, filehash=None):
@@ -81,6 +87,47 @@ class ProofManager():
         @proof: a Proof object for the operation.
         @filehash: hash of the file, needed for deletion, insertions and
         updates. It may be None.
+        raise: MalformedProofException.
+        '''
+        self._checkProof(proof, filehash)
+        self.logger.debug(u"Appending operation %s on %s, filehash=%s"
+                          % (proof.operation, proof.pathname, filehash))
+        self.operations.append((proof, filehash))
+        if proof.operation != VERIFY:
+            self._addToCommitSkipList(proof, filehash)
+        return self._getProofBasis(proof)
+
+    def verifyOperation(self, proof, trusted_basis, filehash=None):
+        '''Checks a proof as addOperation() does, without adding the
+        operation to the register, and returns its basis.
+
+        The proofs checked against the same trusted basis are merged
+        into a partial skiplist (see ProofVerifier), so each proof is
+        hashed only up to the nodes it shares with the previous ones.
+        The basis of the proof on its own is computed only when it
+        doesn't match, so to return the actual wrong basis.
+
+        @proof: a Proof object for the operation.
+        @trusted_basis: the basis the proof is expected to lead to.
+        @filehash: hash of the file, as for addOperation(). It may be
+        None.
+        raise: MalformedProofException.
+        '''
+        self._checkProof(proof, filehash)
+        if self._verifier is None \
+        or self._verifier.trusted_basis != trusted_basis \
+        or len(self._verifier) > MAX_VERIFIED_NODES:
+            self._verifier = ProofVerifier(trusted_basis)
+        if self._verifier.verify(proof):
+            return trusted_basis
+        self.logger.debug(u"Proof of %s doesn't match the verified ones,"
+                          " computing its basis" % proof.pathname)
+        return self._getProofBasis(proof)
+
+    def _checkProof(self, proof, filehash):
+        '''Translates the operation of a proof to the integrity check
+        terms and checks that the proof is well formed for it.
+
         raise: MalformedProofException.
         '''
         client_operation = proof.operation
@@ -154,15 +201,11 @@ class ProofManager():
                     raise MalformedProofException(
                         "VERIFY2 proof whose single path has right contributes.")
 
-        self.logger.debug(u"Appending operation %s on %s, filehash=%s"
-                          % (proof.operation, proof.pathname, filehash))
-        self.operations.append((proof, filehash))
-        return self._getProofBasis(proof)
-
     def abortOperation(self, proof, filehash):
         '''Removes a couple <proof, filehash> from the operation register.
         '''
         self.operations.remove((proof, filehash))
+        self._commit_skiplist = None
 
     def getPendingOperations(self):
         '''Returns a list of the non-verify operations appended to the
@@ -181,14 +224,37 @@ class ProofManager():
         ops = self.getPendingOperations()
         if len(ops) <= 0:
             return None
+        if self._commit_skiplist is None:
+            self.logger.debug(u"Rebuilding the commit skiplist.")
+            self._commit_skiplist = _CommitSkipList()
+            for proof, filehash in ops:
+                self._commit_skiplist.addOperation(deepcopy(proof), filehash)
         self.logger.debug(u"Recomputing basis.")
-        skiplist = ProofManager._buildCommitSkipList(deepcopy(ops))
-        return skiplist.getBasis()
+        return self._commit_skiplist.getBasis()
 
     def flushOperationList(self):
         '''Empties the operations list.
         '''
         self.operations = []
+        self._commit_skiplist = _CommitSkipList()
+
+    def _addToCommitSkipList(self, proof, filehash):
+        '''Merges an operation into the commit skiplist, if it can
+        still be updated incrementally.
+
+        Otherwise the commit skiplist is dropped and it will be rebuilt
+        from the whole operation list by the next getBasis(), which
+        also raises any error found while merging the proof.
+        '''
+        if self._commit_skiplist is None:
+            return
+        if not self._commit_skiplist.isMergeable():
+            self._commit_skiplist = None
+            return
+        try:
+            self._commit_skiplist.addOperation(deepcopy(proof), filehash)
+        except Exception:
+            self._commit_skiplist = None
 
     def _getProofBasis(self, proof):
         '''Computes and returns basis for a single operation proof, that
@@ -211,16 +277,6 @@ class ProofManager():
             if op[0].operation == UPDATE:
                 skipList.updateSkipListOnUpdate(op[0].pathname, op[1])
 
-    @staticmethod
-    def _buildCommitSkipList(operations):
-        '''Given a list of operations, builds & returns a skiplist with
-        operations applied.
-        '''
-        proofs = [op[0] for op in operations]
-        skipList = ProofManager._buildSkipList(proofs)
-        ProofManager._applyOperations(skipList, operations)
-        return skipList
-
     @staticmethod
     def _buildSkipList(proofs):
         '''Given a list of operations, this method builds and returns a
@@ -263,7 +319,7 @@ class ProofManager():
         # First path is chosen for proxy set initialization
         proxies = ProofManager._getProxiesInPath(first_leave)
         root = ProofManager._getPathRoot(first_leave)
-        unproxieds = []
+        unproxieds = set()
 
         # Step 2: merging the other paths to the tree.
         for starting_node in starting_ordered_leaves:
@@ -329,15 +385,19 @@ class ProofManager():
                     the proxy map in the form (proxy_child.pathname,
                     proxy_child.height) -> father_node
         @unproxieds:
-                    list of coordinates (pathname, height) of nodes that
+                    set of coordinates (pathname, height) of nodes that
                     must NOT be replaced by proxies.
+        @return
+                    the node of the path that has replaced a proxy in
+                    the tree, None if no attaching happened.
         '''
         node = starting_node
         while isinstance(node, SkipListNode):
             break_order = ProofManager._attachNodeToTree(node, proxies, unproxieds)
-            node = node.father
             if break_order:
-                break
+                return node
+            node = node.father
+        return None
 
     @staticmethod
     def _attachNodeToTree(node, proxies, unproxieds):
@@ -350,7 +410,7 @@ class ProofManager():
                     the proxy map in the form (proxy_child.pathname,
                     proxy_child.height) -> father_node
         @unproxieds:
-                    list of coordinates (pathname, height) of nodes that
+                    set of coordinates (pathname, height) of nodes that
                     must NOT be replaced by proxies.
         @return
                     True if any attaching happened.
@@ -379,7 +439,7 @@ class ProofManager():
                 newfather.right_child = node
             node.father = newfather
             del proxies[(node.pathname, node.height)]
-            unproxieds.append((node.pathname, node.height))
+            unproxieds.add((node.pathname, node.height))
             break_needed = True
 
         return break_needed
@@ -393,3 +453,83 @@ class ProofManager():
         self.logger.debug(u"-> %s  RELATIVES[%s][%s][%s]" % nodes)
         self._navigateTree(root.lower_child)
         self._navigateTree(root.right_child)
+
+
+class _CommitSkipList(object):
+    '''The skiplist obtained by merging the proofs of the pending
+    operations and applying such operations, whose root label is the
+    basis expected after the commit.
+
+    It is built incrementally: the proofpaths of each operation are
+    merged into the tree as soon as the operation is added, and the
+    operation itself is applied on the next call to getBasis(). Node
+    labels are kept between calls, so only the ancestors of the touched
+    nodes get recomputed.
+
+    Proofs describe the skiplist before any operation has been applied,
+    so no further operation can be merged after the first getBasis()
+    that applied something: see isMergeable().
+    '''
+
+    def __init__(self):
+        self.skiplist = None
+        # Pathnames whose leaf is a SkipListNode of the tree, either as
+        # the beginning of a merged path or along it
+        self._leaf_pathnames = set()
+        self._proxies = {}
+        self._unproxieds = set()
+        self._unapplied_operations = []
+        self._applied = False
+
+    def isMergeable(self):
+        '''Returns True if further operations can be added.
+        '''
+        return not self._applied
+
+    def addOperation(self, proof, filehash):
+        '''Merges the proofpaths of an operation into the tree.
+
+        The proof becomes part of the tree, so it must not be used by
+        the caller anymore.
+        '''
+        assert self.isMergeable()
+        starting_leaves = ProofManager._getStartingLeaves([proof])
+        for leaf in ProofManager._getStartingOrderedLeaves(starting_leaves):
+            if leaf.pathname in self._leaf_pathnames:
+                continue
+            self._mergePath(leaf)
+        self._unapplied_operations.append((proof, filehash))
+
+    def _mergePath(self, leaf):
+        '''Links to the tree the path beginning from the given leaf.
+
+        The leaf must not be in the tree yet: otherwise the path would
+        be walked up to the root without ever meeting a proxy, and the
+        proxies of its discarded nodes would replace those of the tree.
+        '''
+        if self.skiplist is None:
+            self._proxies = ProofManager._getProxiesInPath(leaf)
+            self.skiplist = ClientSkipList(ProofManager._getPathRoot(leaf))
+        else:
+            attached = ProofManager._mergePathInTree(
+                leaf, self._proxies, self._unproxieds)
+            if attached is None:
+                return
+            self.skiplist.addSubtree(attached)
+        node = leaf
+        while isinstance(node, SkipListNode) and node.height == 0:
+            self._leaf_pathnames.add(node.pathname)
+            node = node.father
+
+    def getBasis(self):
+        '''Applies the operations added since the last call and
+        returns the basis of the resulting skiplist.
+
+        raise: UnexpectedBasisException
+        '''
+        if len(self._unapplied_operations) > 0:
+            self._applied = True
+            operations = self._unapplied_operations
+            self._unapplied_operations = []
+            ProofManager._applyOperations(self.skiplist, operations)
+        return self.skiplist.getBasis()
@@ -0,0 +1,161 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+"""
+This is the ProofVerifier module.
+
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+import logging
+
+from FileRockSharedLibraries.IntegrityCheck.SkipListNode import (SkipListNode,
+                                                                 ProxyNode)
+
+
+class ProofVerifier(object):
+    '''ProofVerifier checks many proofs against the same trusted basis,
+    merging them into a single partial skiplist.
+
+    The tree only holds nodes whose label is known to be right: those
+    of the first proof, whose root label matches the trusted basis, and
+    then those of each proof that matches the tree where it meets it.
+    Since a label is the hash of its children ones, a proofpath needs
+    to be hashed only up to the first node it shares with the tree.
+    The rest of the path is just compared with the tree, so a proof is
+    accepted if and only if it would lead to the trusted basis on its
+    own. Proofs of near pathnames share most of their nodes, so
+    checking them in a row costs little more than checking one.
+    '''
+
+    def __init__(self, trusted_basis):
+        self.trusted_basis = trusted_basis
+        # (pathname, height) -> node of the tree, proxies included
+        self._nodes = {}
+        self.logger = logging.getLogger("FR." + self.__class__.__name__)
+
+    def __len__(self):
+        '''Returns the number of nodes in the tree.
+        '''
+        return len(self._nodes)
+
+    def verify(self, proof):
+        '''Checks that the proofpaths of a proof lead to the trusted
+        basis.
+
+        A valid proof is merged into the tree, so its nodes must not be
+        used by the caller anymore. An invalid one is left untouched,
+        apart from the labels of its nodes.
+
+        @proof: a Proof object, already checked for correctness.
+        @return True if the proof is valid.
+        '''
+        leaves = [leaf for leaf in proof.getStartingNodes() if leaf is not None]
+        for leaf in leaves:
+            node, known = self._findMeetingNode(leaf)
+            if known is None:
+                expected_label = self.trusted_basis
+            else:
+                expected_label = known.label
+            if node.computeLabel(forced=True) != expected_label:
+                return False
+            if known is not None and not self._matchesTree(node):
+                return False
+        for leaf in leaves:
+            self._merge(leaf)
+        return True
+
+    def _findMeetingNode(self, leaf):
+        '''Walks the path from the given leaf up to the first node whose
+        position is already in the tree.
+
+        @return a couple (path_node, tree_node), where tree_node is None
+        if the path doesn't meet the tree and path_node is its root.
+        '''
+        node = leaf
+        while True:
+            known = self._nodes.get((node.pathname, node.height))
+            if known is not None or node.father is None:
+                return node, known
+            node = node.father
+
+    def _matchesTree(self, node):
+        '''Checks that the part of a path above the given node, which
+        isn't hashed, has the same nodes of the tree and siblings with
+        the same labels.
+        '''
+        while node.father is not None:
+            father = node.father
+            if not (father.pathname, father.height) in self._nodes:
+                return False
+            sibling = father.getSibling(node)
+            if isinstance(sibling, SkipListNode):
+                known = self._nodes.get((sibling.pathname, sibling.height))
+                if known is None or known.label != sibling.label:
+                    return False
+            node = father
+        return True
+
+    def _merge(self, leaf):
+        '''Links to the tree the verified path beginning from the given
+        leaf.
+        '''
+        node, known = self._findMeetingNode(leaf)
+        if known is None:
+            if len(self._nodes) == 0:
+                self._register(node)
+            return
+        if not isinstance(known, ProxyNode):
+            # The leaf itself is already in the tree
+            return
+        father = known.father
+        if father.lower_child is known:
+            father.lower_child = node
+        else:
+            father.right_child = node
+        node.father = father
+        self._register(node)
+
+    def _register(self, root):
+        '''Adds to the node map the given node and its subtree.
+        '''
+        to_visit = [root]
+        while len(to_visit) > 0:
+            node = to_visit.pop()
+            if not isinstance(node, SkipListNode):
+                continue
+            self._nodes[(node.pathname, node.height)] = node
+            to_visit.append(node.lower_child)
+            to_visit.append(node.right_child)
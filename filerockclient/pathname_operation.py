@@ -85,6 +85,7 @@ class PathnameOperation(object):
         self.to_decrypt = False
         self.encrypted_pathname = None
         self.encrypted_fd = None
+        self.stream_encryption = False
         self.temp_pathname = None
         self.temp_fd = None
         self.extras = {}
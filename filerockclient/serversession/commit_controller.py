@@ -0,0 +1,368 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+"""
+This is the commit_controller module.
+
+Decides when ServerSession has to commit the current transaction.
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+import time
+import logging
+import threading
+
+
+# Estimates used until the first commits have been observed
+DEFAULT_FIXED_COST = 1.0
+DEFAULT_TRANSFER_RATE = 1024 * 1024
+
+# Weight of the last observation in the moving averages
+EWMA_WEIGHT = 0.3
+
+# Transactions uploading less than this don't tell the transfer rate
+MIN_RATE_SAMPLE_BYTES = 1024 * 1024
+
+# Bounds to the target overhead, the lower one is the smallest that the
+# commit_overhead_percent option can express
+MIN_TARGET_OVERHEAD = 0.01
+MAX_TARGET_OVERHEAD = 1.0
+
+
+class CommitController(object):
+    """
+    Chooses the commit points so that the cost of committing doesn't
+    eat the throughput.
+
+    Each commit takes a fixed time (the round trip to the server, the
+    server-side work, our database transactions) plus a time that grows
+    with the number of operations, mostly spent verifying their proofs.
+    Only the fixed part is saved by committing more operations
+    together, so the controller lets the transaction grow until its
+    fixed cost is paid back, that is, until the transaction is at least
+    as old as:
+
+        fixed cost / target overhead
+
+    Both costs are measured on the last commits and averaged; the proof
+    verification time is what separates the fixed cost from the
+    observed commit latency.
+    Whatever the estimates, the transaction is committed when it goes
+    beyond any of the configured upper bounds, or when no operations
+    have been received for a while. The bound on bytes is lowered to
+    what can be transferred in the maximum transaction age at the
+    observed transfer rate, so that on slow links big files don't keep
+    the transaction open for too long.
+
+    With the adaptive policy disabled the fixed thresholds on operations
+    and bytes are used instead.
+
+    Decisions are logged and counted by reason, see get_stats().
+    """
+
+    def __init__(self, idle_seconds, max_operations, max_bytes, max_seconds,
+                 target_overhead, adaptive=True,
+                 threshold_operations=None, threshold_bytes=None):
+        """
+        @param idle_seconds:
+                    Commit when no operations have been received for
+                    this number of seconds.
+        @param max_operations:
+                    Upper bound to the number of operations in
+                    transaction.
+        @param max_bytes:
+                    Upper bound to the bytes to upload in transaction.
+        @param max_seconds:
+                    Upper bound to the age of the transaction, in
+                    seconds.
+        @param target_overhead:
+                    Fraction of the work time that the fixed cost of a
+                    commit is allowed to take, in (0, 1].
+        @param adaptive:
+                    Boolean telling whether the adaptive policy is
+                    active. If it isn't, the following thresholds are
+                    used instead of the bounds.
+        @param threshold_operations:
+                    Commit when the transaction has this number of
+                    operations.
+        @param threshold_bytes:
+                    Commit when the transaction has more than this
+                    number of bytes to upload.
+        """
+        self.logger = logging.getLogger("FR.%s" % self.__class__.__name__)
+        self._idle_seconds = idle_seconds
+        self._max_operations = max_operations
+        self._max_bytes = max_bytes
+        self._max_seconds = max_seconds
+        self._target_overhead = target_overhead
+        self._adaptive = adaptive
+        self._threshold_operations = threshold_operations
+        self._threshold_bytes = threshold_bytes
+        self._lock = threading.Lock()
+        self._fixed_cost = DEFAULT_FIXED_COST
+        self._verification_cost = 0.0
+        self._transfer_rate = float(DEFAULT_TRANSFER_RATE)
+        self._transaction_begin = None
+        self._commit_begin = None
+        self._commit_operations = 0
+        self._verification_time = 0.0
+        self._commits = 0
+        self._decisions = {}
+        self._last_decision = None
+
+    def should_commit(self, operations, data_size, idle_time, now=None):
+        """Tell whether the current transaction has to be committed.
+
+        @param operations:
+                    Number of operations in transaction.
+        @param data_size:
+                    Bytes to upload in transaction.
+        @param idle_time:
+                    Seconds since the last received operation.
+        @param now:
+                    Current time as returned by time.time(), for
+                    testing purposes.
+        @return
+                    A string with the reason for committing, None if
+                    it isn't time to commit.
+        """
+        if now is None:
+            now = time.time()
+        with self._lock:
+            if operations == 0:
+                self._transaction_begin = None
+                return None
+            if self._transaction_begin is None:
+                self._transaction_begin = now
+            age = now - self._transaction_begin
+            reason = self._decide(operations, data_size, idle_time, age)
+            if reason is None:
+                return None
+            self._decisions[reason] = self._decisions.get(reason, 0) + 1
+            self._last_decision = {
+                'reason': reason,
+                'operations': operations,
+                'data_size': data_size,
+                'age': age,
+                'payback_time': self._payback_time(),
+                'max_bytes': self._max_bytes_now()
+            }
+        self.logger.info(
+            u"Time to commit (%s): %s operations, %s bytes, transaction"
+            " age %.1fs, fixed commit cost %.2fs"
+            % (reason, operations, data_size, age, self._fixed_cost))
+        return reason
+
+    def _decide(self, operations, data_size, idle_time, age):
+        if idle_time > self._idle_seconds:
+            return 'idle'
+        if not self._adaptive:
+            if operations >= self._threshold_operations:
+                return 'operations'
+            if data_size > self._threshold_bytes:
+                return 'bytes'
+            return None
+        if operations >= self._max_operations:
+            return 'max_operations'
+        if data_size >= self._max_bytes_now():
+            return 'max_bytes'
+        if age >= self._max_seconds:
+            return 'max_age'
+        if age >= self._payback_time():
+            return 'amortized'
+        return None
+
+    def _payback_time(self):
+        return self._fixed_cost / self._target_overhead
+
+    def _max_bytes_now(self):
+        return min(self._max_bytes, self._transfer_rate * self._max_seconds)
+
+    def on_commit_started(self, operations, data_size, now=None):
+        """The transaction is finished and its commit begins.
+
+        @param operations:
+                    Number of committed operations.
+        @param data_size:
+                    Number of uploaded bytes.
+        @param now:
+                    Current time as returned by time.time(), for
+                    testing purposes.
+        """
+        if now is None:
+            now = time.time()
+        with self._lock:
+            self._commit_begin = now
+            self._commit_operations = operations
+            self._verification_time = 0.0
+            idle = self._last_decision is not None \
+                and self._last_decision['reason'] == 'idle'
+            # An idle or small transaction says nothing about the
+            # transfer rate
+            if data_size >= MIN_RATE_SAMPLE_BYTES and not idle \
+            and self._transaction_begin is not None \
+            and now > self._transaction_begin:
+                rate = data_size / (now - self._transaction_begin)
+                self._transfer_rate = _ewma(self._transfer_rate, rate)
+
+    def on_proofs_verified(self, elapsed):
+        """
+        @param elapsed:
+                    Seconds spent verifying the proofs of the
+                    transaction being committed.
+        """
+        with self._lock:
+            self._verification_time += elapsed
+
+    def on_commit_done(self, now=None):
+        """The server has completed the commit.
+
+        @param now:
+                    Current time as returned by time.time(), for
+                    testing purposes.
+        """
+        if now is None:
+            now = time.time()
+        with self._lock:
+            if self._commit_begin is None:
+                return
+            latency = now - self._commit_begin
+            fixed_cost = max(0.0, latency - self._verification_time)
+            self._fixed_cost = _ewma(self._fixed_cost, fixed_cost)
+            if self._commit_operations > 0:
+                self._verification_cost = _ewma(
+                    self._verification_cost,
+                    self._verification_time / self._commit_operations)
+            self._commit_begin = None
+            self._transaction_begin = None
+            self._commits += 1
+        self.logger.debug(
+            u"Commit took %.2fs, %.2fs verifying proofs. Estimated fixed"
+            " commit cost: %.2fs" % (latency, self._verification_time,
+                                     self._fixed_cost))
+
+    def get_stats(self):
+        """
+        @return
+                    Dictionary with the current estimates (fixed commit
+                    cost and proof verification cost per operation in
+                    seconds, transfer rate in bytes per second, the
+                    resulting payback time in seconds and bound on
+                    bytes), the number of
+                    completed commits, the number of decisions by reason
+                    and the details of the last decision.
+        """
+        with self._lock:
+            return {
+                'fixed_cost': self._fixed_cost,
+                'verification_cost': self._verification_cost,
+                'transfer_rate': self._transfer_rate,
+                'payback_time': self._payback_time(),
+                'max_bytes': self._max_bytes_now(),
+                'commits': self._commits,
+                'decisions': dict(self._decisions),
+                'last_decision': dict(self._last_decision)
+                    if self._last_decision is not None else None
+            }
+
+
+def _ewma(average, sample):
+    return (1 - EWMA_WEIGHT) * average + EWMA_WEIGHT * sample
+
+
+
+def clamp_target_overhead(target_overhead):
+    """
+    @param target_overhead:
+                Fraction of the work time that the fixed cost of a
+                commit is allowed to take, as configured.
+    @return
+                The target overhead brought within
+                [MIN_TARGET_OVERHEAD, MAX_TARGET_OVERHEAD]. With zero or
+                less the fixed cost would never be paid back.
+    """
+    return min(MAX_TARGET_OVERHEAD, max(MIN_TARGET_OVERHEAD, target_overhead))
+
+if __name__ == '__main__':
+
+    def simulation_test(name, controller, files_count, file_size,
+                        transfer_rate, fixed_cost, verification_cost):
+        """ Simulated clock: operations are transferred one after the
+        other and the pipeline stops while committing """
+        clock = 0.0
+        transaction = []
+        committed = []
+        commits = 0
+
+        def commit(clock):
+            data_size = sum(size for (size, _) in transaction)
+            controller.on_commit_started(len(transaction), data_size, clock)
+            verification = verification_cost * len(transaction)
+            controller.on_proofs_verified(verification)
+            clock += verification + fixed_cost
+            controller.on_commit_done(clock)
+            committed.extend(clock - done for (_, done) in transaction)
+            del transaction[:]
+            return clock
+
+        for _ in xrange(files_count):
+            clock += 0.005 + float(file_size) / transfer_rate
+            transaction.append((file_size, clock))
+            data_size = sum(size for (size, _) in transaction)
+            if controller.should_commit(len(transaction), data_size, 0.0,
+                                        clock) is not None:
+                clock = commit(clock)
+                commits += 1
+        if len(transaction) > 0:
+            clock = commit(clock)
+            commits += 1
+        print "%s: %s files of %s KB" % (name, files_count, file_size / 1024)
+        print "> %s seconds elapsed, %s commits, %.1f files/second," \
+            " %.1f seconds on average from transfer to commit" \
+            % (clock, commits, files_count / clock,
+               sum(committed) / len(committed))
+
+    for files_count, file_size in [(5000, 10 * 1024),
+                                   (50, 20 * 1024 * 1024)]:
+        simulation_test(
+            'fixed thresholds',
+            CommitController(10, 1000, 524288000, 300, 0.1, adaptive=False,
+                             threshold_operations=10,
+                             threshold_bytes=52428800),
+            files_count, file_size, 2 * 1024 * 1024, 1.0, 0.002)
+        simulation_test(
+            'adaptive',
+            CommitController(10, 1000, 524288000, 300, 0.1),
+            files_count, file_size, 2 * 1024 * 1024, 1.0, 0.002)
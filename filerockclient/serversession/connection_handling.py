@@ -27,8 +27,11 @@
 """
 This is the connection_handling module.
 
-
-
+Messages are framed on the wire as a MESSAGE_LENGTH_DESCRIPTOR_LENGTH
+bytes long, space padded, decimal length followed by the packed message.
+Messages are received into preallocated buffers and sent without
+slicing them, so that big messages (e.g. a SYNC_FILES_LIST with a large
+dataset) cost time linear in their size.
 
 ----
 
@@ -42,6 +45,7 @@ FileRock Client is licensed under GPLv3 License.
 
 import logging
 import threading
+import Queue
 from select import select
 
 from FileRockSharedLibraries.Communication.Messages import POISON_PILL, unpack
@@ -52,6 +56,10 @@ from filerockclient.serversession.commands import Command
 
 class ServerConnectionWriter(threading.Thread):
     MESSAGE_LENGTH_DESCRIPTOR_LENGTH = 32
+    # Messages already queued when the writer gets one (e.g. the
+    # declarations of many operations) are sent together with it by a
+    # single write, up to this many.
+    MAX_BATCH_MESSAGES = 64
 
     def __init__(self, session_queue, output_message_queue, sock):
         threading.Thread.__init__(self, name=self.__class__.__name__)
@@ -65,22 +73,56 @@ class ServerConnectionWriter(threading.Thread):
     def run(self):
         self.started = True
         try:
-            msg = None
+            batch = []
             while not self._termination_requested():
-                if msg == None:
-                    msg = self.output_message_queue.get()
-                if msg == POISON_PILL:
+                if len(batch) == 0:
+                    batch = self._get_batch()
                     continue
                 _, ready, _ = select([], [self.sock], [], 1)
                 if ready:
-                    self._send_message(msg)
-                    msg = None
+                    if len(batch) == 1:
+                        self._send_message(batch[0])
+                    else:
+                        self._send_messages(batch)
+                    batch = []
         except Exception as exception:
             self.logger.warning(
                 u"Detected a connection problem, aborting: %s", exception)
             self._session_queue.put(
                 Command('BROKENCONNECTION'), 'sessioncommand')
 
+    def _get_batch(self):
+        """Wait for a message to send.
+
+        @return
+                    The list of the messages to send, that is, the
+                    awaited one and those queued after it. Empty if a
+                    poison pill has been received.
+        """
+        batch = []
+        msg = self.output_message_queue.get()
+        while msg != POISON_PILL:
+            batch.append(msg)
+            if len(batch) == self.MAX_BATCH_MESSAGES:
+                break
+            try:
+                msg = self.output_message_queue.get_nowait()
+            except Queue.Empty:
+                break
+        return batch
+
+    def _send_messages(self, msgs):
+        """Send several messages with a single write."""
+        data = []
+        for msg in msgs:
+            if msg.name != 'KEEP_ALIVE':
+                self.logger.debug(u"Sending message %r", msg)
+            msg_length, message = msg.pack()
+            data.append(self._pad(
+                str(msg_length), self.MESSAGE_LENGTH_DESCRIPTOR_LENGTH))
+            data.append(message)
+        self._send_all(memoryview(''.join(data)))
+
     def _send_message(self, msg):
         if msg.name != 'KEEP_ALIVE':
             self.logger.debug(u"Sending message %r", msg)
@@ -88,18 +130,15 @@ class ServerConnectionWriter(threading.Thread):
         msg_length, message = msg.pack()
         msg_length_padded = self._pad(
             str(msg_length), self.MESSAGE_LENGTH_DESCRIPTOR_LENGTH)
-        # First send message length
-        totalsent = 0
-        while totalsent < len(msg_length_padded):
-            sent = self.sock.send(msg_length_padded[totalsent:])
-            if sent == 0:
-                raise ConnectionException(
-                    'Unable to write all the bytes to the socket.')
-            totalsent += sent
-        # Then send packed message
+        # First send message length, then the packed message. Slicing a
+        # memoryview doesn't copy the underlying data.
+        self._send_all(msg_length_padded)
+        self._send_all(memoryview(message))
+
+    def _send_all(self, data):
         totalsent = 0
-        while totalsent < len(message):
-            sent = self.sock.send(message[totalsent:])
+        while totalsent < len(data):
+            sent = self.sock.send(data[totalsent:])
             if sent == 0:
                 raise ConnectionException(
                     'Unable to write all the bytes to the socket.')
@@ -131,11 +170,14 @@ class ServerConnectionWriter(threading.Thread):
         self.logger.debug(u"Server Connection Writer terminated.")
 
     def _termination_requested(self):
-        return self.must_die.wait(0.01)
+        return self.must_die.is_set()
 
 
 class ServerConnectionReader(threading.Thread):
     MESSAGE_LENGTH_DESCRIPTOR_LENGTH = 32
+    # Size of the receive buffer reused across messages. Bigger messages
+    # get a buffer of their own.
+    RECEIVE_BUFFER_SIZE = 1024 * 1024
 
     def __init__(self, input_message_queue, input_keepalive_queue, sock):
         threading.Thread.__init__(self, name=self.__class__.__name__)
@@ -145,12 +187,18 @@ class ServerConnectionReader(threading.Thread):
         self.must_die = threading.Event()
         self.started = False
         self.logger = logging.getLogger("FR.%s" % self.__class__.__name__)
+        self._length_buffer = bytearray(self.MESSAGE_LENGTH_DESCRIPTOR_LENGTH)
+        self._buffer = None
 
     def run(self):
         self.started = True
         try:
             while not self._termination_requested():
-                ready, _, _ = select([self.sock], [], [], 1)
+                # Data already decrypted by the SSL layer isn't reported
+                # by select()
+                ready = self._has_pending_data()
+                if not ready:
+                    ready, _, _ = select([self.sock], [], [], 1)
                 if ready:
                     msg = self._receive_message()
                     if msg.name == 'KEEP_ALIVE':
@@ -167,32 +215,53 @@ class ServerConnectionReader(threading.Thread):
             self.input_message_queue.put(
                 Command('BROKENCONNECTION'), 'sessioncommand')
 
+    def _has_pending_data(self):
+        pending = getattr(self.sock, 'pending', None)
+        return pending is not None and pending() > 0
+
     def _receive_message(self):
+        msg = unpack(self._receive_frame())
+        if msg.name != 'KEEP_ALIVE':
+#            self.logger.debug(u"Received message %r", msg)
+            pass
+        return msg
 
+    def _receive_frame(self):
+        """
+        @return
+                    A read-only buffer with the packed message, valid
+                    until the next call.
+        """
         # Reads expected message length, reading
         # MESSAGE_LENGTH_DESCRIPTOR_LENGTH bytes
-        msg_length = ''
-        while len(msg_length) < self.MESSAGE_LENGTH_DESCRIPTOR_LENGTH:
-            chunk = self.sock.recv(
-                self.MESSAGE_LENGTH_DESCRIPTOR_LENGTH - len(msg_length))
-            if len(chunk) == 0:
-                raise ConnectionException("Server has closed the connection.")
-            msg_length += chunk
-        msg_length = msg_length.strip()
-        msg_length = int(msg_length)
+        self._receive_into(memoryview(self._length_buffer))
+        msg_length = int(str(self._length_buffer).strip())
 
         # Reads msg_length bytes
-        msg = ''
-        while len(msg) < msg_length:
-            chunk = self.sock.recv(msg_length - len(msg))
-            if len(chunk) == 0:
+        if msg_length <= self.RECEIVE_BUFFER_SIZE:
+            if self._buffer is None:
+                self._buffer = bytearray(self.RECEIVE_BUFFER_SIZE)
+            buf = self._buffer
+        else:
+            buf = bytearray(msg_length)
+        self._receive_into(memoryview(buf)[:msg_length])
+        return buffer(buf, 0, msg_length)
+
+    def _receive_into(self, view):
+        """Fill the given memoryview with bytes from the socket.
+
+        @param view:
+                    A writable memoryview, whose whole length must be
+                    filled.
+        """
+        received = 0
+        length = len(view)
+        while received < length:
+            chunk_length = self.sock.recv_into(
+                view[received:], length - received)
+            if chunk_length == 0:
                 raise ConnectionException("Server has closed the connection.")
-            msg += chunk
-        msg = unpack(msg)
-        if msg.name != 'KEEP_ALIVE':
-#            self.logger.debug(u"Received message %r", msg)
-            pass
-        return msg
+            received += chunk_length
 
     def terminate(self):
         '''
@@ -205,8 +274,91 @@ class ServerConnectionReader(threading.Thread):
         self.logger.debug(u"Server Connection Reader terminated.")
 
     def _termination_requested(self):
-        return self.must_die.wait(0.01)
+        return self.must_die.is_set()
 
 
 if __name__ == '__main__':
-    pass
+    import socket
+    import time
+    import datetime
+    from FileRockSharedLibraries.Communication.Messages import \
+        SYNC_FILES_LIST
+
+    class _StringReader(ServerConnectionReader):
+        ''' The previous implementation, which concatenated strings '''
+
+        def _receive_frame(self):
+            msg_length = ''
+            while len(msg_length) < self.MESSAGE_LENGTH_DESCRIPTOR_LENGTH:
+                chunk = self.sock.recv(
+                    self.MESSAGE_LENGTH_DESCRIPTOR_LENGTH - len(msg_length))
+                if len(chunk) == 0:
+                    raise ConnectionException("Connection closed.")
+                msg_length += chunk
+            msg_length = int(msg_length.strip())
+            msg = ''
+            while len(msg) < msg_length:
+                chunk = self.sock.recv(msg_length - len(msg))
+                if len(chunk) == 0:
+                    raise ConnectionException("Connection closed.")
+                msg += chunk
+            return msg
+
+    class _PackedMessage(object):
+        ''' Sends an already packed message, to time just the framing '''
+
+        def __init__(self, msg):
+            self.name = msg.name
+            self._packed = msg.pack()
+
+        def pack(self):
+            return self._packed
+
+    def make_message(entries):
+        lmtime = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        dataset = [{'key': u'folder%s/file%s.txt' % (i % 100, i),
+                    'etag': '%032x' % i,
+                    'lmtime': lmtime,
+                    'size': i}
+                   for i in xrange(entries)]
+        return SYNC_FILES_LIST('SYNC_FILES_LIST', {
+            'basis': 'A' * 64, 'dataset': dataset,
+            'last_commit_client_id': 1,
+            'last_commit_client_hostname': 'host',
+            'last_commit_client_platform': 'linux',
+            'last_commit_timestamp': 0, 'user_quota': 0, 'used_space': 0,
+            'status': 'ACTIVE_PAID', 'expires_on': None, 'plan': {}})
+
+    def round_trip_test(reader_class, msg, times, receive):
+        ''' Sends msg "times" times over a socket pair '''
+        out_sock, in_sock = socket.socketpair()
+        writer = ServerConnectionWriter(None, None, out_sock)
+        reader = reader_class(None, None, in_sock)
+        sender = threading.Thread(
+            target=lambda: [writer._send_message(msg) for _ in xrange(times)])
+        begin = time.time()
+        sender.start()
+        for _ in xrange(times):
+            receive(reader)
+        sender.join()
+        end = time.time()
+        out_sock.close()
+        in_sock.close()
+        print "%s: %s x %s" % (reader_class.__name__, times, receive.__doc__.strip())
+        print "> %s seconds elapsed" % (end - begin)
+
+    def framing(reader):
+        ''' framing only '''
+        return reader._receive_frame()
+
+    def round_trip(reader):
+        ''' pack, frame and unpack '''
+        received = reader._receive_message()
+        assert len(received.getParameter('dataset')) == 100000
+
+    msg = make_message(100000)
+    print "Packed message size: %s bytes" % msg.pack()[0]
+    for receive, times in [(framing, 50), (round_trip, 3)]:
+        to_send = _PackedMessage(msg) if receive is framing else msg
+        round_trip_test(_StringReader, to_send, times, receive)
+        round_trip_test(ServerConnectionReader, to_send, times, receive)
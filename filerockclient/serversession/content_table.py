@@ -0,0 +1,310 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Compact, column oriented tables of pathname metadata.
+
+The three-way diff of the startup synchronization keeps an etag, a size
+and a modification time for each pathname of the warebox, of the storage
+cache and of the storage. Keeping them in pathname-keyed dictionaries
+costs several Python objects per pathname and per attribute, which
+sums up to tens of millions of objects on big wareboxes.
+
+Here pathnames are interned once into a PathnameIndex, which assigns
+them consecutive ids, and each ContentTable keeps its attributes in
+columns indexed by id: etags as 16 bytes binary digests in a bytearray,
+numbers in arrays of doubles. Tables sharing the same index can be
+joined on the id, with no hashing at all.
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+import binascii
+import calendar
+import datetime
+from array import array
+
+
+DIGEST_SIZE = 16
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+class PathnameIndex(object):
+    """
+    Assigns consecutive integer ids to pathnames.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._pathnames = []
+
+    def intern(self, pathname):
+        """
+        @return
+                    The id of pathname, a new one if it wasn't known.
+        """
+        pathname_id = self._ids.get(pathname)
+        if pathname_id is None:
+            pathname_id = len(self._pathnames)
+            self._ids[pathname] = pathname_id
+            self._pathnames.append(pathname)
+        return pathname_id
+
+    def get_id(self, pathname):
+        """
+        @return
+                    The id of pathname or None if it isn't known.
+        """
+        return self._ids.get(pathname)
+
+    def get_pathname(self, pathname_id):
+        return self._pathnames[pathname_id]
+
+    def __len__(self):
+        return len(self._pathnames)
+
+
+class ContentTable(object):
+    """
+    A set of pathnames of a PathnameIndex, with some attributes for each
+    of them.
+
+    Attributes are either etags or numbers, and are all mandatory.
+    Etags that are not MD5 hex digests (e.g. None) are supported, but
+    are not stored compactly. Numbers are stored as doubles, so
+    integers are exact up to 2**53.
+    """
+
+    def __init__(self, index, etag_fields=(), number_fields=()):
+        """
+        @param index:
+                    Instance of PathnameIndex.
+        @param etag_fields:
+                    Names of the etag attributes.
+        @param number_fields:
+                    Names of the number attributes.
+        """
+        self.index = index
+        self._present = bytearray()
+        self._length = 0
+        self._etags = dict((field, _EtagColumn()) for field in etag_fields)
+        self._numbers = dict((field, array('d')) for field in number_fields)
+
+    def add(self, pathname, **values):
+        """Add pathname to the table, or update its attributes.
+
+        @param pathname:
+                    Unicode string.
+        @param values:
+                    A value for each attribute of the table.
+        """
+        pathname_id = self.index.intern(pathname)
+        self._grow(pathname_id + 1)
+        for field, column in self._etags.iteritems():
+            column.set(pathname_id, values[field])
+        for field, column in self._numbers.iteritems():
+            column[pathname_id] = values[field]
+        if not self._present[pathname_id]:
+            self._present[pathname_id] = 1
+            self._length += 1
+        return pathname_id
+
+    def _grow(self, size):
+        missing = size - len(self._present)
+        if missing <= 0:
+            return
+        # Grow geometrically, adding one item at a time is too slow
+        missing = max(missing, len(self._present) / 2)
+        self._present.extend(bytearray(missing))
+        for column in self._etags.itervalues():
+            column.extend(missing)
+        for column in self._numbers.itervalues():
+            column.extend(array('d', [0.0]) * missing)
+
+    def has_id(self, pathname_id):
+        return pathname_id < len(self._present) \
+            and self._present[pathname_id] == 1
+
+    def ids(self):
+        """
+        @return
+                    Iterator over the ids of the pathnames in the table,
+                    in increasing order.
+        """
+        present = self._present
+        return (i for i in xrange(len(present)) if present[i])
+
+    def get_etag(self, field, pathname_id):
+        return self._etags[field].get(pathname_id)
+
+    def get_number(self, field, pathname_id):
+        return self._numbers[field][pathname_id]
+
+    def same_etag(self, pathname_id, field, other, other_field):
+        """Tell whether a pathname has the same etag in this and in
+        another table.
+
+        @param pathname_id:
+                    Id of a pathname in both the tables.
+        """
+        return self._etags[field].equals(
+            pathname_id, other._etags[other_field])
+
+    def view(self, field, convert=None):
+        """
+        @param field:
+                    Name of an attribute.
+        @param convert:
+                    Optional callable converting the stored numbers
+                    into the returned values.
+        @return
+                    A read-only, dictionary-like view that maps the
+                    pathnames of the table to the given attribute.
+        """
+        if field in self._etags:
+            return _FieldView(self, self._etags[field].get)
+        numbers = self._numbers[field]
+        if convert is None:
+            return _FieldView(self, numbers.__getitem__)
+        return _FieldView(self, lambda i: convert(numbers[i]))
+
+    def __contains__(self, pathname):
+        pathname_id = self.index.get_id(pathname)
+        return pathname_id is not None and self.has_id(pathname_id)
+
+    def __iter__(self):
+        get_pathname = self.index.get_pathname
+        return (get_pathname(i) for i in self.ids())
+
+    def __len__(self):
+        return self._length
+
+
+class _EtagColumn(object):
+    """Etags, as binary MD5 digests when possible."""
+
+    def __init__(self):
+        self._digests = bytearray()
+        self._irregular = {}
+
+    def extend(self, count):
+        self._digests.extend(bytearray(count * DIGEST_SIZE))
+
+    def set(self, pathname_id, etag):
+        digest = _to_digest(etag)
+        if digest is None:
+            self._irregular[pathname_id] = etag
+        else:
+            self._irregular.pop(pathname_id, None)
+            start = pathname_id * DIGEST_SIZE
+            self._digests[start:start + DIGEST_SIZE] = digest
+
+    def get(self, pathname_id):
+        if pathname_id in self._irregular:
+            return self._irregular[pathname_id]
+        start = pathname_id * DIGEST_SIZE
+        digest = self._digests[start:start + DIGEST_SIZE]
+        return unicode(binascii.hexlify(digest))
+
+    def equals(self, pathname_id, other):
+        if pathname_id in self._irregular or pathname_id in other._irregular:
+            return self.get(pathname_id) == other.get(pathname_id)
+        start = pathname_id * DIGEST_SIZE
+        end = start + DIGEST_SIZE
+        return self._digests[start:end] == other._digests[start:end]
+
+
+def _to_digest(etag):
+    """
+    @return
+                The binary digest for a lowercase MD5 hex digest, None
+                for any other etag.
+    """
+    if not isinstance(etag, basestring) or len(etag) != DIGEST_SIZE * 2:
+        return None
+    try:
+        digest = binascii.unhexlify(etag)
+    except (TypeError, ValueError, UnicodeError):
+        return None
+    if binascii.hexlify(digest) != etag:
+        return None
+    return digest
+
+
+class _FieldView(object):
+
+    def __init__(self, table, getter):
+        self._table = table
+        self._getter = getter
+
+    def __getitem__(self, pathname):
+        pathname_id = self._table.index.get_id(pathname)
+        if pathname_id is None or not self._table.has_id(pathname_id):
+            raise KeyError(pathname)
+        return self._getter(pathname_id)
+
+    def get(self, pathname, default=None):
+        try:
+            return self[pathname]
+        except KeyError:
+            return default
+
+    def __contains__(self, pathname):
+        return pathname in self._table
+
+    def __iter__(self):
+        return iter(self._table)
+
+    def __len__(self):
+        return len(self._table)
+
+    def keys(self):
+        return list(self._table)
+
+
+def datetime_to_seconds(value):
+    """Convert a naive datetime object into a number of seconds.
+
+    Microseconds are lost.
+    """
+    return calendar.timegm(value.timetuple())
+
+
+def seconds_to_datetime(seconds):
+    """Inverse of datetime_to_seconds()."""
+    return _EPOCH + datetime.timedelta(seconds=seconds)
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,140 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Support for receiving the remote filelist in pages.
+
+The remote filelist (the "dataset" parameter of SYNC_FILES_LIST) is a
+list of dictionaries, one for each pathname on the storage. For storages
+with many objects keeping it in memory is expensive, so the server may
+send it in pages; each page is folded into StartupSynchronization as
+soon as it arrives and then thrown away. StorageListHasher computes the
+hash of the whole filelist page by page.
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+import pickle
+import hashlib
+
+
+# Keys of the pickled records. They are the same objects in every record,
+# so the pickle refers to them through the memo after the first record.
+_RECORD_KEYS = (u'etag', u'key', u'size')
+
+
+class StorageListHasher(object):
+    """
+    Computes get_hash(remove_lmtime_from_filelist(filelist)) without
+    ever holding the whole filelist in memory.
+
+    The hash is persisted (see metadata.LASTACCEPTEDSTATEKEY), so it
+    must be exactly the one computed on the whole list: the records are
+    pickled one at a time by a pickler that behaves as if it was
+    pickling the list. Records must be given in the order they appear
+    in the whole filelist.
+    """
+
+    def __init__(self):
+        self._md5 = hashlib.md5()
+        self._pickler = pickle.Pickler(self)
+        self._pickler.memo = _StreamingMemo()
+        self._pickler.write(pickle.MARK + pickle.LIST)
+        # Placeholder for the list, which is memoized before its items
+        self._list = []
+        self._pickler.memoize(self._list)
+
+    def write(self, data):
+        self._md5.update(data)
+
+    def update(self, records):
+        """
+        @param records:
+                    Iterable of dictionaries with at least the 'key',
+                    'etag' and 'size' keys.
+        """
+        etag, key, size = _RECORD_KEYS
+        for entry in records:
+            self._pickler.save({etag: entry['etag'],
+                                key: entry['key'],
+                                size: entry['size']})
+            self._pickler.write(pickle.APPEND)
+        self._pickler.memo.forget_page()
+
+    def hexdigest(self):
+        md5 = self._md5.copy()
+        md5.update(pickle.STOP)
+        return md5.hexdigest()
+
+
+class _StreamingMemo(dict):
+    """
+    Pickler memo that can forget objects without changing the ids
+    assigned to the following ones, which are given by len(memo).
+
+    The objects memoized while pickling a page are forgotten once the
+    page is done, since the records of different pages are decoded from
+    different messages and so don't share objects. The exceptions are
+    the record keys and the strings shorter than two characters, which
+    CPython caches and may hand out to any page: they stay memoized.
+    Forgetting a page costs time proportional to the page size.
+    """
+
+    def __init__(self):
+        dict.__init__(self)
+        self._count = 0
+        self._page = []
+        self._pinned = set(id(key) for key in _RECORD_KEYS)
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self._count += 1
+        self._page.append(key)
+
+    def __len__(self):
+        return self._count
+
+    def forget_page(self):
+        """Forget the objects memoized since the last call."""
+        for key in self._page:
+            if key in self._pinned:
+                continue
+            _, obj = dict.__getitem__(self, key)
+            if isinstance(obj, basestring) and len(obj) < 2:
+                continue
+            dict.__delitem__(self, key)
+        self._page = []
+
+
+if __name__ == '__main__':
+    pass
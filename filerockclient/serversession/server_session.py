@@ -49,8 +49,11 @@ import traceback
 from filerockclient.util.utilities import stoppable_exponential_backoff_waiting
 from filerockclient.workers.worker_pool import WorkerPool
 from filerockclient.databases.transaction_cache import TransactionCache
+from filerockclient.databases.sqlite_driver import close_thread_connections
 from filerockclient.serversession.transaction import Transaction
 from filerockclient.serversession.transaction_manager import TransactionManager
+from filerockclient.serversession.commit_controller import \
+    CommitController, clamp_target_overhead
 from filerockclient.integritycheck.IntegrityManager import IntegrityManager
 from filerockclient.workers.filters.encryption.adapter import Adapter
 from filerockclient.exceptions import UnexpectedMessageException
@@ -211,6 +214,7 @@ class ServerSession(threading.Thread):
         self.commit_threshold_seconds = None
         self.commit_threshold_operations = None
         self.commit_threshold_bytes = None
+        self.commit_controller = None
         self.transaction_cache = None
         self.integrity_manager = None
         self.cryptoAdapter = None
@@ -253,6 +257,21 @@ class ServerSession(threading.Thread):
             'Client', 'commit_threshold_operations')
         self.commit_threshold_bytes = self.cfg.getint(
             'Client', 'commit_threshold_bytes')
+        overhead_percent = self.cfg.getint('Client', 'commit_overhead_percent')
+        target_overhead = clamp_target_overhead(overhead_percent / 100.0)
+        if target_overhead != overhead_percent / 100.0:
+            self.logger.warning(
+                u"Invalid commit_overhead_percent %s, using %.0f instead"
+                % (overhead_percent, target_overhead * 100))
+        self.commit_controller = CommitController(
+            idle_seconds=self.commit_threshold_seconds,
+            max_operations=self.cfg.getint('Client', 'commit_max_operations'),
+            max_bytes=self.cfg.getint('Client', 'commit_max_bytes'),
+            max_seconds=self.cfg.getint('Client', 'commit_max_seconds'),
+            target_overhead=target_overhead,
+            adaptive=self.cfg.getboolean('Client', 'adaptive_commit'),
+            threshold_operations=self.commit_threshold_operations,
+            threshold_bytes=self.commit_threshold_bytes)
 
         temp = self.cfg.get('Application Paths', 'transaction_cache_db')
         self.transaction_cache = TransactionCache(temp)
@@ -322,6 +341,9 @@ class ServerSession(threading.Thread):
             self.release_network_resources()
             raise
 
+        finally:
+            close_thread_connections()
+
     def _main_loop(self):
         """
         The event loop.
@@ -90,10 +90,16 @@ FileRock Client is licensed under GPLv3 License.
 """
 
 import logging
+import bisect
 from datetime import datetime
 
 from filerockclient.events_queue import PathnameEvent
 from filerockclient.exceptions import ExecutionInterrupted
+from filerockclient.serversession.content_table import \
+    PathnameIndex, ContentTable, datetime_to_seconds, seconds_to_datetime
+
+
+REMOTE_LMTIME_FORMAT = '%Y-%m-%dT%H:%M:%S.000Z'
 
 
 class StartupSynchronization(object):
@@ -104,20 +110,46 @@ class StartupSynchronization(object):
     remote storage have been altered by another client while this was
     not connected. Moreover, the warebox could have been altered offline.
     This algorithm finds a merge strategy for all these changes.
+
+    The content of the storage cache, of the warebox and of the storage
+    is kept in ContentTable objects sharing the same PathnameIndex. The
+    pathname-keyed attributes (local_size, remote_etag, etc.) are
+    read-only views on them.
     """
     def __init__(self, warebox, storage_cache, events_queue):
         self.logger = logging.getLogger("FR.%s" % self.__class__.__name__)
         self.warebox = warebox
         self.storage_cache = storage_cache
         self.events_queue = events_queue
-        self.last_session_warebox_etag = {}
-        self.last_session_storage_etag = {}
-        self.local_size = {}
-        self.local_lmtime = {}
-        self.local_etag = {}
-        self.remote_size = {}
-        self.remote_lmtime = {}
-        self.remote_etag = {}
+        self.reset()
+
+    def reset(self):
+        """Forget the result of any previous synchronization, in order
+        to start receiving a new remote filelist.
+        """
+        self._index = PathnameIndex()
+        self.last_session_content = ContentTable(
+            self._index, etag_fields=('warebox_etag', 'storage_etag'))
+        self._last_session_loaded = False
+        self.local_content = ContentTable(
+            self._index, etag_fields=('etag',),
+            number_fields=('size', 'lmtime'))
+        self.remote_content = ContentTable(
+            self._index, etag_fields=('etag',),
+            number_fields=('size', 'lmtime'))
+        self._remote_updates = set()
+
+        last_session = self.last_session_content
+        self.last_session_warebox_etag = last_session.view('warebox_etag')
+        self.last_session_storage_etag = last_session.view('storage_etag')
+        self.local_size = self.local_content.view('size', int)
+        self.local_lmtime = self.local_content.view(
+            'lmtime', seconds_to_datetime)
+        self.local_etag = self.local_content.view('etag')
+        self.remote_size = self.remote_content.view('size', int)
+        self.remote_lmtime = self.remote_content.view(
+            'lmtime', seconds_to_datetime)
+        self.remote_etag = self.remote_content.view('etag')
 
         # TODO: these two are not used outside of this module,
         # maybe they can be removed.
@@ -131,30 +163,58 @@ class StartupSynchronization(object):
         self.ignored_conflicts = set()
         self.deletion_conflicts = set()
 
-    def prepare(self, storage_content, interruption):
+    def add_remote_content(self, storage_content, interruption):
+        """
+        Step 0a: fold a page of the remote filelist into the remote
+        content, detecting the remote updates as they arrive.
+
+        May be called many times, then prepare() must be called.
+
+        @param storage_content:
+                    A page of the remote filelist, as list of
+                    dictionaries (see _add_remote_content()).
+        @param interruption:
+                    An event object telling if someone in the
+                    application has requested this method to interrupt.
+        """
+        self._load_last_session_content(interruption)
+        last_session = self.last_session_content
+        remote = self.remote_content
+        for pathname, pathname_id in self._add_remote_content(
+                                                        storage_content):
+            if not last_session.has_id(pathname_id) \
+            or not remote.same_etag(pathname_id, 'etag',
+                                    last_session, 'storage_etag'):
+                self._remote_updates.add(pathname)
+
+    def prepare(self, interruption):
         """
-        Step 0: detect offline changes made to both the warebox and
+        Step 0b: detect offline changes made to both the warebox and
         the remote storage by performing a 3-way diff between the
         warebox, the storage cache and the storage.
+
+        The whole remote filelist must have been given to
+        add_remote_content().
         """
         # Collect data
-        last_session_content = self._get_last_session_content(interruption)
-        remote_content = self._get_remote_content(storage_content)
-        local_content = self._get_local_content(interruption)
+        self._load_last_session_content(interruption)
+        self._get_local_content(interruption)
 
-        # print "Last session content:\n%s" % last_session_content
-        # print "Local content:\n%s" % local_content
-        # print "Remote content:\n%s" % remote_content
+        # print "Last session content:\n%s" % list(self.last_session_content)
+        # print "Local content:\n%s" % list(self.local_content)
+        # print "Remote content:\n%s" % list(self.remote_content)
 
         # 1) Detect offline changes.
 
-        # Compute: storage - storage_cache
-        self.content_to_download, self.content_to_delete_locally = \
-            self._detect_remote_changes(last_session_content, remote_content)
+        # Compute: storage - storage_cache. Updates have already been
+        # detected while receiving the remote content.
+        self.content_to_download = self._remote_updates
+        self.content_to_delete_locally = self._detect_deletions(
+            self.last_session_content, self.remote_content)
 
         # Compute: warebox - storage_cache
         self.content_to_upload, self.content_to_delete = \
-            self._detect_local_changes(last_session_content, local_content)
+            self._detect_local_changes()
 
         # Save a backup copy of the list of deletions, we'll need it later
         self.remote_deletions = self.content_to_delete_locally.copy()
@@ -289,54 +349,54 @@ class StartupSynchronization(object):
                 conflicted=(pathname in self.edit_conflicts))
             self.events_queue.put(event)
 
-    def _get_last_session_content(self, interruption):
+    def _load_last_session_content(self, interruption):
+        """Load the storage cache content into last_session_content,
+        unless it's already been loaded.
         """
-        @return the storage cache content.
-        """
-        content_ = self.storage_cache.get_all_records()
-        content = set()
-
-        for (pathname, _, _, _, warebox_etag, storage_etag) in content_:
+        if self._last_session_loaded:
+            return
+        content = self.last_session_content
+        for (pathname, _, _, _, warebox_etag, storage_etag) \
+                in self.storage_cache.get_all_records():
             if interruption.is_set():
                 raise ExecutionInterrupted()
-            content.add(pathname)
-            self.last_session_warebox_etag[pathname] = warebox_etag
-            self.last_session_storage_etag[pathname] = storage_etag
-        return content
+            content.add(pathname,
+                        warebox_etag=warebox_etag, storage_etag=storage_etag)
+        self._last_session_loaded = True
 
     def _get_local_content(self, interruption):
-        """
+        """Load the warebox content into local_content.
+
         @param interruption:
                     An event object telling if someone in the
                     application has requested this method to interrupt.
-        @return
-                    The warebox content.
         """
         self.logger.debug('Starting get local content')
-        content = set()
-        pathnames = self.warebox.get_content(blacklisted=True,
-                                             interruption=interruption)
-
-        for pathname in pathnames:
-            if interruption.is_set():
-                raise ExecutionInterrupted()
-            try:
-                lmtime = self.warebox.get_last_modification_time(pathname)
-                size = self.warebox.get_size(pathname)
-                etag = self.warebox.compute_md5_hex(pathname)
-            except Exception as exception:
-                self.logger.warning(
-                    u'Failed reading disk metadata for pathname %r.'
-                    ' Skipped. Reason: %s' % (pathname, exception))
+        content = self.local_content
+        entries = self.warebox.scan_content(blacklisted=True,
+                                            interruption=interruption)
+
+        sizes = dict((pathname, size) for pathname, size, _ in entries)
+        self.warebox.load_cache_mirror()
+        try:
+            etags, failed = self.warebox.compute_etags(
+                [pathname for pathname, _, _ in entries], sizes, interruption)
+        finally:
+            self.warebox.release_cache_mirror()
+        del sizes
+
+        for pathname in failed:
+            self.logger.warning(
+                u'Failed reading disk metadata for pathname %r.'
+                ' Skipped.' % pathname)
+        for pathname, size, lmtime in entries:
+            if pathname not in etags:
                 continue
-            content.add(pathname)
-            self.local_size[pathname] = size
-            self.local_lmtime[pathname] = lmtime
-            self.local_etag[pathname] = etag
+            content.add(pathname, etag=etags[pathname], size=size,
+                        lmtime=datetime_to_seconds(lmtime))
         self.logger.debug('Local content acquired')
-        return content
 
-    def _get_remote_content(self, storage_content):
+    def _add_remote_content(self, storage_content):
         """
         @param storage_content:
                 list of dictionaries with the following format:
@@ -349,64 +409,71 @@ class StartupSynchronization(object):
                     },
                     ...
                 ]
-        @return the content of the storage as in "storage_content".
+        @return the list of (pathname, pathname id) pairs in
+                "storage_content".
         """
-        content = set()
+        added = []
+        content = self.remote_content
         for record in storage_content:
             pathname = record['key']
-            etag = record['etag']
-            lmtime = datetime.strptime(record['lmtime'],
-                                       '%Y-%m-%dT%H:%M:%S.000Z')
-            size = int(record['size'])
-            self.remote_lmtime[pathname] = lmtime
-            self.remote_size[pathname] = size
-            self.remote_etag[pathname] = etag
-            content.add(pathname)
-        return content
-
-    def _detect_local_changes(self, last_session_content, local_content):
-        """Detect the offline changes made to the warebox.
-        """
-        return self._detect_changes(last_session_content,
-                                    local_content,
-                                    self.local_etag,
-                                    self.last_session_warebox_etag)
+            pathname_id = content.add(
+                pathname, etag=record['etag'], size=int(record['size']),
+                lmtime=_parse_remote_lmtime(record['lmtime']))
+            added.append((pathname, pathname_id))
+        return added
 
-    def _detect_remote_changes(self, last_session_content, remote_content):
-        """Detect the offline changes made to the storage.
+    def _detect_local_changes(self):
+        """Detect the offline changes made to the warebox.
         """
-        return self._detect_changes(last_session_content,
-                                    remote_content,
-                                    self.remote_etag,
-                                    self.last_session_storage_etag)
+        return self._detect_changes(self.last_session_content,
+                                    'warebox_etag',
+                                    self.local_content,
+                                    'etag')
 
-    def _detect_changes(self, content_from, content_to,
-                        etag_map, last_session_etag_map):
+    def _detect_changes(self, content_from, from_field,
+                        content_to, to_field):
         """Detect the update and delete operations necessary to change
         content_from into content_to.
 
+        The two tables are joined on the pathname ids, in a single pass.
+
         @param content_from:
-                    Set of strings representing pathnames.
+                    ContentTable.
+        @param from_field:
+                    Name of the etag attribute of content_from.
         @param content_to:
-                    Set of strings representing pathnames.
-        @params etag_map
-                    Dictionary with an etag for each pathname in content_to
-        @params last_session_etag_map
-                    Dictionary with an etag for each pathname in content_from
+                    ContentTable sharing the index with content_from.
+        @param to_field:
+                    Name of the etag attribute of content_to.
         @return
                     tuple(updated_content, deleted_content), they are
                     both sets of pathnames.
         """
         updated_content = set()
         deleted_content = set()
-        for pathname in content_to:
-            if pathname not in content_from or etag_map[pathname] != last_session_etag_map[pathname]:
-                updated_content.add(pathname)
-        for pathname in content_from:
-            if pathname not in content_to:
-                deleted_content.add(pathname)
+        get_pathname = self._index.get_pathname
+        for pathname_id in xrange(len(self._index)):
+            in_to = content_to.has_id(pathname_id)
+            in_from = content_from.has_id(pathname_id)
+            if in_to:
+                if not in_from or not content_to.same_etag(
+                        pathname_id, to_field, content_from, from_field):
+                    updated_content.add(get_pathname(pathname_id))
+            elif in_from:
+                deleted_content.add(get_pathname(pathname_id))
         return (updated_content, deleted_content)
 
+    def _detect_deletions(self, content_from, content_to):
+        """
+        @return
+                    The set of pathnames in content_from but not in
+                    content_to.
+        """
+        get_pathname = self._index.get_pathname
+        return set(get_pathname(pathname_id)
+                   for pathname_id in content_from.ids()
+                   if not content_to.has_id(pathname_id))
+
     def _detect_edit_conflicts(self, content_to_upload, content_to_download):
         """Detect edit conflicts between uploads and download.
 
@@ -429,7 +496,10 @@ class StartupSynchronization(object):
                     would be enough.
         """
         conflicts = content_to_upload.intersection(content_to_download)
-        redundant_transfers = set(filter(lambda p: self.local_etag[p] == self.remote_etag[p], conflicts))
+        get_id = self._index.get_id
+        is_redundant = lambda p: self.local_content.same_etag(
+            get_id(p), 'etag', self.remote_content, 'etag')
+        redundant_transfers = set(filter(is_redundant, conflicts))
         conflicts.difference_update(redundant_transfers)
         content_to_upload.difference_update(redundant_transfers)
         content_to_download.difference_update(redundant_transfers)
@@ -453,13 +523,89 @@ class StartupSynchronization(object):
                     Set of pathnames that are deletion conflicts.
         """
         # Deletion conflicts are more complex than others, because they must
-        # be extended to folders' content
+        # be extended to folders' content. In sorted order, the uploads
+        # starting with a deleted pathname are a contiguous range, found
+        # by bisection. A deleted pathname starting with a previous one
+        # is skipped, its range has already been collected: this way
+        # ranges never overlap and the whole thing is O((N+M) log N).
+        uploads = sorted(content_to_upload)
+        conflicts = set()
+        prefix = None
+        for pathname in sorted(content_to_delete_locally):
+            if prefix is not None and pathname.startswith(prefix):
+                continue
+            prefix = pathname
+            i = bisect.bisect_left(uploads, prefix)
+            while i < len(uploads) and uploads[i].startswith(prefix):
+                conflicts.add(uploads[i])
+                i += 1
+        return conflicts
+
+
+def _parse_remote_lmtime(lmtime):
+    """Convert a modification time sent by the server into a number of
+    seconds, see content_table.datetime_to_seconds().
+
+    Much faster than datetime.strptime(), which is called anyway for any
+    string not in the usual format in order to reject it.
+    """
+    if len(lmtime) == 24 and lmtime[4] == '-' and lmtime[10] == 'T' \
+    and lmtime[19:] == '.000Z':
+        try:
+            return datetime_to_seconds(datetime(
+                int(lmtime[0:4]), int(lmtime[5:7]), int(lmtime[8:10]),
+                int(lmtime[11:13]), int(lmtime[14:16]), int(lmtime[17:19])))
+        except ValueError:
+            pass
+    return datetime_to_seconds(datetime.strptime(lmtime, REMOTE_LMTIME_FORMAT))
+
+
+if __name__ == '__main__':
+    import time
+
+    def quadratic_detect_deletion_conflicts(content_to_upload,
+                                            content_to_delete_locally):
+        ''' The previous implementation '''
         conflicts = set()
         for pathname in content_to_delete_locally:
             confl = [p for p in content_to_upload if p.startswith(pathname)]
             conflicts.update(set(confl))
         return conflicts
 
+    def make_content(size):
+        ''' Half of the uploads are below deleted folders '''
+        uploads = set()
+        deletions = set()
+        for i in xrange(size):
+            folder = u'folder%s/' % (i % (size / 10))
+            deletions.add(u'deleted/%s' % folder if i % 2 else folder)
+            deletions.add(u'deleted/%sfile%s' % (folder, i))
+            uploads.add(u'%sfile%s' % (folder, i))
+        return uploads, set(list(deletions)[:size])
+
+    def deletion_conflicts_test(size, detect, expected=None):
+        uploads, deletions = make_content(size)
+        begin = time.time()
+        conflicts = detect(uploads, deletions)
+        end = time.time()
+        if expected is not None:
+            assert conflicts == expected
+        print "%s, %s x %s: %s conflicts" \
+            % (detect.__doc__.strip(), size, size, len(conflicts))
+        print "> %s seconds elapsed" % (end - begin)
+        return conflicts
 
-if __name__ == '__main__':
-    pass
+    def sorted_merge_detect_deletion_conflicts(content_to_upload,
+                                               content_to_delete_locally):
+        ''' The sorted merge '''
+        sync = StartupSynchronization(None, None, None)
+        return sync._detect_deletion_conflicts(content_to_upload,
+                                               content_to_delete_locally)
+
+    # The previous implementation would take more than half an hour on
+    # the 100k x 100k input
+    expected = deletion_conflicts_test(
+        3000, quadratic_detect_deletion_conflicts)
+    deletion_conflicts_test(
+        3000, sorted_merge_detect_deletion_conflicts, expected)
+    deletion_conflicts_test(100000, sorted_merge_detect_deletion_conflicts)
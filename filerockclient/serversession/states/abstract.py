@@ -159,6 +159,13 @@ class ServerSessionState(object):
         """
         self.logger.debug(u"Received unexpected WORKERFREE command")
 
+    def _handle_command_OPERATIONSFINISHED(self, command):
+        """All operations in transaction have been finished.
+
+        Only the commit waits for this, for anyone else it's stale.
+        """
+        self.logger.debug(u"Received unexpected OPERATIONSFINISHED command")
+
     def _handle_command_BROKENCONNECTION(self, command):
         """The connection to the server is broken.
         """
@@ -45,7 +45,9 @@ FileRock Client is licensed under GPLv3 License.
 
 """
 
+import collections
 import datetime
+import time
 
 from FileRockSharedLibraries.Communication.Messages import COMMIT_START
 from FileRockSharedLibraries.IntegrityCheck.Proof import Proof
@@ -57,27 +59,117 @@ from filerockclient.exceptions import *
 from filerockclient.serversession.states.abstract import ServerSessionState
 from filerockclient.serversession.states.register import StateRegister
 from filerockclient.serversession.commands import Command
+from filerockclient.serversession.states.replication_and_transfer import \
+    on_operation_rejected
+from filerockclient.workers.filters.encryption import utils as CryptoUtils
 
 
-class CommitState(ServerSessionState):
+# Maximum number of operations of the next transaction received while
+# committing the current one.
+MAX_PREFETCHED_OPERATIONS = 1000
+
+
+class PrefetchingCommitState(ServerSessionState):
+    """Abstract state for the time the current transaction is being
+    committed.
+
+    No operation can be declared to the server until the commit is
+    done, since the proofs it sends back refer to the basis being
+    committed. In the meanwhile the operations of the next transaction
+    keep being received and prepared: uploads to encrypt are sent to
+    the encrypter at once, the other operations are kept aside. These
+    are given back to the input queue, in the same order, when leaving
+    the state, so that Replication & Transfer starts declaring as soon
+    as the commit is done.
+    """
+
+    listened_queues = [
+        'usercommand', 'sessioncommand', 'systemcommand', 'servermessage']
+
+    def __init__(self, session):
+        ServerSessionState.__init__(self, session)
+        self._prefetched_operations = collections.deque()
+
+    def _receive_next_message(self):
+        queues = list(self.listened_queues)
+        if len(self._prefetched_operations) < MAX_PREFETCHED_OPERATIONS:
+            queues.append('operation')
+        return self._context._input_queue.get(queues)
+
+    def _handle_operation(self, file_operation):
+        """An operation for the next transaction, prepare it.
+        """
+        if file_operation.verb == 'UPLOAD' and not file_operation.is_aborted():
+            CryptoUtils.prepare_operation(file_operation)
+            if CryptoUtils.to_encrypt(file_operation):
+                self.logger.debug(
+                    u"Sending operation to encryption before the commit"
+                    " is done: %s" % file_operation)
+                file_operation.register_reject_handler(on_operation_rejected)
+                self._context._internal_facade.set_global_status(
+                    GStatuses.C_NOTALIGNED)
+                self._context.cryptoAdapter.put(file_operation)
+                return
+        self._prefetched_operations.append(file_operation)
+
+    def _handle_command_WORKERFREE(self, command):
+        """Workers will get new operations after the commit.
+        """
+        pass
+
+    def _on_leaving(self):
+        while len(self._prefetched_operations) > 0:
+            operation = self._prefetched_operations.pop()
+            self._context._input_queue.append(operation, 'operation')
+
+
+class CommitState(PrefetchingCommitState):
     """Preparing for committing the current transaction.
+
+    Note: this is a subclass of PrefetchingCommitState
     """
     accepted_messages = ServerSessionState.accepted_messages + \
         []
 
+    # Server messages are left to CommitStartState
+    listened_queues = ['usercommand', 'sessioncommand', 'systemcommand']
+
+    def __init__(self, session):
+        PrefetchingCommitState.__init__(self, session)
+        self._waiting_transaction = False
+
     def _on_entering(self):
         """ServerSession waits for all operations currently handled by
         workers to be completed, afterwards it begins the commit.
 
+        The session isn't blocked while waiting: the transaction sends
+        an OPERATIONSFINISHED command when the last pending upload is
+        finished.
+        """
+        self.logger.debug(u"Committing the current transaction...")
+        self.logger.debug(u"Waiting for the transaction to be finished...")
+        self._waiting_transaction = True
+        self._context.transaction_manager.notify_when_finished(
+            self._on_transaction_finished)
+
+    def _on_transaction_finished(self):
+        """Note: the calling thread can be a worker's one.
+        """
+        self._context._input_queue.put(
+            Command('OPERATIONSFINISHED'), 'sessioncommand')
+
+    def _handle_command_OPERATIONSFINISHED(self, command):
+        """All pending uploads are finished, begin the commit.
+
         Integrity of the transaction is checked and the "candidate basis"
         (the expected basis after our modifications to the storage) is
         computed.
         """
-        self.logger.debug(u"Committing the current transaction...")
-
-        # Block until all pending uploads are finished
-        self.logger.debug(u"Waiting for the transaction to be finished...")
-        self._context.transaction_manager.wait_until_finished()
+        if not self._waiting_transaction \
+        or not self._context.transaction_manager.is_finished():
+            # Stale command, the transaction has changed meanwhile
+            return
+        self._waiting_transaction = False
         self.logger.debug(u"Transaction is finished!")
 
         self.logger.info(u"Committing the following pathnames:")
@@ -85,9 +177,14 @@ class CommitState(ServerSessionState):
         for (op_id, op) in operations:
             self.logger.info(u'    %s "%s"' % (op.verb, op.pathname))
             self.logger.debug(u"    id=%s %s" % (op_id, op))
+        controller = self._context.commit_controller
+        controller.on_commit_started(
+            len(operations), self._context.transaction.data_size())
 
         # Use the received proofs to compute the next expected basis
+        begin = time.time()
         self._check_transaction_integrity(operations)
+        controller.on_proofs_verified(time.time() - begin)
         candidate_basis = self._context.integrity_manager.getCandidateBasis()
         self.logger.info("Candidate basis: %s" % candidate_basis)
 
@@ -112,9 +209,9 @@ class CommitState(ServerSessionState):
         """
         transaction_cache.clear()
         transaction_timestamp = datetime.datetime.now()
-        for op_id, operation in operations:
-            transaction_cache.update_record(
-                op_id, operation, transaction_timestamp)
+        transaction_cache.update_records_bulk(
+            (op_id, operation, transaction_timestamp)
+            for op_id, operation in operations)
 
     def _handle_command_COMMIT(self, message):
         """Any further commit command is redundant here.
@@ -162,8 +259,10 @@ class CommitState(ServerSessionState):
                 raise ProtocolException('WrongBasisFromProofException')
 
 
-class CommitStartState(ServerSessionState):
+class CommitStartState(PrefetchingCommitState):
     """The commit has been started, waiting for a reply from the server.
+
+    Note: this is a subclass of PrefetchingCommitState
     """
     accepted_messages = ServerSessionState.accepted_messages + \
         ['REPLICATION_DECLARE_RESPONSE', 'COMMIT_FORCE', 'COMMIT_DONE',
@@ -194,6 +293,7 @@ class CommitStartState(ServerSessionState):
                                          completed_ops)
 
         self.logger.info(u"Updated basis: %s" % new_basis)
+        self._context.commit_controller.on_commit_done()
         self._context.transaction_manager.clear()
         self._context.operation_responses.clear()
         self._context.refused_declare_count = 0
@@ -249,25 +349,29 @@ class CommitStartState(ServerSessionState):
         and compute the operations to do in the sync phase.
         """
         operations = [op for (_, op) in operations]
-        lmtime = datetime.datetime.now()
+        # Only the last operation on each pathname matters, so they are
+        # collapsed and written with two batched statements.
+        to_update = collections.OrderedDict()
+        to_delete = set()
 
         for operation in operations:
+            pathname = operation.pathname
             if operation.verb in ['UPLOAD', 'REMOTE_COPY']:
-                pathname = operation.pathname
-                warebox_size = operation.warebox_size
-                storage_size = operation.storage_size
-                lmtime = operation.lmtime
-                warebox_etag = operation.warebox_etag
-                storage_etag = operation.storage_etag
-                storage_cache.update_record(
-                    pathname, warebox_size, storage_size, lmtime,
-                    warebox_etag, storage_etag)
+                to_update[pathname] = (
+                    pathname, operation.warebox_size, operation.storage_size,
+                    operation.lmtime, operation.warebox_etag,
+                    operation.storage_etag)
+                to_delete.discard(pathname)
             elif operation.verb == 'DELETE':
-                storage_cache.delete_record(operation.pathname)
+                to_update.pop(pathname, None)
+                to_delete.add(pathname)
             else:
                 raise Exception("Unexpected operation verb while in state "
                     "%s: %s" % (self.__class__.__name__, operation))
 
+        storage_cache.delete_records(list(to_delete))
+        storage_cache.update_records_bulk(to_update.values())
+
     def _update_user_interfaces(self, message):
         """Send the user interfaces information on the successful commit.
         """
@@ -361,6 +465,12 @@ class PendingCommitStartState(CommitStartState):
     accepted_messages = ServerSessionState.accepted_messages + \
         ['COMMIT_DONE', 'COMMIT_ERROR', 'ERROR']
 
+    def _receive_next_message(self):
+        """There is no next transaction yet, operations aren't served
+        before the sync phase.
+        """
+        return ServerSessionState._receive_next_message(self)
+
     def _handle_message_COMMIT_DONE(self, message):
         """Everything went well, the server has completed the commit.
 
@@ -398,4 +508,79 @@ class PendingCommitStartState(CommitStartState):
 
 
 if __name__ == '__main__':
-    pass
+    import time
+    import Queue
+    import threading
+    from mock import MagicMock
+    from filerockclient.pathname_operation import PathnameOperation
+    from filerockclient.util.multi_queue import MultiQueue
+
+    class FakeCryptoAdapter(threading.Thread):
+        """ Encrypts one file at a time, taking a fixed time for each """
+
+        def __init__(self, output_queue, encryption_time):
+            threading.Thread.__init__(self, name='FakeCryptoAdapter')
+            self.daemon = True
+            self.input_queue = Queue.Queue()
+            self.output_queue = output_queue
+            self.encryption_time = encryption_time
+
+        def put(self, operation):
+            self.input_queue.put(operation)
+
+        def run(self):
+            while True:
+                operation = self.input_queue.get()
+                time.sleep(self.encryption_time)
+                operation.encrypted_pathname = u'enc/%s' % operation.pathname
+                self.output_queue.put(operation, 'operation')
+
+    def next_transaction_test(operations_count, commit_time, encryption_time,
+                              prefetch):
+        """ Time needed, once the commit is done, to have all operations
+        of the next transaction ready to be declared """
+        context = MagicMock()
+        context._input_queue = MultiQueue([
+            'servermessage', 'operation', 'usercommand', 'sessioncommand',
+            'systemcommand'])
+        context.cryptoAdapter = FakeCryptoAdapter(context._input_queue,
+                                                  encryption_time)
+        context.cryptoAdapter.start()
+        for i in xrange(operations_count):
+            operation = PathnameOperation(
+                MagicMock(), threading.RLock(), 'UPLOAD',
+                u'encrypted/file%05d' % i,
+                etag='d41d8cd98f00b204e9800998ecf8427e', size=0)
+            context._input_queue.put(operation, 'operation')
+
+        commit_done = time.time() + commit_time
+        if prefetch:
+            state = CommitStartState(context)
+            wake_up = threading.Timer(
+                commit_time, context._input_queue.put,
+                [Command('WORKERFREE'), 'systemcommand'])
+            wake_up.start()
+            while time.time() < commit_done:
+                state.do_execute()
+            state._on_leaving()
+        else:
+            time.sleep(commit_time)
+
+        # What Replication & Transfer does with the received operations
+        begin = time.time()
+        ready = 0
+        while ready < operations_count:
+            operation, _ = context._input_queue.get(['operation'])
+            CryptoUtils.prepare_operation(operation)
+            if CryptoUtils.to_encrypt(operation):
+                context.cryptoAdapter.put(operation)
+            else:
+                ready += 1
+        end = time.time()
+        print "%s uploads to encrypt, %s ms per file, %s ms of commit%s" \
+            % (operations_count, encryption_time * 1000, commit_time * 1000,
+               ", prefetching" if prefetch else "")
+        print "> %s seconds elapsed after the commit" % (end - begin)
+
+    next_transaction_test(50, 1.0, 0.02, False)
+    next_transaction_test(50, 1.0, 0.02, True)
@@ -56,6 +56,10 @@ from filerockclient.serversession.commands import Command
 from filerockclient.util import multi_queue
 
 
+# Number of pathnames per SYNC_FILES_LIST page asked to the server
+FILES_LIST_PAGE_SIZE = 10000
+
+
 class DisconnectedState(ServerSessionState):
     """The client is not connected to the server.
 
@@ -387,7 +391,10 @@ class ReadyForServiceState(ServerSessionState):
         """The server is ready to start syncing. So we are.
         """
         self.logger.info(u"Starting Startup Synchronization phase.")
-        self._context.output_message_queue.put(SYNC_START('SYNC_START'))
+        # Servers that can send the filelist in pages do it
+        message = SYNC_START(
+            'SYNC_START', {'files_list_page_size': FILES_LIST_PAGE_SIZE})
+        self._context.output_message_queue.put(message)
         self._set_next_state(StateRegister.get('SyncStartState'))
 
     def _handle_command_STARTSYNCPHASE(self, command):
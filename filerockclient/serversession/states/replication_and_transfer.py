@@ -49,6 +49,7 @@ import base64
 import binascii
 import datetime
 import socket
+import time
 
 from FileRockSharedLibraries.Communication.Messages import \
     REPLICATION_DECLARE_REQUEST
@@ -61,6 +62,12 @@ from filerockclient.workers.filters.encryption import utils as CryptoUtils
 from filerockclient.serversession.states.abstract import ServerSessionState
 from filerockclient.serversession.states.register import StateRegister
 from filerockclient.serversession.commands import Command
+from filerockclient.util.pathname_trie import PathnameTrie
+
+
+# Maximum number of operations waiting for a worker. Beyond this no more
+# operations are received until a worker becomes free.
+MAX_WAITING_OPERATIONS = 1000
 
 
 class EnteringReplicationAndTransferState(ServerSessionState):
@@ -113,9 +120,16 @@ class ReplicationAndTransferState(ServerSessionState):
     """Replicating local data to the remote storage.
 
     This state receives PathnameOperation objects from its input queue,
-    which must be given to some worker for execution. When all workers
-    are busy it stop listening for operations, until a worker become
-    available again.
+    which are declared to the server and, if they are uploads, given
+    to some worker for execution. Declarations don't wait for the
+    workers: when no worker is available, uploads are kept waiting
+    while the operations that don't need a worker (e.g. deletions) go
+    on being declared, unless they involve the pathname of a waiting
+    operation or one of its ancestors or descendants.
+    Waiting operations are served in order of priority, as given by
+    the scheduling policy of the worker pool, but an operation never
+    overtakes an earlier one involving a related pathname.
+    Operations stop being received only when too many are waiting.
     """
 
     accepted_messages = ServerSessionState.accepted_messages + \
@@ -126,6 +140,19 @@ class ReplicationAndTransferState(ServerSessionState):
         ServerSessionState.__init__(self, session)
         self.last_operation_time = datetime.datetime.now()
         self._context.listening_operations = True
+        # Operations received but not served yet:
+        # sequence number -> (operation, arrival time)
+        self._waiting_operations = {}
+        self._first_seq = 0
+        self._last_seq = 0
+        self._waiting_pathnames = PathnameTrie()
+        # pathname -> sequence numbers of the waiting operations
+        # involving it
+        self._waiting_seqs = {}
+        # sequence number -> sequence numbers of the earlier waiting
+        # operations that must be served first, and vice versa
+        self._blockers = {}
+        self._dependents = {}
 
     def _receive_next_message(self):
         queues = [
@@ -138,8 +165,7 @@ class ReplicationAndTransferState(ServerSessionState):
 
     def _on_entering(self):
         self.logger.debug(u"Started replication & transfer phase.")
-        if self._context.worker_pool.exist_free_workers():
-            self._context.listening_operations = True
+        self._context.listening_operations = True
         self._context._scheduler.schedule_action(
             func=self._check_time_to_commit, name='check_time_to_commit',
             seconds=self._context.commit_threshold_seconds, repeating=True)
@@ -147,28 +173,172 @@ class ReplicationAndTransferState(ServerSessionState):
 
     def _on_leaving(self):
         self._context._scheduler.unschedule_action(self._check_time_to_commit)
+        # The waiting operations will be received again, in arrival order
+        for seq in sorted(self._waiting_operations, reverse=True):
+            operation = self._pop_waiting_operation(seq)
+            self._context._input_queue.append(operation, 'operation')
+        self._context.listening_operations = True
 
     def _handle_command_WORKERFREE(self, command):
-        """A worker is available, start to serve operations again.
+        """A worker is available, serve the operations that were
+        waiting for it.
         """
-        if self._context.worker_pool.exist_free_workers():
+        while True:
+            seq = self._next_waiting_operation()
+            if seq is None:
+                break
+            operation = self._pop_waiting_operation(seq)
+            self._serve_operation(operation)
+        if len(self._waiting_operations) < MAX_WAITING_OPERATIONS:
             self._context.listening_operations = True
 
     def _handle_operation(self, file_operation):
         """Here is an operation to do for replicating a local pathname.
-        Do everything needed to synchronize it.
 
-        If it's OK to serve it (e.g. it hasn't been aborted) then it's
-        first declared to the server and then given to some worker.
+        It's served at once if possible, otherwise it waits for a worker
+        to become free.
         """
         assert file_operation.verb in ['UPLOAD', 'DELETE', 'REMOTE_COPY'], \
             "Unexpected operation verb while in state %s: %s" \
             % (self.__class__.__name__, file_operation)
 
         self.logger.debug(u"Received file operation: %s" % file_operation)
+        if self._must_wait(file_operation):
+            self.logger.debug(u"Operation waits for a worker: %s"
+                              % file_operation)
+            self._push_waiting_operation(file_operation)
+            if len(self._waiting_operations) >= MAX_WAITING_OPERATIONS:
+                self._context.listening_operations = False
+            return
+        self._serve_operation(file_operation)
+
+    def _needs_worker(self, operation):
+        return operation.verb == 'UPLOAD' and not operation.is_aborted()
+
+    def _must_wait(self, operation):
+        """Tell whether an operation can't be served yet, that is, if it
+        needs a worker and none is available for it, or if it must keep
+        its order with some operation already waiting.
+        """
+        if self._needs_worker(operation) \
+        and not self._context.worker_pool.exist_free_workers(operation):
+            return True
+        return len(self._related_waiting_operations(operation)) > 0
+
+    def _related_waiting_operations(self, operation):
+        """
+        @return
+                    The set of sequence numbers of the waiting
+                    operations involving the pathnames of the given
+                    operation, or their ancestors or descendants.
+        """
+        related = set()
+        for pathname in _involved_pathnames(operation):
+            pathnames = list(self._waiting_pathnames.iter_descendants(pathname))
+            if pathname in self._waiting_pathnames:
+                pathnames.append(pathname)
+            ancestor = self._waiting_pathnames.nearest_ancestor(pathname)
+            while ancestor is not None:
+                pathnames.append(ancestor)
+                ancestor = self._waiting_pathnames.nearest_ancestor(ancestor)
+            for related_pathname in pathnames:
+                related.update(self._waiting_seqs[related_pathname])
+        return related
+
+    def _push_waiting_operation(self, operation, first=False):
+        """Make an operation wait, after the related waiting operations
+        or, if "first" is True, before them.
+        """
+        related = self._related_waiting_operations(operation)
+        if first:
+            self._first_seq -= 1
+            seq = self._first_seq
+            blockers, dependents = set(), related
+        else:
+            self._last_seq += 1
+            seq = self._last_seq
+            blockers, dependents = related, set()
+        self._waiting_operations[seq] = (operation, time.time())
+        self._blockers[seq] = blockers
+        self._dependents[seq] = dependents
+        for blocker in blockers:
+            self._dependents[blocker].add(seq)
+        for dependent in dependents:
+            self._blockers[dependent].add(seq)
+        for pathname in _involved_pathnames(operation):
+            self._waiting_pathnames.add(pathname)
+            self._waiting_seqs.setdefault(pathname, set()).add(seq)
+
+    def _pop_waiting_operation(self, seq):
+        operation, _ = self._waiting_operations.pop(seq)
+        for blocker in self._blockers.pop(seq):
+            self._dependents[blocker].discard(seq)
+        for dependent in self._dependents.pop(seq):
+            self._blockers[dependent].discard(seq)
+        for pathname in _involved_pathnames(operation):
+            seqs = self._waiting_seqs[pathname]
+            seqs.discard(seq)
+            if len(seqs) == 0:
+                del self._waiting_seqs[pathname]
+                self._waiting_pathnames.remove(pathname)
+        return operation
+
+    def _next_waiting_operation(self):
+        """Choose the waiting operation to serve next.
+
+        It's the one with the best priority among those that have no
+        earlier related operation waiting and that, if they need a
+        worker, can get one. Ties are broken by arrival order.
+
+        @return
+                    The sequence number of the chosen operation, or None
+                    if no waiting operation can be served now.
+        """
+        worker_pool = self._context.worker_pool
+        policy = worker_pool.scheduling_policy
+        large_lane_free = worker_pool.is_large_lane_free()
+        now = time.time()
+        best = None
+        for seq, (operation, arrival) in self._waiting_operations.iteritems():
+            if len(self._blockers[seq]) > 0:
+                continue
+            if self._needs_worker(operation) \
+            and not worker_pool.exist_free_workers(operation):
+                continue
+            key = (policy.priority(operation, now - arrival, large_lane_free),
+                   seq)
+            if best is None or key < best:
+                best = key
+        return best[1] if best is not None else None
+
+    def _serve_operation(self, file_operation):
+        """Do everything needed to synchronize an operation.
+
+        If it's OK to serve it (e.g. it hasn't been aborted) then it's
+        first declared to the server and then, if it's an upload, given
+        to some worker.
+        """
         if file_operation.is_aborted():
             return
 
+        # Note: operations different from uploads don't need workers,
+        # nor do the uploads to encrypt, until they come back encrypted
+        CryptoUtils.prepare_operation(file_operation)
+        needs_worker = file_operation.verb == 'UPLOAD' \
+            and not CryptoUtils.to_encrypt(file_operation)
+        if needs_worker \
+        and not self._context.worker_pool.acquire_worker(file_operation):
+            # The pool has shrunk since the worker was found free
+            self.logger.debug(u"Operation waits for a worker: %s"
+                              % file_operation)
+            self._push_waiting_operation(file_operation, first=True)
+            if len(self._waiting_operations) >= MAX_WAITING_OPERATIONS:
+                self._context.listening_operations = False
+            return
+        if __debug__ and needs_worker:
+            self._context.worker_pool.track_acquire_anonymous_worker(
+                file_operation.pathname)
+
         file_operation.register_reject_handler(on_operation_rejected)
         self._context._internal_facade.set_global_status(GStatuses.C_NOTALIGNED)
 
@@ -181,38 +351,38 @@ class ReplicationAndTransferState(ServerSessionState):
             self._try_set_global_status_aligned()
             return
 
-        CryptoUtils.prepare_operation(file_operation)
         if CryptoUtils.to_encrypt(file_operation):
             self.logger.debug(u"Sending operation to encryption: %s" % file_operation)
             self._context.cryptoAdapter.put(file_operation)
             return
 
         op_id = self._next_id()
-        must_declare = self._context.transaction_manager.handle_operation(
-            op_id, file_operation, self)
+        try:
+            must_declare = self._context.transaction_manager.handle_operation(
+                op_id, file_operation, self)
+        except Exception:
+            if needs_worker:
+                self._release_unused_worker(file_operation)
+            raise
         if not must_declare:
+            if needs_worker:
+                self._release_unused_worker(file_operation)
             self._try_set_global_status_aligned()
             return
 
         # The operation is not aborted nor ignored, process it
-        if file_operation.verb == 'UPLOAD':
-            # Note: operations different from uploads don't need workers
-            if not self._context.worker_pool.acquire_worker():
-                raise FileRockException(
-                    u"Concurrency trouble in %s: could not acquire a worker"
-                    " although some should have been available"
-                    % (self.__class__.__name__ + "._handle_file_operation"))
-
-            if __debug__:
-                self._context.worker_pool.track_acquire_anonymous_worker(
-                    file_operation.pathname)
-
-            if not self._context.worker_pool.exist_free_workers():
-                self._context.listening_operations = False
-
         self._declare_operation(file_operation, op_id)
         self._check_time_to_commit()
 
+    def _release_unused_worker(self, operation):
+        """Give back the worker acquired for an operation that won't
+        be declared.
+        """
+        self._context.worker_pool.release_worker(operation)
+        if __debug__:
+            self._context.worker_pool.track_release_unassigned_worker(
+                operation.pathname)
+
     def _declare_operation(self, operation, op_id):
         """Declare to the server our intention to synchronize a pathname.
         The reply will contain, among other thing, an authorization
@@ -289,10 +459,10 @@ class ReplicationAndTransferState(ServerSessionState):
             operation.unregister_reject_handler(on_operation_rejected)
             self._context.transaction.remove_operation(op_id)
             if operation.verb == 'UPLOAD':
-                self._context.worker_pool.release_worker()
+                self._context.worker_pool.release_worker(operation)
                 if __debug__:
                     self._context.track_release_unassigned_worker(operation.pathname)
-            self._context._input_queue.append(operation, 'operation')
+            self.postpone_operation(operation)
             self._set_next_state(StateRegister.get('WaitingOnDeclarationFailure'))
             return
 
@@ -343,9 +513,19 @@ class ReplicationAndTransferState(ServerSessionState):
     def postpone_operation(self, operation):
         """Push an operation back to the input queue, so that it will
         be received again the next time.
+
+        Postponed operations come before the waiting ones, which have
+        been received later.
         """
         self.logger.debug(u"Postponing file operation: %s" % (operation))
-        self._context._input_queue.append(operation, 'operation')
+        if len(self._waiting_operations) > 0:
+            self._push_waiting_operation(operation, first=True)
+        else:
+            self._context._input_queue.append(operation, 'operation')
+
+    def _try_set_global_status_aligned(self):
+        if len(self._waiting_operations) == 0:
+            ServerSessionState._try_set_global_status_aligned(self)
 
     def on_commit_necessary_to_proceed(self):
         """Session can decide to commit the current transaction. It
@@ -361,7 +541,8 @@ class ReplicationAndTransferState(ServerSessionState):
     def _update_last_operation_time(self):
         """Remember the last time we synchronized something.
         """
-        if not self._context._input_queue.empty(['operation']):
+        if not self._context._input_queue.empty(['operation']) \
+        or len(self._waiting_operations) > 0:
             self.last_operation_time = datetime.datetime.now()
 
     def _check_time_to_commit(self):
@@ -381,24 +562,18 @@ class ReplicationAndTransferState(ServerSessionState):
         """
         Tell whether it's time to commit the current transaction.
 
-        The values considered to make a decision are:
-         * now: current time
-         * t.size: number of operations in transaction
-         * op: time of the last seen operation.
-        It is time to commit when:
-        t.size > 0 and (
-            either (t.size > max_size_allowed)
-            or (op > max_time_allowed)
-            or (size > max_size_allowed)
-        )
+        The values considered to make a decision are the number of
+        operations in transaction, the bytes they upload and the time
+        of the last seen operation. The decision is up to the commit
+        controller, see filerockclient.serversession.commit_controller.
         """
         self._update_last_operation_time()
-        need = self._context.transaction.size() > 0
-        op_count = self._context.transaction.size() >= self._context.commit_threshold_operations
-        timeout = datetime.datetime.now() - self.last_operation_time > \
-            datetime.timedelta(seconds=self._context.commit_threshold_seconds)
-        size = self._context.transaction.data_size() > self._context.commit_threshold_bytes
-        return (need and (timeout or op_count or size))
+        idle_time = datetime.datetime.now() - self.last_operation_time
+        reason = self._context.commit_controller.should_commit(
+            self._context.transaction.size(),
+            self._context.transaction.data_size(),
+            idle_time.total_seconds())
+        return reason is not None
 
     def _immediate_commit(self):
         """Pre-emptive style commit.
@@ -413,7 +588,7 @@ class ReplicationAndTransferState(ServerSessionState):
         unauthorized = self._context.transaction_manager.flush_unauthorized_operations()
         for operation in unauthorized:
             self.postpone_operation(operation)
-            self._context.worker_pool.release_worker()
+            self._context.worker_pool.release_worker(operation)
             if __debug__: 
                 self._context.worker_pool.track_release_unassigned_worker(operation)
         self._set_next_state(StateRegister.get('CommitState'))
@@ -458,6 +633,12 @@ class ReplicationAndTransferState(ServerSessionState):
                                                  size)
 
 
+def _involved_pathnames(operation):
+    if operation.verb == 'REMOTE_COPY':
+        return [operation.pathname, operation.oldpath]
+    return [operation.pathname]
+
+
 def on_operation_rejected(operation):
     """Called by a worker that couldn't complete an operation.
 
@@ -556,7 +737,7 @@ class WaitingForUnauthorizedOperationsState(ReplicationAndTransferState):
             operation = self._context.transaction_manager.get_operation(id_)
             self._context.transaction.remove_operation(id_)
             if operation.verb == 'UPLOAD':
-                self._context.worker_pool.release_worker()
+                self._context.worker_pool.release_worker(operation)
             self._context._input_queue.append(operation, 'operation')
         if self._context.transaction_manager.all_operations_are_authorized():
             self._pass_to_next_state()
@@ -570,4 +751,180 @@ class WaitingForUnauthorizedOperationsState(ReplicationAndTransferState):
 
 
 if __name__ == '__main__':
-    pass
+    import sys
+    import heapq
+    import random
+    import threading
+    import Queue
+    from mock import MagicMock
+    from FileRockSharedLibraries.Communication.Messages import \
+        REPLICATION_DECLARE_RESPONSE
+    from filerockclient.pathname_operation import PathnameOperation
+    from filerockclient.util.multi_queue import MultiQueue
+    from filerockclient.workers.scheduling import SchedulingPolicy
+    from filerockclient.serversession.connection_handling import \
+        ServerConnectionReader, ServerConnectionWriter
+
+    WORKERS = 4
+
+    class FakeServer(threading.Thread):
+        """ Authorizes the declared operations, replying after the round
+        trip time of the simulated link. Declarations are pipelined, as
+        a real link does. """
+
+        def __init__(self, sock, rtt):
+            threading.Thread.__init__(self, name='FakeServer')
+            self.daemon = True
+            self.reader = ServerConnectionReader(None, None, sock)
+            self.writer = ServerConnectionWriter(None, None, sock)
+            self.rtt = rtt
+            self.replies = []
+            self.replies_ready = threading.Condition()
+            responder = threading.Thread(target=self.respond)
+            responder.daemon = True
+            responder.start()
+
+        def run(self):
+            while True:
+                request = self.reader._receive_message()
+                details = request.getParameter('request_details')
+                reply = REPLICATION_DECLARE_RESPONSE(
+                    'REPLICATION_DECLARE_RESPONSE', {'response_details': {
+                        'request_id': details.request_id, 'result': True,
+                        'auth_token': 'token', 'auth_date': 'date',
+                        'bucket': 'bucket', 'storage_connector_ip': '',
+                        'journal_pathname': details.pathname,
+                        'proof': None}})
+                with self.replies_ready:
+                    heapq.heappush(self.replies,
+                                   (time.time() + self.rtt, reply))
+                    self.replies_ready.notify()
+
+        def respond(self):
+            while True:
+                with self.replies_ready:
+                    while len(self.replies) == 0:
+                        self.replies_ready.wait()
+                    due, reply = self.replies[0]
+                    if due > time.time():
+                        self.replies_ready.wait(due - time.time())
+                        continue
+                    heapq.heappop(self.replies)
+                self.writer._send_message(reply)
+
+    class FakeWorkerPool(object):
+        """ Workers taking a fixed time for each upload """
+
+        def __init__(self, input_queue, transfer_time):
+            self.free = WORKERS
+            self.lock = threading.Lock()
+            self.input_queue = input_queue
+            self.transfer_time = transfer_time
+            self.scheduling_policy = SchedulingPolicy()
+
+        def exist_free_workers(self, operation=None):
+            return self.free > 0
+
+        def is_large_lane_free(self):
+            return True
+
+        def acquire_worker(self, operation=None):
+            with self.lock:
+                if self.free == 0:
+                    return False
+                self.free -= 1
+                return True
+
+        def send_operation(self, operation):
+            def transfer():
+                time.sleep(self.transfer_time)
+                operation.complete()
+                with self.lock:
+                    self.free += 1
+                self.input_queue.put(Command('WORKERFREE'), 'systemcommand')
+            transfer_thread = threading.Thread(target=transfer)
+            transfer_thread.daemon = True
+            transfer_thread.start()
+
+        def track_acquire_anonymous_worker(self, pathname):
+            pass
+
+    class FakeTransactionManager(object):
+
+        def __init__(self):
+            self.operations = {}
+
+        def handle_operation(self, op_id, operation, session):
+            self.operations[op_id] = operation
+            return True
+
+        def get_operation(self, op_id):
+            return self.operations[op_id]
+
+        def authorize_operation(self, op_id):
+            return True
+
+    def declare_test(operations_count, uploads_ratio, rtt, transfer_time):
+        client_sock, server_sock = socket.socketpair()
+        FakeServer(server_sock, rtt).start()
+        context = MagicMock()
+        context._input_queue = MultiQueue([
+            'servermessage', 'operation', 'usercommand', 'sessioncommand',
+            'systemcommand'])
+        context.output_message_queue = Queue.Queue()
+        context.worker_pool = FakeWorkerPool(context._input_queue,
+                                             transfer_time)
+        context.transaction_manager = FakeTransactionManager()
+        context.transaction.size.return_value = 0
+        context.transaction.data_size.return_value = 0
+        context.commit_threshold_seconds = 3600
+        context.commit_controller.should_commit.return_value = None
+        context.storage_ip_address = ''
+        context.id = 0
+        writer = ServerConnectionWriter(context._input_queue,
+                                        context.output_message_queue,
+                                        client_sock)
+        reader = ServerConnectionReader(context._input_queue, Queue.Queue(),
+                                        client_sock)
+        for thread in (writer, reader):
+            thread.daemon = True
+            thread.start()
+        state = ReplicationAndTransferState(context)
+        state._on_entering()
+
+        completed = []
+        completed_deletions = []
+        deletions_count = 0
+        rnd = random.Random(21)
+        for i in xrange(operations_count):
+            verb = 'UPLOAD' if rnd.random() < uploads_ratio else 'DELETE'
+            if verb == 'DELETE':
+                deletions_count += 1
+            operation = PathnameOperation(
+                MagicMock(), threading.RLock(), verb, u'file%05d' % i,
+                etag='d41d8cd98f00b204e9800998ecf8427e', size=0)
+            operation.register_complete_handler(completed.append)
+            if verb == 'DELETE':
+                operation.register_complete_handler(
+                    completed_deletions.append)
+            context._input_queue.put(operation, 'operation')
+
+        begin = time.time()
+        deletions_end = None
+        while len(completed) < operations_count:
+            state.do_execute()
+            if deletions_end is None \
+            and len(completed_deletions) == deletions_count:
+                deletions_end = time.time()
+        end = time.time()
+        print "%s operations, %s%% uploads, RTT %s ms, %s ms per upload" \
+            % (operations_count, int(uploads_ratio * 100), rtt * 1000,
+               transfer_time * 1000)
+        print "> %s seconds to complete the deletions" \
+            % (deletions_end - begin)
+        print "> %s seconds elapsed, %s operations/second" \
+            % (end - begin, operations_count / (end - begin))
+
+    operations_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    declare_test(operations_count, 0.1, 0.1, 0.2)
+    declare_test(operations_count, 0.5, 0.1, 0.2)
@@ -52,12 +52,13 @@ import re
 from FileRockSharedLibraries.Communication.Messages import \
     SYNC_GET_ENCRYPTED_FILES_IVS
 from filerockclient.interfaces import GStatuses, PStatuses
-from filerockclient.util.utilities import format_to_log, get_hash
+from filerockclient.util.utilities import format_to_log
 from filerockclient.exceptions import *
 from filerockclient.workers.filters.encryption import \
     utils as CryptoUtils, helpers as CryptoHelpers
 from filerockclient.serversession.states.abstract import ServerSessionState
 from filerockclient.serversession.states.register import StateRegister
+from filerockclient.serversession.remote_content import StorageListHasher
 from filerockclient.databases import metadata
 
 
@@ -78,6 +79,12 @@ class SyncStartState(ServerSessionState):
     connected, both in the local warebox and on the remote storage,
     merge the remote modifications into the warebox and resolve any
     conflict.
+
+    The server can send the remote filelist in pages, that is, as many
+    SYNC_FILES_LIST messages whose "last_page" parameter is False but
+    for the last one. Pages must be sorted by pathname. Each page is
+    folded into StartupSynchronization as soon as it arrives, so that
+    the whole filelist is never kept in memory.
     """
     accepted_messages = ServerSessionState.accepted_messages + \
         ['SYNC_FILES_LIST', 'SYNC_ENCRYPTED_FILES_IVS']
@@ -95,6 +102,13 @@ class SyncStartState(ServerSessionState):
                             % (self._context.storage_hostname, e))
         ip = self._context.storage_ip_address
         self.logger.debug("Starting storage IP address: %s" % ip)
+        self._context.startup_synchronization.reset()
+        self._storage_list_hasher = StorageListHasher()
+        self._last_remote_pathname = None
+        self._remote_blacklisted = []
+        self._received_pages = 0
+        self._received_records = 0
+        self.storage_list_hash = None
 
     def _validate_storage_content(self, remote_dataset):
         """Validate the format of the remote filelist received from the
@@ -128,6 +142,23 @@ class SyncStartState(ServerSessionState):
 
         #self.logger.debug(u'End of content received from the server.')
 
+    def _check_page_order(self, remote_dataset):
+        """Check that a page of the remote filelist follows the previous
+        ones in pathname order, so that the pages together are sorted
+        as a whole.
+
+        @param remote_dataset:
+                    A page of the remote filelist, already sorted.
+        """
+        if len(remote_dataset) == 0:
+            return
+        if self._last_remote_pathname is not None \
+        and remote_dataset[0]['key'] <= self._last_remote_pathname:
+            raise ProtocolException(
+                "Pages of the remote filelist are not sorted: %r follows %r"
+                % (remote_dataset[0]['key'], self._last_remote_pathname))
+        self._last_remote_pathname = remote_dataset[-1]['key']
+
     def _handle_message_SYNC_FILES_LIST(self, message):
         """Received the remote filelist from the server. Compute
         differences, perform integrity checks on it and ask the user
@@ -156,12 +187,39 @@ class SyncStartState(ServerSessionState):
                         (it might None if plan is "forever", this is the expiration date of the subscription,
                          it does not change when in grace time).
             status: <(TRIAL|ACTIVE|GRACE|SUSPENDED|MAINTAINANCE)>  # unicode (mandatory)
+            last_page: Boolean, False if more pages of the filelist
+                       will follow. Missing means True.
 
 
         """
         storage_content = message.getParameter('dataset')
-        self.storage_content = storage_content
         self._validate_storage_content(storage_content)
+        self._check_page_order(storage_content)
+        self._storage_list_hasher.update(storage_content)
+
+        # Blacklisted pathnames on the storage are reported on the last page
+        self._remote_blacklisted.extend(
+            entry['key'] for entry in storage_content
+            if self._context.warebox.is_blacklisted(entry['key']))
+
+        # Detect remote changes while the next pages are coming
+        try:
+            self._context.startup_synchronization.add_remote_content(
+                                                    storage_content,
+                                                    self._context.must_die)
+        except ExecutionInterrupted:
+            self.logger.debug(u'ExecutionInterrupted, terminating...')
+            self._set_next_state(StateRegister.get('DisconnectedState'))
+            return
+        self._received_pages += 1
+        self._received_records += len(storage_content)
+
+        if message.getParameter('last_page') is False:
+            self.logger.debug(
+                u"Received page %s of the remote filelist (%s pathnames)"
+                % (self._received_pages, self._received_records))
+            return
+        self.storage_list_hash = self._storage_list_hasher.hexdigest()
 
         self.server_basis = message.getParameter('basis')
         self.candidate_basis = self._try_load_candidate_basis()
@@ -220,10 +278,7 @@ class SyncStartState(ServerSessionState):
 
         # No blacklisted pathname should be found on the storage. If any, tell
         # the user and then shut down the application.
-        remote_pathnames = [entry['key'] for entry in storage_content]
-        blacklisted = filter(
-            lambda x: self._context.warebox.is_blacklisted(x),
-            remote_pathnames)
+        blacklisted = self._remote_blacklisted
         if len(blacklisted) > 0:
             self.logger.critical(
                 'The following blacklisted pathnames have been found on the '
@@ -238,7 +293,6 @@ class SyncStartState(ServerSessionState):
         self.logger.debug(u"Starting computing the three-way diff...")
         try:
             self._context.startup_synchronization.prepare(
-                                                    storage_content,
                                                     self._context.must_die)
         except ExecutionInterrupted:
             self.logger.debug(u'ExecutionInterrupted, terminating...')
@@ -322,7 +376,7 @@ class SyncStartState(ServerSessionState):
                 accepted_state = None
 
         if self.client_basis is not None: # First Start, I cannot check anything
-            current_state = self._catch_wrong_states(self.storage_content,
+            current_state = self._catch_wrong_states(self.storage_list_hash,
                                                      accepted_state,
                                                      out_of_sync)
 
@@ -350,8 +404,7 @@ class SyncStartState(ServerSessionState):
                         u'User has refused the synchronization, shutting down')
                     return False
 
-                storage_list_hash = get_hash(remove_lmtime_from_filelist(self.storage_content))
-                to_save = "%s %s" % (self.server_basis, storage_list_hash)
+                to_save = "%s %s" % (self.server_basis, self.storage_list_hash)
                 self._context.metadataDB.set(metadata.LASTACCEPTEDSTATEKEY, to_save)
                 self._save_basis_in_history(self.client_basis,
                                                      self.server_basis,
@@ -365,7 +418,7 @@ class SyncStartState(ServerSessionState):
         return True
 
     def _catch_wrong_states(self,
-                            storage_content,
+                            declared_content,
                             accepted_state,
                             out_of_sync):
         """Perform basic integrity checks on the basis/filelist sent
@@ -378,8 +431,9 @@ class SyncStartState(ServerSessionState):
         If only one has changed then we can tell for sure that something
         is wrong about the integrity of this synchronization.
 
-        @param storage_content:
-                    Filelist of the remote storage.
+        @param declared_content:
+                    Hash of the filelist of the remote storage, as
+                    computed by StorageListHasher.
         @param accepted_state:
                     A (basis, filelist_hash) pair that we accepted on
                     last synchronization, if any.
@@ -387,11 +441,10 @@ class SyncStartState(ServerSessionState):
                     Boolean flag telling whether there are remote
                     modification to replicate on the local data.
         """
-
-        declared_content = get_hash(remove_lmtime_from_filelist(storage_content))
         current_state = "%s %s" % (self.server_basis, declared_content)
 
-        self.logger.debug('storage_content = %s', storage_content)
+        self.logger.debug('storage_content = %s pathnames',
+                          self._received_records)
         self.logger.debug('server_state = %s', current_state)
         self.logger.debug('accepted_state = %s', accepted_state)
         self.logger.debug('out_of_sync = %s', out_of_sync)
@@ -400,12 +453,12 @@ class SyncStartState(ServerSessionState):
             if self.server_basis == self.client_basis:
                 raise HashMismatchException('ERROR! Something to sync with same basis')
             else:
-                self._check_accepted_state(accepted_state, storage_content)
+                self._check_accepted_state(accepted_state, declared_content)
         else:
             if self.server_basis == self.client_basis:
                 accepted_state = None
 
-            self._check_accepted_state(accepted_state, storage_content)
+            self._check_accepted_state(accepted_state, declared_content)
 
             if accepted_state is not None:
                 accepted_basis, _ = accepted_state.split()
@@ -422,7 +475,7 @@ class SyncStartState(ServerSessionState):
 
         return current_state
 
-    def _check_accepted_state(self, accepted_state, storage_content):
+    def _check_accepted_state(self, accepted_state, declared_content):
         """
         If there was an accepted_state, checks if the declared state is
         coherent with the accepted one.
@@ -433,10 +486,9 @@ class SyncStartState(ServerSessionState):
         @param accepted_state:
                 an accepted state, None if not state was accepted or a
                 string as "server_basis<space>get_hash(declared_content)"
-        @param storage_content:
-                list of files declared from server
+        @param declared_content:
+                hash of the list of files declared from server
         """
-        declared_content = get_hash(remove_lmtime_from_filelist(storage_content))
         if accepted_state is not None:
             accepted_basis, accepted_content = accepted_state.split()
             same_basis = (accepted_basis == self.server_basis)
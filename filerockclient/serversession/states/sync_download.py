@@ -119,6 +119,10 @@ class ResolvingDeletionConflictsState(ServerSessionState):
         ServerSessionState.__init__(self, session)
         self._pathname_to_do = {}
         self._pathname2proof = {}
+        # Pathnames and labels shared by the received proofs
+        self._proof_strings = {}
+        # Task waiting for a free worker, with its tracking pathname
+        self._waiting_task = None
         self._queues_to_listen = [
             'usercommand', 'sessioncommand', 'systemcommand',
             'servermessage'
@@ -133,6 +137,8 @@ class ResolvingDeletionConflictsState(ServerSessionState):
         ]
         self._pathname_to_do = {}
         self._pathname2proof = {}
+        self._proof_strings = {}
+        self._waiting_task = None
 
         diff_result = self._context.startup_synchronization
         diff_result.deletion_conflicts
@@ -160,7 +166,7 @@ class ResolvingDeletionConflictsState(ServerSessionState):
         pathname = pathname.replace(') does no exist.', '', 1)
         assert pathname in self._pathname_to_do
 
-        proof = Proof(message.getParameter('proof'))
+        proof = Proof(message.getParameter('proof'), self._proof_strings)
         proof.raw = message.getParameter('proof')
         self._pathname2proof[pathname] = proof
         del self._pathname_to_do[pathname]
@@ -187,11 +193,10 @@ class ResolvingDeletionConflictsState(ServerSessionState):
             self._on_task_abort,
             self._on_task_reject)
 
-        got_it = self._context.worker_pool.acquire_worker()
-        assert got_it
-        if __debug__:
-            self._context.worker_pool.track_acquire_anonymous_worker(task.pathname)
-        self._context.worker_pool.send_operation(task)
+        send_task_to_worker(self, task, task.pathname)
+
+    def _handle_command_WORKERFREE(self, command):
+        on_worker_free(self)
 
     def _on_task_complete(self, task):
         self._set_next_state(StateRegister.get('LocalDeletionState'))
@@ -275,6 +280,10 @@ class LocalDeletionState(ServerSessionState):
         ServerSessionState.__init__(self, session)
         self._pathname_to_do = {}
         self._pathname2proof = {}
+        # Pathnames and labels shared by the received proofs
+        self._proof_strings = {}
+        # Task waiting for a free worker, with its tracking pathname
+        self._waiting_task = None
         self._queues_to_listen = [
             'usercommand', 'sessioncommand', 'systemcommand',
             'servermessage'
@@ -290,6 +299,8 @@ class LocalDeletionState(ServerSessionState):
         ]
         self._pathname_to_do = {}
         self._pathname2proof = {}
+        self._proof_strings = {}
+        self._waiting_task = None
 
         diff_result = self._context.startup_synchronization
         pathnames = diff_result.content_to_delete_locally
@@ -317,7 +328,7 @@ class LocalDeletionState(ServerSessionState):
         pathname = pathname.replace(') does no exist.', '', 1)
         assert pathname in self._pathname_to_do
 
-        proof = Proof(message.getParameter('proof'))
+        proof = Proof(message.getParameter('proof'), self._proof_strings)
         proof.raw = message.getParameter('proof')
         self._pathname2proof[pathname] = proof
         del self._pathname_to_do[pathname]
@@ -338,10 +349,10 @@ class LocalDeletionState(ServerSessionState):
                                self._on_task_abort,
                                self._on_task_reject)
 
-        self._context.worker_pool.acquire_worker()
-        if __debug__:
-            self._context.worker_pool.track_acquire_anonymous_worker("DELETE_LOCAL")
-        self._context.worker_pool.send_operation(task)
+        send_task_to_worker(self, task, "DELETE_LOCAL")
+
+    def _handle_command_WORKERFREE(self, command):
+        on_worker_free(self)
 
     def _on_task_complete(self, task):
         self._set_next_state(
@@ -377,6 +388,32 @@ def sync_on_operation_rejected(operation):
     raise Exception("operation rejected")
 
 
+def send_task_to_worker(state, task, pathname):
+    """Give a task to the workers or, if none is free, keep it in the
+    state until a WORKERFREE command arrives.
+
+    @param state: the ServerSessionState sending the task
+    @param task: the task to send
+    @param pathname: the pathname the worker is tracked by
+    """
+    worker_pool = state._context.worker_pool
+    if not worker_pool.acquire_worker():
+        state.logger.debug(u"Task waits for a worker: %s" % pathname)
+        state._waiting_task = (task, pathname)
+        return
+    state._waiting_task = None
+    if __debug__:
+        worker_pool.track_acquire_anonymous_worker(pathname)
+    worker_pool.send_operation(task)
+
+
+def on_worker_free(state):
+    """Send the task that was waiting for a worker, if any."""
+    if state._waiting_task is not None:
+        task, pathname = state._waiting_task
+        send_task_to_worker(state, task, pathname)
+
+
 def on_download_integrity_error(state, command):
     """
     Attributes available in the command object:
@@ -451,6 +488,10 @@ class DownloadingDirectoriesState(ServerSessionState):
         ServerSessionState.__init__(self, session)
         self._pathname2operation = {}
         self._directories = []
+        # Pathnames and labels shared by the received proofs
+        self._proof_strings = {}
+        # Task waiting for a free worker, with its tracking pathname
+        self._waiting_task = None
         self._queues_to_listen = [
             'usercommand', 'sessioncommand', 'systemcommand',
             'servermessage', 'operation'
@@ -467,6 +508,8 @@ class DownloadingDirectoriesState(ServerSessionState):
         self._context._sync_operations = []
         self._pathname2operation = {}
         self._directories = []
+        self._proof_strings = {}
+        self._waiting_task = None
 
         # Collect all the operations to do.
         # No matter what, we have to successfully complete all these
@@ -519,7 +562,8 @@ class DownloadingDirectoriesState(ServerSessionState):
         msg = message
         trusted_basis = self._context.integrity_manager.getCurrentBasis()
         operation.download_info = {}
-        operation.download_info['proof'] = Proof(msg.getParameter('proof'))
+        operation.download_info['proof'] = Proof(msg.getParameter('proof'),
+                                                 self._proof_strings)
         operation.download_info['proof'].raw = msg.getParameter('proof')
         operation.download_info['trusted_basis'] = trusted_basis
         del self._pathname2operation[operation.pathname]
@@ -537,11 +581,10 @@ class DownloadingDirectoriesState(ServerSessionState):
                                      self._on_task_complete,
                                      self._on_task_abort,
                                      self._on_task_reject)
-        got_it = self._context.worker_pool.acquire_worker()
-        assert got_it
-        if __debug__:
-            self._context.worker_pool.track_acquire_anonymous_worker(task.pathname)
-        self._context.worker_pool.send_operation(task)
+        send_task_to_worker(self, task, task.pathname)
+
+    def _handle_command_WORKERFREE(self, command):
+        on_worker_free(self)
 
     def _on_task_complete(self, task):
         self._set_next_state(StateRegister.get('DownloadingFilesState'))
@@ -568,6 +611,8 @@ class DownloadingFilesState(ServerSessionState):
         self._num_finished_operations = 0
         self._received_all_operations = False
         self._lock = threading.Lock()
+        # Pathnames and labels shared by the received proofs
+        self._proof_strings = {}
 
     def _on_entering(self):
         self._context.id = 0
@@ -577,6 +622,7 @@ class DownloadingFilesState(ServerSessionState):
         self._num_received_operations = 0
         self._num_finished_operations = 0
         self._received_all_operations = False
+        self._proof_strings = {}
 
     def _receive_next_message(self):
         queues = [
@@ -597,13 +643,15 @@ class DownloadingFilesState(ServerSessionState):
                     self._set_next_state(StateRegister.get('SyncDoneState'))
             return
 
-        self._num_received_operations += 1
-
         if not self._context.worker_pool.acquire_worker():
-            raise FileRockException(
-                u"Concurrency trouble in %s: could not acquire a worker"
-                " although some should have been available"
-                % (self.__class__.__name__ + "._handle_file_operation"))
+            # The pool has shrunk since the worker was found free: get
+            # the operation again once a worker is released
+            self.logger.debug(u"Operation waits for a worker: %s" % operation)
+            self._context._input_queue.append(operation, 'operation')
+            self._listening_operations = False
+            return
+
+        self._num_received_operations += 1
 
         if __debug__:
             self._context.worker_pool.track_acquire_anonymous_worker(
@@ -661,7 +709,8 @@ class DownloadingFilesState(ServerSessionState):
         operation.download_info['bucket'] = msg.getParameter('bucket')
         operation.download_info['auth_token'] = msg.getParameter('auth_token')
         operation.download_info['auth_date'] = msg.getParameter('auth_date')
-        operation.download_info['proof'] = Proof(msg.getParameter('proof'))
+        operation.download_info['proof'] = Proof(msg.getParameter('proof'),
+                                                 self._proof_strings)
         operation.download_info['proof'].raw = msg.getParameter('proof')
         operation.download_info['trusted_basis'] = self._context.integrity_manager.getCurrentBasis()
         operation.download_info['remote_ip_address'] = self._context.storage_ip_address
@@ -727,35 +776,25 @@ class SyncDoneState(ServerSessionState):
         with self._context.storage_cache.transaction() as storage_cache:
 
             # Update the records of the downloaded pathnames
-            for operation in operations:
-                pathname = operation.pathname
-                lmtime = operation.lmtime
-                warebox_size = operation.warebox_size
-                storage_size = operation.storage_size
-                warebox_etag = operation.warebox_etag
-                storage_etag = operation.storage_etag
-                record = (pathname, warebox_size, storage_size,
-                        lmtime, warebox_etag, storage_etag)
-                storage_cache.update_record(*record)
+            storage_cache.update_records_bulk(
+                (operation.pathname, operation.warebox_size,
+                 operation.storage_size, operation.lmtime,
+                 operation.warebox_etag, operation.storage_etag)
+                for operation in operations)
 
             diff = self._context.startup_synchronization
 
             # Delete the records of the remotely deleted pathnames
-            for pathname in diff.remote_deletions:
-                storage_cache.delete_record(pathname)
+            storage_cache.delete_records(list(diff.remote_deletions))
 
             # Restore the records of the ignored conflicts (that is, pathnames
             # whose content is the same in the warebox and on the storage but
             # whose cache record is missing)
-            for pathname in diff.ignored_conflicts:
-                warebox_size = diff.local_size[pathname]
-                storage_size = diff.remote_size[pathname]
-                lmtime = diff.local_lmtime[pathname]
-                warebox_etag = diff.local_etag[pathname]
-                storage_etag = diff.remote_etag[pathname]
-                storage_cache.update_record(pathname, warebox_size,
-                                            storage_size, lmtime,
-                                            warebox_etag, storage_etag)
+            storage_cache.update_records_bulk(
+                (pathname, diff.local_size[pathname],
+                 diff.remote_size[pathname], diff.local_lmtime[pathname],
+                 diff.local_etag[pathname], diff.remote_etag[pathname])
+                for pathname in diff.ignored_conflicts)
 
         self.logger.debug("Finished updating the storage cache.")
 
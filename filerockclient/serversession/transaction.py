@@ -80,6 +80,8 @@ class Transaction(object):
         self.can_be_committed = threading.Event()
         self.can_be_committed.set()
         self.pathname2operation = {}
+        # Callbacks waiting for all operations to be finished, see self.notify_when_finished
+        self.finished_handlers = []
 
     def on_operation_finished(self, file_operation):
         self.logger.debug(u"An operation has been finished: %s", file_operation)
@@ -88,6 +90,11 @@ class Transaction(object):
             if len(unfinished_operations) == 0:
                 self.logger.debug(u"For now all operations in transaction are finished.")
                 self.can_be_committed.set()
+            handlers = self.finished_handlers if self.can_be_committed.is_set() else []
+            if len(handlers) > 0:
+                self.finished_handlers = []
+        for handler in handlers:
+            handler()
 
     def add_operation(self, index, operation):
         if operation.pathname in self.pathname2operation:
@@ -157,6 +164,28 @@ class Transaction(object):
         else:
             self.can_be_committed.wait()
 
+    def is_finished(self):
+        with self.lock:
+            return self._is_finished()
+
+    def _is_finished(self):
+        return len(self.operations) == 0 or self.can_be_committed.is_set()
+
+    def notify_when_finished(self, handler):
+        '''Non-blocking version of self.wait_until_finished.
+
+        The handler is called once, without arguments, as soon as all
+        operations are finished: immediately if they already are,
+        otherwise by the thread finishing the last one.
+        Pending handlers are dropped by self.clear.
+        '''
+        with self.lock:
+            finished = self._is_finished()
+            if not finished:
+                self.finished_handlers.append(handler)
+        if finished:
+            handler()
+
     def cancel_waiting(self):
         self.can_be_committed.set()
 
@@ -179,6 +208,8 @@ class Transaction(object):
             return size
 
     def clear(self):
+        with self.lock:
+            self.finished_handlers = []
         self.operations.clear()
         self.pathname2operation.clear()
         self.operations_to_authorize.clear() # This should already be empty, but whatever
@@ -82,18 +82,7 @@ class TransactionManager(object):
         return True
 
     def _find_first_missing_folder(self, pathname):
-        tokens = pathname.split('/')
-        tokens = [token for token in tokens if token != '']
-        del tokens[-1]
-        folders = []
-        folder = ''
-        for token in tokens:
-            folder = u"%s%s/" % (folder, token)
-            folders.append(folder)
-        for folder in folders:
-            if not self.storage_cache.exist_record(folder):
-                return folder
-        return None
+        return self.storage_cache.find_first_missing_ancestor(pathname)
 
     def _cancel_operation(self, operation):
         index = self.transaction.get_id(operation)
@@ -40,29 +40,158 @@ FileRock Client is licensed under GPLv3 License.
 from __future__ import division
 import httplib
 import urllib
-import urllib2
 import contextlib
 import base64
 import binascii
 import hashlib
+import os
+import time
 
 from FileRockSharedLibraries.Communication.RequestDetails import \
     ENCRYPTED_FILES_IV_HEADER
+from filerockclient.util.connection_pool import HTTPSConnectionPool
 
 
 CHUNK_SIZE = 4096
 DOWNLOAD_CHUNK_SIZE = CHUNK_SIZE * 10
 
+# Bounds of the chunks of transfers with no bandwidth limit
+MIN_ADAPTIVE_CHUNK_SIZE = 64 * 1024
+MAX_ADAPTIVE_CHUNK_SIZE = 4 * 1024 * 1024
+# Seconds that transferring a chunk should take. Termination requests
+# are checked between chunks, so this is also how promptly they are
+# honoured.
+TARGET_CHUNK_TIME = 0.25
+
 
 class TerminationException(Exception):
     pass
 
 
+class AdaptiveChunkSize(object):
+    """
+    The size of the chunks a transfer is made of, adapted to its
+    throughput.
+
+    Every chunk costs a system call, a termination check and a progress
+    update, so chunks should be as big as possible; however they must
+    be small enough for a slow connection to transfer one in about
+    TARGET_CHUNK_TIME seconds. The size starts at
+    MIN_ADAPTIVE_CHUNK_SIZE, at most doubles at each chunk and follows
+    the measured throughput, up to MAX_ADAPTIVE_CHUNK_SIZE.
+    """
+
+    def __init__(self,
+                 minimum=MIN_ADAPTIVE_CHUNK_SIZE,
+                 maximum=MAX_ADAPTIVE_CHUNK_SIZE,
+                 target_time=TARGET_CHUNK_TIME):
+        self._minimum = minimum
+        self._maximum = maximum
+        self._target_time = target_time
+        self._size = minimum
+
+    def get(self):
+        """
+        @return
+                    The size in bytes of the next chunk.
+        """
+        return self._size
+
+    def update(self, transferred, elapsed):
+        """Adapt the size to the time a chunk has taken.
+
+        @param transferred:
+                    Size in bytes of the transferred chunk.
+        @param elapsed:
+                    Seconds the transfer has taken.
+        """
+        if elapsed > 0:
+            size = int(transferred / elapsed * self._target_time)
+        else:
+            size = self._maximum
+        size = min(size, self._size * 2, self._maximum)
+        self._size = max(size, self._minimum)
+
+
+class PartialDownload(object):
+    """
+    The progress of a download that can be resumed.
+
+    Data is appended to local_pathname, which is kept on failure so
+    that the next attempt can ask the storage only for the missing
+    bytes. The MD5 of the downloaded data is updated incrementally and
+    carried across attempts; when the partial file has been left by a
+    previous run of the application it is rebuilt by reading the file
+    once, which is much cheaper than downloading it again.
+    """
+
+    def __init__(self, local_pathname):
+        """
+        @param local_pathname:
+                    Filesystem pathname of the partial file. Existing
+                    content is considered already downloaded.
+        """
+        self.local_pathname = local_pathname
+        self.offset = 0
+        self.md5 = hashlib.md5()
+        self.load()
+
+    def load(self):
+        """Synchronizes offset and MD5 with the content of the file."""
+        self.offset = 0
+        self.md5 = hashlib.md5()
+        if not os.path.exists(self.local_pathname):
+            return
+        with open(self.local_pathname, 'rb') as local_file:
+            for chunk in iter(lambda: local_file.read(DOWNLOAD_CHUNK_SIZE), ''):
+                self.update(chunk)
+
+    def check(self):
+        """Reloads the state if the file doesn't match it anymore, e.g.
+        since the last write has failed.
+        """
+        try:
+            size = os.path.getsize(self.local_pathname)
+        except OSError:
+            size = 0
+        if size != self.offset:
+            self.load()
+
+    def reset(self):
+        """Discards the downloaded data."""
+        with open(self.local_pathname, 'wb'):
+            pass
+        self.offset = 0
+        self.md5 = hashlib.md5()
+
+    def update(self, chunk):
+        """Accounts for a chunk of data appended to the file."""
+        self.md5.update(chunk)
+        self.offset += len(chunk)
+
+    def get_etag(self):
+        return binascii.hexlify(self.md5.digest())
+
+
 class StorageConnector(object):
 
-    def __init__(self, warebox, cfg):
+    def __init__(self, warebox, cfg, connection_pool=None):
+        """
+        @param warebox:
+                    Instance of filerockclient.warebox.Warebox.
+        @param cfg:
+                    Instance of filerockclient.config.ConfigManager.
+        @param connection_pool:
+                    Instance of
+                    filerockclient.util.connection_pool.HTTPSConnectionPool
+                    used for the transfers, possibly shared with other
+                    connectors. A private one is created if omitted.
+        """
         self.warebox = warebox
         self.endpoint = cfg.get('System', 'storage_endpoint')
+        if connection_pool is None:
+            connection_pool = HTTPSConnectionPool()
+        self.connection_pool = connection_pool
         ##_fix_get_http_request()
 
     def get_percentage(self, point, total):
@@ -71,11 +200,21 @@ class StorageConnector(object):
         else:
             return 100
 
-    def byte_to_send(self, bandwidth, max):
-        if bandwidth is not None:
+    def byte_to_send(self, bandwidth, chunk_size):
+        """
+        @param bandwidth:
+                    Instance of filerockclient.workers.bandwidth.Bandwidth
+                    or None.
+        @param chunk_size:
+                    Instance of AdaptiveChunkSize, used when there is no
+                    bandwidth limit.
+        @return
+                    The number of bytes to transfer in the next chunk.
+        """
+        if bandwidth is not None and bandwidth.is_enabled():
             return bandwidth.byte_to_send()
         else:
-            return max
+            return chunk_size.get()
 
     def upload_file(self,
             local_pathname, remote_pathname, remote_ip_address, bucket, token,
@@ -99,7 +238,7 @@ class StorageConnector(object):
             percentageQueue(percentage)
         try:
             with open_function(local_pathname, 'rb') as body:
-                with contextlib.closing(httplib.HTTPSConnection(address, timeout=10)) as connection:
+                with self.connection_pool.connection(address, headers['Host']) as connection:
 #                    connection.set_debuglevel(1)
 #                    connection.request('PUT', target, body, headers)
                     connection.putrequest('PUT', target, True, True)
@@ -107,21 +246,22 @@ class StorageConnector(object):
                         connection.putheader(k, v)
                     connection.endheaders()
 
-                    chunk = body.read(self.byte_to_send(bandwidth, CHUNK_SIZE))
+                    chunk_size = AdaptiveChunkSize()
+                    chunk = body.read(self.byte_to_send(bandwidth, chunk_size))
                     while len(chunk) > 0:
                         if terminationEvent is not None:
                             if terminationEvent.is_set():
                                 raise TerminationException()
-                            else:
-                                connection.send(chunk)
-                        else:
-                            connection.send(chunk)
+                        begin = time.time()
+                        connection.send(chunk)
+                        chunk_size.update(len(chunk), time.time() - begin)
                         if percentageQueue is not None:
                             uploaded += len(chunk)
+                            last_percentage = percentage
                             percentage = self.get_percentage(uploaded, file_size)
-                            if (percentage % 3 == 0):
+                            if percentage != last_percentage:
                                 percentageQueue(percentage)
-                        chunk = body.read(self.byte_to_send(bandwidth, CHUNK_SIZE))
+                        chunk = body.read(self.byte_to_send(bandwidth, chunk_size))
 
                     response = connection.getresponse()
                     result = {'success': None, 'details': {}}
@@ -151,59 +291,101 @@ class StorageConnector(object):
 
     def download_file(self, local_pathname, remote_pathname, remote_ip_address,
             bucket, token, auth_date, open_function, terminationEvent=None,
-            byte_range=None, percentageQueue=None, logger=None, bandwidth=None):
+            byte_range=None, percentageQueue=None, logger=None, bandwidth=None,
+            partial_download=None):
         """
         byte_range specifies byte range to download. Format must be like:
             1) xxx-yyy
             2) -yyy
             3) xxx-
         where xxx is starting offset and yyy is ending offset
+
+        partial_download is an optional instance of PartialDownload for
+        local_pathname. If given, the download resumes from its offset
+        and byte_range is ignored. The returned etag is the one of the
+        whole file.
         """
-        target = urllib.quote(remote_pathname.encode('utf-8'))  # Damn urllib2
-        #url = 'http://%s.%s/%s' % (bucket, self.endpoint, target)
-        url = 'https://%s/%s' % (remote_ip_address, target)
+        if partial_download is not None:
+            partial_download.check()
+            if partial_download.offset > 0:
+                byte_range = '%s-' % partial_download.offset
+        target = urllib.quote('/%s' % remote_pathname.encode('utf-8'))
         headers = {}
         headers['Host'] = '%s.%s' % (bucket, self.endpoint)
         headers['Date'] = auth_date
         headers['Authorization'] = token
         if byte_range is not None: headers['Range'] = "bytes=%s" % byte_range
-        request = urllib2.Request(url, None, headers)
         downloaded = 0
 
         try:
-            with contextlib.closing(urllib2.urlopen(request)) as remote_file:
-                with open_function(local_pathname, 'wb') as local_file:
-                    file_size = int(remote_file.info()['Content-Length'])
-                    percentage = self.get_percentage(downloaded, file_size)
+            with self.connection_pool.connection(remote_ip_address, headers['Host']) as connection:
+                connection.request('GET', target, None, headers)
+                response = connection.getresponse()
+
+                if response.status not in (200, 206):
+                    # Read the body anyway, so that the connection can be
+                    # reused
+                    response.read()
+                    if response.status == 416 and partial_download is not None:
+                        # Range not satisfiable, the partial file can't be
+                        # trusted. Next attempt will start from scratch.
+                        partial_download.reset()
+                    result = {'success': False, 'details': {}}
+                    result['details']['status'] = response.status
+                    result['details']['reason'] = response.reason
+                    result['details']['headers'] = '%s' % response.getheaders()
+                    result['details']['body'] = None
+                    return result
+
+                if partial_download is None:
+                    mode = 'wb'
                     etag = hashlib.md5()
+                elif response.status == 206:
+                    self._check_content_range(response, partial_download.offset)
+                    mode = 'ab'
+                    downloaded = partial_download.offset
+                    etag = partial_download
+                else:
+                    # The storage has ignored the range, start again
+                    partial_download.reset()
+                    mode = 'wb'
+                    etag = partial_download
+
+                with open_function(local_pathname, mode) as local_file:
+                    file_size = downloaded + int(response.getheader('Content-Length'))
+                    percentage = self.get_percentage(downloaded, file_size)
 
-                    chunk = remote_file.read(self.byte_to_send(bandwidth, DOWNLOAD_CHUNK_SIZE))
+                    chunk_size = AdaptiveChunkSize()
+                    begin = time.time()
+                    chunk = response.read(self.byte_to_send(bandwidth, chunk_size))
 
                     while len(chunk) > 0:
+                        chunk_size.update(len(chunk), time.time() - begin)
                         if terminationEvent is not None:
                             if terminationEvent.is_set():
                                 raise TerminationException()
-                            else:
-                                local_file.write(chunk)
-                        else:
-                            local_file.write(chunk)
+                        local_file.write(chunk)
 
                         etag.update(chunk)
 
                         if percentageQueue is not None:
                             downloaded += len(chunk)
+                            last_percentage = percentage
                             percentage = self.get_percentage(downloaded, file_size)
-                            if (percentage % 2 == 0):
+                            if percentage != last_percentage:
                                 percentageQueue(percentage)
-                        chunk = remote_file.read(self.byte_to_send(bandwidth, DOWNLOAD_CHUNK_SIZE))
+                        begin = time.time()
+                        chunk = response.read(self.byte_to_send(bandwidth, chunk_size))
 
-#                    local_file.write(remote_file.read())
                     result = {'success': True, 'details': {}}
-                    result['details']['status'] = 200
+                    result['details']['status'] = response.status
                     result['details']['reason'] = None
-                    result['details']['headers'] = '%s' % remote_file.info()
+                    result['details']['headers'] = '%s' % response.getheaders()
                     result['details']['body'] = None
-                    result['etag'] = binascii.hexlify(etag.digest())
+                    if partial_download is None:
+                        result['etag'] = binascii.hexlify(etag.digest())
+                    else:
+                        result['etag'] = partial_download.get_etag()
                     return result
 
         except TerminationException as e:
@@ -216,28 +398,8 @@ class StorageConnector(object):
             result['details']['termination'] = True
             return result
 
-        except urllib2.URLError as e:
-            result = {'success': False, 'details': {}}
-            result['details']['status'] = None
-            result['details']['reason'] = None
-            result['details']['headers'] = None
-            result['details']['body'] = None
-
-            if hasattr(e, 'code'):
-                # Only for HTTPError
-                result['details']['status'] = e.code
-
-            if hasattr(e, 'reason'):
-                # Only for URLError (Damn urllib2)
-                result['details']['reason'] = e.reason
-
-            if hasattr(e, 'info'):
-                # Only for HTTPError
-                result['details']['headers'] = '%s' % e.info()
-
-            return result
-
         except Exception as e:
+            # Note: connection timeouts raise socket.error
             result = {'success': False, 'details': {}}
             result['details']['status'] = None
             result['details']['reason'] = u'%r' % e
@@ -245,6 +407,14 @@ class StorageConnector(object):
             result['details']['body'] = None
             return result
 
+    def _check_content_range(self, response, offset):
+        """Makes sure that a partial response starts at the given offset."""
+        content_range = response.getheader('Content-Range', '')
+        if not content_range.startswith('bytes %s-' % offset):
+            raise Exception(
+                'Unexpected Content-Range "%s" resuming from offset %s'
+                % (content_range, offset))
+
     def check_connection(self):
         with contextlib.closing(httplib.HTTPConnection(self.endpoint)) as connection:
             #connection.set_debuglevel(1)
@@ -278,4 +448,73 @@ class StorageConnector(object):
 
 
 if __name__ == '__main__':
-    pass
+    import sys
+    import tempfile
+
+    class DiscardingConnection(object):
+        ''' An HTTP connection to an infinitely fast storage '''
+
+        def putrequest(self, *args):
+            pass
+
+        def putheader(self, *args):
+            pass
+
+        def endheaders(self):
+            pass
+
+        def send(self, data):
+            pass
+
+        def getresponse(self):
+            class Response(object):
+                status = 200
+                reason = 'OK'
+
+                def getheaders(self):
+                    return []
+
+                def read(self):
+                    return ''
+            return Response()
+
+    class DiscardingPool(HTTPSConnectionPool):
+
+        @contextlib.contextmanager
+        def connection(self, address, host):
+            yield DiscardingConnection()
+
+    class Config(object):
+
+        def get(self, section, option):
+            return 'storage.endpoint'
+
+    class FixedChunkConnector(StorageConnector):
+        ''' The former strategy: 1 KB chunks when there is no limit '''
+
+        def byte_to_send(self, bandwidth, chunk_size):
+            return 1024
+
+    def upload_test(connector_class, pathname, size):
+        ''' CPU time spent by the client to upload a file '''
+        connector = connector_class(None, Config(), DiscardingPool())
+        begin = time.clock()
+        result = connector.upload_file(
+            pathname, u'file', '127.0.0.1', 'bucket', 'token', 'date', open,
+            file_md5='0' * 32, file_size=size,
+            percentageQueue=lambda percentage: None)
+        end = time.clock()
+        assert result['success'], result
+        gigabytes = size / (1024 * 1024 * 1024)
+        print "%s: %s MB" % (connector_class.__name__, size // (1024 * 1024))
+        print "> %s CPU seconds per GB" % ((end - begin) / gigabytes)
+
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    size *= 1024 * 1024
+    with tempfile.NamedTemporaryFile() as f:
+        block = os.urandom(1024 * 1024)
+        for _ in xrange(size // len(block)):
+            f.write(block)
+        f.flush()
+        upload_test(FixedChunkConnector, f.name, size)
+        upload_test(StorageConnector, f.name, size)
@@ -43,6 +43,13 @@ from itertools import izip, repeat
 
 
 from filerockclient.interfaces import GStatuses, GStatus, PStatuses
+from filerockclient.config import USER_DEFINED_OPTIONS
+
+
+# Options which can be changed without restarting the client
+BANDWIDTH_OPTIONS = set([
+    (USER_DEFINED_OPTIONS, u'bandwidth_limit_upload'),
+    (USER_DEFINED_OPTIONS, u'bandwidth_limit_download')])
 
 
 class ClientFacade(object):
@@ -93,8 +100,21 @@ class ClientFacade(object):
         return self._core._warebox_need_merge(warebox_path)
 
     def apply_config(self, cfg):
+        old_cfg = self._core.cfg.to_dict()
         self._core.cfg.from_dict(cfg)
         self._core.cfg.write_to_file()
+        changed = set((section, option)
+                      for section in cfg
+                      for option, value in cfg[section].iteritems()
+                      if old_cfg.get(section, {}).get(option) != unicode(value))
+        if len(changed) > 0 and changed <= BANDWIDTH_OPTIONS:
+            # No need to restart for changing the bandwidth limits
+            self._core.set_bandwidth_limits(
+                self._core.cfg.getint(USER_DEFINED_OPTIONS,
+                                      u'bandwidth_limit_upload'),
+                self._core.cfg.getint(USER_DEFINED_OPTIONS,
+                                      u'bandwidth_limit_download'))
+            return
         if 'warebox_path' in cfg['Application Paths']:
             self._core._change_warebox_path(cfg['Application Paths']['warebox_path'])
         if 'osx_label_shellext' in cfg['User Defined Options'] \
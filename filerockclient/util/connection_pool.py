@@ -0,0 +1,273 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+This is the connection_pool module.
+
+Keeps alive the HTTPS connections toward the storage, so that
+transferring many small files doesn't pay a TCP and TLS handshake for
+each one of them.
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+import httplib
+import select
+import socket
+import time
+import threading
+import logging
+import contextlib
+
+
+DEFAULT_TIMEOUT = 10
+MAX_IDLE_CONNECTIONS_PER_ENDPOINT = 4
+MAX_IDLE_TIME = 30
+
+
+class HTTPSConnectionPool(object):
+    """
+    A thread-safe pool of persistent HTTPS connections.
+
+    Connections are grouped by endpoint, that is, by the (address, host)
+    pair they have been opened for. A connection is given back to the
+    pool only when the last request has been completed and its response
+    has been fully read; any error while using it makes it discarded.
+    Idle connections are closed after MAX_IDLE_TIME seconds and are
+    checked to be still alive before being reused, since the storage
+    can close them at any time.
+
+    Usage:
+
+        with pool.connection(address, host) as connection:
+            connection.request(...)
+            response = connection.getresponse()
+            response.read()
+    """
+
+    def __init__(self,
+                 timeout=DEFAULT_TIMEOUT,
+                 max_idle_connections=MAX_IDLE_CONNECTIONS_PER_ENDPOINT,
+                 max_idle_time=MAX_IDLE_TIME):
+        """
+        @param timeout:
+                    Socket timeout in seconds of the created connections.
+        @param max_idle_connections:
+                    Maximum number of idle connections kept for each
+                    endpoint.
+        @param max_idle_time:
+                    Number of seconds after which an idle connection
+                    gets closed.
+        """
+        self.logger = logging.getLogger("FR.%s" % self.__class__.__name__)
+        self._timeout = timeout
+        self._max_idle_connections = max_idle_connections
+        self._max_idle_time = max_idle_time
+        self._lock = threading.Lock()
+        # endpoint -> list of (connection, release time), most recently
+        # released last
+        self._idle = {}
+        self._endpoints = {}
+        self._created = 0
+        self._reused = 0
+        self._discarded = 0
+        self._evicted = 0
+
+    @contextlib.contextmanager
+    def connection(self, address, host):
+        """Context manager that lends a connection for the endpoint.
+
+        The connection is given back to the pool on exit, unless an
+        exception has been raised.
+
+        @param address:
+                    Network address to connect to.
+        @param host:
+                    Value of the "Host" HTTP header that will be sent.
+        """
+        connection = self.get_connection(address, host)
+        try:
+            yield connection
+        except:
+            self.discard_connection(connection)
+            raise
+        self.release_connection(connection)
+
+    def get_connection(self, address, host):
+        """Get an alive idle connection for the endpoint, or a new one.
+
+        @param address:
+                    Network address to connect to.
+        @param host:
+                    Value of the "Host" HTTP header that will be sent.
+        @return
+                    Instance of httplib.HTTPSConnection.
+        """
+        endpoint = (address, host)
+        now = time.time()
+        to_close = []
+        connection = None
+        with self._lock:
+            to_close.extend(self._evict_expired(now))
+            idle = self._idle.get(endpoint, [])
+            while len(idle) > 0 and connection is None:
+                candidate, _ = idle.pop()
+                if _is_connection_dropped(candidate):
+                    to_close.append(candidate)
+                    self._discarded += 1
+                else:
+                    connection = candidate
+                    self._reused += 1
+            if connection is None:
+                self._created += 1
+        for dead in to_close:
+            dead.close()
+        if connection is None:
+            connection = httplib.HTTPSConnection(address,
+                                                 timeout=self._timeout)
+        self._endpoints[id(connection)] = endpoint
+        return connection
+
+    def release_connection(self, connection):
+        """Give back a connection whose last response has been fully read.
+
+        Connections closed by the server (e.g. "Connection: close") are
+        not kept.
+        """
+        endpoint = self._endpoints.pop(id(connection), None)
+        if endpoint is None or connection.sock is None:
+            connection.close()
+            return
+        to_close = []
+        with self._lock:
+            idle = self._idle.setdefault(endpoint, [])
+            idle.append((connection, time.time()))
+            if len(idle) > self._max_idle_connections:
+                old_connection, _ = idle.pop(0)
+                to_close.append(old_connection)
+                self._evicted += 1
+        for old_connection in to_close:
+            old_connection.close()
+
+    def discard_connection(self, connection):
+        """Close a connection that can't be reused, e.g. since a
+        transfer has been interrupted in the middle.
+        """
+        self._endpoints.pop(id(connection), None)
+        with self._lock:
+            self._discarded += 1
+        connection.close()
+
+    def _evict_expired(self, now):
+        """Remove from the pool the connections idle since too long.
+
+        Must be called holding self._lock.
+
+        @return
+                    The list of removed connections, to be closed.
+        """
+        expired = []
+        for endpoint, idle in self._idle.items():
+            alive = []
+            for connection, release_time in idle:
+                if now - release_time > self._max_idle_time:
+                    expired.append(connection)
+                else:
+                    alive.append((connection, release_time))
+            if len(alive) > 0:
+                self._idle[endpoint] = alive
+            else:
+                del self._idle[endpoint]
+        self._evicted += len(expired)
+        return expired
+
+    def close_all(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+        for connections in idle.itervalues():
+            for connection, _ in connections:
+                connection.close()
+
+    def get_reuse_ratio(self):
+        """
+        @return
+                    The fraction of lent connections that were reused
+                    rather than created, in [0, 1].
+        """
+        with self._lock:
+            total = self._created + self._reused
+            if total == 0:
+                return 0.0
+            return float(self._reused) / total
+
+    def get_stats(self):
+        """
+        @return
+                    Dictionary with the counters of created, reused,
+                    discarded (broken or dropped by the server) and
+                    evicted (idle for too long) connections, the number
+                    of currently idle connections and the reuse ratio.
+        """
+        ratio = self.get_reuse_ratio()
+        with self._lock:
+            return {
+                'created': self._created,
+                'reused': self._reused,
+                'discarded': self._discarded,
+                'evicted': self._evicted,
+                'idle': sum(len(idle) for idle in self._idle.itervalues()),
+                'reuse_ratio': ratio
+            }
+
+
+def _is_connection_dropped(connection):
+    """Tell whether an idle connection can't be used anymore.
+
+    An idle keep-alive socket has nothing to read: if select() reports
+    it as readable, the server has either closed it or sent something
+    unexpected. Either way it can't be reused.
+    """
+    sock = connection.sock
+    if sock is None:
+        return True
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+    except (select.error, socket.error, ValueError):
+        return True
+    return len(readable) > 0
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,233 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Index of a set of pathnames answering hierarchy queries.
+
+Pathnames are in the warebox internal format: relative, forward slash
+separated, with a trailing slash for directories. The trie has a node
+for each pathname component, so that asking for the descendants or the
+ancestors of a pathname costs time proportional to its depth rather
+than to the number of indexed pathnames. Ancestry is decided on whole
+components: "a/" is an ancestor of "a/b", while "a" isn't an ancestor
+of "ab".
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+
+class _Node(object):
+    __slots__ = ('children', 'present', 'size')
+
+    def __init__(self):
+        # component -> _Node
+        self.children = {}
+        # Whether the pathname ending at this node belongs to the set
+        self.present = False
+        # Number of pathnames of the set in the subtree, this included
+        self.size = 0
+
+
+class PathnameTrie(object):
+    """
+    A set of pathnames, indexed by their components.
+
+    Every operation costs O(depth of the pathname), except for the
+    enumerations, which cost O(depth + number of returned pathnames).
+    Not thread-safe.
+    """
+
+    def __init__(self, pathnames=()):
+        """
+        @param pathnames:
+                    Iterable of pathnames to initially add.
+        """
+        self._root = _Node()
+        for pathname in pathnames:
+            self.add(pathname)
+
+    def add(self, pathname):
+        """
+        @return
+                    True if pathname wasn't in the set yet.
+        """
+        path = [self._root]
+        node = self._root
+        for component in _split(pathname):
+            child = node.children.get(component)
+            if child is None:
+                child = node.children[component] = _Node()
+            node = child
+            path.append(node)
+        if node.present:
+            return False
+        node.present = True
+        for node in path:
+            node.size += 1
+        return True
+
+    def remove(self, pathname):
+        """
+        @return
+                    True if pathname was in the set.
+        """
+        components = _split(pathname)
+        path = self._find_path(components)
+        if path is None or not path[-1].present:
+            return False
+        path[-1].present = False
+        for node in path:
+            node.size -= 1
+        # Prune the nodes left without pathnames
+        for i in xrange(len(components), 0, -1):
+            if path[i].size > 0:
+                break
+            del path[i - 1].children[components[i - 1]]
+        return True
+
+    def clear(self):
+        self._root = _Node()
+
+    def __contains__(self, pathname):
+        node = self._find(pathname)
+        return node is not None and node.present
+
+    def __len__(self):
+        return self._root.size
+
+    def __iter__(self):
+        return self.iter_descendants(u'')
+
+    def count_descendants(self, pathname):
+        """
+        @return
+                    The number of pathnames of the set that are proper
+                    descendants of pathname.
+        """
+        node = self._find(pathname)
+        if node is None:
+            return 0
+        return node.size - (1 if node.present else 0)
+
+    def iter_descendants(self, pathname, postorder=False):
+        """Iterate over the pathnames of the set that are proper
+        descendants of pathname, in lexicographic order of components.
+
+        @param postorder:
+                    If True, descendants are returned after their own
+                    descendants (e.g. deleting them in this order
+                    never leaves a folder with content), otherwise
+                    before them.
+        """
+        node = self._find(pathname)
+        if node is None:
+            return iter([])
+        return self._iter_subtree(pathname, node, postorder)
+
+    def _iter_subtree(self, pathname, node, postorder):
+        for component in sorted(node.children):
+            child = node.children[component]
+            child_pathname = pathname + component
+            if child.present and not postorder:
+                yield child_pathname
+            for descendant in self._iter_subtree(
+                                    child_pathname, child, postorder):
+                yield descendant
+            if child.present and postorder:
+                yield child_pathname
+
+    def nearest_ancestor(self, pathname):
+        """
+        @return
+                    The deepest proper ancestor of pathname belonging to
+                    the set, None if there is none.
+        """
+        nearest = None
+        ancestor = u''
+        node = self._root
+        for component in _split(pathname)[:-1]:
+            node = node.children.get(component)
+            if node is None:
+                break
+            ancestor += component
+            if node.present:
+                nearest = ancestor
+        return nearest
+
+    def first_missing_ancestor(self, pathname):
+        """
+        @return
+                    The shallowest proper ancestor of pathname not
+                    belonging to the set, None if they all belong to it.
+        """
+        ancestor = u''
+        node = self._root
+        for component in _split(pathname)[:-1]:
+            ancestor += component
+            if node is not None:
+                node = node.children.get(component)
+            if node is None or not node.present:
+                return ancestor
+        return None
+
+    def _find(self, pathname):
+        path = self._find_path(_split(pathname))
+        return path[-1] if path is not None else None
+
+    def _find_path(self, components):
+        node = self._root
+        path = [node]
+        for component in components:
+            node = node.children.get(component)
+            if node is None:
+                return None
+            path.append(node)
+        return path
+
+
+def _split(pathname):
+    """
+    @return
+                The list of components of pathname, each one with its
+                trailing slash if it's a directory. E.g.: u'a/b/c' gives
+                [u'a/', u'b/', u'c'].
+    """
+    parts = pathname.split(u'/')
+    components = [part + u'/' for part in parts[:-1]]
+    if parts[-1] != u'':
+        components.append(parts[-1])
+    return components
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,145 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+"""
+This is the resizable_semaphore module.
+
+A bounded semaphore whose number of permits can change at runtime.
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+import threading
+
+
+class ResizableSemaphore(object):
+    """
+    A bounded semaphore counting the free workers of a pool whose size
+    changes over time.
+
+    Growing the pool adds free permits at once. Shrinking it never
+    takes permits away from the free ones: the removed permits are
+    retired as they are released, so a thread that has just seen a
+    free permit can still acquire it, and the number of permits in use
+    reaches the new capacity as the running tasks finish. As with
+    threading.BoundedSemaphore, releasing more permits than have been
+    acquired raises ValueError.
+    """
+
+    def __init__(self, value=1):
+        """
+        @param value:
+                    The initial number of permits, all free.
+        """
+        if value < 0:
+            raise ValueError("semaphore initial value must be >= 0")
+        self._cond = threading.Condition(threading.Lock())
+        self._capacity = value
+        self._value = value
+        # Permits that will be removed when released
+        self._debt = 0
+
+    def acquire(self, blocking=True):
+        """
+        @return
+                    True if a permit has been acquired, False otherwise.
+        """
+        with self._cond:
+            while self._value == 0:
+                if not blocking:
+                    return False
+                self._cond.wait()
+            self._value -= 1
+            return True
+
+    __enter__ = acquire
+
+    def release(self):
+        with self._cond:
+            if self._debt > 0:
+                self._debt -= 1
+                return
+            if self._value >= self._capacity:
+                raise ValueError("Semaphore released too many times")
+            self._value += 1
+            self._cond.notify()
+
+    def __exit__(self, t, v, tb):
+        self.release()
+
+    def resize(self, capacity):
+        """Change the total number of permits.
+
+        @param capacity:
+                    The new number of permits, free or in use.
+        """
+        if capacity < 0:
+            raise ValueError("semaphore capacity must be >= 0")
+        with self._cond:
+            delta = capacity - self._capacity
+            self._capacity = capacity
+            if delta > 0:
+                # Growing cancels the removals still pending
+                cancelled = min(delta, self._debt)
+                self._debt -= cancelled
+                self._value += delta - cancelled
+                self._cond.notify(delta - cancelled)
+            elif delta < 0:
+                self._debt += -delta
+
+    def get_capacity(self):
+        with self._cond:
+            return self._capacity
+
+    def get_value(self):
+        """
+        @return
+                    The number of free permits, which may exceed the
+                    capacity until the removed permits are retired.
+        """
+        with self._cond:
+            return self._value
+
+    def get_in_use(self):
+        """
+        @return
+                    The number of acquired permits not released yet,
+                    including those that will be removed when released.
+        """
+        with self._cond:
+            return self._capacity + self._debt - self._value
+
+
+if __name__ == '__main__':
+    pass
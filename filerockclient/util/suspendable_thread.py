@@ -39,6 +39,8 @@ FileRock Client is licensed under GPLv3 License.
 
 from threading import Thread, Event, Condition
 
+from filerockclient.databases.sqlite_driver import close_thread_connections
+
 
 class ConcurrentSuspensionException(Exception):
     ''' Raised when more than one thread try to control the same Suspendee '''
@@ -86,8 +88,11 @@ class SuspendableThread(Thread):
         '''
         The old good threading.Thread's run() method.
         '''
-        self._check_suspension()
-        self._main()
+        try:
+            self._check_suspension()
+            self._main()
+        finally:
+            close_thread_connections()
         self.__terminated.set()
 
     def _main(self):
@@ -43,7 +43,6 @@ FileRock Client is licensed under GPLv3 License.
 """
 
 import os
-import hashlib
 import contextlib
 import binascii
 import sys
@@ -52,10 +51,14 @@ import time
 import datetime
 import distutils.dir_util
 import shutil
+import threading
 from StringIO import StringIO
 
 from filerockclient.exceptions import FileRockException, ExecutionInterrupted
-from filerockclient.databases.warebox_cache import WareboxCache
+from filerockclient.databases.warebox_cache import WareboxCache, \
+    WareboxCacheMirror
+from filerockclient.warebox_scanner import WareboxScanner
+from filerockclient.hashing_engine import HashingEngine
 from filerockclient.blacklist.blacklist import Blacklist
 from filerockclient.blacklist.blacklisted_expressions import \
     BLACKLISTED_DIRS, BLACKLISTED_FILES, CONTAINS_PATTERN, EXTENTIONS
@@ -134,6 +137,13 @@ class Warebox(object):
                                    EXTENTIONS)
         self.cache = WareboxCache(cfg.get('Application Paths',
                                           'warebox_cache_db'))
+        self._cache_mirror = None
+        self._cache_mirror_users = 0
+        self._cache_mirror_lock = threading.Lock()
+        self.scanner = WareboxScanner(self._warebox_path,
+                                      self.is_blacklisted)
+        self.hashing_engine = HashingEngine(
+            self.compute_md5_hex, cfg.getint('Client', 'hashing_threads'))
 
     def get_warebox_path(self):
         """
@@ -483,10 +493,95 @@ class Warebox(object):
             if not recursive:
                 break
 
-        all_pathnames = set(self.cache.get_all_keys())
-        self.cache.delete_records(all_pathnames.difference(set(pathnames)))
+        self._forget_cached_pathnames_except(pathnames)
         return pathnames
 
+    def scan_content(self,
+                     folder=u'',
+                     recursive=True,
+                     blacklisted=True,
+                     interruption=None):
+        """Get the list of pathnames contained in the given folder,
+        together with their size and last modification time.
+
+        Same as get_content() but much faster than calling get_size()
+        and get_last_modification_time() on the pathnames it returns,
+        since the metadata are collected while listing the directories.
+        See filerockclient.warebox_scanner.
+
+        @param folder:
+                    A warebox relative directory of the warebox to whom
+                    read the content.
+        @param recursive:
+                    Boolean telling whether the scan should be recursive.
+        @param blacklisted:
+                    Boolean telling whether blacklisted pathnames must
+                    be returned too.
+        @param interruption:
+                    Optional event object, the scan raises
+                    ExecutionInterrupted as soon as it gets set.
+        @return
+                    List of (pathname, size, lmtime) tuples, sorted by
+                    pathname.
+        """
+        entries = self.scanner.scan(folder, recursive, blacklisted,
+                                    interruption)
+        self._forget_cached_pathnames_except(
+            [pathname for (pathname, _, _) in entries])
+        return entries
+
+    def _forget_cached_pathnames_except(self, pathnames):
+        """Delete from the cache the pathnames no more in the warebox.
+
+        @param pathnames:
+                    Iterable of the pathnames found by the last scan.
+        """
+        mirror = self._cache_mirror
+        if mirror is not None:
+            mirror.flush()
+        all_pathnames = set(self.cache.get_all_keys())
+        to_delete = list(all_pathnames.difference(set(pathnames)))
+        if mirror is not None:
+            mirror.delete_records(to_delete)
+        else:
+            self.cache.delete_records(to_delete)
+
+    def load_cache_mirror(self):
+        """Load the internal cache into memory.
+
+        Until release_cache_mirror() is called, etags are looked up and
+        updated in memory, which is much faster when computing the etag
+        of many pathnames. Modifications are persisted by
+        flush_cache_mirror() or when the mirror is released.
+        Calls can be nested, e.g. by different threads; the mirror is
+        loaded by the first one and released by the last one.
+        """
+        with self._cache_mirror_lock:
+            if self._cache_mirror_users == 0:
+                mirror = WareboxCacheMirror(self.cache)
+                mirror.load()
+                self._cache_mirror = mirror
+            self._cache_mirror_users += 1
+
+    def flush_cache_mirror(self):
+        """Persist the modifications made to the in-memory cache, if it
+        has been loaded.
+        """
+        mirror = self._cache_mirror
+        if mirror is not None:
+            mirror.flush()
+
+    def release_cache_mirror(self):
+        """Persist and drop the in-memory cache loaded by
+        load_cache_mirror().
+        """
+        with self._cache_mirror_lock:
+            self._cache_mirror_users -= 1
+            if self._cache_mirror_users == 0:
+                mirror = self._cache_mirror
+                self._cache_mirror = None
+                mirror.flush()
+
     def get_size(self, pathname):
         """
         @param pathname:
@@ -529,14 +624,30 @@ class Warebox(object):
         @return
                     Boolean.
         """
-        if self.cache.exist_record(pathname):
-            _, csize, clmtime, cetag = self.cache.get_record(pathname)
-            if (clmtime == unicode(self.get_last_modification_time(pathname)))\
-            and (csize) == self.get_size(pathname):
-                return False
-        return True
+        return self._get_cached_etag(pathname) is None
 
-    def compute_md5(self, pathname):
+    def _get_cached_etag(self, pathname):
+        """
+        @param pathname:
+                    A warebox relative pathname.
+        @return
+                    The etag of the pathname from the internal cache,
+                    or None if it isn't there or it's out of date.
+        """
+        mirror = self._cache_mirror
+        if mirror is not None:
+            record = mirror.get_record(pathname)
+        else:
+            record = self.cache.get_record(pathname)
+        if record is None:
+            return None
+        _, csize, clmtime, cetag = record
+        if (clmtime == unicode(self.get_last_modification_time(pathname)))\
+        and (csize) == self.get_size(pathname):
+            return cetag
+        return None
+
+    def compute_md5(self, pathname, interruption=None):
         """Compute the binary MD5 hash of the given pathname.
 
         Raises CantReadPathnameException is the pathname can't be opened
@@ -544,17 +655,17 @@ class Warebox(object):
 
         @param pathname:
                     A warebox relative pathname.
+        @param interruption:
+                    Optional event object, hashing raises
+                    ExecutionInterrupted as soon as it gets set.
         @return
                     The binary MD5 hash of the pathname content.
         """
 
         def aux():
             """Auxiliary function which actually does the work."""
-            md5 = hashlib.md5()
             with self.open(pathname) as file_:
-                for chunk in iter(lambda: file_.read(8192), ''):
-                    md5.update(chunk)
-            return md5.digest()
+                return self.hashing_engine.md5(file_, interruption)
 
         counter = 0
         final_md5 = None
@@ -590,12 +701,13 @@ class Warebox(object):
         @param md5_hex:
                     The hexadecimal MD5 hash of the pathname content.
         """
-        if self.cache.exist_record(pathname):
-            self.cache.update_record_fields(
+        mirror = self._cache_mirror
+        if mirror is not None:
+            mirror.update_record(
                 pathname,
-                size=self.get_size(pathname),
-                lmtime=self.get_last_modification_time(pathname),
-                etag=md5_hex)
+                self.get_size(pathname),
+                self.get_last_modification_time(pathname),
+                md5_hex)
         else:
             self.cache.update_record(
                 unicode(pathname),
@@ -603,24 +715,48 @@ class Warebox(object):
                 self.get_last_modification_time(pathname),
                 md5_hex)
 
-    def compute_md5_hex(self, pathname):
+    def compute_md5_hex(self, pathname, interruption=None):
         """Compute the hexadecimal text representation of the MD5 hash
         of the given pathname's data.
 
         @param pathname:
                     A warebox relative pathname.
+        @param interruption:
+                    Optional event object, hashing raises
+                    ExecutionInterrupted as soon as it gets set.
         @return
                     The hexadecimal MD5 hash of the pathname content.
         """
-        if not self._is_new(pathname):
-            _, _, _, etag = self.cache.get_record(pathname)
+        etag = self._get_cached_etag(pathname)
+        if etag is not None:
             return etag
 
-        md5_hex = binascii.hexlify(self.compute_md5(pathname))
+        md5_hex = binascii.hexlify(self.compute_md5(pathname, interruption))
         self._update_cache(pathname, md5_hex)
 
         return md5_hex
 
+    def compute_etags(self, pathnames, sizes=None, interruption=None):
+        """Compute the etags of many pathnames in parallel.
+
+        See compute_md5_hex() and filerockclient.hashing_engine.
+
+        @param pathnames:
+                    List of warebox relative pathnames.
+        @param sizes:
+                    Optional dictionary mapping pathnames to their
+                    size, used to hash the biggest ones first.
+        @param interruption:
+                    Optional event object, the computation raises
+                    ExecutionInterrupted as soon as it gets set.
+        @return
+                    A tuple (etags, failed): a dictionary mapping
+                    pathnames to their etag and the list of pathnames
+                    that couldn't be read.
+        """
+        return self.hashing_engine.compute_etags(
+            pathnames, sizes, interruption)
+
     def rename(self, pathname_from, pathname_to, prefix=None):
         """Rename an element in the warebox.
 
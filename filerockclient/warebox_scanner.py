@@ -0,0 +1,319 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Single-pass, parallel scanner of the warebox content.
+
+Warebox.get_content() walks the warebox with os.walk and leaves to the
+caller the job of asking size and modification time of each pathname,
+which costs several os.stat calls per file. The scanner collects the
+pathname, its type, its size and its modification time while listing
+each directory, touching every entry with a single stat call (none at
+all on platforms where the "scandir" module gets them from the
+directory listing itself).
+Subdirectories are listed in parallel by a bounded pool of threads:
+most of the time is spent waiting for the filesystem, which releases
+the GIL.
+
+The "scandir" module is an optional dependency, we fall back on
+os.listdir and os.lstat if it isn't installed.
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+import os
+import stat
+import datetime
+import threading
+import Queue
+
+from filerockclient.exceptions import ExecutionInterrupted
+from filerockclient.util.utilities import fastjoin
+
+try:
+    from scandir import scandir as _scandir
+except ImportError:
+    _scandir = None
+
+
+DEFAULT_SCANNER_THREADS = 4
+
+
+class WareboxScanner(object):
+    """
+    Lists the content of a directory tree together with the metadata
+    of each pathname.
+
+    Pathnames are produced in the warebox internal format: relative to
+    the root, forward slash separated, with a trailing slash for
+    directories. Each entry of the scan result is a tuple:
+
+        (pathname, size, lmtime)
+
+    where size is 0 for directories and lmtime is a datetime object,
+    the same values returned by Warebox.get_size() and
+    Warebox.get_last_modification_time().
+
+    The filtering rules are the same of Warebox.get_content(): regular
+    files and directories are returned, other file types aren't;
+    symbolic links are followed to tell the type of their target, but
+    the scan doesn't descend into linked directories.
+    """
+
+    def __init__(self, root_path, is_blacklisted,
+                 max_threads=DEFAULT_SCANNER_THREADS):
+        """
+        @param root_path:
+                    Filesystem absolute pathname of the root of the
+                    tree to scan, as unicode.
+        @param is_blacklisted:
+                    Callable telling whether a relative pathname is
+                    blacklisted. Must be thread-safe.
+        @param max_threads:
+                    Maximum number of threads listing directories in
+                    parallel. With 1 the scan is done in the calling
+                    thread.
+        """
+        self._root_path = root_path
+        self._is_blacklisted = is_blacklisted
+        self._max_threads = max(1, max_threads)
+
+    def scan(self, folder=u'', recursive=True, blacklisted=True,
+             interruption=None):
+        """Get the content of the given folder together with its
+        metadata.
+
+        @param folder:
+                    A relative directory pathname, the root of the
+                    tree if omitted.
+        @param recursive:
+                    Boolean telling whether the scan should be recursive.
+        @param blacklisted:
+                    Boolean telling whether the blacklist is active,
+                    that is, if blacklisted pathnames must be skipped.
+        @param interruption:
+                    Optional threading.Event object. When set, the scan
+                    is aborted by raising ExecutionInterrupted.
+        @return
+                    List of (pathname, size, lmtime) tuples, sorted by
+                    pathname.
+        """
+        if folder != u'' and not folder.endswith(u'/'):
+            folder += u'/'
+        if not recursive or self._max_threads == 1:
+            entries = self._serial_scan(
+                folder, recursive, blacklisted, interruption)
+        else:
+            entries = self._parallel_scan(folder, blacklisted, interruption)
+        entries.sort()
+        return entries
+
+    def _check_interruption(self, interruption):
+        if interruption is not None and interruption.is_set():
+            raise ExecutionInterrupted()
+
+    def _serial_scan(self, folder, recursive, blacklisted, interruption):
+        entries = []
+        to_visit = [folder]
+        while len(to_visit) > 0:
+            self._check_interruption(interruption)
+            subfolders = self._scan_folder(
+                to_visit.pop(), blacklisted, entries)
+            if recursive:
+                to_visit.extend(subfolders)
+        return entries
+
+    def _parallel_scan(self, folder, blacklisted, interruption):
+        entries = []
+        folders = Queue.Queue()
+        errors = []
+        stop = threading.Event()
+
+        def list_folders():
+            while True:
+                folder = folders.get()
+                try:
+                    if folder is None:
+                        return
+                    if stop.is_set():
+                        continue
+                    for subfolder in self._scan_folder(
+                                            folder, blacklisted, entries):
+                        folders.put(subfolder)
+                except Exception as e:
+                    errors.append(e)
+                    stop.set()
+                finally:
+                    folders.task_done()
+
+        threads = []
+        for i in xrange(self._max_threads):
+            thread = threading.Thread(
+                target=list_folders, name='WareboxScanner-%s' % i)
+            thread.daemon = True
+            threads.append(thread)
+            thread.start()
+
+        folders.put(folder)
+        try:
+            # Queue.join() can't be interrupted, so we poll the same
+            # condition it waits on.
+            with folders.all_tasks_done:
+                while folders.unfinished_tasks > 0:
+                    folders.all_tasks_done.wait(0.5)
+                    if interruption is not None and interruption.is_set():
+                        stop.set()
+        finally:
+            stop.set()
+            for _ in threads:
+                folders.put(None)
+
+        self._check_interruption(interruption)
+        if len(errors) > 0:
+            raise errors[0]
+        return entries
+
+    def _scan_folder(self, folder, blacklisted, entries):
+        """Append the content of a single folder to "entries".
+
+        Unreadable folders are silently skipped, as os.walk does.
+
+        @param folder:
+                    A relative directory pathname.
+        @param blacklisted:
+                    Boolean telling whether the blacklist is active.
+        @param entries:
+                    List to append the found entries to.
+        @return
+                    The list of subfolders to descend into.
+        """
+        subfolders = []
+        abs_folder = fastjoin(self._root_path, folder)
+        try:
+            listing = self._list_folder(abs_folder)
+        except OSError:
+            return subfolders
+
+        for name, is_dir, is_link, statresult in listing:
+            # It seems that os.listdir() can return non-unicode
+            # pathnames. This guard checks against it.
+            assert type(name) == unicode
+            if is_dir:
+                pathname = folder + name + u'/'
+                if blacklisted and self._is_blacklisted(pathname):
+                    continue
+                entries.append((pathname, 0, _lmtime(statresult)))
+                if not is_link:
+                    subfolders.append(pathname)
+            elif stat.S_ISREG(statresult.st_mode):
+                pathname = folder + name
+                if blacklisted and self._is_blacklisted(pathname):
+                    continue
+                entries.append(
+                    (pathname, statresult.st_size, _lmtime(statresult)))
+        return subfolders
+
+    def _list_folder(self, abs_folder):
+        """
+        @return
+                    List of (name, is_dir, is_link, statresult) tuples,
+                    where statresult describes the target of symbolic
+                    links. Entries that can't be stat'ed are skipped.
+        """
+        listing = []
+        if _scandir is not None:
+            for entry in _scandir(abs_folder):
+                try:
+                    is_link = entry.is_symlink()
+                    statresult = entry.stat(follow_symlinks=True)
+                except OSError:
+                    continue
+                is_dir = stat.S_ISDIR(statresult.st_mode)
+                listing.append((entry.name, is_dir, is_link, statresult))
+            return listing
+
+        for name in os.listdir(abs_folder):
+            abs_pathname = fastjoin(abs_folder, name)
+            try:
+                statresult = os.lstat(abs_pathname)
+                is_link = stat.S_ISLNK(statresult.st_mode)
+                if is_link:
+                    statresult = os.stat(abs_pathname)
+            except OSError:
+                continue
+            is_dir = stat.S_ISDIR(statresult.st_mode)
+            listing.append((name, is_dir, is_link, statresult))
+        return listing
+
+
+def _lmtime(statresult):
+    # Same resolution as Warebox.get_last_modification_time()
+    return datetime.datetime.fromtimestamp(int(statresult.st_mtime))
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    from filerockclient.util.utilities import fastrelpath
+
+    def walk_and_stat_test(root_path):
+        ''' The os.walk based scan used by Warebox.get_content() '''
+        begin = time.time()
+        count = 0
+        for curr_folder, folders, files in os.walk(root_path):
+            for name in folders + files:
+                pathname = fastjoin(curr_folder, name)
+                if not os.path.isdir(pathname):
+                    os.stat(pathname)
+                    os.stat(pathname)[stat.ST_SIZE]
+                os.stat(pathname)[stat.ST_MTIME]
+                fastrelpath(pathname, root_path)
+                count += 1
+        end = time.time()
+        print "os.walk: %s pathnames" % count
+        print "> %s seconds elapsed" % (end - begin)
+
+    def scanner_test(root_path, max_threads):
+        ''' The scanner, with the given number of threads '''
+        scanner = WareboxScanner(root_path, lambda p: False, max_threads)
+        begin = time.time()
+        entries = scanner.scan()
+        end = time.time()
+        print "WareboxScanner (%s threads): %s pathnames" \
+            % (max_threads, len(entries))
+        print "> %s seconds elapsed" % (end - begin)
+
+    root_path = unicode(os.path.abspath(sys.argv[1]))
+    walk_and_stat_test(root_path)
+    scanner_test(root_path, 1)
+    scanner_test(root_path, DEFAULT_SCANNER_THREADS)
@@ -0,0 +1,343 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+"""
+This is the autoscaling module.
+
+Decides how many workers a pool should run at the same time.
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+import time
+import logging
+import threading
+
+
+# Seconds of observation between two decisions
+DEFAULT_INTERVAL = 15
+
+# Tasks to observe before deciding
+MIN_SAMPLES = 4
+
+# An added worker is kept only if it brings at least this fraction of
+# the throughput of an average worker
+MIN_GAIN = 0.5
+
+# Fraction of failed tasks beyond which the concurrency is halved
+MAX_ERROR_RATE = 0.1
+
+# Fraction of the CPUs that the tasks are allowed to keep busy
+MAX_LOAD = 0.9
+
+# Per-task latency growth, with no throughput gain, that means congestion
+LATENCY_TOLERANCE = 1.5
+
+# Decisions to wait before adding workers again after removing some
+PROBE_DELAY = 3
+
+
+class ConcurrencyController(object):
+    """
+    Chooses the concurrency of a pool of workers by observing the tasks
+    they complete.
+
+    The controller climbs the throughput: while tasks are waiting for a
+    free worker it adds one worker at a time, and keeps it only if the
+    aggregate throughput (bytes of completed tasks per second) grows by
+    at least MIN_GAIN times the throughput of an average worker. On a
+    fast link this goes on until the link is full; on a slow one the
+    step back comes soon. A worker is removed as well when:
+
+        - too many tasks fail: the concurrency is halved;
+        - the tasks keep the CPUs too busy (encryption only);
+        - the per-task latency grows with no throughput gain, that is,
+          the link has got congested.
+
+    After removing workers the controller waits PROBE_DELAY decisions
+    before trying to add them again, so that conditions that change
+    over time (e.g. a laptop moving to another network) are followed.
+    The concurrency always stays within the configured bounds.
+
+    Decisions are logged and counted by reason, see get_stats().
+    """
+
+    def __init__(self, name, initial, min_workers, max_workers, cpus=1,
+                 enabled=True, interval=DEFAULT_INTERVAL):
+        """
+        @param name:
+                    Name of the pool, used for logging.
+        @param initial:
+                    Initial concurrency.
+        @param min_workers:
+                    Lower bound to the concurrency.
+        @param max_workers:
+                    Upper bound to the concurrency.
+        @param cpus:
+                    Number of CPUs the CPU time of the tasks is compared
+                    with.
+        @param enabled:
+                    Boolean telling whether the concurrency may change.
+                    If it isn't, it stays at the initial value.
+        @param interval:
+                    Seconds of observation between two decisions.
+        """
+        self.logger = logging.getLogger("FR.%s.%s"
+                                        % (self.__class__.__name__, name))
+        self._min_workers = max(1, min_workers)
+        self._max_workers = max(self._min_workers, max_workers)
+        self._cpus = max(1, cpus)
+        self._enabled = enabled
+        self._interval = interval
+        self._lock = threading.Lock()
+        self.concurrency = initial
+        if enabled:
+            self.concurrency = min(self._max_workers,
+                                   max(self._min_workers, initial))
+        # Throughput and latency observed at the current concurrency,
+        # or before the last added worker
+        self._reference = None
+        self._last_move = 0
+        self._probe_delay = 0
+        self._decisions = {}
+        self._last_decision = None
+        # The first observation starts with the first task
+        self._reset_window(None)
+
+    def _reset_window(self, now):
+        self._window_start = now
+        self._tasks = 0
+        self._errors = 0
+        self._bytes = 0
+        self._latency = 0.0
+        self._cpu_time = 0.0
+        self._saturated = False
+
+    def on_saturated(self):
+        """A task had to wait since all workers were busy."""
+        with self._lock:
+            self._saturated = True
+
+    def on_task_done(self, size, elapsed, success=True, cpu_time=0.0,
+                     now=None):
+        """A worker has finished a task.
+
+        @param size:
+                    Bytes processed by the task.
+        @param elapsed:
+                    Seconds taken by the task.
+        @param success:
+                    Boolean telling whether the task succeeded.
+        @param cpu_time:
+                    CPU seconds spent by the task, if known.
+        @return
+                    The new concurrency if it has to change, None
+                    otherwise.
+        """
+        if now is None:
+            now = time.time()
+        with self._lock:
+            if self._window_start is None:
+                self._window_start = now - elapsed
+            self._tasks += 1
+            if success:
+                self._bytes += size
+                self._latency += elapsed
+            else:
+                self._errors += 1
+            self._cpu_time += cpu_time
+            return self._decide(now)
+
+    def _decide(self, now):
+        elapsed = now - self._window_start
+        if not self._enabled or elapsed < self._interval \
+        or self._tasks < MIN_SAMPLES:
+            return None
+
+        current = self.concurrency
+        completed = self._tasks - self._errors
+        throughput = self._bytes / elapsed
+        latency = self._latency / completed if completed > 0 else None
+        error_rate = float(self._errors) / self._tasks
+        load = self._cpu_time / (elapsed * self._cpus)
+        reference = self._reference
+
+        target, reason = current, None
+        if error_rate > MAX_ERROR_RATE:
+            target, reason = current // 2, 'errors'
+        elif load > MAX_LOAD:
+            target, reason = current - 1, 'load'
+        elif self._last_move > 0 and reference is not None \
+        and throughput < reference[0] * (1 + MIN_GAIN / (current - 1)):
+            target, reason = current - 1, 'no_gain'
+        elif self._last_move == 0 and reference is not None \
+        and latency is not None and reference[1] is not None \
+        and latency > reference[1] * LATENCY_TOLERANCE \
+        and throughput <= reference[0]:
+            target, reason = current - 1, 'latency'
+        elif self._saturated and self._probe_delay == 0 \
+        and load * (current + 1) / current <= MAX_LOAD:
+            target, reason = current + 1, 'probe'
+        target = min(self._max_workers, max(self._min_workers, target))
+
+        if target < current:
+            self._probe_delay = PROBE_DELAY
+        elif self._probe_delay > 0:
+            self._probe_delay -= 1
+        if target > current or reason != 'no_gain':
+            self._reference = (throughput, latency)
+        self._last_move = cmp(target, current)
+
+        self._last_decision = {
+            'reason': reason, 'concurrency': target,
+            'throughput': throughput, 'latency': latency,
+            'error_rate': error_rate, 'load': load}
+        self._reset_window(now)
+        if target == current:
+            return None
+        self._decisions[reason] = self._decisions.get(reason, 0) + 1
+        self.logger.debug(
+            u"Concurrency %s -> %s (%s): %.0f B/s, latency %s s,"
+            u" error rate %.2f, load %.2f"
+            % (current, target, reason, throughput, latency, error_rate,
+               load))
+        self.concurrency = target
+        return target
+
+    def get_stats(self):
+        """
+        @return
+                    Dictionary with the current concurrency, its bounds,
+                    the number of changes by reason and the inputs of
+                    the last decision.
+        """
+        with self._lock:
+            return {
+                'concurrency': self.concurrency,
+                'min_workers': self._min_workers,
+                'max_workers': self._max_workers,
+                'changes': dict(self._decisions),
+                'last_decision': self._last_decision
+            }
+
+
+if __name__ == '__main__':
+    import random
+    import multiprocessing
+    from filerockclient.config import DEFAULT_CONFIG, CLIENT_SECTION
+    from filerockclient.workers.worker_pool import DEFAULT_WORKERS
+    from filerockclient.workers.filters.encryption.adapter import \
+        NUMBER_OF_WORKER
+
+    KB = 1024
+    MB = 1024 * 1024
+
+    def office_link(concurrency):
+        """ 1 Gbit/s, each transfer limited to 3 MB/s by the RTT """
+        return min(3 * MB, 125 * MB / concurrency), 0.0, 0.0
+
+    def mobile_link(concurrency):
+        """ 3G: beyond two transfers the losses eat the bandwidth and
+        the requests start timing out """
+        link = 250 * KB * max(0.2, 1 - 0.15 * max(0, concurrency - 2))
+        return link / concurrency, 0.04 * max(0, concurrency - 2), 0.0
+
+    def encryption(cpus):
+        """ Each task keeps a CPU busy encrypting at 40 MB/s; beyond
+        "cpus" tasks they share the CPUs """
+        def link(concurrency):
+            share = min(1.0, float(cpus) / concurrency)
+            return 40 * MB * share, 0.0, share
+        return link
+
+    def simulation_test(name, link, controller, seconds=900, size=4 * MB):
+        """ Simulated clock: there are always tasks waiting and each
+        running task processes "size" bytes at the rate the link gives
+        it, using the given share of a CPU. Removed workers finish their
+        task first. """
+        random.seed(0)
+        clock = 0.0
+        step = 0.05
+        running = []
+        done_bytes = 0
+        measured_from = seconds / 2
+        while clock < seconds:
+            while len(running) < controller.concurrency:
+                running.append([clock, 0, 0.0])
+            rate, error_probability, cpu_share = link(len(running))
+            controller.on_saturated()
+            clock += step
+            for transfer in list(running):
+                transfer[1] += rate * step
+                transfer[2] += cpu_share * step
+                if transfer[1] >= size:
+                    running.remove(transfer)
+                    success = random.random() >= error_probability
+                    if success and clock >= measured_from:
+                        done_bytes += size
+                    controller.on_task_done(size, clock - transfer[0],
+                                            success, transfer[2], now=clock)
+        print "%s: %s workers at the end" % (name, controller.concurrency)
+        print "> %.0f KB/s in the last %s seconds, changes: %s" \
+            % (done_bytes / KB / (seconds - measured_from),
+               seconds - measured_from, controller.get_stats()['changes'])
+
+    def option(name):
+        return int(DEFAULT_CONFIG[CLIENT_SECTION][name])
+
+    # The bounds the client uses with the default configuration
+    try:
+        cpus = multiprocessing.cpu_count()
+    except NotImplementedError:
+        cpus = 1
+    crypto_max = option(u'crypto_workers_max') or cpus
+    transfer_bounds = (option(u'transfer_workers_min'),
+                       option(u'transfer_workers_max'))
+    crypto_bounds = (option(u'crypto_workers_min'), crypto_max)
+
+    scenarios = [
+        ('office', office_link, 4 * MB, DEFAULT_WORKERS, transfer_bounds, 1),
+        ('3G', mobile_link, 1 * MB, DEFAULT_WORKERS, transfer_bounds, 1),
+        ('encryption, %s CPUs' % cpus, encryption(cpus), 4 * MB,
+         NUMBER_OF_WORKER, crypto_bounds, cpus)]
+    for name, link, size, initial, (low, high), task_cpus in scenarios:
+        simulation_test('%s, %s workers' % (name, initial), link,
+                        ConcurrencyController('sim', initial, low, high,
+                                              task_cpus, enabled=False),
+                        size=size)
+        simulation_test('%s, autoscaling within [%s, %s]' % (name, low, high),
+                        link,
+                        ConcurrencyController('sim', initial, low, high,
+                                              task_cpus),
+                        size=size)
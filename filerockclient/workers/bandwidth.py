@@ -27,6 +27,11 @@
 """
 Bandwidth limit module
 
+Transfers are shaped by a token bucket: tokens (bytes) are added at the
+configured rate, up to a burst size, and each chunk must be paid with
+tokens before being sent. Chunks are granted in order of request, so
+workers sharing a bucket get the same share of the bandwidth.
+
 ----
 
 This module is part of the FileRock Client.
@@ -44,54 +49,101 @@ FROM_KB_TO_BYTE = 1024
 
 CHUNK_SIZE = 1024
 
+# Each chunk is worth QUANTUM_TIME seconds of transfer at the limit rate,
+# which is also about how long a worker waits for its turn. Idle periods
+# let the bucket accumulate up to BURST_TIME seconds of transfer.
+QUANTUM_TIME = 0.1
+BURST_TIME = 1.0
+MIN_QUANTUM = 512
+
+
 class Bandwidth(object):
-    
+    """
+    A token bucket shared by the workers transferring in the same
+    direction.
+
+    byte_to_send() reserves a chunk worth QUANTUM_TIME seconds at the
+    limit rate and blocks the caller until the bucket has paid for it.
+    Reservations are served in arrival order: a worker can't get its
+    next chunk before the ones already requested by the others, so the
+    bandwidth is shared fairly among the active workers. The lock is
+    held only while making the reservation, never while waiting.
+
+    The limit can be changed at any time with set_limit(). A limit of
+    0 disables the shaping.
+    """
+
     def __init__(self, limit, max_chunk_size=CHUNK_SIZE):
-        self.start =  time()
+        """
+        @param limit:
+                    Maximum rate in KB/s, 0 or less means no limit.
+        @param max_chunk_size:
+                    Chunk size returned by byte_to_send() when there is
+                    no limit.
+        """
         self.max_chunk_size = max_chunk_size
-        self.limit = limit * FROM_KB_TO_BYTE
-        if (limit <= 0):
-            self.limit=0     
-#         print "KB/s LIMIT %s " % (self.limit/1024)
-        self._reset_limit()
         self.lock = Lock()
-    
-    def _reset_limit(self):
-        self.remaining = self.limit    
-
-    def _check_timer(self):
-        now = time()
-        elapsed = now-self.start
-        if (elapsed) > 1:
-            self.start = now
-            self._reset_limit()
-
-
-    def _remaining(self):
-        now = time()
-        diff = (now-self.start)
-        if (diff < 1) and (diff > 0):
-            return (1-diff)
-        else:
-            return 0
-        
-    def _next_chunk_len(self):
-        to_send = self.remaining - self.remaining/2
-        self.remaining /= 2
-        return to_send
-    
-    def _is_enabled(self):
+        self._last_refill = self._now()
+        self._set_limit(limit)
+        self._tokens = self._capacity
+
+    def _set_limit(self, limit):
+        self.limit = max(0, limit * FROM_KB_TO_BYTE)
+        self._quantum = max(MIN_QUANTUM, int(self.limit * QUANTUM_TIME))
+        self._capacity = max(self._quantum, self.limit * BURST_TIME)
+
+    def set_limit(self, limit):
+        """Change the rate limit, effective from the next chunk.
+
+        @param limit:
+                    Maximum rate in KB/s, 0 or less means no limit.
+        """
+        with self.lock:
+            was_enabled = self.is_enabled()
+            self._refill(self._now())
+            self._set_limit(limit)
+            if not was_enabled:
+                self._tokens = self._capacity
+            self._tokens = min(self._tokens, self._capacity)
+
+    def _refill(self, now):
+        """Add the tokens accumulated since the last refill.
+
+        Must be called holding self.lock.
+        """
+        elapsed = max(0.0, now - self._last_refill)
+        self._last_refill = now
+        if self.is_enabled():
+            self._tokens = min(self._capacity,
+                               self._tokens + elapsed * self.limit)
+
+    def _now(self):
+        return time()
+
+    def _wait(self, seconds):
+        sleep(seconds)
+
+    def is_enabled(self):
         return (self.limit > 0)
-        
+
     def byte_to_send(self):
-        if not self._is_enabled():
+        """Reserve the next chunk and wait until it can be sent.
+
+        @return
+                    The size in bytes of the chunk.
+        """
+        if not self.is_enabled():
             return self.max_chunk_size
         with self.lock:
-            while True:
-                self._check_timer()
-                to_send = self._next_chunk_len()
-                if to_send > 0:
-                    break
-                else:
-                    sleep(self._remaining())
-            return to_send
\ No newline at end of file
+            self._refill(self._now())
+            to_send = self._quantum
+            # Tokens can go negative: that's the debt of the chunks
+            # reserved before this one.
+            self._tokens -= to_send
+            if self._tokens < 0:
+                waiting_time = -self._tokens / float(self.limit)
+            else:
+                waiting_time = 0
+        if waiting_time > 0:
+            self._wait(waiting_time)
+        return to_send
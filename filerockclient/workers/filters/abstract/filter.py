@@ -43,6 +43,7 @@ FileRock Client is licensed under GPLv3 License.
 import threading, Queue, logging
 
 from connector import Connector as AbstractConnector
+from filerockclient.util.resizable_semaphore import ResizableSemaphore
 
 
 WAIT_SEC_BEFORE_RETRY = 1
@@ -73,7 +74,7 @@ class Filter(threading.Thread):
         self.operations = operationQueue
         self.resultsQueue = resultQueue
 
-        self.freeWorker = threading.Semaphore(self.maxWorker)
+        self.freeWorker = ResizableSemaphore(self.maxWorker)
 
         self.force_termination=False
         self.off = []
@@ -94,7 +95,9 @@ class Filter(threading.Thread):
         task = self.operations.get()
         while task and not self.force_termination:
             if (not task.is_aborted()) and (self._is_my_responsability(task)):
-                self.freeWorker.acquire()
+                if not self.freeWorker.acquire(False):
+                    self._on_all_workers_busy()
+                    self.freeWorker.acquire()
                 if self.free != []:
                     self.free[0].set_working(task)
                 elif self.off != []:
@@ -145,6 +148,12 @@ class Filter(threading.Thread):
             connector.start_WorkerWatcher()
             self.connectors.append(connector)
 
+    def _on_all_workers_busy(self):
+        '''
+        Called when a task has to wait for a free worker
+        '''
+        pass
+
     def _is_my_responsability(self, task):
         '''
         The filter will execute this task only if this method return True
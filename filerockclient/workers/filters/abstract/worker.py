@@ -85,7 +85,7 @@ class Worker(multiprocessing.Process):
                         else:
                             self._on_task_complete(tw)
                             try:
-                                self.termination.put_nowait({'success':True}) #On termination Send Back the task
+                                self.termination.put_nowait(self._task_result(tw)) #On termination Send Back the task
                             except Queue.Full:
                                 pass
                             break
@@ -147,6 +147,14 @@ class Worker(multiprocessing.Process):
     def _is_task_completed(self, tw):
         return self.times == 0
 
+    def _task_result(self, tw):
+        """
+        Returns the termination message of a task completed successfully,
+        it's received by the WorkerWatcher as the "result" parameter of
+        _on_success
+        """
+        return {'success':True}
+
     def _more_init(self):
         """
         Called as first function on run()
@@ -40,12 +40,14 @@ FileRock Client is licensed under GPLv3 License.
 
 """
 
-import Queue, logging
+import Queue, logging, multiprocessing
 
 from filerockclient.workers.filters.encryption import utils as CryptoUtils
+from filerockclient.workers.autoscaling import ConcurrencyController
 from filter import CryptoFilter
 import os
 
+# Workers running at startup, and always if autoscaling is disabled
 NUMBER_OF_WORKER = 2
 
 
@@ -84,8 +86,20 @@ class Adapter(object):
         self.enc_dir = os.path.join(self.cfg.get('Application Paths', 'temp_dir'), enc_dir)
         if first_startup:
             CryptoUtils.create_encrypted_dir(warebox, self.logger)
+        try:
+            cpus = multiprocessing.cpu_count()
+        except NotImplementedError:
+            cpus = 1
+        max_workers = cfg.getint('Client', 'crypto_workers_max')
+        self.concurrency = ConcurrencyController(
+            'CryptoFilter', NUMBER_OF_WORKER,
+            cfg.getint('Client', 'crypto_workers_min'),
+            max_workers if max_workers > 0 else cpus,
+            cpus=cpus,
+            enabled=cfg.getboolean('Client', 'autoscaling_workers'))
         self.crypto_filter = CryptoFilter(self.input_queue, self.output_queue,
-                             NUMBER_OF_WORKER, cfg, warebox, lockfile_fd)
+                             self.concurrency.concurrency, cfg, warebox, lockfile_fd,
+                             self.concurrency)
 
     def check_precondition(self, ui):
         """
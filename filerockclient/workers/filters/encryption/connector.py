@@ -49,7 +49,8 @@ class Connector(AbstractConnector):
     CryptoConnector extend the prototypes.Connector.Connector
     """
 
-    def __init__(self, index, statuses, resultsQueue, freeWorker, cfg, warebox, enc_dir, lockfile_fd):
+    def __init__(self, index, statuses, resultsQueue, freeWorker, cfg, warebox, enc_dir, lockfile_fd,
+                 on_task_done=None):
         """
         Initializes the connector adding configuration object and WorkerWatcher class
 
@@ -62,12 +63,23 @@ class Connector(AbstractConnector):
                     File descriptor of the lock file which ensures there
                     is only one instance of FileRock Client running.
                     Child processes have to close it to avoid stale locks.
+        @param on_task_done:
+                    Optional callable receiving size, elapsed time,
+                    success and CPU time of each task
         """
         AbstractConnector.__init__(self, index, statuses, resultsQueue, freeWorker)
         self.cfg = cfg
         self.warebox = warebox
         self.enc_dir = enc_dir
         self.lockfile_fd = lockfile_fd
+        self.on_task_done = on_task_done
+
+    def task_done(self, size, elapsed, success, cpu_time):
+        """
+        Reports the outcome of a task
+        """
+        if self.on_task_done is not None:
+            self.on_task_done(size, elapsed, success, cpu_time)
 
     def start_WorkerWatcher(self):
         """
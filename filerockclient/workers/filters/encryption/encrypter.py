@@ -41,6 +41,7 @@ FileRock Client is licensed under GPLv3 License.
 """
 
 import os
+import hashlib
 from Crypto.Cipher import AES
 from filerockclient.workers.filters.encryption import utils as CryptoUtils
 from filerockclient.workers.filters.encryption.pkcs7_padder import PKCS7Padder
@@ -60,6 +61,10 @@ class Encrypter(object):
         Reads the output filename from taskwrapper.out_filename
         Every TaskStep read a chunksize from input filename and write it crypet to output filename
 
+        If the taskwrapper has stream_encryption set, nothing is written:
+        only the md5 and the size of the encrypted data are computed, see
+        EncryptingReader.
+
         @param chunksize:
                 Sets the size of the chunk which the function
                 uses to read and encrypt the file. Larger chunk
@@ -70,6 +75,9 @@ class Encrypter(object):
         self.padder = PKCS7Padder()
         self.completed = False
         self.warebox_path = warebox_path
+        self.outfile = None
+        self.md5 = None
+        self.size = 0
 
 
     def _on_new_task(self, tw):
@@ -87,22 +95,49 @@ class Encrypter(object):
 
         self.infile = open(in_filename, mode='rb')
 
-        self.outfile = open(out_filename, mode='wb') #Open output file in write binary mode
+        self.md5 = hashlib.md5()
+        self.size = 0
+        if getattr(tw, 'stream_encryption', False):
+            self.outfile = None
+        else:
+            self.outfile = open(out_filename, mode='wb') #Open output file in write binary mode
 
         iv = tw.iv
         self.encryptor = AES.new(tw.key, AES.MODE_CFB, iv, segment_size=128) #Initialize encryptor
-        self.outfile.write(CryptoUtils.PROTOCOL_VERSION)
-        self.outfile.write(iv) #Write initialization vector in output file
+        self._write(CryptoUtils.PROTOCOL_VERSION)
+        self._write(iv) #Write initialization vector in output file
         self.chunk = self.infile.read(self.chunksize)
 
+    def _write(self, data):
+        """
+        Writes encrypted data to the output file or, if there isn't any,
+        just accounts for it
+        """
+        if self.outfile is not None:
+            self.outfile.write(data)
+        else:
+            self.md5.update(data)
+            self.size += len(data)
+
+    def _get_stream_result(self):
+        """
+        Returns the etag and the size of the encrypted data of the last
+        task, if it has not been written to a file
+        """
+        if self.outfile is not None:
+            return {}
+        return {'storage_etag': self.md5.hexdigest(),
+                'storage_size': self.size}
+
     def _on_task_abort(self, tw):
         """
         Clean the environment in case of abort
 
         @param tw: the wrapper task
         """
-        self.outfile.close() #Close the output file
-        if os.path.exists(tw.out_pathname):
+        if self.outfile is not None:
+            self.outfile.close() #Close the output file
+        if tw.out_pathname is not None and os.path.exists(tw.out_pathname):
             os.remove(tw.out_pathname) #Remove the incomplete output file
         self.infile.close() #Close the input file
 
@@ -112,7 +147,8 @@ class Encrypter(object):
 
         @param tw: the wrapper task
         """
-        self.outfile.close()
+        if self.outfile is not None:
+            self.outfile.close()
         self.infile.close()
 
     def _task_step(self, tw):
@@ -124,12 +160,12 @@ class Encrypter(object):
         if not self.completed:
             nextchunk = self.infile.read(self.chunksize)
             if len(nextchunk) > 0:
-                self.outfile.write(self.encryptor.encrypt(self.chunk))
+                self._write(self.encryptor.encrypt(self.chunk))
                 self.chunk = nextchunk
             else:
                 chunk_padded = self.padder.encode(self.chunk)
                 encrypted_chunk=self.encryptor.encrypt(chunk_padded)
-                self.outfile.write(encrypted_chunk)
+                self._write(encrypted_chunk)
                 self.completed = True
 
     def _is_task_completed(self, tw):
@@ -139,3 +175,88 @@ class Encrypter(object):
         @param tw: the wrapped task
         """
         return self.completed
+
+
+class EncryptingReader(object):
+    """
+    Read-only file-like object that returns the encrypted version of
+    another file, in the same format produced by Encrypter.
+
+    It lets uploading a file while encrypting it, without ever writing
+    the encrypted data on disk. The encryption is deterministic for a
+    given key and iv, so the uploaded data matches the etag computed by
+    the Encrypter in streaming mode as long as the file doesn't change
+    in the meanwhile. Should its size change, reading raises IOError
+    rather than producing more or less data than declared.
+    """
+
+    def __init__(self, infile, key, iv, expected_size=None, chunksize=None):
+        """
+        @param infile: the file-like object to encrypt, opened in binary mode
+        @param key: the encryption key
+        @param iv: the initialization vector, 16 bytes
+        @param expected_size:
+                    optional size of the encrypted data, as declared
+                    to the storage
+        @param chunksize:
+                    size of the chunks read from infile, must be
+                    divisible by 16
+        """
+        self.infile = infile
+        self.chunksize = chunksize or CryptoUtils.CHUNK_SIZE
+        self.padder = PKCS7Padder()
+        self.encryptor = AES.new(key, AES.MODE_CFB, iv, segment_size=128)
+        self.expected_size = expected_size
+        self.produced = 0
+        self.completed = False
+        self.buffer = str(CryptoUtils.PROTOCOL_VERSION) + iv
+        self.offset = 0
+        self.chunk = self.infile.read(self.chunksize)
+
+    def _encrypt_next_chunk(self):
+        """
+        Encrypts one more chunk of infile and appends it to the buffer
+        """
+        nextchunk = self.infile.read(self.chunksize)
+        if len(nextchunk) > 0:
+            encrypted_chunk = self.encryptor.encrypt(self.chunk)
+            self.chunk = nextchunk
+        else:
+            chunk_padded = self.padder.encode(self.chunk)
+            encrypted_chunk = self.encryptor.encrypt(chunk_padded)
+            self.completed = True
+        self.buffer = self.buffer[self.offset:] + encrypted_chunk
+        self.offset = 0
+
+    def read(self, size=-1):
+        """
+        Returns up to "size" bytes of encrypted data, all the remaining
+        data if size is negative, an empty string at the end.
+        """
+        if size < 0:
+            while not self.completed:
+                self._encrypt_next_chunk()
+            size = len(self.buffer) - self.offset
+        while not self.completed and len(self.buffer) - self.offset < size:
+            self._encrypt_next_chunk()
+
+        data = self.buffer[self.offset:self.offset + size]
+        self.offset += len(data)
+        self.produced += len(data)
+
+        if self.expected_size is not None:
+            if self.produced > self.expected_size \
+            or (len(data) == 0 and self.produced != self.expected_size):
+                raise IOError(
+                    'File size changed while encrypting it: %s bytes '
+                    'expected' % self.expected_size)
+        return data
+
+    def close(self):
+        self.infile.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
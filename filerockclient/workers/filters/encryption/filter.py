@@ -43,16 +43,22 @@ FileRock Client is licensed under GPLv3 License.
 from filerockclient.workers.filters.abstract.filter import Filter as AbstractFilter
 from filerockclient.workers.filters.encryption.connector import Connector
 from filerockclient.workers.filters.encryption import utils as CryptoUtils
-import logging, os
+import logging, os, threading
 
 
 class CryptoFilter(AbstractFilter):
     """
     Crypto Filter manages tasks with Encrypt and Decrypt verbs,
     it pass the tasks to a pool of processes and wait the completion on a Queue
+
+    The number of processes running at the same time can be changed by
+    a concurrency controller, which observes the completed tasks.
+    Worker watchers are added when needed and never removed: the idle
+    ones shut their process down anyway.
     """
 
-    def __init__(self, operationQueue, resultsQueue, maxWorker, cfg, warebox, lockfile_fd):
+    def __init__(self, operationQueue, resultsQueue, maxWorker, cfg, warebox, lockfile_fd,
+                 concurrency=None):
         """
         @param operationQueue: the input queue, cryptoFilter reads the new tasks from it
         @param resultsQueue: the output queue, the managed tasks will be sent back through it
@@ -63,6 +69,10 @@ class CryptoFilter(AbstractFilter):
                     File descriptor of the lock file which ensures there
                     is only one instance of FileRock Client running.
                     Child processes have to close it to avoid stale locks.
+        @param concurrency:
+                    Optional instance of
+                    filerockclient.workers.autoscaling.ConcurrencyController
+                    deciding the number of workers.
         """
         AbstractFilter.__init__(self, operationQueue, resultsQueue, maxWorker, name=self.__class__.__name__)
         self.logger = logging.getLogger('FR.%s' % self.getName())
@@ -70,24 +80,81 @@ class CryptoFilter(AbstractFilter):
         self.enc_dir=CryptoUtils.get_encryption_dir(cfg)
         self.warebox = warebox
         self.lockfile_fd = lockfile_fd
+        self.concurrency = concurrency
+        self._resize_lock = threading.Lock()
 
     def _start_WorkerWatchers(self):
         """
         Starts the worker watchers pool
         """
-        workers = self.maxWorker
-        for i in range(workers):
-            self.logger.debug(u"Start Worker Watcher %d/%d" % (i,workers))
-            connector = self.Connector(i,
-                                       self.statuses,
-                                       self.resultsQueue,
-                                       self.freeWorker,
-                                       self.cfg,
-                                       self.warebox,
-                                       self.enc_dir,
-                                       self.lockfile_fd)
-            connector.start_WorkerWatcher()
-            self.connectors.append(connector)
+        with self._resize_lock:
+            while len(self.connectors) < self.maxWorker:
+                self._start_WorkerWatcher()
+
+    def _start_WorkerWatcher(self):
+        index = len(self.connectors)
+        self.logger.debug(u"Start Worker Watcher %d/%d" % (index, self.maxWorker))
+        connector = self.Connector(index,
+                                   self.statuses,
+                                   self.resultsQueue,
+                                   self.freeWorker,
+                                   self.cfg,
+                                   self.warebox,
+                                   self.enc_dir,
+                                   self.lockfile_fd,
+                                   self.on_task_done)
+        connector.start_WorkerWatcher()
+        self.connectors.append(connector)
+
+    def on_task_done(self, size, elapsed, success, cpu_time):
+        """
+        Called by a worker watcher at the end of each task, lets the
+        number of workers follow the observed performance
+
+        @param size: bytes encrypted or decrypted
+        @param elapsed: seconds taken by the task
+        @param success: boolean telling whether the task succeeded
+        @param cpu_time: CPU seconds spent by the worker process
+        """
+        if self.concurrency is None:
+            return
+        workers = self.concurrency.on_task_done(size, elapsed, success, cpu_time)
+        if workers is not None:
+            self.set_max_workers(workers)
+
+    def set_max_workers(self, workers):
+        """
+        Changes the number of workers running at the same time. Busy
+        workers finish their task before the semaphore shrinks.
+        """
+        with self._resize_lock:
+            previous = self.maxWorker
+            self.freeWorker.resize(workers)
+            self.maxWorker = workers
+            if self.isAlive():
+                while len(self.connectors) < workers:
+                    self._start_WorkerWatcher()
+            # Surplus processes shut down once idle for a while
+            self.logger.info(u"Running %s encryption workers instead of %s"
+                             u" (%s worker watchers, %s processes alive)"
+                             % (workers, previous, len(self.connectors),
+                                self._count_alive_processes()))
+
+    def _count_alive_processes(self):
+        """
+        Returns the number of worker processes currently running
+        """
+        alive = 0
+        for connector in self.connectors:
+            watcher = getattr(connector, 'worker', None)
+            process = getattr(watcher, 'process', None)
+            if process is not None and process.is_alive():
+                alive += 1
+        return alive
+
+    def _on_all_workers_busy(self):
+        if self.concurrency is not None:
+            self.concurrency.on_saturated()
 
     def _is_my_responsability(self, task):
         """
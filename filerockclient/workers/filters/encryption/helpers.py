@@ -104,7 +104,8 @@ def clean_env(pathname_operation, logger=None):
     """
     if pathname_operation.to_decrypt or pathname_operation.to_encrypt:
 #        os.close(pathname_operation.encrypted_fd)
-        if os.path.exists(pathname_operation.encrypted_pathname):
+        if pathname_operation.encrypted_pathname is not None \
+        and os.path.exists(pathname_operation.encrypted_pathname):
             os.remove(pathname_operation.encrypted_pathname)
         if logger:
             logger.debug(u'Encrypted file %s deleted' % pathname_operation.encrypted_pathname)
@@ -61,6 +61,7 @@ class TaskWrapper(AbstractTaskWrapper):
         """
         Random.atfork()
         AbstractTaskWrapper.__init__(self, task)
+        self.stream_encryption = False
 
     def __check_enc_dir(self, pathname):
         """
@@ -88,7 +89,12 @@ class TaskWrapper(AbstractTaskWrapper):
         self.key = unhexlify(cfg.get('User', 'encryption_key'))
         self.__check_enc_dir(enc_dir)
         if self.task.to_encrypt:
-            CryptoUtils.set_temp_file(self.task, cfg, enc_dir)
+            # In streaming mode the encrypted data isn't written anywhere,
+            # only its etag and size are computed. The file will be
+            # encrypted again while uploading it, with the same iv.
+            self.stream_encryption = CryptoUtils.is_stream_encryption_enabled(cfg)
+            if not self.stream_encryption:
+                CryptoUtils.set_temp_file(self.task, cfg, enc_dir)
             self.iv = Random.new().read(16)
             self.task.iv = unicode(hexlify(self.iv))
             self.out_pathname = self.task.encrypted_pathname
@@ -231,6 +231,13 @@ def prepare_operation(pathname_operation, temp_dir=ENC_DIR):
             pathname_operation.to_encrypt = True
             return True
 
+def is_stream_encryption_enabled(cfg):
+    """
+    Returns true if files to upload should be encrypted while sending
+    them, rather than into a temporary file
+    """
+    return cfg.getboolean('Client', 'streaming_encryption')
+
 def get_encryption_dir(cfg):
     return os.path.join(cfg.get('Application Paths', 'temp_dir'), ENC_DIR)
 
@@ -254,7 +261,8 @@ def clean_env(pathname_operation, logger=None):
     """
     Cleans environment after encryption operations, removing encrypted file
     """
-    if pathname_operation.to_encrypt:
+    if pathname_operation.to_encrypt \
+    and pathname_operation.encrypted_pathname is not None:
         if os.path.exists(pathname_operation.encrypted_pathname):
             _try_remove(pathname_operation.encrypted_pathname, logger)
             if logger:
@@ -268,7 +276,8 @@ def to_encrypt(pathname_operation):
     Returns true if the pathname operation should be encrypted
     """
     return pathname_operation.to_encrypt \
-        and pathname_operation.encrypted_pathname is None
+        and pathname_operation.encrypted_pathname is None \
+        and not pathname_operation.stream_encryption
 
 def to_decrypt(pathname_operation):
     """
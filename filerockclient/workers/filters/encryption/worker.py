@@ -119,6 +119,7 @@ class Worker(AbstractWorker):
             self.op = self.encrypter
         elif tw.task.to_decrypt:
             self.op = self.decrypter
+        self.cpu_begin = _cpu_time()
 
         try:
             self.op._on_new_task(tw)
@@ -154,3 +155,23 @@ class Worker(AbstractWorker):
 
     def _is_task_completed(self, tw):
         return self.op.completed
+
+    def _task_result(self, tw):
+        """
+        Adds the etag and size of the encrypted data when the
+        encryption has been done without writing it, and the CPU time
+        spent by this process on the task
+        """
+        result = AbstractWorker._task_result(self, tw)
+        if tw.task.to_encrypt:
+            result.update(self.encrypter._get_stream_result())
+        result['cpu_time'] = _cpu_time() - self.cpu_begin
+        return result
+
+
+def _cpu_time():
+    """
+    Returns the user and system CPU seconds spent by this process
+    """
+    times = os.times()
+    return times[0] + times[1]
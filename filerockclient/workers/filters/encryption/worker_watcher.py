@@ -96,8 +96,22 @@ class WorkerWatcher(AbstractWorkerWatcher):
         """
         tw = self.TaskWrapper(task)
         tw.prepare(self.cfg, self.enc_dir)
+        self.task_begin = time.time()
         return tw
 
+    def __report_task(self, tw, result, success):
+        """
+        Reports size, duration and CPU time of a task to the filter
+        """
+        if tw.task.to_encrypt:
+            size = getattr(tw.task, 'warebox_size', None)
+        else:
+            size = getattr(tw.task, 'storage_size', None)
+        self.connector.task_done(size or 0,
+                                 time.time() - self.task_begin,
+                                 success,
+                                 result.get('cpu_time', 0.0))
+
     def __is_directory(self, pathname):
         """
         Tells if a pathname corresponds to a directory.
@@ -191,7 +205,13 @@ class WorkerWatcher(AbstractWorkerWatcher):
         """
         Applies custom actions on task if its computation ends successfully
         """
-        if tw.task.to_encrypt:
+        self.__report_task(tw, result, True)
+        if tw.task.to_encrypt and tw.stream_encryption:
+            tw.task.storage_size = result['storage_size']
+            tw.task.storage_etag = result['storage_etag']
+            tw.task.stream_encryption = True
+            self.logger.debug(u'Successfully computed the encrypted etag of %s, it will be encrypted while uploading' % tw.task.pathname)
+        elif tw.task.to_encrypt:
             tw.task.storage_size = self.__get_local_file_size(tw.task.encrypted_pathname)
             tw.task.storage_etag = self.__compute_md5_hex(tw.task.encrypted_pathname)
             self.logger.debug(u'Successfully encrypted %s to %s' % (tw.task.pathname, tw.task.encrypted_pathname))
@@ -216,6 +236,8 @@ class WorkerWatcher(AbstractWorkerWatcher):
         """
         Applies custom actions on task if its computation ends unsuccessfully
         """
+        if not tw.task.is_aborted():
+            self.__report_task(tw, result, False)
         if (tw.task.to_encrypt or tw.task.to_decrypt) \
         and tw.task.encrypted_pathname is not None \
         and os.path.exists(tw.task.encrypted_pathname):
@@ -0,0 +1,267 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+"""
+This is the scheduling module.
+
+Decides in which order the operations waiting for a worker are served.
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+import bisect
+
+
+# The same size classes used by WareboxSnapshot.split_by_size()
+DEFAULT_SIZE_CLASSES = [0, 65536, 524288, 4194304, 10485760, 52428800]
+
+# Files at least this large don't use the workers reserved for small files
+DEFAULT_SMALL_FILE_SIZE = 4194304
+
+# Operations that transfer no data and unblock the others
+URGENT_VERBS = frozenset([
+    'DELETE', 'DELETE_LOCAL', 'REMOTE_COPY',
+    'CREATE_DIRECTORIES', 'RESOLVE_DELETION_CONFLICTS'])
+
+URGENT_PRIORITY = -1
+LARGE_LANE_PRIORITY = -0.5
+
+
+class SchedulingPolicy(object):
+    """
+    Priorities and lanes of the operations served by the workers.
+
+    The lower the priority, the sooner an operation is served:
+
+        - operations transferring no data (deletions, copies, directory
+          creations) come first, with URGENT_PRIORITY;
+        - the other ones come in order of size class, so that thousands
+          of small documents don't wait behind a big video;
+        - waiting makes the priority grow by one size class every
+          "aging_seconds". Aging never brings an operation before the
+          urgent ones.
+
+    Workers are split in two lanes. The last "reserved_workers" workers
+    are reserved for files smaller than "small_file_size": large files
+    can't keep all workers busy at once. On the other hand, when no
+    worker is busy with a large file, the next large file comes before
+    the small ones: large files always make progress, and their
+    transfers keep the bandwidth busy while the small files pay the
+    latency of their requests.
+
+    With the policy disabled all operations have the same priority and
+    no worker is reserved, that is, they are served in arrival order.
+    """
+
+    def __init__(self, enabled=True, size_classes=DEFAULT_SIZE_CLASSES,
+                 small_file_size=DEFAULT_SMALL_FILE_SIZE, reserved_workers=1,
+                 aging_seconds=120):
+        """
+        @param enabled:
+                    Boolean telling whether the policy is active.
+        @param size_classes:
+                    Increasing list of sizes in bytes, starting from 0.
+                    Each two consecutive elements define a size class,
+                    the last element is the lower bound of an unbounded
+                    class.
+        @param small_file_size:
+                    Files smaller than this can use the reserved workers.
+        @param reserved_workers:
+                    Number of workers reserved for small files.
+        @param aging_seconds:
+                    Waiting time that makes an operation gain one size
+                    class. 0 disables aging.
+        """
+        self.enabled = enabled
+        self._size_classes = list(size_classes)
+        self._small_file_size = small_file_size
+        self._reserved_workers = reserved_workers
+        self._aging_seconds = aging_seconds
+
+    def size_class(self, operation):
+        """
+        @return
+                    The index of the size class of the operation.
+        """
+        return bisect.bisect_right(self._size_classes, _size(operation)) - 1
+
+    def is_urgent(self, operation):
+        return operation.verb in URGENT_VERBS \
+            or operation.pathname.endswith(u'/')
+
+    def is_large(self, operation):
+        """
+        @return
+                    True if the operation can't use the workers reserved
+                    for small files.
+        """
+        if not self.enabled or self.is_urgent(operation):
+            return False
+        return _size(operation) >= self._small_file_size
+
+    def priority(self, operation, waited=0.0, large_lane_free=False):
+        """
+        @param operation:
+                    A PathnameOperation or a worker task.
+        @param waited:
+                    Number of seconds the operation has been waiting.
+        @param large_lane_free:
+                    Boolean telling whether no worker is busy with a
+                    large file.
+        @return
+                    The priority of the operation, the lower the sooner.
+        """
+        if not self.enabled:
+            return 0
+        if self.is_urgent(operation):
+            return URGENT_PRIORITY
+        if large_lane_free and self.is_large(operation):
+            return LARGE_LANE_PRIORITY
+        priority = float(self.size_class(operation))
+        if self._aging_seconds > 0:
+            priority -= float(waited) / self._aging_seconds
+        return max(priority, 0.0)
+
+    def max_large_operations(self, workers):
+        """
+        @param workers:
+                    The number of workers in the pool.
+        @return
+                    How many workers can be busy with large files at
+                    the same time. There is always at least one.
+        """
+        if not self.enabled:
+            return workers
+        return max(1, workers - self._reserved_workers)
+
+
+def _size(operation):
+    size = getattr(operation, 'storage_size', None)
+    if size is None:
+        size = getattr(operation, 'warebox_size', None)
+    return size if size is not None else 0
+
+
+if __name__ == '__main__':
+    import random
+
+    class FakeOperation(object):
+
+        def __init__(self, pathname, size):
+            self.verb = 'UPLOAD'
+            self.pathname = pathname
+            self.storage_size = size
+
+    def percentile(values, fraction):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * fraction))]
+
+    def simulation_test(name, policy, workload, workers, rate, overhead):
+        """ Simulated clock: the running transfers share a link of "rate"
+        bytes per second and each operation first pays "overhead"
+        seconds of latency. Free workers pick the waiting operation with
+        the best priority, as ReplicationAndTransferState does. """
+        waiting = []
+        # [overhead left, bytes left, arrival, operation]
+        running = []
+        large_running = 0
+        synced = {}
+        clock = 0.0
+        arrivals = list(workload)
+        arrivals.reverse()
+        while len(arrivals) > 0 or len(waiting) > 0 or len(running) > 0:
+            while len(arrivals) > 0 and arrivals[-1][0] <= clock:
+                waiting.append(arrivals.pop())
+            while len(running) < workers and len(waiting) > 0:
+                best = None
+                for index, (arrival, seq, operation) in enumerate(waiting):
+                    if policy.is_large(operation) and large_running \
+                    >= policy.max_large_operations(workers):
+                        continue
+                    key = (policy.priority(operation, clock - arrival,
+                                           large_running == 0), seq)
+                    if best is None or key < best[0]:
+                        best = (key, index)
+                if best is None:
+                    break
+                arrival, seq, operation = waiting.pop(best[1])
+                if policy.is_large(operation):
+                    large_running += 1
+                running.append(
+                    [overhead, operation.storage_size, arrival, operation])
+            transferring = len([r for r in running if r[0] <= 0])
+            share = float(rate) / max(1, transferring)
+            steps = [r[0] if r[0] > 0 else r[1] / share for r in running]
+            if len(arrivals) > 0:
+                steps.append(arrivals[-1][0] - clock)
+            step = max(0.0, min(steps))
+            clock += step
+            for r in running:
+                if r[0] > 0:
+                    r[0] -= step
+                else:
+                    r[1] -= step * share
+            for r in [r for r in running if r[0] <= 1e-9 and r[1] <= 1e-3]:
+                running.remove(r)
+                _, _, arrival, operation = r
+                if policy.is_large(operation):
+                    large_running -= 1
+                size_class = policy.size_class(operation)
+                synced.setdefault(size_class, []).append(clock - arrival)
+            for r in running:
+                r[0] = max(r[0], 0.0) if r[0] > 1e-9 else 0.0
+        print "%s: %s files, %s seconds elapsed" % (name, len(workload), clock)
+        for size_class in sorted(synced):
+            times = synced[size_class]
+            print "> class >= %s KB (%s files): p50 %.1f s, p99 %.1f s" \
+                % (DEFAULT_SIZE_CLASSES[size_class] / 1024, len(times),
+                   percentile(times, 0.5), percentile(times, 0.99))
+
+    random.seed(0)
+    files = []
+    for count, min_size, max_size in [(2000, 1024, 65535),
+                                      (200, 65536, 524287),
+                                      (60, 524288, 4194303),
+                                      (15, 4194304, 10485759),
+                                      (6, 10485760, 52428799),
+                                      (2, 52428800, 314572800)]:
+        files.extend(random.randint(min_size, max_size)
+                     for _ in xrange(count))
+    random.shuffle(files)
+    # Files are found by the scan at 100 per second
+    workload = [(seq * 0.01, seq, FakeOperation(u'file%s' % seq, size))
+                for seq, size in enumerate(files)]
+    for name, policy in [('arrival order', SchedulingPolicy(enabled=False)),
+                         ('priority', SchedulingPolicy())]:
+        simulation_test(name, policy, workload, 4, 2 * 1024 * 1024, 0.1)
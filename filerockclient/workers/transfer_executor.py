@@ -0,0 +1,507 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+This is the transfer_executor module.
+
+Uploads and downloads the files of the pathname operations handled by
+a worker. The executor lives as long as its worker does, so the
+storage connector, the connection pool and the logger are set up once
+and reused by all the transfers.
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+from tempfile import mkstemp
+from binascii import unhexlify
+import traceback
+import hashlib
+import os
+import logging
+
+from filerockclient.interfaces import PStatuses
+from filerockclient.storage_connector import StorageConnector, PartialDownload
+from filerockclient.workers.filters.encryption.encrypter import \
+    EncryptingReader
+from filerockclient.util.utilities import stoppable_exponential_backoff_waiting
+
+
+DOWNLOAD_DIR = 'downloads'
+PARTIAL_DOWNLOAD_DIR = 'partial'
+
+SUCCESS = 0
+INTERRUPTED = 1
+FAILED = 2
+
+
+class TransferExecutor(object):
+    """
+    Handles the upload and download of files on behalf of a worker.
+
+    Transfers are executed in the calling thread, one at a time. The
+    current one can be interrupted at any time from another thread by
+    setting terminationEvent, which the owner must clear before
+    starting the next one.
+    """
+
+    def __init__(self,
+                 warebox,
+                 terminationEvent,
+                 percentage_callback,
+                 cfg,
+                 pool,
+                 name):
+        """
+        @param warebox:
+                    Instance of filerockclient.warebox.Warebox.
+        @param terminationEvent:
+                    threading.Event used to stop the upload/download
+        @param percentage_callback:
+                    Function called with the operation, its status and
+                    the transfer percentage.
+        @param cfg:
+                    instance of filerockclient.config.ConfigManager
+        @param pool:
+                    Instance of filerockclient.workers.worker_pool.WorkerPool
+                    giving the bandwidths and the connection pool.
+        @param name:
+                    Name of the owner worker, used for logging.
+        """
+        self.logger = logging.getLogger(
+            "FR.%s of %s" % (self.__class__.__name__, name))
+        self.terminationEvent = terminationEvent
+        self.cfg = cfg
+        self.up_bandwidth = pool.up_bandwidth
+        self.down_bandwidth = pool.down_bandwidth
+        self.connection_pool = pool.connection_pool
+        self.percentage_callback = percentage_callback
+        self.warebox = warebox
+        self.connector = StorageConnector(
+            self.warebox, self.cfg, self.connection_pool)
+
+    def execute(self, file_operation):
+        """
+        Transfers the file of the given operation.
+
+        @param file_operation: instance of filerockclient.pathname_operation
+        @return
+                    Dictionary whose 'status' key is one among SUCCESS,
+                    INTERRUPTED and FAILED. Successful downloads also
+                    have the 'actual_etag' key.
+        """
+        self.logger.debug(u'Started to handle %s' % file_operation)
+        self._get_temp_file(file_operation)
+        result = self._handle_operation(file_operation)
+        if result['status'] == SUCCESS:
+            self.logger.debug(u'Operation completed: %s' % file_operation)
+        elif result['status'] == INTERRUPTED:
+            self.logger.debug(u'Failed performing operation %s. '
+                              'INTERRUPTED.' % file_operation)
+        else:
+            self.logger.debug(u'Failed performing operation %s.'
+                              % file_operation)
+        return result
+
+    def _check_download_dir(self, download_dir):
+        if os.path.exists(download_dir) and os.path.isdir(download_dir):
+            return True
+        elif os.path.exists(download_dir) and not os.path.isdir(download_dir):
+            os.unlink(download_dir)
+        elif not os.path.exists(download_dir):
+            os.makedirs(download_dir)
+
+    def _get_download_dir(self):
+        temp_dir = self.cfg.get('Application Paths', 'temp_dir')
+        temp_dir = os.path.join(temp_dir, DOWNLOAD_DIR)
+        self._check_download_dir(temp_dir)
+        return temp_dir
+
+    def _get_partial_download_pathname(self, file_operation):
+        """
+        Returns the pathname of the file that holds the data downloaded
+        so far for the given operation.
+
+        The name depends on both the pathname and the storage etag, so
+        that an interrupted download can be resumed, even after a
+        restart, only if the remote content hasn't changed.
+        """
+        partial_dir = os.path.join(self._get_download_dir(),
+                                   PARTIAL_DOWNLOAD_DIR)
+        self._check_download_dir(partial_dir)
+        key = u'%s\n%s' % (file_operation.pathname, file_operation.storage_etag)
+        return os.path.join(partial_dir,
+                            hashlib.md5(key.encode('utf-8')).hexdigest())
+
+    def _get_temp_file(self, file_operation):
+        if file_operation.verb == 'DOWNLOAD':
+            temp_dir = self._get_download_dir()
+            temp_fd, temp_pathname = mkstemp(dir=temp_dir)
+            os.close(temp_fd)
+            file_operation.temp_pathname = temp_pathname
+            file_operation.temp_fd = temp_fd
+
+    def _handle_operation(self, file_operation):
+        """
+        Handles a file_operation, uploading o downloading the associated file
+
+        @param file_operation: instance of filerockclient.pathname_operation
+        """
+        try:
+            if file_operation.verb == 'UPLOAD':
+                result = self._handle_upload_operation(file_operation)
+                return result
+            elif file_operation.verb == 'DOWNLOAD':
+                result = self._handle_download_operation(file_operation)
+                return result
+            else:
+                self.logger.debug(u'Unsupported verb for operation,'
+                                  ' giving up: %s' % file_operation)
+                result = {'status': FAILED}
+                return result
+        except Exception as e:
+            self.logger.debug(u'Exception caught: %s\n%s'
+                              % (e, traceback.format_exc()))
+            result = {'status': FAILED}
+            return result
+
+    def _handle_upload_operation(self, file_operation):
+        """
+        Handles upload operation
+
+        Prepares useful data and delegates to the connector the upload
+
+        @param file_operation: instance of filerockclient.pathname_operation
+        """
+
+        if file_operation.to_encrypt and file_operation.stream_encryption:
+            pathname = file_operation.pathname
+            open_function = self._get_encrypting_open_function(file_operation)
+            etag = file_operation.storage_etag
+            size = file_operation.storage_size
+            iv = file_operation.iv
+        elif file_operation.to_encrypt:
+            pathname = file_operation.encrypted_pathname
+            open_function = open
+            etag = file_operation.storage_etag
+            size = file_operation.storage_size
+            iv = file_operation.iv
+        else:
+            pathname = file_operation.pathname
+            open_function = self.warebox.open
+            etag = file_operation.warebox_etag
+            size = file_operation.warebox_size
+            iv = None
+
+        args = [
+            pathname,
+            file_operation.upload_info['remote_pathname'],
+            file_operation.upload_info['remote_ip_address'],
+            file_operation.upload_info['bucket'],
+            file_operation.upload_info['auth_token'],
+            file_operation.upload_info['auth_date'],
+            open_function,
+            etag,
+            size,
+            iv
+        ]
+
+        percentage_callback = \
+            lambda percentage: \
+            self.percentage_callback(file_operation,
+                                     PStatuses.UPLOADING,
+                                     percentage)
+        do_upload = \
+            lambda event: \
+            self.connector.upload_file(*args,
+                                       terminationEvent=event,
+                                       percentageQueue=percentage_callback,
+                                       logger=self.logger,
+                                       bandwidth=self.up_bandwidth)
+
+        return self._perform_network_transfer(do_upload, file_operation)
+
+    def _get_encrypting_open_function(self, file_operation):
+        """
+        Returns an "open" function that gives the encrypted content of
+        the warebox file, computed while reading it.
+
+        @param file_operation: instance of filerockclient.pathname_operation
+        """
+        key = unhexlify(self.cfg.get('User', 'encryption_key'))
+        iv = unhexlify(file_operation.iv)
+        size = file_operation.storage_size
+
+        def open_encrypted(pathname, mode):
+            return EncryptingReader(self.warebox.open(pathname, mode),
+                                    key, iv, size)
+
+        return open_encrypted
+
+    def _handle_download_operation(self, file_operation):
+        """
+        Handles download operation
+
+        Prepares useful data and delegates to the connector the download
+
+        @param file_operation: instance of filerockclient.pathname_operation
+        """
+        if file_operation.to_decrypt:
+            pathname = file_operation.encrypted_pathname
+            open_function = open
+        else:
+            pathname = file_operation.temp_pathname
+            open_function = open
+
+        partial_pathname = self._get_partial_download_pathname(file_operation)
+        partial_download = PartialDownload(partial_pathname)
+        if partial_download.offset > 0:
+            self.logger.debug(u'Resuming download of "%s" from byte %s'
+                              % (file_operation.pathname,
+                                 partial_download.offset))
+
+        args = [
+            partial_pathname,
+            file_operation.pathname,
+            file_operation.download_info['remote_ip_address'],
+            file_operation.download_info['bucket'],
+            file_operation.download_info['auth_token'],
+            file_operation.download_info['auth_date'],
+            open_function
+        ]
+
+        percentage_callback = \
+            lambda percentage: \
+            self.percentage_callback(file_operation,
+                                     PStatuses.DOWNLOADING,
+                                     percentage)
+
+        def do_download(event):
+            offset = partial_download.offset
+            result = self.connector.download_file(
+                *args,
+                terminationEvent=event,
+                percentageQueue=percentage_callback,
+                logger=self.logger,
+                bandwidth=self.down_bandwidth,
+                partial_download=partial_download)
+            if result['success'] and offset > 0 \
+            and result['etag'] != file_operation.storage_etag:
+                # Don't let a bad partial file look like an integrity
+                # error, download it again from scratch.
+                self.logger.warning(u'Resumed download of "%s" has a wrong'
+                                    ' etag, discarding the partial data'
+                                    % file_operation.pathname)
+                partial_download.reset()
+                result = {'success': False, 'details': {}}
+            result['progress'] = partial_download.offset > offset
+            return result
+
+        result = self._perform_network_transfer(do_download, file_operation)
+        if result['status'] == SUCCESS:
+            if os.path.exists(pathname):
+                os.remove(pathname)
+            os.rename(partial_pathname, pathname)
+        return result
+
+    def _perform_network_transfer(self, transfer_strategy, file_operation):
+        """Does a limited number of attempts to perform the given transfer.
+
+        In case of failure a certain time interval is awaited and another
+        attempt is performed. The waiting time is doubled each time until
+        the maximum amount of attempts is reached. Attempts that have
+        made some progress (that is, a download that can be resumed)
+        don't count and reset the waiting time.
+        The transfer could be interrupted in any time by setting
+        terminationEvent.
+
+        @param transfer_strategy:
+                    lambda function wrapping the transfer method.
+        @param file_operation:
+                    instance of filerockclient.pathname_operation.
+
+        """
+        max_attempts = 10
+        waiting_time = 1
+
+        attempts = 0
+        while not self.terminationEvent.is_set() and attempts <= max_attempts:
+            self.logger.debug(u'Started network transfer for: %s "%s":'
+                              % (file_operation.verb, file_operation.pathname))
+            response = transfer_strategy(self.terminationEvent)
+
+            if response['success']:
+                self.logger.debug(u'Successfully ended network transfer'
+                                  ' for: %s "%s":' %
+                                  (file_operation.verb, file_operation.pathname))
+                result = {'status': SUCCESS}
+                if file_operation.verb == 'DOWNLOAD':
+                    result['actual_etag'] = response['etag']
+                return result
+
+            elif 'termination' in response['details']:
+                    result = {'status': INTERRUPTED}
+                    return result
+
+            if response.get('progress', False):
+                attempts = 0
+                waiting_time = 1
+
+            self.logger.warning(u'HTTP %s failed for operation: %s. '
+                                'Retrying in %s seconds...' %
+                                (file_operation.verb, file_operation, waiting_time))
+            self.logger.debug(u'Response details: %s' % (response['details']))
+            waiting_time = stoppable_exponential_backoff_waiting(
+                waiting_time, self.terminationEvent)
+            attempts += 1
+
+        if self.terminationEvent.is_set():
+            # termination requested from outside
+            result = {'status': INTERRUPTED}
+            return result
+
+        self.logger.error(u'Ok, I have tried performing %s for %d times.'
+                          ' I am done now. Put that stuff in a FedEx box and'
+                          ' send it via mail.'
+                          % (file_operation, max_attempts))
+        result = {'status': FAILED}
+        return result
+
+
+
+if __name__ == '__main__':
+    import time
+    import Queue
+    import threading
+    import multiprocessing
+    from filerockclient.util.ipc_log_receiver import LogsReceiver
+
+    class Stub(object):
+        """ Warebox, configuration and pool, as far as the executor cares """
+        up_bandwidth = down_bandwidth = connection_pool = None
+
+        def get(self, section, option):
+            return ''
+
+    class InstantConnector(object):
+        def upload_file(self, *args, **kwds):
+            kwds['percentageQueue'](100)
+            return {'success': True, 'details': {}}
+
+    class Upload(object):
+        verb = 'UPLOAD'
+        to_encrypt = False
+        warebox_etag = 'd41d8cd98f00b204e9800998ecf8427e'
+        warebox_size = 0
+        upload_info = {'remote_pathname': u'file', 'remote_ip_address': '',
+                       'bucket': '', 'auth_token': '', 'auth_date': ''}
+
+        def __init__(self, i):
+            self.pathname = u'file%05d' % i
+
+    def make_executor():
+        executor = TransferExecutor(Stub(), threading.Event(),
+                                    lambda op, status, percentage: None,
+                                    Stub(), Stub(), 'Worker')
+        executor.connector = InstantConnector()
+        return executor
+
+    def child_thread(executor, input_queue, output_queue):
+        """ What the per-worker child thread did for each operation """
+        while True:
+            operation = input_queue.get()
+            if operation is None:
+                return
+            executor.terminationEvent.clear()
+            result = executor.execute(operation)
+            output_queue.put(('completed', result))
+
+    def spawned_child_test(count):
+        """ A child, its queues and its logs receiver for each operation,
+        as when the previous child was dead """
+        begin = time.time()
+        for i in xrange(count):
+            executor = make_executor()
+            input_queue, output_queue = Queue.Queue(), Queue.Queue()
+            logs_queue = multiprocessing.Queue()
+            logs_receiver = LogsReceiver('Worker', logs_queue)
+            logs_receiver.start()
+            child = threading.Thread(target=child_thread,
+                                     args=(executor, input_queue, output_queue))
+            child.start()
+            input_queue.put(Upload(i))
+            output_queue.get()
+            input_queue.put(None)
+            child.join()
+            logs_receiver.stop()
+            logs_queue.put(('log', ('debug', 'Die please!')))
+            logs_receiver.join()
+            logs_queue.close()
+            logs_queue.join_thread()
+        end = time.time()
+        print "Spawned child: %s uploads" % count
+        print "> %s seconds elapsed, %s ms per file" \
+            % (end - begin, (end - begin) * 1000 / count)
+
+    def long_lived_child_test(count):
+        """ The same child for all operations, crossing two queues """
+        executor = make_executor()
+        input_queue, output_queue = Queue.Queue(), Queue.Queue()
+        child = threading.Thread(target=child_thread,
+                                 args=(executor, input_queue, output_queue))
+        child.start()
+        begin = time.time()
+        for i in xrange(count):
+            input_queue.put(Upload(i))
+            output_queue.get()
+        end = time.time()
+        input_queue.put(None)
+        child.join()
+        print "Long-lived child: %s uploads" % count
+        print "> %s seconds elapsed, %s ms per file" \
+            % (end - begin, (end - begin) * 1000 / count)
+
+    def executor_test(count):
+        """ The worker executing the transfers itself """
+        executor = make_executor()
+        begin = time.time()
+        for i in xrange(count):
+            executor.terminationEvent.clear()
+            executor.execute(Upload(i))
+        end = time.time()
+        print "TransferExecutor: %s uploads" % count
+        print "> %s seconds elapsed, %s ms per file" \
+            % (end - begin, (end - begin) * 1000 / count)
+
+    spawned_child_test(10)
+    long_lived_child_test(10000)
+    executor_test(10000)
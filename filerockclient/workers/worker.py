@@ -41,10 +41,9 @@ FileRock Client is licensed under GPLv3 License.
 """
 
 import os
+import time
 import logging
 import threading
-import multiprocessing
-import Queue
 import traceback
 from threading import Thread
 from datetime import datetime
@@ -52,11 +51,13 @@ from datetime import datetime
 from filerockclient.pathname_operation import PathnameOperation
 from filerockclient.serversession.states.sync_download import \
     CreateDirectoriesTask, DeleteLocalTask, ResolveDeletionConflictsTask
-from filerockclient.util.ipc_log_receiver import LogsReceiver
-from filerockclient.workers.worker_child import WorkerChild
+from filerockclient.workers.transfer_executor import TransferExecutor, \
+    SUCCESS, INTERRUPTED
 from filerockclient.interfaces import PStatuses
 from filerockclient.workers.filters.encryption import utils as CryptoUtils
 from filerockclient.util.utilities import _try_remove
+from filerockclient.util.pathname_trie import PathnameTrie
+from filerockclient.databases.sqlite_driver import close_thread_connections
 from filerockclient.integritycheck.IntegrityManager import \
     IntegrityManager, WrongBasisFromProofException
 from filerockclient.integritycheck.ProofManager import MalformedProofException
@@ -96,20 +97,14 @@ class Worker(Thread):
         self.operation_queue = operation_queue
         self._server_session = server_session
         self.warebox = warebox
-        self.child = None
-
-        self.input_queue = None
-        self.communicationQueue = None
-        self.child_logger = None
-        self.child_logs_queue = None
+        self.executor = None
+        self.terminationEvent = threading.Event()
         self.cryptoAdapter = cryptoAdapter
         self.integrity_manager = IntegrityManager(None)
 
         self._worker_pool = worker_pool
         self.must_die = threading.Event()
         self.last_send = datetime.now()
-        self.communicationQueue = None
-        self.child_logs_queue = None
 
     def run(self):
         """
@@ -123,7 +118,8 @@ class Worker(Thread):
                 self._serve_file_operations()
             self.logger.debug(u"I'm terminated.")
         finally:
-            self._terminate_child()
+            self._clean_env()
+            close_thread_connections()
 
     def _serve_file_operations(self):
         """
@@ -173,7 +169,7 @@ class Worker(Thread):
                 self._worker_pool.track_assert_assigned(
                     self.ident, file_operation.pathname)
 
-            self._worker_pool.release_worker()
+            self._worker_pool.release_worker(file_operation)
 
             if __debug__:
                 self._worker_pool.track_release_worker(
@@ -216,20 +212,18 @@ class Worker(Thread):
         '''
 
         with file_operation.lock:
-            if not file_operation.is_aborted():
-                self.logger.debug(u"Starting child process to handle file"
-                                  " operation: %s" % file_operation)
-                try:
-                    self._spawn_child(file_operation)
-                    self.input_queue.put(('FileOperation', file_operation))
-                except Exception as e:
-                    self.logger.error(
-                        u"Could not spawn a child process: %r" % e)
-                    raise OperationRejection(file_operation)
-            else:
+            if file_operation.is_aborted():
                 self.logger.debug(u"Got an already aborted operation, "
                                   "giving up: %s" % file_operation)
                 return False
+            # From now on an abort reaches the transfer
+            self.terminationEvent.clear()
+            try:
+                executor = self._get_executor()
+            except Exception as e:
+                self.logger.error(
+                    u"Could not create the transfer executor: %r" % e)
+                raise OperationRejection(file_operation)
 
         if file_operation.verb == 'UPLOAD':
             status = PStatuses.UPLOADING
@@ -237,54 +231,46 @@ class Worker(Thread):
             status = PStatuses.DOWNLOADING
 
         self._send_percentage(file_operation, status, 0)
-        termination = False
         max_retry = 3
 
-        while not termination:
-            message, content = self.communicationQueue.get()
-            self.logger.debug(u'Worker send back %s with content %s'
-                              % (message, content))
+        while True:
+            begin = time.time()
+            try:
+                result = executor.execute(file_operation)
+            except Exception as e:
+                self.logger.error(u"Transfer executor died: %r" % e)
+                self.logger.debug(traceback.format_exc())
+                self.executor = None
+                self._worker_pool.on_transfer_done(
+                    0, time.time() - begin, success=False)
+                raise OperationRejection(file_operation)
+
+            if result['status'] != INTERRUPTED:
+                self._worker_pool.on_transfer_done(
+                    getattr(file_operation, 'storage_size', None) or 0,
+                    time.time() - begin,
+                    success=(result['status'] == SUCCESS))
 
-            if message == 'completed':
-                termination = True
+            if result['status'] == SUCCESS:
                 if file_operation.verb == 'DOWNLOAD':
-                    return {'actual_etag': content['actual_etag']}
+                    return {'actual_etag': result['actual_etag']}
                 else:
                     return True
 
-            elif message == 'interrupted':
-                self.logger.debug(u"Child has been terminated by "
+            elif result['status'] == INTERRUPTED:
+                self.logger.debug(u"Transfer has been interrupted by "
                                   "Software Operation: %s"
                                   % file_operation)
                 file_operation.abort()
-                termination = True
                 return False
 
-            elif message == 'failed':
-                self.logger.error(u"Child has been terminated, "
+            else:
+                self.logger.error(u"Transfer has failed, "
                                   "Assuming failure for operation: %s"
                                   % file_operation)
                 max_retry -= 1
                 if max_retry == 0:
                     raise OperationRejection(file_operation)
-                self.input_queue.put(('FileOperation', file_operation))
-
-            elif message == 'percentage':
-                self._send_percentage(file_operation, status, content)
-
-            elif message == 'log':
-                level, msg = content
-                self.child_logger[level](msg)
-
-            elif message == 'ShuttingDown':
-                self.logger.debug(u"Get a shutting down message from process")
-                termination = True
-                return False
-
-            elif message == 'DIED':
-                self.child = None
-                termination = True
-                raise OperationRejection(file_operation)
 
     def _handle_upload_file_operation(self, operation):
         try:
@@ -434,10 +420,10 @@ class Worker(Thread):
             return result
 
         try:
-            self.integrity_manager.addOperation('DOWNLOAD',
-                                                pathname,
-                                                proof,
-                                                actual_etag)
+            self.integrity_manager.verifyOperation('DOWNLOAD',
+                                                   pathname,
+                                                   proof,
+                                                   actual_etag)
             result['valid'] = True
             result['computed_basis'] = basis
 
@@ -486,18 +472,13 @@ class Worker(Thread):
                     res['expected_basis'], res['computed_basis'])
                 return
 
-        roots = {}
-        for pathname in pathnames:
-            found_ancestor = False
-            for root in roots:
-                if pathname.startswith(root):
-                    found_ancestor = True
-                    break
-            if not found_ancestor:
-                roots[pathname] = True
+        # Deleting a folder deletes its whole content
+        trie = PathnameTrie(pathnames)
+        roots = [pathname for pathname in pathnames
+                 if trie.nearest_ancestor(pathname) is None]
 
         try:
-            for pathname in roots.iterkeys():
+            for pathname in roots:
                 self.warebox.delete_tree(pathname)
         except Exception as e:
             self.logger.error(
@@ -518,10 +499,10 @@ class Worker(Thread):
         result['computed_basis'] = None
 
         try:
-            self.integrity_manager.addOperation('DELETE_LOCAL',
-                                                pathname,
-                                                proof,
-                                                None)
+            self.integrity_manager.verifyOperation('DELETE_LOCAL',
+                                                   pathname,
+                                                   proof,
+                                                   None)
             result['valid'] = True
             result['computed_basis'] = trusted_basis
 
@@ -584,7 +565,7 @@ class Worker(Thread):
         conflicts = task.deletion_conflicts
         content_to_delete_locally = task.content_to_delete_locally
 
-        for pathname in conflicts:
+        for pathname in sorted(conflicts):
             basis = task.trusted_basis
             proof = task.pathname2proof[pathname]
             res = self._check_deletelocal_integrity(pathname, proof, basis)
@@ -629,101 +610,37 @@ class Worker(Thread):
                 u"filesystem. Are you locking the Warebox?")
             raise
 
-    def _start_child_logger(self):
-        self._stop_child_logger()
-        self.child_logs_queue = multiprocessing.Queue()
-        self.child_logger = LogsReceiver(self.getName(), self.child_logs_queue)
-        self.child_logger.start()
-        if self.child_logger is None:
-            logger = logging.getLogger(u'FR.WorkerChild of %s' % self.getName())
-            self.child_logger = {
-                'info': logger.info,
-                'debug': logger.debug,
-                'warning': logger.warning,
-                'error': logger.error,
-                'critical': logger.critical
-            }
-
-    def _stop_child_logger(self):
-        if self.child_logger is not None:
-            self.child_logger.stop()
-            self.child_logs_queue.put(('log', ('debug', 'Die please!')))
-            self.child_logger.join()
-            self.child_logger = None
-
-        if self.child_logs_queue is not None:
-            self.child_logs_queue.close()
-            self.child_logs_queue.join_thread()
-            self.child_logs_queue = None
-
-    def _create_multiprocessing_queues(self):
-        self._destroy_multiprocessing_queues()
-        self.input_queue = Queue.Queue()
-        self.communicationQueue = Queue.Queue()
-
-    def _destroy_multiprocessing_queue(self, queue):
-        if queue is not None:
-            while not queue.empty():
-                queue.get_nowait()
-#             queue.close()
-#             queue.join_thread()
-            queue = None
-
-    def _destroy_multiprocessing_queues(self):
-        self._destroy_multiprocessing_queue(self.input_queue)
-        self._destroy_multiprocessing_queue(self.communicationQueue)
-
-    def _spawn_child(self, file_operation):
-        if self.child is None or not self.child.is_alive():
-#             self.terminationEvent = multiprocessing.Event()
-            self.terminationEvent = threading.Event()
-            self._create_multiprocessing_queues()
-            self._start_child_logger()
-            try:
-                self.logger.debug(u"Allocating child process to handle file "
-                                  "operation: %s" % file_operation)
-                self.child = WorkerChild(self.warebox,
-                                         self.input_queue,
-                                         self.communicationQueue,
-                                         self.terminationEvent,
-                                         self._send_percentage,
-                                         #self.child_logs_queue,
-                                         self.cfg,
-                                         self._worker_pool)
-
-                self.child.start()
-                self.logger.debug(u"Child process Started to handle file "
-                                  "operation: %s" % file_operation)
-            except Exception:
-                self._stop_child_logger()
-                raise
+    def _get_executor(self):
+        """
+        @return
+                    The transfer executor of this worker, created at
+                    the first transfer and then reused.
+        """
+        if self.executor is None:
+            self.logger.debug(u"Creating the transfer executor")
+            self.executor = TransferExecutor(self.warebox,
+                                             self.terminationEvent,
+                                             self._send_percentage,
+                                             self.cfg,
+                                             self._worker_pool,
+                                             self.getName())
+        return self.executor
 
     def on_operation_abort(self, file_operation):
         self.logger.debug(u'Abort detected for the operation I am handling: '
-                          '%s. Terminating child process...' % file_operation)
+                          '%s. Interrupting the transfer...' % file_operation)
         self.abort_operation()
 
     def abort_operation(self):
-        if self.child is not None and self.child.is_alive():
-            try:
-                if self.terminationEvent is not None:
-                    self.terminationEvent.set()
-#                 else:
-#                     self.child.terminate()
-            except:
-                pass
-
-    def _terminate_child(self):
+        self.terminationEvent.set()
+
+    def terminate_child(self):
+        """Interrupt the running transfer, if any."""
         self.stop_network_transfer()
-        if self.child is not None:
-            self.input_queue.put(('PoisonPill', None))
-            self.child.join(5)
-            self.child = None
 
     def _clean_env(self):
-        self._terminate_child()
-        self._stop_child_logger()
-        self._destroy_multiprocessing_queues()
+        self.stop_network_transfer()
+        self.executor = None
 
     def _on_poison_pill(self):
         self.logger.debug(u"Got poison pill.")
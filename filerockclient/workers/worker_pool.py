@@ -44,19 +44,40 @@ import logging
 import threading
 import Queue
 import os
+import time
+import itertools
 
-from filerockclient.config import USER_DEFINED_OPTIONS
+from filerockclient.config import USER_DEFINED_OPTIONS, CLIENT_SECTION
 from filerockclient.workers.worker import Worker
-from filerockclient.workers.worker_child import DOWNLOAD_DIR
+from filerockclient.workers.transfer_executor import DOWNLOAD_DIR
+from filerockclient.workers.transfer_executor import PARTIAL_DOWNLOAD_DIR
 from filerockclient.workers.bandwidth import Bandwidth
 from filerockclient.workers.bandwidth import CHUNK_SIZE
+from filerockclient.workers.scheduling import SchedulingPolicy
+from filerockclient.workers.autoscaling import ConcurrencyController
+from filerockclient.util.connection_pool import HTTPSConnectionPool
+from filerockclient.util.resizable_semaphore import ResizableSemaphore
+
+
+# Partially downloaded files not resumed for this many seconds are deleted
+PARTIAL_DOWNLOAD_MAX_AGE = 7 * 24 * 60 * 60
+
+# Workers running at startup, and always if autoscaling is disabled
+DEFAULT_WORKERS = 4
+
+# Workers must stop before serving any other operation
+POISON_PILL_PRIORITY = -2
 
 
 class MyPriorityQueue(Queue.PriorityQueue):
+    """Priority queue of (priority, sequence number, element) tuples.
+
+    The sequence number keeps the arrival order among elements with the
+    same priority. Only the elements are returned.
+    """
 
     def get(self, block=True, timeout=None):
-        _, element = Queue.PriorityQueue.get(self, block, timeout)
-        return element
+        return Queue.PriorityQueue.get(self, block, timeout)[-1]
 
     def get_nowait(self):
         return self.get(False)
@@ -67,7 +88,15 @@ class WorkerPool(object):
     it can send operations to the workers and keep count of free workers.
 
     The operations are sent through a queue and the counting is done by
-    a semaphore.
+    a semaphore. The scheduling policy gives the operations their
+    priority and limits the workers busy with large files, see
+    filerockclient.workers.scheduling.
+
+    The number of workers follows the measured throughput, latency and
+    error rate of the transfers, see
+    filerockclient.workers.autoscaling. Workers are added by starting
+    new threads and removed by sending poison pills, while the
+    semaphore is resized accordingly.
     """
 
     def __init__(self, warebox, server_session, cfg, cryptoAdapter):
@@ -84,22 +113,42 @@ class WorkerPool(object):
         self.started = False
         self._server_session = server_session
         self.logger = logging.getLogger("FR.%s" % self.__class__.__name__)
-        self.how_many_workers = 4
+        self.concurrency = ConcurrencyController(
+            self.__class__.__name__, DEFAULT_WORKERS,
+            cfg.getint(CLIENT_SECTION, u'transfer_workers_min'),
+            cfg.getint(CLIENT_SECTION, u'transfer_workers_max'),
+            enabled=cfg.getboolean(CLIENT_SECTION, u'autoscaling_workers'))
+        self.how_many_workers = self.concurrency.concurrency
+        self._resize_lock = threading.Lock()
+        self._warebox = warebox
+        self._cryptoAdapter = cryptoAdapter
 
         self.up_bandwidth = Bandwidth(
             cfg.getint(USER_DEFINED_OPTIONS, u'bandwidth_limit_upload'))
         self.down_bandwidth = Bandwidth(
             cfg.getint(USER_DEFINED_OPTIONS, u'bandwidth_limit_download'),
             max_chunk_size=CHUNK_SIZE*10)
+        self.connection_pool = HTTPSConnectionPool(
+            max_idle_connections=cfg.getint(
+                CLIENT_SECTION, u'transfer_workers_max'))
         self.cfg = cfg
         self.worker_operation_queue = MyPriorityQueue()
+        self._sequence = itertools.count()
+        self.scheduling_policy = SchedulingPolicy(
+            enabled=cfg.getboolean(CLIENT_SECTION, u'priority_scheduling'),
+            small_file_size=cfg.getint(CLIENT_SECTION, u'small_file_size'),
+            reserved_workers=cfg.getint(
+                CLIENT_SECTION, u'small_files_workers'),
+            aging_seconds=cfg.getint(
+                CLIENT_SECTION, u'scheduling_aging_seconds'))
+        # ids of the operations holding a worker for a large file
+        self._large_operations = set()
+        self._large_operations_lock = threading.Lock()
         self.workers = []
-        self.free_worker = threading.BoundedSemaphore(self.how_many_workers)
+        self.free_worker = ResizableSemaphore(self.how_many_workers)
 
         for _ in range(self.how_many_workers):
-            worker = Worker(warebox, self.worker_operation_queue,
-                            server_session, cfg, cryptoAdapter, self)
-            self.workers.append(worker)
+            self.workers.append(self._create_worker())
 
         if __debug__:
             # If an entry (workerid, pathname) exists in both mappings it means
@@ -115,7 +164,7 @@ class WorkerPool(object):
             assert pathname not in self.track_pathname2workerid
             self.track_pathname2workerid[pathname] = None
             self.logger.debug("track worker: after acquire %d, %d, %d" % (
-                              self.free_worker._Semaphore__value,
+                              self.free_worker.get_value(),
                               len(self.track_workerid2pathname),
                               len(self.track_pathname2workerid)))
 
@@ -126,7 +175,7 @@ class WorkerPool(object):
             self.track_pathname2workerid[pathname] = workerid
             self.track_workerid2pathname[workerid] = pathname
             self.logger.debug("track worker: after assigned %d, %d, %d" % (
-                              self.free_worker._Semaphore__value,
+                              self.free_worker.get_value(),
                               len(self.track_workerid2pathname),
                               len(self.track_pathname2workerid)))
 
@@ -137,7 +186,7 @@ class WorkerPool(object):
             del self.track_workerid2pathname[workerid]
             del self.track_pathname2workerid[p]
             self.logger.debug("track worker: after release %d, %d, %d" % (
-                              self.free_worker._Semaphore__value,
+                              self.free_worker.get_value(),
                               len(self.track_workerid2pathname),
                               len(self.track_pathname2workerid)))
 
@@ -146,7 +195,7 @@ class WorkerPool(object):
             assert self.track_pathname2workerid[pathname] is None
             del self.track_pathname2workerid[pathname]
             self.logger.debug("track worker: after release unassigned %d, %d, %d" % (
-                              self.free_worker._Semaphore__value,
+                              self.free_worker.get_value(),
                               len(self.track_workerid2pathname),
                               len(self.track_pathname2workerid)))
 
@@ -162,12 +211,69 @@ class WorkerPool(object):
             assert p == pathname
             assert self.track_workerid2pathname[workerid] == p
 
+    def _create_worker(self):
+        return Worker(self._warebox, self.worker_operation_queue,
+                      self._server_session, self.cfg, self._cryptoAdapter,
+                      self)
+
     def start_workers(self):
         """Starts all the workers calling their start method
         """
-        self.started = True
-        for worker in self.workers:
-            worker.start()
+        with self._resize_lock:
+            self.started = True
+            for worker in self.workers:
+                worker.start()
+
+    def on_transfer_done(self, size, elapsed, success=True):
+        """Called by a worker at the end of each transfer attempt, lets
+        the number of workers follow the observed performance.
+
+        Note: the calling thread is the worker's one.
+
+        @param size:
+                    Bytes transferred.
+        @param elapsed:
+                    Seconds taken by the transfer.
+        @param success:
+                    Boolean telling whether the transfer succeeded.
+        """
+        concurrency = self.concurrency.on_task_done(size, elapsed, success)
+        if concurrency is not None:
+            self._resize(concurrency)
+
+    def _resize(self, how_many_workers):
+        """Change the number of workers.
+
+        New workers are started at once. Workers are removed by poison
+        pills, which are served before any operation. The removed
+        semaphore permits are retired as they are released, never taken
+        from the free ones: this runs in a worker's thread, and the
+        session thread may have just found a free worker that it is
+        about to acquire.
+        """
+        with self._resize_lock:
+            previous = self.how_many_workers
+            if how_many_workers == previous:
+                return
+            self.logger.info(u"Running %s workers instead of %s"
+                             % (how_many_workers, previous))
+            self.free_worker.resize(how_many_workers)
+            self.how_many_workers = how_many_workers
+            # Forget the workers that have already taken a poison pill
+            self.workers = [w for w in self.workers if not w.must_die.is_set()]
+            if how_many_workers > previous:
+                for _ in xrange(how_many_workers - previous):
+                    worker = self._create_worker()
+                    self.workers.append(worker)
+                    if self.started:
+                        worker.start()
+            else:
+                for _ in xrange(previous - how_many_workers):
+                    self.worker_operation_queue.put(
+                        (POISON_PILL_PRIORITY, next(self._sequence),
+                         'POISON_PILL'))
+        if how_many_workers > previous:
+            self._server_session.signal_free_worker()
 
     def on_disconnect(self):
         """Terminates the workers processes and waits their termination
@@ -175,10 +281,10 @@ class WorkerPool(object):
         self.logger.debug('Stopping Workers')
         for w in self.workers:
             w.terminate_child()
-        for w in self.workers:
+        for _ in xrange(self.how_many_workers):
             if self.free_worker.acquire(False):
                 self.logger.debug('Acquiring the worker Semaphore')
-        for w in self.workers:
+        for _ in xrange(self.how_many_workers):
             self.free_worker.release()
             self.logger.debug('Released the worker Semaphore')
         while True:
@@ -186,6 +292,9 @@ class WorkerPool(object):
                 self.worker_operation_queue.get_nowait()
             except Queue.Empty:
                 break
+        with self._large_operations_lock:
+            self._large_operations.clear()
+        self._close_connections()
 
     def on_connect(self):
         pass
@@ -197,31 +306,82 @@ class WorkerPool(object):
         """
         if __debug__:
             self.track_assert_acquired(operation.pathname)
-        self.worker_operation_queue.put((1, operation))
+        priority = self.scheduling_policy.priority(operation)
+        self.worker_operation_queue.put(
+            (priority, next(self._sequence), operation))
 
-    def acquire_worker(self):
+    def acquire_worker(self, operation=None):
         """Tries to acquire the free_worker semaphore
 
+        @param operation:
+                    The operation the worker is acquired for, if known.
+                    Large files can't take the workers reserved for the
+                    small ones.
         @return: True if the semaphore was acquired, False otherwise
         """
-        return self.free_worker.acquire(False)
-
-    def exist_free_workers(self):
-        """Checks the presence of a free worker trying to
-        acquire the semaphore and releasing it
-
+        if operation is None:
+            return self._acquire_free_worker()
+        with self._large_operations_lock:
+            if not self._is_lane_free(operation):
+                return False
+            if not self._acquire_free_worker():
+                return False
+            if self.scheduling_policy.is_large(operation):
+                self._large_operations.add(id(operation))
+            return True
+
+    def exist_free_workers(self, operation=None):
+        """Checks the presence of a free worker looking at the
+        semaphore, without acquiring it: releasing it would retire the
+        permit if the pool has just shrunk.
+
+        @param operation:
+                    If given, also check that the worker could be
+                    acquired for this operation.
         @return: True if there is a free worker, false otherwise
         """
-        exist = self.free_worker.acquire(False)
-        if exist:
-            self.free_worker.release()
-        return exist
+        if operation is not None:
+            with self._large_operations_lock:
+                if not self._is_lane_free(operation):
+                    return False
+        if self.free_worker.get_value() > 0:
+            return True
+        # Some operation is going to wait for a worker
+        self.concurrency.on_saturated()
+        return False
+
+    def _acquire_free_worker(self):
+        if self.free_worker.acquire(False):
+            return True
+        # Some operation is going to wait for a worker
+        self.concurrency.on_saturated()
+        return False
+
+    def is_large_lane_free(self):
+        """
+        @return: True if no worker is busy with a large file
+        """
+        with self._large_operations_lock:
+            return len(self._large_operations) == 0
 
-    def release_worker(self):
+    def _is_lane_free(self, operation):
+        if not self.scheduling_policy.is_large(operation):
+            return True
+        max_large = self.scheduling_policy.max_large_operations(
+            self.how_many_workers)
+        return len(self._large_operations) < max_large
+
+    def release_worker(self, operation=None):
         """Releases the semaphore and sends a message to server session
+
+        @param operation:
+                    The operation the worker was acquired for, if known.
         """
         assert len(self.track_pathname2workerid) > 0
-        assert self.free_worker._Semaphore__value < self.how_many_workers
+        assert self.free_worker.get_in_use() > 0
+        if operation is not None:
+            with self._large_operations_lock:
+                self._large_operations.discard(id(operation))
         self.free_worker.release()
         self._server_session.signal_free_worker()
 
@@ -229,7 +389,8 @@ class WorkerPool(object):
         """Sends the poison pill to each worker and waits for their termination
         """
         for w in self.workers:
-            self.worker_operation_queue.put((0, 'POISON_PILL'))
+            self.worker_operation_queue.put(
+                (POISON_PILL_PRIORITY, next(self._sequence), 'POISON_PILL'))
             w.stop_network_transfer()
 
     def terminate(self):
@@ -242,8 +403,30 @@ class WorkerPool(object):
             for w in self.workers:
                 w.join() if w is not threading.current_thread() else None
             self.logger.debug(u"Workers terminated.")
+        self._close_connections()
         self.logger.debug(u"WorkerPool terminated.")
 
+    def set_bandwidth_limits(self, upload_limit, download_limit):
+        """Change the bandwidth limits of the running transfers.
+
+        @param upload_limit:
+                    Maximum upload rate in KB/s, 0 means no limit.
+        @param download_limit:
+                    Maximum download rate in KB/s, 0 means no limit.
+        """
+        self.logger.debug(u"Setting bandwidth limits to %s KB/s up, "
+                          u"%s KB/s down" % (upload_limit, download_limit))
+        self.up_bandwidth.set_limit(upload_limit)
+        self.down_bandwidth.set_limit(download_limit)
+
+    def _close_connections(self):
+        """Closes the idle storage connections and logs how well they
+        have been reused.
+        """
+        self.logger.debug(u"Storage connections: %s"
+                          % self.connection_pool.get_stats())
+        self.connection_pool.close_all()
+
     def clean_download_dir(self):
         """Deletes all the files in the encryption dir
         """
@@ -258,6 +441,27 @@ class WorkerPool(object):
                         os.unlink(file_path)
                 except Exception:
                     self.logger.exception('Error cleaning temp encryption dir')
+        self._clean_partial_download_dir(
+            os.path.join(folder, PARTIAL_DOWNLOAD_DIR))
+
+    def _clean_partial_download_dir(self, folder):
+        """Deletes the partially downloaded files that haven't been
+        resumed for a long time. The others are kept, since they let
+        interrupted downloads be resumed.
+        """
+        if not os.path.exists(folder):
+            return
+        now = time.time()
+        for the_file in os.listdir(folder):
+            file_path = os.path.join(folder, the_file)
+            try:
+                if os.path.isfile(file_path) \
+                and now - os.path.getmtime(file_path) > PARTIAL_DOWNLOAD_MAX_AGE:
+                    self.logger.debug('Unlinking stale partial download %s'
+                                      % file_path)
+                    os.unlink(file_path)
+            except Exception:
+                self.logger.exception('Error cleaning partial download dir')
 
 if __name__ == '__main__':
     pass
@@ -66,7 +66,8 @@ def test_integrity_error_if_different_storage_but_basis_is_trusted(
                         disconnectedstate_cls_mock, downloadstate_cls_mock)
 
     # There is nothing in the warebox
-    components['mock']['warebox'].get_content.return_value = []
+    components['mock']['warebox'].scan_content.return_value = []
+    components['mock']['warebox'].compute_etags.return_value = ({}, [])
 
     # There is nothing in the storage cache
     assert_equal(components['real']['storage_cache'].get_all_records(), [])
@@ -129,7 +130,8 @@ def test_integrity_error_if_storage_is_trusted_but_different_basis(
                         disconnectedstate_cls_mock, downloadstate_cls_mock)
 
     # There is nothing in the warebox
-    components['mock']['warebox'].get_content.return_value = []
+    components['mock']['warebox'].scan_content.return_value = []
+    components['mock']['warebox'].compute_etags.return_value = ({}, [])
 
     # There is nothing in the storage cache
     assert_equal(components['real']['storage_cache'].get_all_records(), [])
@@ -187,7 +189,8 @@ def test_integrity_error_if_different_storage_but_basis_is_candidate(
                         disconnectedstate_cls_mock, downloadstate_cls_mock)
 
     # There is nothing in the warebox
-    components['mock']['warebox'].get_content.return_value = []
+    components['mock']['warebox'].scan_content.return_value = []
+    components['mock']['warebox'].compute_etags.return_value = ({}, [])
 
     # There is nothing in the storage cache...
     assert_equal(components['real']['storage_cache'].get_all_records(), [])
@@ -255,7 +258,8 @@ def test_integrity_error_storage_is_candidate_but_different_basis(
                         disconnectedstate_cls_mock, downloadstate_cls_mock)
 
     # There is nothing in the warebox
-    components['mock']['warebox'].get_content.return_value = []
+    components['mock']['warebox'].scan_content.return_value = []
+    components['mock']['warebox'].compute_etags.return_value = ({}, [])
 
     # There is nothing in the storage cache...
     assert_equal(components['real']['storage_cache'].get_all_records(), [])
@@ -330,7 +334,8 @@ def test_integrity_error_if_storage_is_different_but_basis_is_accepted(
                         disconnectedstate_cls_mock, downloadstate_cls_mock)
 
     # There is nothing in the warebox
-    components['mock']['warebox'].get_content.return_value = []
+    components['mock']['warebox'].scan_content.return_value = []
+    components['mock']['warebox'].compute_etags.return_value = ({}, [])
 
     # There is nothing in the storage cache
     assert_equal(components['real']['storage_cache'].get_all_records(), [])
@@ -433,7 +438,8 @@ def test_integrity_error_if_storage_is_accepted_but_basis_is_different(
                         disconnectedstate_cls_mock, downloadstate_cls_mock)
 
     # There is nothing in the warebox
-    components['mock']['warebox'].get_content.return_value = []
+    components['mock']['warebox'].scan_content.return_value = []
+    components['mock']['warebox'].compute_etags.return_value = ({}, [])
 
     # There is nothing in the storage cache
     assert_equal(components['real']['storage_cache'].get_all_records(), [])
@@ -81,7 +81,8 @@ def test_nothing_to_sync_from_clean_state(
     download_state_mock.do_execute.side_effect = terminate
 
     # There is nothing in the warebox
-    components['mock']['warebox'].get_content.return_value = []
+    components['mock']['warebox'].scan_content.return_value = []
+    components['mock']['warebox'].compute_etags.return_value = ({}, [])
 
     # Send ServerSession a scenario with no data on the storage.
     components['real']['metadata'].set('trusted_basis', 'TRUSTEDBASIS')
@@ -143,7 +144,8 @@ def test_download_operations_from_clean_state(
     download_state_mock.do_execute.side_effect = terminate
 
     # There is nothing in the warebox
-    components['mock']['warebox'].get_content.return_value = []
+    components['mock']['warebox'].scan_content.return_value = []
+    components['mock']['warebox'].compute_etags.return_value = ({}, [])
 
     components['real']['metadata'].set('trusted_basis', 'TRUSTEDBASIS')
 
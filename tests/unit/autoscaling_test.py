@@ -0,0 +1,141 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+This is the autoscaling_test module.
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+
+from nose.tools import *
+
+from filerockclient.workers import autoscaling
+from filerockclient.workers.autoscaling import ConcurrencyController
+
+
+MB = 1024 * 1024
+INTERVAL = autoscaling.DEFAULT_INTERVAL
+
+
+def _window(controller, start, throughput, latency=1.0, errors=0,
+            cpu_time=0.0, saturated=True):
+    """Complete the tasks of one observation window at the given
+    aggregate throughput, return the decision."""
+    if saturated:
+        controller.on_saturated()
+    tasks = autoscaling.MIN_SAMPLES + errors
+    size = throughput * INTERVAL / autoscaling.MIN_SAMPLES
+    result = None
+    for i in xrange(tasks):
+        # The first task starts with the window, the last one ends it
+        now = start + latency + (INTERVAL - latency) * i / (tasks - 1)
+        result = controller.on_task_done(
+            size, latency, success=(i >= errors),
+            cpu_time=cpu_time / tasks, now=now)
+    return result
+
+
+def test_no_decision_before_enough_samples():
+    controller = ConcurrencyController('test', 4, 1, 16)
+    controller.on_saturated()
+    assert_equal(controller.on_task_done(MB, 1.0, now=0.0), None)
+    assert_equal(controller.on_task_done(MB, 1.0, now=INTERVAL * 10), None)
+    assert_equal(controller.concurrency, 4)
+
+
+def test_grows_while_throughput_grows():
+    controller = ConcurrencyController('test', 4, 1, 16)
+    assert_equal(_window(controller, 0, 4 * MB), 5)
+    assert_equal(_window(controller, INTERVAL, 5 * MB), 6)
+    assert_equal(_window(controller, 2 * INTERVAL, 6 * MB), 7)
+
+
+def test_does_not_grow_without_waiting_tasks():
+    controller = ConcurrencyController('test', 4, 1, 16)
+    assert_equal(_window(controller, 0, 4 * MB, saturated=False), None)
+    assert_equal(controller.concurrency, 4)
+
+
+def test_steps_back_when_throughput_does_not_grow():
+    controller = ConcurrencyController('test', 4, 1, 16)
+    assert_equal(_window(controller, 0, 4 * MB), 5)
+    assert_equal(_window(controller, INTERVAL, 4 * MB), 4)
+    # Growing is tried again only after a while
+    start = 2 * INTERVAL
+    for _ in xrange(autoscaling.PROBE_DELAY):
+        assert_equal(_window(controller, start, 4 * MB), None)
+        start += INTERVAL
+    assert_equal(_window(controller, start, 4 * MB), 5)
+
+
+def test_halves_on_errors():
+    controller = ConcurrencyController('test', 8, 1, 16)
+    assert_equal(_window(controller, 0, 4 * MB, errors=2), 4)
+
+
+def test_shrinks_on_cpu_load():
+    controller = ConcurrencyController('test', 2, 1, 4, cpus=2)
+    assert_equal(_window(controller, 0, 4 * MB, cpu_time=2 * INTERVAL), 1)
+    # Room for one more worker
+    controller = ConcurrencyController('test', 2, 1, 4, cpus=4)
+    assert_equal(_window(controller, 0, 4 * MB, cpu_time=2 * INTERVAL), 3)
+    # No room for one more worker
+    controller = ConcurrencyController('test', 3, 1, 4, cpus=4)
+    assert_equal(_window(controller, 0, 4 * MB, cpu_time=3 * INTERVAL), None)
+
+
+def test_shrinks_on_congestion():
+    controller = ConcurrencyController('test', 4, 1, 16)
+    assert_equal(_window(controller, 0, 4 * MB, saturated=False), None)
+    assert_equal(_window(controller, INTERVAL, 3 * MB, latency=2.0), 3)
+
+
+def test_stays_within_bounds():
+    controller = ConcurrencyController('test', 10, 1, 4)
+    assert_equal(controller.concurrency, 4)
+    assert_equal(_window(controller, 0, 4 * MB), None)
+    controller = ConcurrencyController('test', 1, 1, 4)
+    assert_equal(_window(controller, 0, 4 * MB, errors=2), None)
+    assert_equal(controller.concurrency, 1)
+
+
+def test_disabled():
+    controller = ConcurrencyController('test', 4, 1, 16, enabled=False)
+    assert_equal(_window(controller, 0, 4 * MB, errors=2), None)
+    assert_equal(_window(controller, INTERVAL, 4 * MB), None)
+    assert_equal(controller.concurrency, 4)
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,158 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+This is the bandwidth_test module.
+
+The shaper is driven by a simulated clock: each simulated worker asks
+for a chunk when it's ready, the time the shaper makes it wait is
+recorded instead of slept, and the worker is ready again when the
+wait is over. The simulation is single-threaded and deterministic.
+
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+from nose.tools import *
+
+from filerockclient.workers.bandwidth import Bandwidth, FROM_KB_TO_BYTE
+
+
+def test_unlimited_bandwidth_returns_max_chunk_size():
+    bandwidth = SimulatedBandwidth(0, max_chunk_size=4096)
+    assert_false(bandwidth.is_enabled())
+    assert_equal(bandwidth.byte_to_send(), 4096)
+    assert_equal(bandwidth.waited, 0)
+
+
+def test_single_worker_rate():
+    bandwidth = SimulatedBandwidth(100)
+    sent = simulate(bandwidth, workers=1, begin=0, end=100)
+    assert_rate(sum(sent), 100, 100)
+
+
+def test_many_workers_rate():
+    bandwidth = SimulatedBandwidth(500)
+    sent = simulate(bandwidth, workers=8, begin=0, end=100)
+    assert_rate(sum(sent), 100, 500)
+
+
+def test_workers_get_a_fair_share():
+    bandwidth = SimulatedBandwidth(300)
+    sent = simulate(bandwidth, workers=4, begin=0, end=100)
+    average = sum(sent) / len(sent)
+    for worker_sent in sent:
+        assert_almost_equal(worker_sent, average, delta=average * 0.02)
+
+
+def test_chunks_dont_shrink():
+    bandwidth = SimulatedBandwidth(100)
+    chunks = set()
+    ready = [0.0, 0.0, 0.0]
+    for _ in xrange(1000):
+        i = ready.index(min(ready))
+        bandwidth.clock = ready[i]
+        bandwidth.waited = 0
+        chunks.add(bandwidth.byte_to_send())
+        ready[i] = bandwidth.clock + bandwidth.waited
+    assert_equal(chunks, set([100 * FROM_KB_TO_BYTE / 10]))
+
+
+def test_limit_change_at_runtime():
+    bandwidth = SimulatedBandwidth(100)
+    simulate(bandwidth, workers=4, begin=0, end=50)
+    bandwidth.set_limit(400)
+    sent = simulate(bandwidth, workers=4, begin=50, end=150)
+    assert_rate(sum(sent), 100, 400)
+    bandwidth.set_limit(50)
+    sent = simulate(bandwidth, workers=4, begin=150, end=350)
+    assert_rate(sum(sent), 200, 50)
+
+
+def test_limit_can_be_enabled_and_disabled():
+    bandwidth = SimulatedBandwidth(0, max_chunk_size=4096)
+    bandwidth.set_limit(200)
+    sent = simulate(bandwidth, workers=2, begin=0, end=100)
+    assert_rate(sum(sent), 100, 200)
+    bandwidth.set_limit(0)
+    assert_equal(bandwidth.byte_to_send(), 4096)
+
+
+''' Helper functions: '''
+
+class SimulatedBandwidth(Bandwidth):
+
+    def __init__(self, limit, max_chunk_size=1024):
+        self.clock = 0.0
+        self.waited = 0.0
+        Bandwidth.__init__(self, limit, max_chunk_size)
+
+    def _now(self):
+        return self.clock
+
+    def _wait(self, seconds):
+        self.waited += seconds
+
+
+def simulate(bandwidth, workers, begin, end):
+    """Let the workers transfer as fast as the shaper allows between
+    the simulated times "begin" and "end".
+
+    @return
+                The list of bytes sent by each worker.
+    """
+    ready = [begin] * workers
+    sent = [0] * workers
+    served = range(workers)
+    while True:
+        # Workers ready at the same time are served round-robin
+        i = min(xrange(workers), key=lambda i: (ready[i], served[i]))
+        if ready[i] >= end:
+            break
+        served[i] = max(served) + 1
+        bandwidth.clock = ready[i]
+        bandwidth.waited = 0
+        chunk = bandwidth.byte_to_send()
+        # A chunk is sent only after the wait, it's lost if that's too late
+        if bandwidth.clock + bandwidth.waited < end:
+            sent[i] += chunk
+        ready[i] = bandwidth.clock + bandwidth.waited
+    return sent
+
+
+def assert_rate(sent, seconds, limit_kb):
+    """The achieved rate must be within 3% of the limit. The initial
+    burst is part of the allowance."""
+    rate = sent / float(seconds)
+    limit = limit_kb * FROM_KB_TO_BYTE
+    assert_almost_equal(rate, limit, delta=limit * 0.03)
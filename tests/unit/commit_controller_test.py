@@ -0,0 +1,146 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+"""
+This is the commit_controller_test module.
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+
+from nose.tools import *
+
+from filerockclient.serversession.commit_controller import \
+    CommitController, clamp_target_overhead
+
+
+MB = 1024 * 1024
+
+
+def _controller(**kwargs):
+    params = {
+        'idle_seconds': 10, 'max_operations': 1000, 'max_bytes': 500 * MB,
+        'max_seconds': 300, 'target_overhead': 0.1}
+    params.update(kwargs)
+    return CommitController(**params)
+
+
+def test_fixed_thresholds_when_not_adaptive():
+    controller = _controller(adaptive=False, threshold_operations=10,
+                             threshold_bytes=50 * MB)
+    assert_equal(controller.should_commit(9, 50 * MB, 0, now=0), None)
+    assert_equal(controller.should_commit(10, 0, 0, now=1), 'operations')
+    assert_equal(controller.should_commit(1, 50 * MB + 1, 0, now=2), 'bytes')
+    assert_equal(controller.should_commit(1, 0, 11, now=3), 'idle')
+    # The age of the transaction doesn't matter
+    assert_equal(controller.should_commit(1, 0, 0, now=1000), None)
+
+
+def test_empty_transaction_is_never_committed():
+    controller = _controller()
+    assert_equal(controller.should_commit(0, 0, 3600, now=0), None)
+
+
+def test_commit_when_the_fixed_cost_is_paid_back():
+    controller = _controller()
+    # One second of fixed cost at most 10% of the time: 10 seconds
+    assert_equal(controller.should_commit(1, 0, 0, now=100), None)
+    assert_equal(controller.should_commit(50, 0, 0, now=109), None)
+    assert_equal(controller.should_commit(90, 0, 0, now=110), 'amortized')
+
+
+def test_age_is_counted_from_the_first_operation():
+    controller = _controller()
+    controller.should_commit(1, 0, 0, now=100)
+    controller.should_commit(0, 0, 0, now=105)
+    assert_equal(controller.should_commit(1, 0, 0, now=112), None)
+
+
+def test_upper_bounds():
+    controller = _controller(max_seconds=5)
+    assert_equal(controller.should_commit(1000, 0, 0, now=0), 'max_operations')
+    assert_equal(controller.should_commit(1, 500 * MB, 0, now=0), 'max_bytes')
+    assert_equal(controller.should_commit(1, 0, 0, now=5), 'max_age')
+
+
+def test_fixed_cost_is_learned_from_the_commit_latency():
+    controller = _controller()
+    controller.should_commit(100, 0, 0, now=0)
+    controller.on_commit_started(100, 0, now=10)
+    controller.on_proofs_verified(0.5)
+    controller.on_commit_done(now=13.5)
+    stats = controller.get_stats()
+    # The sample of fixed cost is 3 seconds, proof verification aside
+    assert_almost_equal(stats['fixed_cost'], 0.7 * 1.0 + 0.3 * 3.0)
+    assert_almost_equal(stats['verification_cost'], 0.3 * 0.005)
+    assert_almost_equal(stats['payback_time'], stats['fixed_cost'] / 0.1)
+    assert_equal(stats['commits'], 1)
+    assert_equal(controller.should_commit(1, 0, 0, now=20), None)
+    assert_equal(controller.should_commit(1, 0, 0, now=36), 'amortized')
+
+
+def test_bytes_bound_follows_the_transfer_rate():
+    controller = _controller(max_seconds=100)
+    # 10 MB in 100 seconds, far below the 1 MB/s assumed at first
+    for _ in xrange(20):
+        controller.should_commit(1, 0, 0, now=0)
+        controller.on_commit_started(1, 10 * MB, now=100)
+        controller.on_commit_done(now=100)
+    stats = controller.get_stats()
+    assert_almost_equal(stats['transfer_rate'], 0.1 * MB, delta=0.01 * MB)
+    assert_almost_equal(stats['max_bytes'], 10 * MB, delta=1 * MB)
+    assert_equal(controller.should_commit(1, 11 * MB, 0, now=0), 'max_bytes')
+
+
+def test_decisions_are_counted():
+    controller = _controller()
+    controller.should_commit(1, 0, 11, now=0)
+    controller.should_commit(1, 0, 11, now=1)
+    controller.should_commit(1000, 0, 0, now=2)
+    stats = controller.get_stats()
+    assert_equal(stats['decisions'], {'idle': 2, 'max_operations': 1})
+    assert_equal(stats['last_decision']['reason'], 'max_operations')
+    assert_equal(stats['last_decision']['operations'], 1000)
+
+
+def test_zero_overhead_is_clamped():
+    target_overhead = clamp_target_overhead(0 / 100.0)
+    assert_true(target_overhead > 0)
+    assert_equal(clamp_target_overhead(2.0), 1.0)
+    assert_equal(clamp_target_overhead(0.1), 0.1)
+    # One second of fixed cost at most 1% of the time: 100 seconds
+    controller = _controller(target_overhead=target_overhead)
+    assert_equal(controller.should_commit(1, 0, 0, now=0), None)
+    assert_equal(controller.should_commit(1, 0, 0, now=99), None)
+    assert_equal(controller.should_commit(1, 0, 0, now=100), 'amortized')
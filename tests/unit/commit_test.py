@@ -0,0 +1,159 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+"""
+This is the commit_test module.
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+
+import Queue
+import threading
+from nose.tools import *
+from mock import MagicMock, patch
+
+from filerockclient.pathname_operation import PathnameOperation
+from filerockclient.util.multi_queue import MultiQueue
+from filerockclient.serversession.transaction import Transaction
+from filerockclient.serversession.transaction_manager import \
+    TransactionManager
+from filerockclient.serversession.commands import Command
+from filerockclient.serversession.states.commit import \
+    CommitState, CommitStartState
+
+
+def _operation(verb, pathname):
+    return PathnameOperation(MagicMock(), threading.RLock(), verb, pathname,
+                             None, 'd41d8cd98f00b204e9800998ecf8427e', 0)
+
+
+def _authorized_transaction(*operations):
+    transaction = Transaction()
+    for index, operation in enumerate(operations):
+        transaction.add_operation(index + 1, operation)
+        transaction.authorize_operation(index + 1)
+    return transaction
+
+
+def _make_context(transaction):
+    context = MagicMock()
+    context._input_queue = MultiQueue([
+        'servermessage', 'operation', 'usercommand', 'sessioncommand',
+        'systemcommand'])
+    context.output_message_queue = Queue.Queue()
+    context.transaction = transaction
+    context.transaction_manager = TransactionManager(transaction, MagicMock())
+    context.metadataDB.transaction.return_value.__enter__.return_value = \
+        (MagicMock(), MagicMock())
+    return context
+
+
+def _received_operations(context):
+    operations = []
+    while not context._input_queue.empty(['operation']):
+        operation, _ = context._input_queue.get(['operation'])
+        operations.append(operation)
+    return operations
+
+
+def test_finished_handler_is_called_at_once_for_a_finished_transaction():
+    calls = []
+    Transaction().notify_when_finished(lambda: calls.append(True))
+    assert_equal(calls, [True])
+
+
+def test_finished_handler_is_called_by_the_last_finished_operation():
+    first, second = _operation('UPLOAD', u'a'), _operation('UPLOAD', u'b')
+    transaction = _authorized_transaction(first, second)
+    calls = []
+    transaction.notify_when_finished(lambda: calls.append(True))
+    first.complete()
+    assert_equal(calls, [])
+    second.abort()
+    assert_equal(calls, [True])
+    assert_true(transaction.is_finished())
+
+
+def test_finished_handler_is_dropped_by_clear():
+    operation = _operation('UPLOAD', u'a')
+    transaction = _authorized_transaction(operation)
+    calls = []
+    transaction.notify_when_finished(lambda: calls.append(True))
+    transaction.clear()
+    operation.complete()
+    assert_equal(calls, [])
+
+
+@patch('filerockclient.serversession.states.register.StateRegister.get')
+def test_commit_starts_when_the_last_upload_is_finished(get_state):
+    operation = _operation('UPLOAD', u'a')
+    context = _make_context(_authorized_transaction(operation))
+    state = CommitState(context)
+    state._check_transaction_integrity = MagicMock()
+    state._on_entering()
+    assert_true(context.output_message_queue.empty())
+    operation.complete()
+    state.do_execute()
+    commit_start = context.output_message_queue.get_nowait()
+    assert_equal(commit_start.name, 'COMMIT_START')
+    assert_equal(commit_start.getParameter('achieved_operations'), [1])
+
+
+def test_stale_operations_finished_command_is_ignored():
+    operation = _operation('UPLOAD', u'a')
+    context = _make_context(_authorized_transaction(operation))
+    state = CommitState(context)
+    state._on_entering()
+    context._input_queue.put(Command('OPERATIONSFINISHED'), 'sessioncommand')
+    state.do_execute()
+    assert_true(context.output_message_queue.empty())
+
+
+def test_next_transaction_is_received_while_committing():
+    context = _make_context(Transaction())
+    state = CommitStartState(context)
+    to_encrypt = _operation('UPLOAD', u'encrypted/secret')
+    operations = [
+        _operation('UPLOAD', u'a'), to_encrypt, _operation('DELETE', u'b')]
+    for operation in operations:
+        context._input_queue.put(operation, 'operation')
+    for _ in operations:
+        state.do_execute()
+    assert_true(context._input_queue.empty(['operation']))
+    context.cryptoAdapter.put.assert_called_once_with(to_encrypt)
+    # Received again in the same order after the commit
+    state._on_leaving()
+    assert_equal(_received_operations(context),
+                 [operations[0], operations[2]])
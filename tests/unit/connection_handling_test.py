@@ -0,0 +1,175 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+This is the connection_handling_test module.
+
+
+
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+from nose.tools import *
+import Queue
+import socket
+import threading
+from FileRockSharedLibraries.Communication.Messages import \
+    SYNC_FILES_LIST, KEEP_ALIVE, COMMIT_START, POISON_PILL
+from filerockclient.exceptions import ConnectionException
+from filerockclient.serversession.connection_handling import \
+    ServerConnectionWriter, ServerConnectionReader
+
+
+class TrickleSocket(object):
+    """Socket receiving at most "chunk" bytes per call."""
+
+    def __init__(self, sock, chunk):
+        self.sock = sock
+        self.chunk = chunk
+
+    def recv_into(self, view, nbytes):
+        return self.sock.recv_into(view, min(nbytes, self.chunk))
+
+
+def setup():
+    global out_sock, in_sock, writer, reader
+    out_sock, in_sock = socket.socketpair()
+    writer = ServerConnectionWriter(None, Queue.Queue(), out_sock)
+    reader = ServerConnectionReader(None, None, in_sock)
+
+
+def teardown():
+    out_sock.close()
+    in_sock.close()
+
+
+def send_in_background(*messages):
+    sender = threading.Thread(
+        target=lambda: [writer._send_message(msg) for msg in messages])
+    sender.start()
+    return sender
+
+
+def make_sync_files_list(entries):
+    dataset = [{'key': u'file%s' % i, 'etag': '%032x' % i,
+                'lmtime': '2012-01-01 00:00:00', 'size': i}
+               for i in xrange(entries)]
+    return SYNC_FILES_LIST('SYNC_FILES_LIST', {
+        'basis': 'A' * 64, 'dataset': dataset,
+        'last_commit_client_id': 1,
+        'last_commit_client_hostname': 'host',
+        'last_commit_client_platform': 'linux',
+        'last_commit_timestamp': 0, 'user_quota': 0, 'used_space': 0,
+        'status': 'ACTIVE_PAID', 'expires_on': None, 'plan': {}})
+
+
+@with_setup(setup, teardown)
+def test_messages_round_trip():
+    sender = send_in_background(
+        KEEP_ALIVE('KEEP_ALIVE', {'id': 1}),
+        COMMIT_START('COMMIT_START', {'achieved_operations': [1, 2]}))
+    msg1 = reader._receive_message()
+    msg2 = reader._receive_message()
+    sender.join()
+    assert_equal(msg1.name, 'KEEP_ALIVE')
+    assert_equal(msg2.name, 'COMMIT_START')
+    assert_equal(msg2.getParameter('achieved_operations'), [1, 2])
+
+
+@with_setup(setup, teardown)
+def test_message_bigger_than_receive_buffer():
+    reader.RECEIVE_BUFFER_SIZE = 1024
+    msg = make_sync_files_list(1000)
+    sender = send_in_background(msg, KEEP_ALIVE('KEEP_ALIVE', {'id': 1}))
+    received = reader._receive_message()
+    keep_alive = reader._receive_message()
+    sender.join()
+    assert_greater(msg.pack()[0], reader.RECEIVE_BUFFER_SIZE)
+    assert_equal(received.getParameter('dataset'),
+                 msg.getParameter('dataset'))
+    assert_equal(keep_alive.name, 'KEEP_ALIVE')
+
+
+@with_setup(setup, teardown)
+def test_message_received_in_small_chunks():
+    reader.sock = TrickleSocket(in_sock, 7)
+    msg = make_sync_files_list(10)
+    sender = send_in_background(msg)
+    received = reader._receive_message()
+    sender.join()
+    assert_equal(received.getParameter('dataset'),
+                 msg.getParameter('dataset'))
+
+
+@with_setup(setup, teardown)
+@raises(ConnectionException)
+def test_truncated_message_raises_connection_exception():
+    out_sock.sendall('100'.ljust(32) + 'truncated')
+    out_sock.close()
+    reader._receive_message()
+
+
+@with_setup(setup, teardown)
+def test_queued_messages_are_sent_together():
+    messages = [KEEP_ALIVE('KEEP_ALIVE', {'id': i}) for i in xrange(5)]
+    for msg in messages:
+        writer.output_message_queue.put(msg)
+    batch = writer._get_batch()
+    assert_equal(batch, messages)
+    sender = threading.Thread(target=writer._send_messages, args=(batch,))
+    sender.start()
+    received = [reader._receive_message() for _ in messages]
+    sender.join()
+    assert_equal([msg.getParameter('id') for msg in received], range(5))
+
+
+@with_setup(setup, teardown)
+def test_batch_size_is_limited():
+    writer.MAX_BATCH_MESSAGES = 3
+    for i in xrange(5):
+        writer.output_message_queue.put(KEEP_ALIVE('KEEP_ALIVE', {'id': i}))
+    assert_equal(len(writer._get_batch()), 3)
+    assert_equal(len(writer._get_batch()), 2)
+
+
+@with_setup(setup, teardown)
+def test_poison_pill_ends_the_batch():
+    msg = KEEP_ALIVE('KEEP_ALIVE', {'id': 1})
+    writer.output_message_queue.put(msg)
+    writer.output_message_queue.put(POISON_PILL)
+    writer.output_message_queue.put(KEEP_ALIVE('KEEP_ALIVE', {'id': 2}))
+    assert_equal(writer._get_batch(), [msg])
+    writer.output_message_queue.get_nowait()
+    writer.output_message_queue.put(POISON_PILL)
+    assert_equal(writer._get_batch(), [])
@@ -0,0 +1,116 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+This is the connection_pool_test module.
+
+
+
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+from nose.tools import *
+from mock import patch
+import socket
+from filerockclient.util.connection_pool import HTTPSConnectionPool
+
+
+class FakeConnection(object):
+    """Stands for httplib.HTTPSConnection, with a real socket."""
+
+    def __init__(self, address, timeout=None):
+        self.address = address
+        self.sock, self.peer = socket.socketpair()
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+        self.sock = None
+
+
+@patch('httplib.HTTPSConnection', FakeConnection)
+def test_released_connection_is_reused():
+    pool = HTTPSConnectionPool()
+    with pool.connection('1.2.3.4', 'bucket.host') as connection:
+        pass
+    with pool.connection('1.2.3.4', 'bucket.host') as connection2:
+        pass
+    assert_is(connection, connection2)
+    assert_equal(pool.get_stats()['created'], 1)
+    assert_equal(pool.get_reuse_ratio(), 0.5)
+
+
+@patch('httplib.HTTPSConnection', FakeConnection)
+def test_connections_are_not_shared_among_endpoints():
+    pool = HTTPSConnectionPool()
+    with pool.connection('1.2.3.4', 'bucket1.host') as connection:
+        pass
+    with pool.connection('1.2.3.4', 'bucket2.host') as connection2:
+        pass
+    assert_is_not(connection, connection2)
+
+
+@patch('httplib.HTTPSConnection', FakeConnection)
+def test_connection_is_discarded_on_error():
+    pool = HTTPSConnectionPool()
+    try:
+        with pool.connection('1.2.3.4', 'bucket.host') as connection:
+            raise IOError()
+    except IOError:
+        pass
+    assert_is_none(connection.sock)
+    assert_equal(pool.get_stats()['idle'], 0)
+
+
+@patch('httplib.HTTPSConnection', FakeConnection)
+def test_connection_closed_by_server_is_not_reused():
+    pool = HTTPSConnectionPool()
+    with pool.connection('1.2.3.4', 'bucket.host') as connection:
+        pass
+    connection.peer.close()
+    with pool.connection('1.2.3.4', 'bucket.host') as connection2:
+        pass
+    assert_is_not(connection, connection2)
+    assert_equal(pool.get_stats()['discarded'], 1)
+
+
+@patch('httplib.HTTPSConnection', FakeConnection)
+def test_idle_connections_are_evicted():
+    pool = HTTPSConnectionPool(max_idle_time=-1)
+    with pool.connection('1.2.3.4', 'bucket.host') as connection:
+        pass
+    with pool.connection('1.2.3.4', 'bucket.host') as connection2:
+        pass
+    assert_is_not(connection, connection2)
+    assert_equal(pool.get_stats()['evicted'], 1)
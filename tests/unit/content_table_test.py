@@ -0,0 +1,134 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+This is the content_table_test module.
+
+
+
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+from nose.tools import *
+import datetime
+from filerockclient.serversession.content_table import \
+    PathnameIndex, ContentTable, datetime_to_seconds, seconds_to_datetime
+
+
+ETAG_A = u'd41d8cd98f00b204e9800998ecf8427e'
+ETAG_B = u'0cc175b9c0f1b6a831c399e269772661'
+
+
+def make_table(index=None):
+    if index is None:
+        index = PathnameIndex()
+    return ContentTable(index, etag_fields=('etag',),
+                        number_fields=('size', 'lmtime'))
+
+
+def test_pathnames_are_interned_once():
+    index = PathnameIndex()
+    table1 = make_table(index)
+    table2 = make_table(index)
+    id1 = table1.add(u'a', etag=ETAG_A, size=1, lmtime=0)
+    id2 = table2.add(u'a', etag=ETAG_B, size=2, lmtime=0)
+    assert_equal(id1, id2)
+    assert_equal(len(index), 1)
+    assert_equal(index.get_pathname(id1), u'a')
+
+
+def test_views():
+    table = make_table()
+    lmtime = datetime.datetime(2012, 5, 8, 21, 26, 42)
+    table.add(u'a', etag=ETAG_A, size=2 ** 40,
+              lmtime=datetime_to_seconds(lmtime))
+    sizes = table.view('size', int)
+    lmtimes = table.view('lmtime', seconds_to_datetime)
+    etags = table.view('etag')
+    assert_equal(sizes[u'a'], 2 ** 40)
+    assert_equal(lmtimes[u'a'], lmtime)
+    assert_equal(etags[u'a'], ETAG_A)
+    assert_true(u'a' in etags)
+    assert_false(u'b' in etags)
+    assert_is_none(sizes.get(u'b'))
+    assert_raises(KeyError, lambda: sizes[u'b'])
+
+
+def test_pathnames_of_other_tables_are_not_members():
+    index = PathnameIndex()
+    table1 = make_table(index)
+    table2 = make_table(index)
+    table1.add(u'a', etag=ETAG_A, size=1, lmtime=0)
+    table2.add(u'b', etag=ETAG_A, size=1, lmtime=0)
+    table1.add(u'c', etag=ETAG_A, size=1, lmtime=0)
+    assert_false(u'b' in table1)
+    assert_equal(list(table1), [u'a', u'c'])
+    assert_equal(len(table1), 2)
+    assert_raises(KeyError, lambda: table1.view('etag')[u'b'])
+
+
+def test_irregular_etags():
+    index = PathnameIndex()
+    table1 = make_table(index)
+    table2 = make_table(index)
+    for etag in [None, u'"quoted"', ETAG_A.upper(), u'x' * 32]:
+        pathname_id = table1.add(u'a', etag=etag, size=1, lmtime=0)
+        table2.add(u'a', etag=etag, size=1, lmtime=0)
+        assert_equal(table1.view('etag')[u'a'], etag)
+        assert_true(table1.same_etag(pathname_id, 'etag', table2, 'etag'))
+    table2.add(u'a', etag=ETAG_A, size=1, lmtime=0)
+    assert_false(table1.same_etag(pathname_id, 'etag', table2, 'etag'))
+
+
+def test_same_etag():
+    index = PathnameIndex()
+    table1 = make_table(index)
+    table2 = make_table(index)
+    id_a = table1.add(u'a', etag=ETAG_A, size=1, lmtime=0)
+    table2.add(u'a', etag=ETAG_A, size=1, lmtime=0)
+    id_b = table1.add(u'b', etag=ETAG_A, size=1, lmtime=0)
+    table2.add(u'b', etag=ETAG_B, size=1, lmtime=0)
+    assert_true(table1.same_etag(id_a, 'etag', table2, 'etag'))
+    assert_false(table1.same_etag(id_b, 'etag', table2, 'etag'))
+
+
+def test_many_pathnames():
+    table = make_table()
+    for i in xrange(10000):
+        table.add(u'file%s' % i, etag=u'%032x' % i, size=i, lmtime=i)
+    sizes = table.view('size', int)
+    etags = table.view('etag')
+    assert_equal(len(table), 10000)
+    assert_equal(sizes[u'file9999'], 9999)
+    assert_equal(etags[u'file1234'], u'%032x' % 1234)
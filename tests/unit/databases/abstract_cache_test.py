@@ -181,6 +181,44 @@ class Test(unittest.TestCase):
             self.assertEqual([], self.cache1.get_all_records())
             self.assertEqual([], self.cache2.get_all_records())
 
+    def test_bulk_update(self):
+        self.cache.update_record(1, 2, 3, 'foo')
+        self.cache.update_records_bulk([(1, 20, 30, 'bar'), (4, 5, 6, 'baz')])
+        self.assertEqual([(1, 20, 30, 'bar'), (4, 5, 6, 'baz')],
+                         sorted(self.cache.get_all_records()))
+
+    def test_bulk_update_wrong_number_columns(self):
+        with self.assertRaises(WrongNumberOfParameters):
+            self.cache.update_records_bulk([(1, 2, 3, 'foo'), (4, 5, 6)])
+        self.assertEqual([], self.cache.get_all_records())
+
+    def test_bulk_update_in_multi_cache_transaction(self):
+        with self.cache1.transaction(self.cache2) as (c1, c2):
+            c1.update_records_bulk([(1, 2, 3, 'foo')])
+            c2.update_records_bulk([(4, 5, 6, 'bar'), (4, 7, 8, 'baz')])
+        self.assertEqual([(1, 2, 3, 'foo')], self.cache1.get_all_records())
+        self.assertEqual([(4, 7, 8, 'baz')], self.cache2.get_all_records())
+
+    def test_bulk_get(self):
+        self.cache.update_records_bulk((n, n, n, 'foo') for n in xrange(2000))
+        records = self.cache.get_records_bulk(range(0, 4000, 2))
+        self.assertEqual(1000, len(records))
+        self.assertEqual((1998, 1998, 1998, 'foo'), records[1998])
+        self.assertFalse(1999 in records)
+
+    def test_key_index_is_made_unique(self):
+        self.cache._execute(u'DROP INDEX "first_index"')
+        self.cache._execute(u'CREATE INDEX "first_index" on %s (first ASC)'
+                            % DATABASE_NAME)
+        self.cache._execute(u'INSERT INTO %s VALUES (1, 2, 3, "old")'
+                            % DATABASE_NAME)
+        self.cache._execute(u'INSERT INTO %s VALUES (1, 2, 3, "new")'
+                            % DATABASE_NAME)
+        cache = AbstractCache(FILENAME, DATABASE_NAME, SCHEMA, 'first')
+        self.assertEqual([(1, 2, 3, 'new')], cache.get_all_records())
+        cache.update_record(1, 2, 3, 'newer')
+        self.assertEqual([(1, 2, 3, 'newer')], cache.get_all_records())
+
 
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
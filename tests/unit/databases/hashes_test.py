@@ -39,27 +39,17 @@ FileRock Client is licensed under GPLv3 License.
 
 from nose.tools import *
 import os
+import shutil
+import tempfile
 
 from filerockclient.databases.hashes import HashesDB
 
 
 def test_hash_insertion():
-    db = HashesDB(get_fresh_filename('hashes.db'))
-    db.add('ABC', 'DEF', user_accepted=False)
-    print db.list()
-
-
-# Helper functions:
-
-def get_current_dir(current_module):
-    return os.path.dirname(os.path.abspath(current_module))
-
-
-def get_fresh_filename(name):
-    data_dir = os.path.join(get_current_dir(__file__), 'test_data')
-    if not os.path.exists(data_dir):
-        os.mkdir(data_dir)
-    pathname = os.path.join(data_dir, name)
-    if os.path.exists(pathname):
-        os.remove(pathname)
-    return pathname
+    data_dir = tempfile.mkdtemp()
+    try:
+        db = HashesDB(os.path.join(data_dir, 'hashes.db'))
+        db.add('ABC', 'DEF', user_accepted=False)
+        print db.list()
+    finally:
+        shutil.rmtree(data_dir)
@@ -45,7 +45,8 @@ import os
 import threading
 import sqlite3
 
-from filerockclient.databases.sqlite_driver import SQLiteDB
+from filerockclient.databases.sqlite_driver import SQLiteDB, \
+    JOURNAL_MODE_WAL, close_thread_connections
 
 
 def test_object_creation():
@@ -212,6 +213,97 @@ def test_no_concurrent_transaction_allowed():
         delete_file(db._filename)
 
 
+def test_connection_survives_queries():
+    db = create_onefield_database()
+    try:
+        connection = db._get_connection()
+        db.query("SELECT * FROM test")
+        db.execute("INSERT INTO test VALUES ('abc')")
+        db.commit_transaction()
+        assert_true(db._get_connection() is connection)
+    finally:
+        db.close()
+        delete_file(db._filename)
+
+
+def test_wal_journal_mode():
+    filename = absolute_filename('test.db')
+    delete_file(filename)
+    db = SQLiteDB(filename, journal_mode=JOURNAL_MODE_WAL)
+    try:
+        rows = db.query("PRAGMA journal_mode")
+        assert_equal(rows[0][0].upper(), JOURNAL_MODE_WAL)
+        rows = db.query("PRAGMA synchronous")
+        assert_equal(rows[0][0], 1)  # NORMAL
+    finally:
+        db.close()
+        delete_file(filename)
+        delete_file(filename + '-wal')
+        delete_file(filename + '-shm')
+
+
+def test_wal_readers_dont_wait_for_writers():
+    filename = absolute_filename('test.db')
+    delete_file(filename)
+    db = SQLiteDB(filename, journal_mode=JOURNAL_MODE_WAL)
+    db.execute("CREATE TABLE test (field1 text)")
+    rows = []
+
+    def other_thread():
+        try:
+            rows.extend(db.query("SELECT * FROM test"))
+        finally:
+            db.close()
+
+    try:
+        db.execute("INSERT INTO test values ('1')")
+        th1 = threading.Thread(target=other_thread)
+        th1.start()
+        th1.join()
+        assert_equal(rows, [])
+    finally:
+        db.close()
+        delete_file(filename)
+        delete_file(filename + '-wal')
+        delete_file(filename + '-shm')
+
+
+def test_close_all_closes_connections_of_other_threads():
+    db = create_onefield_database()
+    connections = []
+
+    def other_thread():
+        connections.append(db._get_connection())
+
+    try:
+        th1 = threading.Thread(target=other_thread)
+        th1.start()
+        th1.join()
+        db.close_all()
+        assert_raises(sqlite3.ProgrammingError,
+                      connections[0].execute, "SELECT * FROM test")
+        assert_equal(db.query("SELECT * FROM test"), [])
+    finally:
+        db.close()
+        delete_file(db._filename)
+
+
+def test_close_thread_connections():
+    db1 = create_onefield_database()
+    db2 = SQLiteDB(absolute_filename('test2.db'))
+    try:
+        connection1 = db1._get_connection()
+        connection2 = db2._get_connection()
+        close_thread_connections()
+        assert_false(db1._get_connection() is connection1)
+        assert_false(db2._get_connection() is connection2)
+    finally:
+        db1.close()
+        db2.close()
+        delete_file(db1._filename)
+        delete_file(db2._filename)
+
+
 # Helper functions:
 
 def create_onefield_database():
@@ -0,0 +1,103 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+This is the storage_cache_test module.
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+import unittest
+import os
+import datetime
+
+from filerockclient.databases.storage_cache import StorageCache
+
+FILENAME = 'storage_cache_test.db'
+
+LMTIME = datetime.datetime(2012, 1, 1)
+
+
+def record(pathname):
+    return (pathname, 1, 1, LMTIME, u'etag', u'etag')
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = StorageCache(FILENAME)
+        self.cache.update_records_bulk(
+            [record(u'a/'), record(u'a/b.txt'), record(u'a_c/')])
+
+    def tearDown(self):
+        self.cache.destroy()
+        assert not os.path.exists(FILENAME)
+
+    def test_exist_record_proper_prefix(self):
+        self.assertTrue(self.cache.exist_record_proper_prefix(u'a/'))
+        self.assertFalse(self.cache.exist_record_proper_prefix(u'a_c/'))
+        # Neither wildcards nor case insensitive matches, as with LIKE
+        self.assertFalse(self.cache.exist_record_proper_prefix(u'a%/'))
+        self.assertFalse(self.cache.exist_record_proper_prefix(u'A/'))
+
+    def test_modifications_update_the_index(self):
+        self.assertFalse(self.cache.exist_record_proper_prefix(u'a_c/'))
+        self.cache.update_record(*record(u'a_c/d.txt'))
+        self.assertTrue(self.cache.exist_record_proper_prefix(u'a_c/'))
+        self.cache.delete_records([u'a/b.txt'])
+        self.assertFalse(self.cache.exist_record_proper_prefix(u'a/'))
+        self.cache.clear()
+        self.assertFalse(self.cache.exist_record_proper_prefix(u'a_c/'))
+
+    def test_index_is_loaded_from_the_database(self):
+        cache = StorageCache(FILENAME)
+        self.assertTrue(cache.exist_record_proper_prefix(u'a/'))
+        self.assertEqual(cache.find_first_missing_ancestor(u'a/x/y.txt'),
+                         u'a/x/')
+        self.assertEqual(cache.find_first_missing_ancestor(u'x/y.txt'),
+                         u'x/')
+        self.assertIsNone(cache.find_first_missing_ancestor(u'a/y.txt'))
+
+    def test_transactions(self):
+        with self.cache.transaction() as cache:
+            cache.update_record(*record(u'a_c/d.txt'))
+        self.assertTrue(self.cache.exist_record_proper_prefix(u'a_c/'))
+        with self.assertRaises(ValueError):
+            with self.cache.transaction() as cache:
+                cache.delete_record(u'a_c/d.txt')
+                raise ValueError()
+        self.assertTrue(self.cache.exist_record_proper_prefix(u'a_c/'))
+
+
+if __name__ == "__main__":
+    unittest.main()
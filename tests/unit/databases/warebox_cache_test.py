@@ -0,0 +1,132 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+This is the warebox_cache_test module.
+
+
+
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+import unittest
+import datetime
+import os
+
+from filerockclient.databases.warebox_cache import WareboxCache, \
+    WareboxCacheMirror
+
+FILENAME = 'warebox_cache_test.db'
+
+LMTIME = datetime.datetime(2012, 1, 1, 12, 30, 15)
+
+
+class WareboxCacheMirrorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = WareboxCache(FILENAME)
+        self.cache.update_record(u'a.txt', 1, LMTIME, u'etag_a')
+        self.cache.update_record(u'b.txt', 2, LMTIME, u'etag_b')
+
+    def tearDown(self):
+        self.cache.destroy()
+        assert not os.path.exists(FILENAME)
+
+    def test_records_are_read_from_memory(self):
+        mirror = WareboxCacheMirror(self.cache)
+        mirror.load()
+        self.cache.clear()
+        self.assertTrue(mirror.is_complete())
+        self.assertEqual(mirror.get_record(u'a.txt'),
+                         (u'a.txt', 1, unicode(LMTIME), u'etag_a'))
+        self.assertEqual(mirror.get_record(u'c.txt'), None)
+
+    def test_records_have_the_database_representation(self):
+        mirror = WareboxCacheMirror(self.cache)
+        mirror.load()
+        mirror.update_record(u'c.txt', 3, LMTIME, u'etag_c')
+        mirror.flush()
+        self.assertEqual(mirror.get_record(u'c.txt'),
+                         self.cache.get_record(u'c.txt'))
+        self.assertEqual(mirror.get_record(u'a.txt'),
+                         self.cache.get_record(u'a.txt'))
+
+    def test_updates_are_written_on_flush(self):
+        mirror = WareboxCacheMirror(self.cache)
+        mirror.load()
+        mirror.update_record(u'a.txt', 10, LMTIME, u'new_etag_a')
+        mirror.update_record(u'c.txt', 3, LMTIME, u'etag_c')
+        self.assertEqual(self.cache.get_record(u'a.txt')[3], u'etag_a')
+        self.assertFalse(self.cache.exist_record(u'c.txt'))
+        mirror.flush()
+        self.assertEqual(sorted(self.cache.get_all_records()), [
+            (u'a.txt', 10, unicode(LMTIME), u'new_etag_a'),
+            (u'b.txt', 2, unicode(LMTIME), u'etag_b'),
+            (u'c.txt', 3, unicode(LMTIME), u'etag_c')])
+
+    def test_too_many_updates_are_flushed(self):
+        mirror = WareboxCacheMirror(self.cache, max_dirty_records=2)
+        mirror.load()
+        mirror.update_record(u'c.txt', 3, LMTIME, u'etag_c')
+        self.assertFalse(self.cache.exist_record(u'c.txt'))
+        mirror.update_record(u'd.txt', 4, LMTIME, u'etag_d')
+        self.assertTrue(self.cache.exist_record(u'c.txt'))
+        self.assertTrue(self.cache.exist_record(u'd.txt'))
+
+    def test_deleted_records(self):
+        mirror = WareboxCacheMirror(self.cache)
+        mirror.load()
+        mirror.update_record(u'c.txt', 3, LMTIME, u'etag_c')
+        mirror.delete_records([u'a.txt', u'c.txt'])
+        mirror.flush()
+        self.assertEqual(mirror.get_record(u'a.txt'), None)
+        self.assertEqual(mirror.get_record(u'c.txt'), None)
+        self.assertEqual(self.cache.get_all_keys(), [u'b.txt'])
+
+    def test_memory_bounded_mirror_falls_back_on_database(self):
+        mirror = WareboxCacheMirror(self.cache, max_records=1)
+        mirror.load()
+        self.assertFalse(mirror.is_complete())
+        self.assertEqual(len(mirror._records), 1)
+        self.assertEqual(mirror.get_record(u'a.txt')[3], u'etag_a')
+        self.assertEqual(mirror.get_record(u'b.txt')[3], u'etag_b')
+        mirror.update_record(u'c.txt', 3, LMTIME, u'etag_c')
+        self.assertEqual(len(mirror._records), 1)
+        self.assertEqual(mirror.get_record(u'c.txt')[3], u'etag_c')
+        mirror.flush()
+        self.assertEqual(mirror.get_record(u'c.txt')[3], u'etag_c')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+This is the encrypting_reader_test module.
+
+
+
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+from nose.tools import *
+import os
+import shutil
+import hashlib
+import tempfile
+from StringIO import StringIO
+from filerockclient.workers.filters.encryption.encrypter import \
+    Encrypter, EncryptingReader
+
+
+KEY = '0123456789abcdef0123456789abcdef'
+IV = 'fedcba9876543210'
+SIZES = [0, 1, 15, 16, 17, 64 * 1024, 64 * 1024 + 1, 200000]
+
+
+class FakeTask(object):
+    pass
+
+
+class FakeTaskWrapper(object):
+
+    def __init__(self, pathname, encrypted_pathname, stream_encryption):
+        self.task = FakeTask()
+        self.task.pathname = pathname
+        self.task.encrypted_pathname = encrypted_pathname
+        self.out_pathname = encrypted_pathname
+        self.stream_encryption = stream_encryption
+        self.key = KEY
+        self.iv = IV
+
+
+def setup():
+    global TEMP_DIR
+    TEMP_DIR = tempfile.mkdtemp()
+
+
+def teardown():
+    shutil.rmtree(TEMP_DIR)
+
+
+def test_reader_produces_the_same_data_as_encrypter():
+    for size in SIZES:
+        plaintext = os.urandom(size)
+        expected = encrypt_to_file(plaintext)
+        reader = EncryptingReader(StringIO(plaintext), KEY, IV)
+        actual = ''.join(iter(lambda: reader.read(1000), ''))
+        assert_equal(actual, expected)
+
+
+def test_streaming_encrypter_computes_etag_and_size():
+    for size in SIZES:
+        plaintext = os.urandom(size)
+        expected = encrypt_to_file(plaintext)
+        result = encrypt(plaintext, stream_encryption=True)
+        assert_equal(result['storage_etag'], hashlib.md5(expected).hexdigest())
+        assert_equal(result['storage_size'], len(expected))
+
+
+@raises(IOError)
+def test_reader_fails_if_the_file_grows():
+    plaintext = os.urandom(1000)
+    size = len(encrypt_to_file(plaintext))
+    reader = EncryptingReader(StringIO(plaintext + 'x' * 16), KEY, IV, size)
+    reader.read()
+
+
+@raises(IOError)
+def test_reader_fails_if_the_file_shrinks():
+    plaintext = os.urandom(1000)
+    size = len(encrypt_to_file(plaintext))
+    reader = EncryptingReader(StringIO(plaintext[:-16]), KEY, IV, size)
+    while reader.read(100) != '':
+        pass
+
+
+''' Helper functions: '''
+
+def encrypt(plaintext, stream_encryption):
+    pathname = os.path.join(TEMP_DIR, 'plain')
+    encrypted_pathname = os.path.join(TEMP_DIR, 'encrypted')
+    with open(pathname, 'wb') as f:
+        f.write(plaintext)
+    tw = FakeTaskWrapper(pathname, encrypted_pathname, stream_encryption)
+    encrypter = Encrypter()
+    encrypter._on_new_task(tw)
+    while not encrypter._is_task_completed(tw):
+        encrypter._task_step(tw)
+    encrypter._on_task_complete(tw)
+    return encrypter._get_stream_result()
+
+
+def encrypt_to_file(plaintext):
+    encrypt(plaintext, stream_encryption=False)
+    with open(os.path.join(TEMP_DIR, 'encrypted'), 'rb') as f:
+        return f.read()
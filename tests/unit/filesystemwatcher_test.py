@@ -292,6 +292,14 @@ class EtagRecomputingWareboxMock(object):
         self.recomputed_pathnames.append(pathname)
         return 'RECOMPUTED'
 
+    def compute_etags(self, pathnames, sizes=None, interruption=None):
+        etags = dict((pathname, self.compute_md5_hex(pathname))
+                     for pathname in pathnames)
+        return etags, []
+
+    def flush_cache_mirror(self):
+        pass
+
 
 def create_snapshot_with_etags_before_modification():
     metadata = {}
@@ -0,0 +1,136 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+This is the hashing_engine_test module.
+
+
+
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+from nose.tools import *
+import os
+import shutil
+import hashlib
+import binascii
+import tempfile
+import threading
+
+from filerockclient.hashing_engine import HashingEngine
+from filerockclient.exceptions import ExecutionInterrupted
+
+
+def test_etags_are_md5_of_the_content():
+    with temp_files({'a': 'a' * 3000000, 'b': '', 'c': 'hello'}) as root:
+        engine = create_engine(root, max_threads=4)
+        etags, failed = engine.compute_etags(['a', 'b', 'c'])
+        assert_equal(failed, [])
+        for name, content in [('a', 'a' * 3000000), ('b', ''), ('c', 'hello')]:
+            assert_equal(etags[name], hashlib.md5(content).hexdigest())
+
+
+def test_serial_and_parallel_engines_agree():
+    files = dict(('file%s' % i, os.urandom(i * 1000)) for i in xrange(20))
+    with temp_files(files) as root:
+        serial = create_engine(root, max_threads=1)
+        parallel = create_engine(root, max_threads=4, buffer_size=4096)
+        assert_equal(serial.compute_etags(files.keys()),
+                     parallel.compute_etags(files.keys()))
+
+
+def test_biggest_pathnames_are_hashed_first():
+    files = {'small': 'x', 'big': 'x' * 1000, 'medium': 'x' * 10}
+    with temp_files(files) as root:
+        engine = create_engine(root, max_threads=1)
+        engine.compute_etags(
+            files.keys(), dict((k, len(v)) for k, v in files.iteritems()))
+        assert_equal(engine.hashed_pathnames, ['big', 'medium', 'small'])
+
+
+def test_unreadable_pathnames_are_reported_as_failed():
+    with temp_files({'a': 'content'}) as root:
+        engine = create_engine(root, max_threads=4)
+        etags, failed = engine.compute_etags(['a', 'missing'])
+        assert_equal(etags.keys(), ['a'])
+        assert_equal(failed, ['missing'])
+
+
+def test_interruption():
+    files = dict(('file%s' % i, 'content') for i in xrange(10))
+    with temp_files(files) as root:
+        interruption = threading.Event()
+        interruption.set()
+        for max_threads in [1, 4]:
+            engine = create_engine(root, max_threads)
+            assert_raises(ExecutionInterrupted, engine.compute_etags,
+                          files.keys(), None, interruption)
+
+
+def test_throughput_accounts_hashed_bytes():
+    with temp_files({'a': 'a' * 100000, 'b': 'b' * 50000}) as root:
+        engine = create_engine(root, max_threads=2, buffer_size=4096)
+        engine.compute_etags(['a', 'b'])
+        stats = engine.get_stats()
+        assert_equal(stats['hashed_bytes'], 150000)
+        assert_true(stats['hashing_time'] > 0)
+        assert_true(stats['throughput'] > 0)
+
+
+''' Helper functions: '''
+
+class temp_files(object):
+
+    def __init__(self, files):
+        self.files = files
+
+    def __enter__(self):
+        self.root = tempfile.mkdtemp()
+        for name, content in self.files.iteritems():
+            with open(os.path.join(self.root, name), 'wb') as f:
+                f.write(content)
+        return self.root
+
+    def __exit__(self, *exc_info):
+        shutil.rmtree(self.root)
+
+
+def create_engine(root, max_threads, buffer_size=1024 * 1024):
+    def compute_etag(pathname, interruption=None):
+        engine.hashed_pathnames.append(pathname)
+        with open(os.path.join(root, pathname), 'rb') as file_:
+            return binascii.hexlify(engine.md5(file_, interruption))
+    engine = HashingEngine(compute_etag, max_threads, buffer_size)
+    engine.hashed_pathnames = []
+    return engine
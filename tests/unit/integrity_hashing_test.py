@@ -0,0 +1,150 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+
+"""
+This is the integrity_hashing_test module.
+
+Cross-checks the labels computed by the skiplist nodes, which feed
+the digest one part at a time, against the ones computed by joining
+the parts with Hashing.getHash: the basis of the same dataset must be
+bit-identical.
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+import logging
+import random
+from hashlib import md5
+from nose.tools import *
+
+from FileRockSharedLibraries.IntegrityCheck.Hashing import (
+    getHash, getPartsHash, encode)
+from FileRockSharedLibraries.IntegrityCheck.SkipList import AbstractSkipList
+from FileRockSharedLibraries.IntegrityCheck.SkipListNode import (
+    SkipListNode, ProxyNode)
+
+
+class SimpleSkipList(AbstractSkipList):
+
+    def __init__(self):
+        super(SimpleSkipList, self).__init__()
+        self.logger = logging.getLogger("FR.%s" % self.__class__.__name__)
+
+
+def _reference_label(node):
+    """Compute the label of a node as getHash would, from scratch."""
+    if isinstance(node, ProxyNode):
+        return node.label
+    right = None
+    if node.right_child is not None:
+        right = _reference_label(node.right_child)
+    if node.height == 0:
+        if right is None:
+            return encode(node.pathname) + node.filehash
+        return getHash([encode(node.pathname), node.filehash, right])
+    lower = _reference_label(node.lower_child)
+    if right is None:
+        return lower
+    return getHash([lower, right])
+
+
+def _random_pathname(rnd):
+    chars = u'abc/\u00e8\u4e2d\U0001f600 .'
+    return u'dir%s/' % rnd.randint(0, 5) + u''.join(
+        rnd.choice(chars) for _ in xrange(rnd.randint(1, 12)))
+
+
+def _filehash(rnd):
+    return md5(str(rnd.random())).hexdigest()
+
+
+def test_parts_hash_equals_joined_hash():
+    rnd = random.Random(19)
+    parts = [u'', '', None, u'\u00e8\u4e2d', u'+INF', encode(u'\u00e8'),
+             md5('a').hexdigest(), unicode(md5('b').hexdigest())]
+    for _ in xrange(500):
+        chosen = [rnd.choice(parts) for _ in xrange(rnd.randint(0, 4))]
+        assert_equal(getPartsHash(*chosen), getHash(chosen))
+
+
+def test_encoded_pathname_is_cached():
+    node = SkipListNode(u'dir/\u00e8.txt', 0, filehash=md5('').hexdigest())
+    encoded = node.getEncodedPathname()
+    assert_equal(encoded, encode(u'dir/\u00e8.txt'))
+    assert_true(node.getEncodedPathname() is encoded)
+
+
+def test_labels_are_identical_to_joined_hashing():
+    rnd = random.Random(42)
+    skiplist = SimpleSkipList()
+    dataset = {}
+    while len(dataset) < 300:
+        dataset[_random_pathname(rnd)] = _filehash(rnd)
+    for pathname in dataset:
+        skiplist.updateSkipListOnInsert(pathname, dataset[pathname])
+    assert_equal(skiplist.getBasis(), _reference_label(skiplist.root))
+
+    # Labels recomputed lazily, with the encoded pathnames already
+    # cached, must stay the same too.
+    for _ in xrange(10):
+        for pathname in rnd.sample(sorted(dataset), 20):
+            skiplist.updateSkipListOnUpdate(pathname, _filehash(rnd))
+        for pathname in rnd.sample(sorted(dataset), 10):
+            skiplist.updateSkipListOnDelete(pathname)
+            del dataset[pathname]
+        for _ in xrange(10):
+            pathname = _random_pathname(rnd)
+            if pathname not in dataset:
+                dataset[pathname] = _filehash(rnd)
+                skiplist.updateSkipListOnInsert(pathname, dataset[pathname])
+        basis = skiplist.getBasis()
+        assert_equal(basis, _reference_label(skiplist.root))
+        assert_equal(basis, skiplist.getBasis(forced=True))
+
+
+def test_labels_with_unicode_proxy_labels():
+    # Proxy labels come from JSON, so they are unicode objects
+    root = SkipListNode(u'-INF', 1)
+    leaf = SkipListNode(u'-INF', 0, filehash=u'-INF')
+    proxy = ProxyNode(u'dir/\u00e8', 0, label=unicode(md5('x').hexdigest()))
+    leaf.father, root.lower_child = root, leaf
+    proxy.father, root.right_child = root, proxy
+    leaf.right_child = ProxyNode(u'a', 0, label=u'\u00e8' + u'0' * 31)
+    leaf.right_child.father = leaf
+    assert_equal(root.computeLabel(), _reference_label(root))
+
+
+if __name__ == '__main__':
+    pass
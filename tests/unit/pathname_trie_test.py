@@ -0,0 +1,115 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+This is the pathname_trie_test module.
+
+
+
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+from nose.tools import *
+from filerockclient.util.pathname_trie import PathnameTrie
+
+
+PATHNAMES = [u'a/', u'a/b/', u'a/b/c.txt', u'a/d.txt', u'ab', u'e/f/g.txt']
+
+
+def test_membership():
+    trie = PathnameTrie(PATHNAMES)
+    assert_equal(len(trie), 6)
+    assert_true(u'a/b/' in trie)
+    assert_false(u'a/b' in trie)
+    assert_false(u'e/f/' in trie)
+    assert_false(trie.add(u'a/'))
+    assert_true(trie.add(u'e/'))
+    assert_equal(len(trie), 7)
+
+
+def test_remove_prunes_empty_nodes():
+    trie = PathnameTrie(PATHNAMES)
+    assert_true(trie.remove(u'e/f/g.txt'))
+    assert_false(trie.remove(u'e/f/g.txt'))
+    assert_false(trie.remove(u'a/x'))
+    assert_equal(trie._root.children.keys().count(u'e/'), 0)
+    assert_true(trie.remove(u'a/b/'))
+    assert_true(u'a/b/c.txt' in trie)
+    assert_equal(trie.count_descendants(u'a/'), 2)
+    assert_equal(len(trie), 4)
+
+
+def test_count_descendants():
+    trie = PathnameTrie(PATHNAMES)
+    assert_equal(trie.count_descendants(u''), 6)
+    assert_equal(trie.count_descendants(u'a/'), 3)
+    assert_equal(trie.count_descendants(u'a/b/'), 1)
+    assert_equal(trie.count_descendants(u'a/b/c.txt'), 0)
+    # Not in the set, but has descendants in it
+    assert_equal(trie.count_descendants(u'e/'), 1)
+    assert_equal(trie.count_descendants(u'x/'), 0)
+
+
+def test_iter_descendants():
+    trie = PathnameTrie(PATHNAMES)
+    assert_equal(list(trie.iter_descendants(u'a/')),
+                 [u'a/b/', u'a/b/c.txt', u'a/d.txt'])
+    assert_equal(list(trie.iter_descendants(u'a/', postorder=True)),
+                 [u'a/b/c.txt', u'a/b/', u'a/d.txt'])
+    assert_equal(list(trie.iter_descendants(u'x/')), [])
+    assert_equal(sorted(trie), sorted(PATHNAMES))
+
+
+def test_ancestors_are_whole_components():
+    trie = PathnameTrie([u'a', u'a/'])
+    assert_is_none(trie.nearest_ancestor(u'ab'))
+    assert_equal(trie.nearest_ancestor(u'a/b'), u'a/')
+
+
+def test_nearest_ancestor():
+    trie = PathnameTrie(PATHNAMES)
+    assert_equal(trie.nearest_ancestor(u'a/b/c.txt'), u'a/b/')
+    assert_equal(trie.nearest_ancestor(u'a/b/x/y/z'), u'a/b/')
+    assert_equal(trie.nearest_ancestor(u'a/b/'), u'a/')
+    assert_is_none(trie.nearest_ancestor(u'a/'))
+    assert_is_none(trie.nearest_ancestor(u'e/f/g.txt'))
+
+
+def test_first_missing_ancestor():
+    trie = PathnameTrie(PATHNAMES)
+    assert_is_none(trie.first_missing_ancestor(u'a/b/c.txt'))
+    assert_is_none(trie.first_missing_ancestor(u'a/'))
+    assert_equal(trie.first_missing_ancestor(u'a/b/x/y.txt'), u'a/b/x/')
+    assert_equal(trie.first_missing_ancestor(u'e/f/g.txt'), u'e/')
+    assert_equal(trie.first_missing_ancestor(u'x/y/'), u'x/')
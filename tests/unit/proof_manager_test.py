@@ -0,0 +1,360 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+"""
+This is the proof_manager_test module.
+
+The proofs are generated from a complete skiplist, as the server would
+do, and the basis computed by the ProofManager is checked against the
+one of the complete skiplist after applying the same operations.
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+import json
+import logging
+import random
+from copy import deepcopy
+from hashlib import md5
+from nose.tools import *
+
+from FileRockSharedLibraries.IntegrityCheck.SkipList import AbstractSkipList
+from FileRockSharedLibraries.IntegrityCheck.SkipListNode import (
+    SkipListNode, ProxyNode)
+from FileRockSharedLibraries.IntegrityCheck.Proof import Proof
+from filerockclient.integritycheck.ProofManager import (
+    ProofManager, MalformedProofException)
+from filerockclient.integritycheck.IntegrityManager import (
+    IntegrityManager, WrongBasisFromProofException)
+
+
+class FullSkipList(AbstractSkipList):
+    """A skiplist holding the whole dataset, as the server one."""
+
+    def __init__(self, dataset={}):
+        super(FullSkipList, self).__init__()
+        self.logger = logging.getLogger("FR.%s" % self.__class__.__name__)
+        for pathname in sorted(dataset):
+            self.updateSkipListOnInsert(pathname, dataset[pathname])
+
+    def get_proof(self, pathname, operation, path_pathnames):
+        """Build the proof of an operation, made of the computation
+        paths starting from the leaves of the given pathnames.
+        """
+        self.getBasis()
+        proofpaths = {}
+        for path_pathname in path_pathnames:
+            proofpaths[path_pathname] = _copy_path(self.leaves[path_pathname])
+        return Proof.getInstance(pathname, operation, proofpaths)
+
+    def neighbours(self, pathname):
+        pathnames = sorted(p for p in self.pathnames if not self._isGuard(p))
+        lower = [p for p in pathnames if p < pathname]
+        upper = [p for p in pathnames if p > pathname]
+        left = lower[-1] if len(lower) > 0 else u'-INF'
+        right = upper[0] if len(upper) > 0 else u'+INF'
+        return left, right
+
+
+def _copy_path(leaf):
+    """Copy the path from a leaf to the root, replacing the siblings
+    with proxies.
+    """
+    first_node = None
+    copied_child = None
+    original = leaf
+    while original is not None:
+        node = SkipListNode(original.pathname, original.height,
+                            label=original.label, filehash=original.filehash)
+        for side in ('lower_child', 'right_child'):
+            child = getattr(original, side)
+            if child is None:
+                continue
+            if copied_child is not None and child == copied_child:
+                setattr(node, side, copied_child)
+                copied_child.father = node
+            else:
+                proxy = ProxyNode(child.pathname, child.height, child.label)
+                proxy.father = node
+                setattr(node, side, proxy)
+        if first_node is None:
+            first_node = node
+        copied_child = node
+        original = original.father
+    return first_node
+
+
+def _filehash(content):
+    return md5(content).hexdigest()
+
+
+def _make_dataset(size, rnd):
+    return dict((u'dir%s/file%05d' % (rnd.randint(0, 9), i),
+                 _filehash(str(i)))
+                for i in xrange(size))
+
+
+def _declare(server, manager, verb, pathname, filehash=None):
+    """Let the ProofManager check the proof of an operation, returning
+    the proof basis.
+    """
+    left, right = server.neighbours(pathname)
+    if verb == 'DELETE':
+        path_pathnames = [left, pathname]
+    elif pathname in server.pathnames:
+        path_pathnames = [pathname]
+    else:
+        path_pathnames = [left, right]
+    proof = server.get_proof(pathname, verb, path_pathnames)
+    proof.operation = verb
+    proof.pathname = pathname
+    return manager.addOperation(proof, filehash), proof
+
+
+def _random_operations(dataset, count, rnd):
+    operations = []
+    existing = rnd.sample(sorted(dataset), count)
+    for i, pathname in enumerate(existing):
+        if i % 3 == 0:
+            operations.append(('DELETE', pathname, None))
+        elif i % 3 == 1:
+            operations.append(('UPLOAD', pathname, _filehash(pathname)))
+        else:
+            new_pathname = pathname + u'.new'
+            operations.append(('UPLOAD', new_pathname, _filehash(new_pathname)))
+    rnd.shuffle(operations)
+    return operations
+
+
+def _apply(server, operations):
+    for verb, pathname, filehash in operations:
+        if verb == 'DELETE':
+            server.updateSkipListOnDelete(pathname)
+        elif pathname in server.pathnames:
+            server.updateSkipListOnUpdate(pathname, filehash)
+        else:
+            server.updateSkipListOnInsert(pathname, filehash)
+
+
+def test_commit_basis():
+    rnd = random.Random(16)
+    dataset = _make_dataset(300, rnd)
+    server = FullSkipList(dataset)
+    trusted_basis = server.getBasis()
+    manager = ProofManager()
+    operations = _random_operations(dataset, 60, rnd)
+    for verb, pathname, filehash in operations:
+        basis, _ = _declare(server, manager, verb, pathname, filehash)
+        assert_equal(basis, trusted_basis)
+    _apply(server, operations)
+    assert_equal(manager.getBasis(), server.getBasis(forced=True))
+    # The second call must not apply the operations twice
+    assert_equal(manager.getBasis(), server.getBasis())
+
+
+def test_operations_added_after_basis():
+    rnd = random.Random(17)
+    dataset = _make_dataset(200, rnd)
+    server = FullSkipList(dataset)
+    manager = ProofManager()
+    operations = _random_operations(dataset, 20, rnd)
+    for verb, pathname, filehash in operations[:10]:
+        _declare(server, manager, verb, pathname, filehash)
+    manager.getBasis()
+    for verb, pathname, filehash in operations[10:]:
+        _declare(server, manager, verb, pathname, filehash)
+    _apply(server, operations)
+    assert_equal(manager.getBasis(), server.getBasis())
+
+
+def test_aborted_operation():
+    rnd = random.Random(18)
+    dataset = _make_dataset(200, rnd)
+    server = FullSkipList(dataset)
+    manager = ProofManager()
+    operations = _random_operations(dataset, 10, rnd)
+    for verb, pathname, filehash in operations:
+        _, proof = _declare(server, manager, verb, pathname, filehash)
+    manager.abortOperation(proof, operations[-1][2])
+    _apply(server, operations[:-1])
+    assert_equal(manager.getBasis(), server.getBasis())
+
+
+def test_flush_operation_list():
+    rnd = random.Random(19)
+    dataset = _make_dataset(100, rnd)
+    server = FullSkipList(dataset)
+    manager = ProofManager()
+    for verb, pathname, filehash in _random_operations(dataset, 10, rnd):
+        _declare(server, manager, verb, pathname, filehash)
+    manager.flushOperationList()
+    assert_equal(manager.getBasis(), None)
+    operations = _random_operations(dataset, 10, rnd)
+    for verb, pathname, filehash in operations:
+        _declare(server, manager, verb, pathname, filehash)
+    _apply(server, operations)
+    assert_equal(manager.getBasis(), server.getBasis())
+
+
+def test_label_of_deep_tree():
+    # A chain of leaves deeper than the recursion limit
+    root = previous = SkipListNode(u'-INF', 0, filehash=u'-INF')
+    for i in xrange(5000):
+        node = SkipListNode(u'%05d' % i, 0, filehash=_filehash(str(i)))
+        previous.right_child = node
+        node.father = previous
+        previous = node
+    label = root.computeLabel()
+    assert_equal(root.computeLabel(forced=True), label)
+    previous.filehash = _filehash('changed')
+    previous.outdateAncestors()
+    assert_not_equal(root.computeLabel(), label)
+
+
+def _verify_proof(server, pathname):
+    """Build the proof the server sends for a download or a local
+    deletion of the given pathname.
+    """
+    if pathname in server.pathnames:
+        return server.get_proof(pathname, 'VERIFY', [pathname])
+    return server.get_proof(pathname, 'VERIFY', server.neighbours(pathname))
+
+
+def _tamper_upper_proxy(proof):
+    node = proof.getStartingNodes()[0]
+    tampered = None
+    while node is not None:
+        for child in (node.lower_child, node.right_child):
+            if isinstance(child, ProxyNode):
+                tampered = child
+        node = node.father
+    tampered.label = _filehash('tampered')
+
+
+def test_verify_operations():
+    rnd = random.Random(20)
+    dataset = _make_dataset(500, rnd)
+    server = FullSkipList(dataset)
+    trusted_basis = server.getBasis()
+    manager = ProofManager()
+    for pathname in sorted(dataset):
+        proof = _verify_proof(server, pathname)
+        proof.operation = 'DOWNLOAD'
+        proof.pathname = pathname
+        assert_equal(
+            manager.verifyOperation(proof, trusted_basis, dataset[pathname]),
+            trusted_basis)
+        assert_true(len(manager._verifier) <= len(server.pathnames) * 20)
+    for pathname in [u'0', u'dir3/file00000.deleted', u'zzz']:
+        proof = _verify_proof(server, pathname)
+        proof.operation = 'DELETE_LOCAL'
+        proof.pathname = pathname
+        assert_equal(manager.verifyOperation(proof, trusted_basis),
+                     trusted_basis)
+    assert_equal(manager.getPendingOperations(), [])
+
+
+def test_verify_wrong_operations():
+    rnd = random.Random(21)
+    dataset = _make_dataset(300, rnd)
+    server = FullSkipList(dataset)
+    trusted_basis = server.getBasis()
+    manager = ProofManager()
+    pathnames = sorted(dataset)
+    for i, pathname in enumerate(pathnames):
+        proof = _verify_proof(server, pathname)
+        filehash = dataset[pathname]
+        if i % 7 == 3:
+            filehash = _filehash('tampered')
+            proof.proofpaths[pathname].filehash = filehash
+        elif i % 7 == 5:
+            _tamper_upper_proxy(proof)
+        proof.operation = 'DOWNLOAD'
+        proof.pathname = pathname
+        alone = deepcopy(proof)
+        basis = manager.verifyOperation(proof, trusted_basis, filehash)
+        if i % 7 in (3, 5):
+            assert_not_equal(basis, trusted_basis)
+            assert_equal(basis, ProofManager().addOperation(alone, filehash))
+        else:
+            assert_equal(basis, trusted_basis)
+
+
+def test_verify_operation_with_integrity_manager():
+    rnd = random.Random(22)
+    dataset = _make_dataset(50, rnd)
+    server = FullSkipList(dataset)
+    manager = IntegrityManager(server.getBasis())
+    pathname = sorted(dataset)[10]
+    manager.verifyOperation(
+        'DOWNLOAD', pathname, _verify_proof(server, pathname),
+        dataset[pathname])
+    proof = _verify_proof(server, pathname)
+    proof.proofpaths[pathname].filehash = _filehash('tampered')
+    try:
+        manager.verifyOperation(
+            'DOWNLOAD', pathname, proof, _filehash('tampered'))
+        assert_true(False, 'Wrong proof was accepted')
+    except WrongBasisFromProofException as e:
+        assert_equal(e.pathname, pathname)
+        assert_not_equal(e.operation_basis, server.getBasis())
+    assert_raises(MalformedProofException, manager.verifyOperation,
+                  'DOWNLOAD', pathname, _verify_proof(server, pathname),
+                  _filehash('another'))
+
+
+def test_proof_decoding_with_string_table():
+    rnd = random.Random(23)
+    dataset = _make_dataset(100, rnd)
+    server = FullSkipList(dataset)
+    trusted_basis = server.getBasis()
+    string_table = {}
+    pathnames = sorted(dataset)[40:42]
+    proofs = []
+    for pathname in pathnames:
+        raw = _verify_proof(server, pathname).serialize()
+        proof = Proof(raw, string_table)
+        assert_equal(json.loads(proof.serialize()), json.loads(raw))
+        proofs.append(proof)
+    roots = [ProofManager._getPathRoot(proof.getStartingNodes()[0])
+             for proof in proofs]
+    assert_true(roots[0].pathname is roots[1].pathname)
+    assert_false(hasattr(roots[0], '__dict__'))
+    manager = ProofManager()
+    for pathname, proof in zip(pathnames, proofs):
+        proof.operation = 'DOWNLOAD'
+        proof.pathname = pathname
+        assert_equal(
+            manager.verifyOperation(proof, trusted_basis, dataset[pathname]),
+            trusted_basis)
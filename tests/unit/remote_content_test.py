@@ -0,0 +1,91 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+This is the remote_content_test module.
+
+
+
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+from nose.tools import *
+import json
+from filerockclient.util.utilities import get_hash
+from filerockclient.serversession.remote_content import StorageListHasher
+from filerockclient.serversession.states.sync_diff import \
+    remove_lmtime_from_filelist
+
+
+def make_filelist(start, count):
+    """A filelist as decoded from a SYNC_FILES_LIST message."""
+    filelist = [{'key': u'dir/file%06d' % i,
+                 'etag': u'%032x' % i,
+                 'size': i if i % 2 == 0 else unicode(i),
+                 'lmtime': u'2012-05-08T21:26:42.000Z'}
+                for i in xrange(start, start + count)]
+    return json.loads(json.dumps(filelist))
+
+
+def test_empty_filelist_hash():
+    assert_equal(StorageListHasher().hexdigest(), get_hash([]))
+
+
+def test_paged_hash_equals_hash_of_whole_filelist():
+    whole = make_filelist(0, 3000)
+    expected = get_hash(remove_lmtime_from_filelist(whole))
+    hasher = StorageListHasher()
+    for start in xrange(0, 3000, 1000):
+        hasher.update(make_filelist(start, 1000))
+    assert_equal(hasher.hexdigest(), expected)
+
+
+def test_hasher_forgets_previous_pages():
+    hasher = StorageListHasher()
+    for start in xrange(0, 3000, 1000):
+        hasher.update(make_filelist(start, 1000))
+    # Just the three dictionary keys and the one-digit sizes
+    assert_less(len(dict.keys(hasher._pickler.memo)), 10)
+
+
+def test_paged_hash_with_objects_shared_across_pages():
+    pages = [make_filelist(start, 1000) for start in xrange(0, 3000, 1000)]
+    for page in pages:
+        for entry in page:
+            entry['etag'] = u''
+    expected = get_hash(remove_lmtime_from_filelist(sum(pages, [])))
+    hasher = StorageListHasher()
+    for page in pages:
+        hasher.update(page)
+    assert_equal(hasher.hexdigest(), expected)
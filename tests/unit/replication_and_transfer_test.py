@@ -0,0 +1,281 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+"""
+This is the replication_and_transfer_test module.
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+import Queue
+import threading
+from nose.tools import *
+from mock import MagicMock
+
+from filerockclient.pathname_operation import PathnameOperation
+from filerockclient.util.multi_queue import MultiQueue
+from filerockclient.serversession.commit_controller import CommitController
+from filerockclient.workers.scheduling import SchedulingPolicy
+from filerockclient.serversession.states import replication_and_transfer
+from filerockclient.serversession.states.replication_and_transfer import \
+    ReplicationAndTransferState
+
+
+MB = 1024 * 1024
+
+
+class FakeWorkerPool(object):
+
+    def __init__(self, workers, large_workers=None):
+        self.free = workers
+        self.scheduling_policy = SchedulingPolicy(reserved_workers=0)
+        self.large = 0
+        self.large_workers = large_workers
+
+    def exist_free_workers(self, operation=None):
+        if operation is not None and self.large_workers is not None \
+        and self.scheduling_policy.is_large(operation):
+            return self.free > 0 and self.large < self.large_workers
+        return self.free > 0
+
+    def is_large_lane_free(self):
+        return self.large == 0
+
+    def acquire_worker(self, operation=None):
+        if not self.exist_free_workers(operation):
+            return False
+        self.free -= 1
+        if operation is not None and self.scheduling_policy.is_large(operation):
+            self.large += 1
+        return True
+
+    def release_worker(self, operation=None):
+        self.free += 1
+        if operation is not None and self.scheduling_policy.is_large(operation):
+            self.large -= 1
+
+    def send_operation(self, operation):
+        pass
+
+    def track_acquire_anonymous_worker(self, pathname):
+        pass
+
+    def track_release_unassigned_worker(self, pathname):
+        pass
+
+
+def _make_state(workers):
+    context = MagicMock()
+    context._input_queue = MultiQueue([
+        'servermessage', 'operation', 'usercommand', 'sessioncommand',
+        'systemcommand'])
+    context.output_message_queue = Queue.Queue()
+    context.worker_pool = FakeWorkerPool(workers)
+    context.transaction_manager.handle_operation.return_value = True
+    context.transaction.size.return_value = 0
+    context.transaction.data_size.return_value = 0
+    context.commit_threshold_seconds = 60
+    context.commit_threshold_operations = 100
+    context.commit_threshold_bytes = 1000
+    context.commit_controller = CommitController(
+        60, 1000, 10000, 300, 0.1, adaptive=False,
+        threshold_operations=100, threshold_bytes=1000)
+    context.id = 0
+    return ReplicationAndTransferState(context)
+
+
+def _operation(verb, pathname, oldpath=None, size=0):
+    return PathnameOperation(MagicMock(), threading.RLock(), verb, pathname,
+                             oldpath, 'd41d8cd98f00b204e9800998ecf8427e', size)
+
+
+def _declared(state):
+    pathnames = []
+    while not state._context.output_message_queue.empty():
+        msg = state._context.output_message_queue.get_nowait()
+        pathnames.append(msg.getParameter('request_details').pathname)
+    return pathnames
+
+
+def _worker_released(state, operation=None):
+    state._context.worker_pool.release_worker(operation)
+    state._handle_command_WORKERFREE(None)
+
+
+def test_operations_without_workers_are_declared_while_workers_are_busy():
+    state = _make_state(workers=1)
+    state._handle_operation(_operation('UPLOAD', u'a'))
+    state._handle_operation(_operation('UPLOAD', u'b'))
+    state._handle_operation(_operation('DELETE', u'c'))
+    state._handle_operation(_operation('REMOTE_COPY', u'e/', u'd/'))
+    assert_equal(_declared(state), [u'a', u'c', u'e/'])
+    _worker_released(state)
+    assert_equal(_declared(state), [u'b'])
+
+
+def test_operations_on_waiting_pathnames_keep_their_order():
+    state = _make_state(workers=0)
+    state._handle_operation(_operation('UPLOAD', u'dir/file'))
+    state._handle_operation(_operation('DELETE', u'dir/'))
+    state._handle_operation(_operation('DELETE', u'other'))
+    state._handle_operation(_operation('REMOTE_COPY', u'copy/', u'dir/sub/'))
+    state._handle_operation(_operation('UPLOAD', u'new'))
+    assert_equal(_declared(state), [u'other'])
+    _worker_released(state)
+    assert_equal(_declared(state), [u'dir/file', u'dir/', u'copy/'])
+    _worker_released(state)
+    assert_equal(_declared(state), [u'new'])
+
+
+def test_waiting_uploads_are_served_by_priority():
+    state = _make_state(workers=2)
+    small = _operation('UPLOAD', u'small0')
+    state._handle_operation(_operation('UPLOAD', u'big1', size=100 * MB))
+    state._handle_operation(small)
+    state._handle_operation(_operation('UPLOAD', u'big2', size=100 * MB))
+    state._handle_operation(_operation('UPLOAD', u'small1'))
+    state._handle_operation(_operation('UPLOAD', u'dir/'))
+    assert_equal(_declared(state), [u'big1', u'small0'])
+    _worker_released(state, small)
+    assert_equal(_declared(state), [u'dir/'])
+    _worker_released(state)
+    assert_equal(_declared(state), [u'small1'])
+    _worker_released(state)
+    assert_equal(_declared(state), [u'big2'])
+
+
+def test_large_uploads_take_the_free_large_lane_first():
+    state = _make_state(workers=1)
+    big = _operation('UPLOAD', u'big1', size=100 * MB)
+    state._handle_operation(big)
+    state._handle_operation(_operation('UPLOAD', u'small'))
+    state._handle_operation(_operation('UPLOAD', u'big2', size=100 * MB))
+    assert_equal(_declared(state), [u'big1'])
+    _worker_released(state, big)
+    assert_equal(_declared(state), [u'big2'])
+
+
+def test_small_uploads_do_not_wait_for_a_large_lane():
+    state = _make_state(workers=2)
+    state._context.worker_pool.large_workers = 1
+    state._handle_operation(_operation('UPLOAD', u'big1', size=100 * MB))
+    state._handle_operation(_operation('UPLOAD', u'big2', size=100 * MB))
+    state._handle_operation(_operation('UPLOAD', u'small'))
+    assert_equal(_declared(state), [u'big1', u'small'])
+
+
+def test_uploads_do_not_overtake_related_operations():
+    state = _make_state(workers=1)
+    state._handle_operation(_operation('UPLOAD', u'big', size=100 * MB))
+    state._handle_operation(_operation('UPLOAD', u'dir/f', size=50 * MB))
+    state._handle_operation(_operation('UPLOAD', u'dir/f', size=1000))
+    state._handle_operation(_operation('UPLOAD', u'other', size=20 * MB))
+    assert_equal(_declared(state), [u'big'])
+    _worker_released(state)
+    assert_equal(_declared(state), [u'other'])
+    _worker_released(state)
+    assert_equal(_declared(state), [u'dir/f'])
+    _worker_released(state)
+    assert_equal(_declared(state), [u'dir/f'])
+
+
+def test_aborted_operations_do_not_wait():
+    state = _make_state(workers=0)
+    operation = _operation('UPLOAD', u'a')
+    operation.abort()
+    state._handle_operation(operation)
+    assert_equal(len(state._waiting_operations), 0)
+
+
+def test_waiting_operations_are_received_again_on_leaving():
+    state = _make_state(workers=0)
+    state._handle_operation(_operation('UPLOAD', u'a'))
+    state._handle_operation(_operation('UPLOAD', u'b'))
+    state.postpone_operation(_operation('DELETE', u'postponed'))
+    state._on_leaving()
+    queue = state._context._input_queue
+    received = []
+    while not queue.empty(['operation']):
+        operation, _ = queue.get(['operation'])
+        received.append(operation.pathname)
+    assert_equal(received, [u'postponed', u'a', u'b'])
+    assert_equal(len(state._waiting_pathnames), 0)
+
+
+def test_operations_are_not_received_when_too_many_wait():
+    old_max = replication_and_transfer.MAX_WAITING_OPERATIONS
+    replication_and_transfer.MAX_WAITING_OPERATIONS = 2
+    try:
+        state = _make_state(workers=0)
+        state._handle_operation(_operation('UPLOAD', u'a'))
+        assert_true(state._context.listening_operations)
+        state._handle_operation(_operation('UPLOAD', u'b'))
+        assert_false(state._context.listening_operations)
+        _worker_released(state)
+        assert_true(state._context.listening_operations)
+    finally:
+        replication_and_transfer.MAX_WAITING_OPERATIONS = old_max
+
+
+def test_operation_waits_if_the_pool_shrinks_before_acquiring():
+    state = _make_state(workers=1)
+    pool = state._context.worker_pool
+    acquire_worker = pool.acquire_worker
+
+    def shrink_and_acquire(operation=None):
+        # The pool shrinks after the free worker has been seen
+        pool.acquire_worker = acquire_worker
+        pool.free -= 1
+        return acquire_worker(operation)
+
+    pool.acquire_worker = shrink_and_acquire
+    state._handle_operation(_operation('UPLOAD', u'a'))
+    assert_equal(_declared(state), [])
+    assert_equal(len(state._waiting_operations), 1)
+    assert_false(state._context.transaction_manager.handle_operation.called)
+    _worker_released(state)
+    assert_equal(_declared(state), [u'a'])
+    assert_equal(pool.free, 0)
+
+
+def test_worker_is_released_if_the_operation_is_not_declared():
+    state = _make_state(workers=1)
+    state._context.transaction_manager.handle_operation.return_value = False
+    state._handle_operation(_operation('UPLOAD', u'a'))
+    assert_equal(_declared(state), [])
+    assert_equal(state._context.worker_pool.free, 1)
+
+
+if __name__ == '__main__':
+    pass
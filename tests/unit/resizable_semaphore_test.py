@@ -0,0 +1,127 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+This is the resizable_semaphore_test module.
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+
+import threading
+from nose.tools import *
+
+from filerockclient.util.resizable_semaphore import ResizableSemaphore
+
+
+def _acquire_all(semaphore):
+    acquired = 0
+    while semaphore.acquire(False):
+        acquired += 1
+    return acquired
+
+
+def test_bounded():
+    semaphore = ResizableSemaphore(2)
+    assert_true(semaphore.acquire(False))
+    semaphore.release()
+    assert_raises(ValueError, semaphore.release)
+
+
+def test_grow_adds_free_permits():
+    semaphore = ResizableSemaphore(2)
+    assert_equal(_acquire_all(semaphore), 2)
+    semaphore.resize(4)
+    assert_equal(semaphore.get_value(), 2)
+    assert_equal(_acquire_all(semaphore), 2)
+    assert_equal(semaphore.get_in_use(), 4)
+
+
+def test_shrink_does_not_take_free_permits():
+    semaphore = ResizableSemaphore(4)
+    assert_true(semaphore.acquire(False))
+    semaphore.resize(2)
+    assert_equal(semaphore.get_value(), 3)
+    assert_equal(semaphore.get_in_use(), 1)
+    # A permit seen free before the shrink can still be acquired
+    assert_true(semaphore.acquire(False))
+    semaphore.release()
+    semaphore.release()
+    assert_equal(semaphore.get_in_use(), 0)
+    assert_equal(_acquire_all(semaphore), 2)
+
+
+def test_shrink_removes_busy_permits_when_released():
+    semaphore = ResizableSemaphore(4)
+    assert_equal(_acquire_all(semaphore), 4)
+    semaphore.resize(2)
+    assert_equal(semaphore.get_in_use(), 4)
+    semaphore.release()
+    semaphore.release()
+    assert_equal(semaphore.get_value(), 0)
+    semaphore.release()
+    assert_equal(semaphore.get_value(), 1)
+    semaphore.release()
+    assert_equal(semaphore.get_value(), 2)
+    assert_raises(ValueError, semaphore.release)
+
+
+def test_grow_cancels_pending_removals():
+    semaphore = ResizableSemaphore(4)
+    assert_equal(_acquire_all(semaphore), 4)
+    semaphore.resize(2)
+    semaphore.resize(3)
+    assert_equal(semaphore.get_value(), 0)
+    for _ in xrange(4):
+        semaphore.release()
+    assert_equal(semaphore.get_value(), 3)
+
+
+def test_grow_wakes_up_waiting_threads():
+    semaphore = ResizableSemaphore(0)
+    acquired = threading.Event()
+
+    def acquire():
+        semaphore.acquire()
+        acquired.set()
+
+    thread = threading.Thread(target=acquire)
+    thread.daemon = True
+    thread.start()
+    assert_false(acquired.wait(0.1))
+    semaphore.resize(1)
+    assert_true(acquired.wait(5))
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,128 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+This is the scheduling_test module.
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+
+import threading
+from nose.tools import *
+from mock import MagicMock
+
+from filerockclient.pathname_operation import PathnameOperation
+from filerockclient.workers.scheduling import SchedulingPolicy, \
+    URGENT_PRIORITY, LARGE_LANE_PRIORITY
+
+
+MB = 1024 * 1024
+
+
+def _operation(verb, pathname, size=0):
+    return PathnameOperation(MagicMock(), threading.RLock(), verb, pathname,
+                             None, 'd41d8cd98f00b204e9800998ecf8427e', size)
+
+
+def test_size_classes():
+    policy = SchedulingPolicy()
+    assert_equal(policy.size_class(_operation('UPLOAD', u'a', 0)), 0)
+    assert_equal(policy.size_class(_operation('UPLOAD', u'a', 65535)), 0)
+    assert_equal(policy.size_class(_operation('UPLOAD', u'a', 65536)), 1)
+    assert_equal(policy.size_class(_operation('UPLOAD', u'a', 20 * MB)), 4)
+    assert_equal(policy.size_class(_operation('UPLOAD', u'a', 20000 * MB)), 5)
+
+
+def test_smaller_files_come_first():
+    policy = SchedulingPolicy()
+    small = policy.priority(_operation('UPLOAD', u'a', 1000))
+    medium = policy.priority(_operation('UPLOAD', u'b', 1 * MB))
+    large = policy.priority(_operation('UPLOAD', u'c', 100 * MB))
+    assert_true(small < medium < large)
+
+
+def test_directories_and_deletions_come_first():
+    policy = SchedulingPolicy()
+    assert_equal(policy.priority(_operation('UPLOAD', u'dir/')),
+                 URGENT_PRIORITY)
+    assert_equal(policy.priority(_operation('DELETE', u'a', 100 * MB)),
+                 URGENT_PRIORITY)
+    task = MagicMock(verb='CREATE_DIRECTORIES', pathname='CREATE_DIRECTORIES')
+    assert_equal(policy.priority(task), URGENT_PRIORITY)
+    assert_true(policy.priority(_operation('UPLOAD', u'a', 0)) >
+                URGENT_PRIORITY)
+
+
+def test_waiting_operations_age():
+    policy = SchedulingPolicy(aging_seconds=60)
+    large = _operation('UPLOAD', u'a', 100 * MB)
+    small = _operation('UPLOAD', u'b', 1000)
+    assert_equal(policy.priority(large, waited=120), 3)
+    assert_equal(policy.priority(large, waited=3600),
+                 policy.priority(small))
+    assert_true(policy.priority(large, waited=3600) > URGENT_PRIORITY)
+
+
+def test_large_files_take_their_lane_first():
+    policy = SchedulingPolicy()
+    large = _operation('UPLOAD', u'a', 100 * MB)
+    small = _operation('UPLOAD', u'b', 1000)
+    assert_equal(policy.priority(large, large_lane_free=True),
+                 LARGE_LANE_PRIORITY)
+    assert_true(policy.priority(small, large_lane_free=True) >
+                LARGE_LANE_PRIORITY)
+    assert_true(policy.priority(_operation('DELETE', u'c'),
+                                large_lane_free=True) < LARGE_LANE_PRIORITY)
+
+
+def test_workers_reserved_for_small_files():
+    policy = SchedulingPolicy(small_file_size=4 * MB, reserved_workers=1)
+    assert_true(policy.is_large(_operation('UPLOAD', u'a', 4 * MB)))
+    assert_false(policy.is_large(_operation('UPLOAD', u'a', 4 * MB - 1)))
+    assert_false(policy.is_large(_operation('DELETE', u'a', 4 * MB)))
+    assert_equal(policy.max_large_operations(4), 3)
+    assert_equal(policy.max_large_operations(1), 1)
+
+
+def test_disabled_policy_keeps_arrival_order():
+    policy = SchedulingPolicy(enabled=False)
+    large = _operation('UPLOAD', u'a', 100 * MB)
+    assert_equal(policy.priority(large, large_lane_free=True),
+                 policy.priority(_operation('DELETE', u'b')))
+    assert_false(policy.is_large(large))
+    assert_equal(policy.max_large_operations(4), 4)
+
+
+if __name__ == '__main__':
+    pass
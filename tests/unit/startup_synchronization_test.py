@@ -0,0 +1,187 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+This is the startup_synchronization_test module.
+
+
+
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+from nose.tools import *
+from mock import MagicMock
+import json
+import datetime
+from filerockclient.serversession.startup_synchronization import \
+    StartupSynchronization
+
+
+def make_filelist(start, count):
+    """A filelist as decoded from a SYNC_FILES_LIST message."""
+    filelist = [{'key': u'dir/file%06d' % i,
+                 'etag': u'%032x' % i,
+                 'size': i if i % 2 == 0 else unicode(i),
+                 'lmtime': u'2012-05-08T21:26:42.000Z'}
+                for i in xrange(start, start + count)]
+    return json.loads(json.dumps(filelist))
+
+
+def make_interruption():
+    interruption = MagicMock()
+    interruption.is_set.return_value = False
+    return interruption
+
+
+def make_startup_synchronization(cache_records):
+    warebox = MagicMock()
+    warebox.scan_content.return_value = []
+    warebox.compute_etags.return_value = ({}, [])
+    storage_cache = MagicMock()
+    storage_cache.get_all_records.return_value = cache_records
+    return StartupSynchronization(warebox, storage_cache, MagicMock())
+
+
+def test_remote_changes_are_detected_across_pages():
+    interruption = make_interruption()
+    cache_records = [
+        (u'dir/file000000', 0, 0, None, u'%032x' % 0, u'%032x' % 0),
+        (u'dir/file001500', 0, 0, None, u'old', u'old'),
+        (u'dir/gone', 0, 0, None, u'etag', u'etag')
+    ]
+    sync = make_startup_synchronization(cache_records)
+    sync.add_remote_content(make_filelist(0, 1000), interruption)
+    sync.add_remote_content(make_filelist(1000, 1000), interruption)
+    sync.prepare(interruption)
+    expected = set(u'dir/file%06d' % i for i in xrange(1, 2000))
+    assert_equal(sync.content_to_download, expected)
+    assert_equal(sync.remote_deletions, set([u'dir/gone']))
+    assert_equal(sync.remote_size[u'dir/file000003'], 3)
+    storage_cache = sync.storage_cache
+    assert_equal(storage_cache.get_all_records.call_count, 1)
+
+
+def test_reset_forgets_the_remote_content():
+    interruption = make_interruption()
+    sync = make_startup_synchronization([])
+    sync.add_remote_content(make_filelist(0, 10), interruption)
+    sync.prepare(interruption)
+    sync.reset()
+    sync.add_remote_content(make_filelist(5, 1), interruption)
+    sync.prepare(interruption)
+    assert_equal(sync.content_to_download, set([u'dir/file000005']))
+    assert_equal(len(sync.remote_etag), 1)
+
+
+def test_three_way_diff():
+    lmtime = datetime.datetime(2012, 5, 8, 21, 26, 42)
+    etag = lambda c: unicode(c * 32)
+    cache_records = [
+        # pathname, _, _, _, warebox etag, storage etag
+        (u'same', 0, 0, None, etag('1'), etag('1')),
+        (u'uploaded', 0, 0, None, etag('2'), etag('2')),
+        (u'downloaded', 0, 0, None, etag('3'), etag('3')),
+        (u'conflicted', 0, 0, None, etag('4'), etag('4')),
+        (u'both_changed_equal', 0, 0, None, etag('5'), etag('5')),
+        (u'deleted_locally', 0, 0, None, etag('6'), etag('6')),
+        (u'deleted_remotely', 0, 0, None, etag('7'), etag('7')),
+    ]
+    local = {
+        u'same': etag('1'),
+        u'uploaded': etag('a'),
+        u'downloaded': etag('3'),
+        u'conflicted': etag('b'),
+        u'both_changed_equal': etag('c'),
+        u'deleted_remotely': etag('7'),
+        u'new_local': etag('d'),
+    }
+    remote = {
+        u'same': etag('1'),
+        u'uploaded': etag('2'),
+        u'downloaded': etag('e'),
+        u'conflicted': etag('f'),
+        u'both_changed_equal': etag('c'),
+        u'deleted_locally': etag('6'),
+    }
+    sync = make_startup_synchronization(cache_records)
+    sync.warebox.scan_content.return_value = [
+        (pathname, 10, lmtime) for pathname in sorted(local)]
+    sync.warebox.compute_etags.return_value = (local, [])
+    storage_content = [
+        {'key': pathname, 'etag': remote[pathname], 'size': 20,
+         'lmtime': u'2012-05-08T21:26:42.000Z'}
+        for pathname in sorted(remote)]
+    interruption = make_interruption()
+    sync.add_remote_content(storage_content, interruption)
+    sync.prepare(interruption)
+
+    assert_equal(sync.content_to_upload, set([u'uploaded', u'new_local']))
+    assert_equal(sync.content_to_download,
+                 set([u'downloaded', u'conflicted']))
+    assert_equal(sync.edit_conflicts, set([u'conflicted']))
+    assert_equal(sync.ignored_conflicts, set([u'both_changed_equal']))
+    assert_equal(sync.content_to_delete, set([u'deleted_locally']))
+    assert_equal(sync.content_to_delete_locally, set([u'deleted_remotely']))
+    assert_equal(sync.remote_deletions, set([u'deleted_remotely']))
+    assert_equal(sync.local_size[u'same'], 10)
+    assert_equal(sync.local_lmtime[u'same'], lmtime)
+    assert_equal(sync.remote_size[u'same'], 20)
+    assert_equal(sync.remote_lmtime[u'same'], lmtime)
+    assert_equal(sync.remote_etag[u'conflicted'], etag('f'))
+    assert_equal(sync.last_session_warebox_etag[u'same'], etag('1'))
+
+
+def test_deletion_conflicts_extend_to_deleted_folders():
+    sync = make_startup_synchronization([])
+    uploads = set([u'a/b/file', u'a/c', u'ab', u'b/file', u'c/d/e/f'])
+    deletions = set([u'a/', u'a/b/', u'a', u'c/d/', u'x'])
+    conflicts = sync._detect_deletion_conflicts(uploads, deletions)
+    # Raw prefixes, as always: deleting "a" also matches "ab"
+    assert_equal(conflicts, set([u'a/b/file', u'a/c', u'ab', u'c/d/e/f']))
+
+
+def test_deletion_conflicts_match_brute_force():
+    import random
+    rnd = random.Random(42)
+    names = [u'a', u'b', u'ab', u'a/', u'b/', u'a/b/', u'a/b', u'b/a/']
+    make_pathname = lambda: u''.join(
+        rnd.choice(names) for _ in xrange(rnd.randint(1, 4)))
+    sync = make_startup_synchronization([])
+    for _ in xrange(50):
+        uploads = set(make_pathname() for _ in xrange(30))
+        deletions = set(make_pathname() for _ in xrange(10))
+        expected = set(p for p in uploads
+                       for d in deletions if p.startswith(d))
+        assert_equal(sync._detect_deletion_conflicts(uploads, deletions),
+                     expected)
@@ -0,0 +1,197 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+This is the storage_connector_test module.
+
+
+
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+from nose.tools import *
+from mock import MagicMock
+import os
+import re
+import httplib
+import hashlib
+import shutil
+import tempfile
+import threading
+import BaseHTTPServer
+from filerockclient.storage_connector import StorageConnector, \
+    PartialDownload, AdaptiveChunkSize
+from filerockclient.workers.bandwidth import Bandwidth
+from filerockclient.util.connection_pool import HTTPSConnectionPool
+
+
+CONTENT = os.urandom(300000)
+
+
+class RangeRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serves CONTENT, honouring "Range: bytes=X-" headers."""
+
+    protocol_version = 'HTTP/1.1'
+    requested_ranges = []
+
+    def do_GET(self):
+        byte_range = self.headers.getheader('Range')
+        self.requested_ranges.append(byte_range)
+        start = 0
+        if byte_range is not None:
+            start = int(re.match('bytes=(\d+)-', byte_range).group(1))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %s-%s/%s'
+                             % (start, len(CONTENT) - 1, len(CONTENT)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', len(CONTENT) - start)
+        self.end_headers()
+        self.wfile.write(CONTENT[start:])
+
+    def log_message(self, *args):
+        pass
+
+
+class PlainConnectionPool(HTTPSConnectionPool):
+    """Talks plain HTTP to the test server."""
+
+    def get_connection(self, address, host):
+        return httplib.HTTPConnection(address, SERVER.server_port)
+
+    def release_connection(self, connection):
+        connection.close()
+
+
+def setup():
+    global SERVER, TEMP_DIR
+    TEMP_DIR = tempfile.mkdtemp()
+    SERVER = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), RangeRequestHandler)
+    thread = threading.Thread(target=SERVER.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+
+def teardown():
+    SERVER.shutdown()
+    shutil.rmtree(TEMP_DIR)
+
+
+def test_download_resumes_from_partial_file():
+    pathname = os.path.join(TEMP_DIR, 'partial')
+    with open(pathname, 'wb') as f:
+        f.write(CONTENT[:100000])
+    partial_download = PartialDownload(pathname)
+    assert_equal(partial_download.offset, 100000)
+
+    del RangeRequestHandler.requested_ranges[:]
+    result = download(pathname, partial_download)
+
+    assert_true(result['success'])
+    assert_equal(RangeRequestHandler.requested_ranges, ['bytes=100000-'])
+    assert_equal(result['etag'], hashlib.md5(CONTENT).hexdigest())
+    with open(pathname, 'rb') as f:
+        assert_equal(f.read(), CONTENT)
+
+
+def test_download_without_partial_data_starts_from_scratch():
+    pathname = os.path.join(TEMP_DIR, 'new')
+    partial_download = PartialDownload(pathname)
+
+    del RangeRequestHandler.requested_ranges[:]
+    result = download(pathname, partial_download)
+
+    assert_true(result['success'])
+    assert_equal(RangeRequestHandler.requested_ranges, [None])
+    assert_equal(result['etag'], hashlib.md5(CONTENT).hexdigest())
+
+
+def test_interrupted_download_keeps_its_progress():
+    pathname = os.path.join(TEMP_DIR, 'interrupted')
+    partial_download = PartialDownload(pathname)
+    termination = threading.Event()
+
+    def interrupt_after_first_chunk(percentage):
+        termination.set()
+
+    result = download(pathname, partial_download, termination,
+                      interrupt_after_first_chunk)
+    assert_false(result['success'])
+    assert_greater(partial_download.offset, 0)
+    assert_equal(os.path.getsize(pathname), partial_download.offset)
+
+    result = download(pathname, partial_download)
+    assert_true(result['success'])
+    assert_equal(result['etag'], hashlib.md5(CONTENT).hexdigest())
+
+
+def test_chunk_size_grows_with_throughput():
+    chunk_size = AdaptiveChunkSize(minimum=1000, maximum=100000, target_time=1)
+    assert_equal(chunk_size.get(), 1000)
+    chunk_size.update(1000, 0.0001)
+    assert_equal(chunk_size.get(), 2000)
+    for _ in xrange(10):
+        chunk_size.update(chunk_size.get(), 0)
+    assert_equal(chunk_size.get(), 100000)
+
+
+def test_chunk_size_follows_slow_connections():
+    chunk_size = AdaptiveChunkSize(minimum=1000, maximum=100000, target_time=1)
+    for _ in xrange(10):
+        chunk_size.update(chunk_size.get(), 0)
+    chunk_size.update(100000, 20)
+    assert_equal(chunk_size.get(), 5000)
+    chunk_size.update(5000, 100)
+    assert_equal(chunk_size.get(), 1000)
+
+
+def test_bandwidth_limit_overrides_chunk_size():
+    connector = StorageConnector(None, MagicMock())
+    chunk_size = AdaptiveChunkSize()
+    assert_equal(connector.byte_to_send(Bandwidth(0), chunk_size),
+                 chunk_size.get())
+    assert_equal(connector.byte_to_send(Bandwidth(10), chunk_size), 1024)
+
+
+''' Helper functions: '''
+
+def download(pathname, partial_download, termination=None,
+             percentage_callback=None):
+    cfg = MagicMock()
+    cfg.get.return_value = 'storage.endpoint'
+    connector = StorageConnector(None, cfg, PlainConnectionPool())
+    return connector.download_file(
+        pathname, u'file.txt', '127.0.0.1', 'bucket', 'token', 'date', open,
+        terminationEvent=termination, percentageQueue=percentage_callback,
+        partial_download=partial_download)
@@ -0,0 +1,125 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+"""
+This is the transfer_executor_test module.
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+import threading
+from nose.tools import *
+from mock import MagicMock
+
+from filerockclient.workers.transfer_executor import TransferExecutor, \
+    SUCCESS, INTERRUPTED, FAILED
+
+
+class FakeConnector(object):
+    """Uploads instantly, or blocks until terminated if told so."""
+
+    def __init__(self):
+        self.uploads = []
+        self.block = False
+        self.started = threading.Event()
+
+    def upload_file(self, *args, **kwds):
+        self.uploads.append(args[0])
+        self.started.set()
+        if self.block:
+            kwds['terminationEvent'].wait()
+            return {'success': False, 'details': {'termination': True}}
+        kwds['percentageQueue'](100)
+        return {'success': True, 'details': {}}
+
+
+def _make_executor():
+    percentages = []
+    callback = lambda op, status, percentage: percentages.append(percentage)
+    executor = TransferExecutor(MagicMock(), threading.Event(), callback,
+                                MagicMock(), MagicMock(), 'Worker_test')
+    executor.connector = FakeConnector()
+    return executor, percentages
+
+
+def _make_upload(pathname):
+    operation = MagicMock()
+    operation.verb = 'UPLOAD'
+    operation.pathname = pathname
+    operation.to_encrypt = False
+    operation.upload_info = {'remote_pathname': pathname,
+                             'remote_ip_address': '127.0.0.1',
+                             'bucket': 'bucket',
+                             'auth_token': 'token',
+                             'auth_date': 'date'}
+    return operation
+
+
+def test_executor_is_reused_across_operations():
+    executor, percentages = _make_executor()
+    for i in xrange(3):
+        result = executor.execute(_make_upload(u'file%s' % i))
+        assert_equal(result['status'], SUCCESS)
+    assert_equal(executor.connector.uploads, [u'file0', u'file1', u'file2'])
+    assert_equal(percentages, [100, 100, 100])
+
+
+def test_running_transfer_is_aborted_by_termination_event():
+    executor, _ = _make_executor()
+    executor.connector.block = True
+    results = []
+    thread = threading.Thread(
+        target=lambda: results.append(executor.execute(_make_upload(u'f'))))
+    thread.start()
+    assert_true(executor.connector.started.wait(5))
+    executor.terminationEvent.set()
+    thread.join(5)
+    assert_equal(results, [{'status': INTERRUPTED}])
+
+    # The owner clears the event to go on with the next operation
+    executor.terminationEvent.clear()
+    executor.connector.block = False
+    result = executor.execute(_make_upload(u'g'))
+    assert_equal(result['status'], SUCCESS)
+
+
+def test_unsupported_operation_fails():
+    executor, _ = _make_executor()
+    operation = _make_upload(u'f')
+    operation.verb = 'DELETE'
+    assert_equal(executor.execute(operation), {'status': FAILED})
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,130 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+This is the warebox_scanner_test module.
+
+
+
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+from nose.tools import *
+from filerockclient.warebox_scanner import WareboxScanner
+from filerockclient.exceptions import ExecutionInterrupted
+import os
+import shutil
+import tempfile
+import datetime
+import threading
+
+
+ROOT = None
+
+
+def setup():
+    global ROOT
+    ROOT = unicode(tempfile.mkdtemp())
+    os.makedirs(os.path.join(ROOT, u'dir1', u'dir2'))
+    os.makedirs(os.path.join(ROOT, u'blacklisted'))
+    write_file(u'file1.txt', 'x' * 10)
+    write_file(u'dir1/file2.txt', 'x' * 20)
+    write_file(u'dir1/dir2/file3.txt', '')
+    write_file(u'blacklisted/file4.txt', 'x')
+    if hasattr(os, 'symlink'):
+        os.symlink(os.path.join(ROOT, u'dir1'), os.path.join(ROOT, u'link'))
+
+
+def teardown():
+    shutil.rmtree(ROOT)
+
+
+def test_scan_collects_pathnames_and_metadata():
+    for max_threads in [1, 4]:
+        entries = create_scanner(max_threads).scan()
+        sizes = dict((p, size) for (p, size, _) in entries)
+        assert_equal(sizes[u'file1.txt'], 10)
+        assert_equal(sizes[u'dir1/file2.txt'], 20)
+        assert_equal(sizes[u'dir1/dir2/file3.txt'], 0)
+        assert_equal(sizes[u'dir1/'], 0)
+        assert_equal(sizes[u'dir1/dir2/'], 0)
+        assert_not_in(u'blacklisted/', sizes)
+        assert_not_in(u'blacklisted/file4.txt', sizes)
+        for (pathname, _, lmtime) in entries:
+            assert_is_instance(lmtime, datetime.datetime)
+
+
+def test_scan_result_is_sorted():
+    for max_threads in [1, 4]:
+        pathnames = [p for (p, _, _) in create_scanner(max_threads).scan()]
+        assert_equal(pathnames, sorted(pathnames))
+
+
+def test_scan_does_not_descend_into_linked_folders():
+    if not hasattr(os, 'symlink'):
+        return
+    pathnames = [p for (p, _, _) in create_scanner(4).scan()]
+    assert_in(u'link/', pathnames)
+    assert_not_in(u'link/file2.txt', pathnames)
+
+
+def test_blacklist_can_be_disabled():
+    entries = create_scanner(4).scan(blacklisted=False)
+    pathnames = [p for (p, _, _) in entries]
+    assert_in(u'blacklisted/file4.txt', pathnames)
+
+
+def test_not_recursive_scan_lists_one_folder():
+    entries = create_scanner(4).scan(folder=u'dir1', recursive=False)
+    pathnames = [p for (p, _, _) in entries]
+    assert_equal(pathnames, [u'dir1/dir2/', u'dir1/file2.txt'])
+
+
+@raises(ExecutionInterrupted)
+def test_scan_can_be_interrupted():
+    interruption = threading.Event()
+    interruption.set()
+    create_scanner(4).scan(interruption=interruption)
+
+
+''' Helper functions: '''
+
+def create_scanner(max_threads):
+    is_blacklisted = lambda pathname: pathname.startswith(u'blacklisted/')
+    return WareboxScanner(ROOT, is_blacklisted, max_threads)
+
+
+def write_file(pathname, content):
+    with open(os.path.join(ROOT, pathname), 'wb') as f:
+        f.write(content)
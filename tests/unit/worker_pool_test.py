@@ -0,0 +1,125 @@
+# -*- coding: ascii -*-
+#  ______ _ _      _____            _       _____ _ _            _
+# |  ____(_) |    |  __ \          | |     / ____| (_)          | |
+# | |__   _| | ___| |__) |___   ___| | __ | |    | |_  ___ _ __ | |_
+# |  __| | | |/ _ \  _  // _ \ / __| |/ / | |    | | |/ _ \ '_ \| __|
+# | |    | | |  __/ | \ \ (_) | (__|   <  | |____| | |  __/ | | | |_
+# |_|    |_|_|\___|_|  \_\___/ \___|_|\_\  \_____|_|_|\___|_| |_|\__|
+#
+# Copyright (C) 2012 Heyware s.r.l.
+#
+# This file is part of FileRock Client.
+#
+# FileRock Client is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FileRock Client is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with FileRock Client. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+"""
+This is the worker_pool_test module.
+
+----
+
+This module is part of the FileRock Client.
+
+Copyright (C) 2012 - Heyware s.r.l.
+
+FileRock Client is licensed under GPLv3 License.
+
+"""
+
+
+import time
+from nose.tools import *
+from mock import MagicMock
+
+from filerockclient.config import DEFAULT_CONFIG
+from filerockclient.workers.worker_pool import WorkerPool
+
+
+class FakeConfig(object):
+
+    def get(self, section, option):
+        return DEFAULT_CONFIG[section][option]
+
+    def getint(self, section, option):
+        return int(self.get(section, option))
+
+    def getboolean(self, section, option):
+        return self.get(section, option) == u'True'
+
+
+def _alive_workers(pool, expected):
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        alive = len([w for w in pool.workers if w.is_alive()])
+        if alive == expected:
+            break
+        time.sleep(0.01)
+    return alive
+
+
+def test_grow_adds_workers_and_free_permits():
+    session = MagicMock()
+    pool = WorkerPool(MagicMock(), session, FakeConfig(), MagicMock())
+    pool.start_workers()
+    try:
+        pool._resize(6)
+        assert_equal(pool.how_many_workers, 6)
+        assert_equal(pool.free_worker.get_value(), 6)
+        assert_equal(_alive_workers(pool, 6), 6)
+        assert_true(session.signal_free_worker.called)
+    finally:
+        pool.terminate()
+
+
+def test_shrink_stops_workers():
+    pool = WorkerPool(MagicMock(), MagicMock(), FakeConfig(), MagicMock())
+    pool.start_workers()
+    try:
+        assert_true(pool.acquire_worker())
+        pool._resize(2)
+        assert_equal(pool.how_many_workers, 2)
+        assert_equal(pool.free_worker.get_in_use(), 1)
+        assert_equal(_alive_workers(pool, 2), 2)
+        pool._resize(3)
+        assert_equal(len(pool.workers), 3)
+        assert_equal(_alive_workers(pool, 3), 3)
+    finally:
+        pool.terminate()
+
+
+def test_shrink_between_exist_free_workers_and_acquire_worker():
+    pool = WorkerPool(MagicMock(), MagicMock(), FakeConfig(), MagicMock())
+    for _ in xrange(3):
+        assert_true(pool.acquire_worker())
+    assert_true(pool.exist_free_workers())
+    pool._resize(1)
+    assert_true(pool.acquire_worker())
+    assert_false(pool.exist_free_workers())
+    assert_equal(pool.free_worker.get_in_use(), 4)
+
+
+def test_shrink_with_free_workers_retires_permits_when_released():
+    pool = WorkerPool(MagicMock(), MagicMock(), FakeConfig(), MagicMock())
+    pool._resize(1)
+    assert_true(pool.exist_free_workers())
+    for _ in xrange(4):
+        assert_true(pool.acquire_worker())
+    for _ in xrange(4):
+        pool.free_worker.release()
+    assert_equal(pool.free_worker.get_value(), 1)
+
+
+if __name__ == '__main__':
+    pass